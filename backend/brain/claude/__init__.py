@@ -4,6 +4,7 @@ Soporta: Claude (Anthropic), Gemini (Google), ChatGPT (OpenAI)
 """
 
 from .client import ClaudeBrainClient, ClaudeConfig, ClaudeModel
+from .call_layer import LLMCallLayer, BudgetExceededError
 from .gemini_client import GeminiBrainClient, GeminiConfig
 from .openai_client import OpenAIBrainClient, OpenAIConfig, OpenAIModel
 from .tools import BRAIN_TOOLS, LOGISTICS_AGENT_TOOLS, CUSTOMER_AGENT_TOOLS
@@ -13,6 +14,8 @@ __all__ = [
     'ClaudeBrainClient',
     'ClaudeConfig',
     'ClaudeModel',
+    'LLMCallLayer',
+    'BudgetExceededError',
     # Gemini (Google)
     'GeminiBrainClient',
     'GeminiConfig',
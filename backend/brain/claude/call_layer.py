@@ -0,0 +1,318 @@
+"""
+Capa de llamadas al LLM para el cerebro autónomo.
+
+Se ubica entre ClaudeBrainClient y el SDK y evita pagar dos veces por la
+misma pregunta:
+- Cache exacto de respuestas por hash del prompt normalizado, con TTL
+- Coalescing: prompts idénticos en vuelo comparten una sola llamada
+- System prompt como bloque estático marcado para el prompt caching del proveedor
+- Presupuesto de tokens por hora (token bucket) que descarta primero lo
+  menos prioritario
+
+El cliente envuelto solo necesita `messages.create(**kwargs)` asíncrono,
+así que en tests se usa un cliente falso que registra las llamadas.
+"""
+
+from typing import Any, Callable, Dict, List, Optional, Union
+from collections import OrderedDict
+from dataclasses import dataclass
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+# Fracción del presupuesto que debe quedar libre tras la llamada para
+# admitirla; None = nunca se descarta (puede endeudar el bucket)
+PRIORITY_RESERVE: Dict[str, Optional[float]] = {
+    'critical': None,
+    'high': 0.05,
+    'normal': 0.2,
+    'low': 0.5,
+}
+
+# Claves que cambian en cada evento sin cambiar su significado
+VOLATILE_KEYS = frozenset({'timestamp', 'received_at', 'created_at', 'updated_at'})
+
+# Salida esperada para reservar presupuesto antes de conocer el uso real
+EXPECTED_OUTPUT_TOKENS = 1024
+
+# Peso de los tokens de prompt caching frente a un token de entrada normal
+# (lectura del cache ~10% del precio, escritura ~125%)
+CACHE_READ_WEIGHT = 0.1
+CACHE_WRITE_WEIGHT = 1.25
+
+_WHITESPACE = re.compile(r'\s+')
+_ISO_TIMESTAMP = re.compile(
+    r'\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?(?:Z|[+-]\d{2}:?\d{2})?'
+)
+
+
+class BudgetExceededError(Exception):
+    """La llamada se descartó por falta de presupuesto de tokens"""
+
+
+@dataclass
+class CallResult:
+    """Respuesta del LLM y de dónde salió"""
+    response: Any
+    source: str  # api, cache, coalesced
+
+
+def normalize_prompt(text: str) -> str:
+    """Colapsa espacios y enmascara timestamps ISO para el hash del cache"""
+    return _WHITESPACE.sub(' ', _ISO_TIMESTAMP.sub('<ts>', text)).strip()
+
+
+def semantic_key(*parts: Any) -> str:
+    """
+    Clave estable para datos estructurados, ignorando campos volátiles.
+
+    Ejemplo: semantic_key(event.type, event.data) es igual para dos eventos
+    del mismo tipo y la misma guía en el mismo estado aunque lleguen con
+    timestamps distintos.
+    """
+    def strip(value):
+        if isinstance(value, dict):
+            return {k: strip(v) for k, v in value.items() if k not in VOLATILE_KEYS}
+        if isinstance(value, (list, tuple)):
+            return [strip(v) for v in value]
+        return value
+
+    raw = json.dumps([strip(p) for p in parts], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _texts(value: Any) -> List[str]:
+    """Todos los textos de un system/messages (string o lista de bloques)"""
+    if isinstance(value, str):
+        return [value]
+    if isinstance(value, dict):
+        texts = [value['text']] if isinstance(value.get('text'), str) else []
+        return texts + _texts(value.get('content'))
+    if isinstance(value, list):
+        return [t for item in value for t in _texts(item)]
+    return []
+
+
+class TokenBucket:
+    """Bucket de tokens que se rellena de forma continua hasta `capacity`"""
+
+    def __init__(self, capacity: float, refill_per_second: float,
+                 clock: Callable[[], float] = time.monotonic):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self._clock = clock
+        self._level = capacity
+        self._updated = clock()
+
+    @property
+    def level(self) -> float:
+        now = self._clock()
+        self._level = min(self.capacity, self._level + (now - self._updated) * self.refill_per_second)
+        self._updated = now
+        return self._level
+
+    def try_consume(self, amount: float, reserve: Optional[float]) -> bool:
+        """Consume si, tras hacerlo, queda al menos `reserve` * capacidad"""
+        if reserve is not None and self.level - amount < reserve * self.capacity:
+            return False
+        self._level = self.level - amount
+        return True
+
+    def adjust(self, delta: float):
+        """Corrige una reserva con el uso real (delta > 0 = se gastó más)"""
+        self._level = self.level - delta
+
+
+class ResponseCache:
+    """Cache LRU de respuestas con TTL"""
+
+    def __init__(self, ttl_seconds: float, max_entries: int = 1000,
+                 clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl_seconds
+        self.max_entries = max_entries
+        self._clock = clock
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[Any]:
+        item = self._entries.get(key)
+        if item is None:
+            return None
+        expires, value = item
+        if self._clock() >= expires:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key: str, value: Any):
+        self._entries[key] = (self._clock() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+class LLMCallLayer:
+    """
+    Envoltura de `messages.create` con cache, coalescing y presupuesto.
+
+    Ejemplo de uso:
+        calls = LLMCallLayer(anthropic.AsyncAnthropic(), tokens_per_hour=2_000_000)
+        result = await calls.create(
+            {'model': ..., 'max_tokens': 1024,
+             'system': calls.system_blocks(SYSTEM_PROMPT),
+             'messages': [{'role': 'user', 'content': prompt}]},
+            priority='normal'
+        )
+        result.response, result.source  # source: api | cache | coalesced
+    """
+
+    def __init__(self,
+                 client: Any,
+                 tokens_per_hour: int = 2_000_000,
+                 cache_ttl_seconds: float = 300,
+                 max_cache_entries: int = 1000,
+                 clock: Callable[[], float] = time.monotonic):
+        self.client = client
+        self.cache = ResponseCache(cache_ttl_seconds, max_cache_entries, clock)
+        self.budget = TokenBucket(tokens_per_hour, tokens_per_hour / 3600, clock)
+        self._in_flight: Dict[str, asyncio.Future] = {}
+
+        self.metrics = {
+            'api_calls': 0,
+            'cache_hits': 0,
+            'coalesced': 0,
+            'shed': 0,
+            'input_tokens': 0,
+            'output_tokens': 0,
+            'cache_read_tokens': 0,
+            'cache_write_tokens': 0
+        }
+
+    @staticmethod
+    def system_blocks(static: str, dynamic: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        System prompt en bloques: el estático primero y marcado con
+        cache_control, para que el proveedor reutilice el prefijo
+        (tools + system) entre llamadas; lo variable va después.
+        """
+        blocks = [{'type': 'text', 'text': static, 'cache_control': {'type': 'ephemeral'}}]
+        if dynamic:
+            blocks.append({'type': 'text', 'text': dynamic})
+        return blocks
+
+    def request_key(self, request: Dict[str, Any], cache_key: Optional[str] = None) -> str:
+        """
+        Hash del request normalizado.
+
+        Con `cache_key` los mensajes se reemplazan por esa clave semántica;
+        el modelo, el system y las tools siempre forman parte del hash.
+        """
+        parts = {
+            'model': request.get('model'),
+            'max_tokens': request.get('max_tokens'),
+            'temperature': request.get('temperature'),
+            'system': [normalize_prompt(t) for t in _texts(request.get('system'))],
+            'tools': [tool.get('name') for tool in request.get('tools') or []],
+            'messages': cache_key or [normalize_prompt(t) for t in _texts(request.get('messages'))]
+        }
+        raw = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def estimate_tokens(self, request: Dict[str, Any]) -> int:
+        """Estimación gruesa (4 caracteres por token) más la salida esperada"""
+        chars = sum(len(t) for t in _texts(request.get('system')) + _texts(request.get('messages')))
+        if request.get('tools'):
+            chars += len(json.dumps(request['tools'], default=str))
+        return chars // 4 + min(request.get('max_tokens', EXPECTED_OUTPUT_TOKENS), EXPECTED_OUTPUT_TOKENS)
+
+    async def create(self,
+                     request: Dict[str, Any],
+                     priority: str = 'normal',
+                     cache_key: Optional[str] = None,
+                     use_cache: bool = True) -> CallResult:
+        """
+        Ejecuta (o reutiliza) una llamada a `messages.create`.
+
+        Raises:
+            BudgetExceededError: si el presupuesto no alcanza para esta prioridad
+        """
+        key = self.request_key(request, cache_key)
+
+        if use_cache:
+            cached = self.cache.get(key)
+            if cached is not None:
+                self.metrics['cache_hits'] += 1
+                return CallResult(cached, 'cache')
+
+        leader = self._in_flight.get(key)
+        if leader is not None:
+            self.metrics['coalesced'] += 1
+            return CallResult(await asyncio.shield(leader), 'coalesced')
+
+        estimate = self.estimate_tokens(request)
+        if not self.budget.try_consume(estimate, PRIORITY_RESERVE.get(priority, PRIORITY_RESERVE['normal'])):
+            self.metrics['shed'] += 1
+            logger.warning(f"⛔ Llamada LLM descartada por presupuesto (prioridad {priority})")
+            raise BudgetExceededError(f"Presupuesto de tokens agotado para prioridad '{priority}'")
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            self.metrics['api_calls'] += 1
+            response = await self.client.messages.create(**request)
+        except asyncio.CancelledError:
+            self.budget.adjust(-estimate)
+            future.cancel()
+            raise
+        except Exception as e:
+            self.budget.adjust(-estimate)  # Sin respuesta no hubo consumo
+            future.set_exception(e)
+            future.exception()  # Evita el warning si nadie más esperaba
+            raise
+        finally:
+            self._in_flight.pop(key, None)
+
+        self._account(response, estimate)
+        if use_cache:
+            self.cache.put(key, response)
+        future.set_result(response)
+        return CallResult(response, 'api')
+
+    def _account(self, response: Any, estimate: int):
+        """Registra el uso real y corrige la reserva del presupuesto (tokens ponderados por costo)"""
+        usage = getattr(response, 'usage', None)
+        if usage is None:
+            return
+
+        input_tokens = getattr(usage, 'input_tokens', 0) or 0
+        output_tokens = getattr(usage, 'output_tokens', 0) or 0
+        cache_read = getattr(usage, 'cache_read_input_tokens', 0) or 0
+        cache_write = getattr(usage, 'cache_creation_input_tokens', 0) or 0
+
+        self.metrics['input_tokens'] += input_tokens
+        self.metrics['output_tokens'] += output_tokens
+        self.metrics['cache_read_tokens'] += cache_read
+        self.metrics['cache_write_tokens'] += cache_write
+
+        spent = (
+            input_tokens + output_tokens
+            + cache_read * CACHE_READ_WEIGHT
+            + cache_write * CACHE_WRITE_WEIGHT
+        )
+        self.budget.adjust(spent - estimate)
+
+    def get_metrics(self) -> Dict[str, Union[int, float]]:
+        """Métricas de la capa (incluye presupuesto restante)"""
+        return {
+            **self.metrics,
+            'cached_responses': len(self.cache),
+            'budget_remaining': int(self.budget.level)
+        }
@@ -1,6 +1,9 @@
 """
 Cliente unificado de Claude API para el cerebro autónomo de Litper Pro.
 Usa claude-sonnet-4-20250514 como modelo principal.
+
+Todas las llamadas pasan por LLMCallLayer (cache de respuestas, coalescing,
+prompt caching del system prompt y presupuesto de tokens por hora).
 """
 
 import anthropic
@@ -13,6 +16,8 @@ import os
 from datetime import datetime
 import logging
 
+from .call_layer import BudgetExceededError, LLMCallLayer
+
 logger = logging.getLogger(__name__)
 
 
@@ -31,6 +36,8 @@ class ClaudeConfig:
     max_tokens: int = 4096
     temperature: float = 0.7
     timeout: int = 60
+    response_cache_ttl: int = field(default_factory=lambda: int(os.getenv("BRAIN_RESPONSE_CACHE_TTL", "300")))
+    tokens_per_hour: int = field(default_factory=lambda: int(os.getenv("BRAIN_TOKENS_PER_HOUR", "2000000")))
 
 
 class ClaudeBrainClient:
@@ -47,6 +54,11 @@ class ClaudeBrainClient:
 
         self.client = anthropic.Anthropic(api_key=self.config.api_key)
         self.async_client = anthropic.AsyncAnthropic(api_key=self.config.api_key)
+        self.calls = LLMCallLayer(
+            self.async_client,
+            tokens_per_hour=self.config.tokens_per_hour,
+            cache_ttl_seconds=self.config.response_cache_ttl
+        )
 
         # Métricas de uso
         self.metrics = {
@@ -162,42 +174,54 @@ Formato de respuesta (JSON):
                     context: str,
                     role: str = 'brain',
                     model: ClaudeModel = None,
-                    tools: List[Dict] = None) -> Dict[str, Any]:
+                    tools: List[Dict] = None,
+                    priority: str = 'normal',
+                    cache_key: Optional[str] = None) -> Dict[str, Any]:
         """
         Método principal de pensamiento del cerebro.
         Usa Claude para razonar sobre un contexto.
+
+        Args:
+            priority: low, normal, high, critical; decide qué se descarta
+                primero cuando se agota el presupuesto de tokens
+            cache_key: Clave semántica para el cache de respuestas (ver
+                call_layer.semantic_key); sin ella se usa el prompt normalizado
         """
         model = model or self.config.default_model
         system_prompt = self.system_prompts.get(role, self.system_prompts['brain'])
 
-        messages = [{"role": "user", "content": context}]
+        request = {
+            'model': model.value,
+            'max_tokens': self.config.max_tokens,
+            'system': self.calls.system_blocks(system_prompt),
+            'messages': [{"role": "user", "content": context}]
+        }
+        if tools:
+            # Usar tool_use para acciones estructuradas
+            request['tools'] = tools
 
         self.metrics['total_requests'] += 1
         self.metrics['last_request'] = datetime.now().isoformat()
 
         try:
-            if tools:
-                # Usar tool_use para acciones estructuradas
-                response = await self.async_client.messages.create(
-                    model=model.value,
-                    max_tokens=self.config.max_tokens,
-                    system=system_prompt,
-                    messages=messages,
-                    tools=tools
-                )
-            else:
-                response = await self.async_client.messages.create(
-                    model=model.value,
-                    max_tokens=self.config.max_tokens,
-                    system=system_prompt,
-                    messages=messages
-                )
+            result = await self.calls.create(
+                request,
+                priority=priority,
+                cache_key=cache_key,
+                # Lo crítico siempre se razona de nuevo
+                use_cache=priority != 'critical'
+            )
+            response = result.response
 
             self.metrics['successful_requests'] += 1
-            self.metrics['total_tokens'] += response.usage.input_tokens + response.usage.output_tokens
+            if result.source == 'api':
+                self.metrics['total_tokens'] += response.usage.input_tokens + response.usage.output_tokens
 
             return self._parse_response(response)
 
+        except BudgetExceededError as e:
+            self.metrics['failed_requests'] += 1
+            return {"error": str(e), "success": False, "shed": True}
         except anthropic.APIError as e:
             self.metrics['failed_requests'] += 1
             logger.error(f"Claude API Error: {e}")
@@ -232,7 +256,7 @@ Analiza y decide la mejor acción a tomar. Responde en formato JSON.
 """
         # Usar modelo más potente para decisiones críticas
         model = ClaudeModel.OPUS if urgency == "critical" else ClaudeModel.SONNET
-        return await self.think(context, role='decision', model=model)
+        return await self.think(context, role='decision', model=model, priority=urgency)
 
     async def learn(self,
                     action: str,
@@ -251,7 +275,7 @@ CONTEXTO: {json.dumps(context, ensure_ascii=False) if context else 'N/A'}
 Analiza qué funcionó, qué no, y qué se puede mejorar.
 Responde en formato JSON.
 """
-        return await self.think(learning_context, role='learning', model=ClaudeModel.HAIKU)
+        return await self.think(learning_context, role='learning', model=ClaudeModel.HAIKU, priority='low')
 
     async def analyze_image(self,
                             image_base64: str,
@@ -302,7 +326,8 @@ Responde en formato JSON.
         async def process_one(item: Dict) -> Dict:
             async with semaphore:
                 context = f"{processor_prompt}\n\nITEM: {json.dumps(item, ensure_ascii=False)}"
-                result = await self.think(context, role='agent', model=ClaudeModel.HAIKU)
+                # Items repetidos se resuelven con el cache/coalescing de la capa
+                result = await self.think(context, role='agent', model=ClaudeModel.HAIKU, priority='low')
                 return {"input": item, "output": result}
 
         results = await asyncio.gather(*[process_one(item) for item in items])
@@ -401,6 +426,7 @@ Responde en formato JSON como array.
         """Retorna métricas de uso del cliente."""
         return {
             **self.metrics,
+            'call_layer': self.calls.get_metrics(),
             'success_rate': (
                 self.metrics['successful_requests'] / self.metrics['total_requests'] * 100
                 if self.metrics['total_requests'] > 0 else 0
@@ -319,6 +319,51 @@ BRAIN_TOOLS: List[Dict[str, Any]] = [
             },
             "required": ["category", "description"]
         }
+    },
+    {
+        "name": "execute_plan",
+        "description": "Ejecuta varias acciones como un plan con dependencias (ej: predecir retraso -> seleccionar transportadora -> notificar cliente -> crear alerta). Los pasos independientes corren en paralelo. Un paso puede usar la salida de otro con {{id_paso.campo}}.",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "steps": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "id": {
+                                "type": "string",
+                                "description": "Identificador del paso (ej: predecir, seleccionar, notificar)"
+                            },
+                            "tool": {
+                                "type": "string",
+                                "description": "Tool a ejecutar en este paso"
+                            },
+                            "input": {
+                                "type": "object",
+                                "description": "Parámetros de la tool; admite referencias {{id_paso.campo}}"
+                            },
+                            "depends_on": {
+                                "type": "array",
+                                "items": {"type": "string"},
+                                "description": "Pasos que deben terminar antes (además de los referenciados)"
+                            },
+                            "compensate": {
+                                "type": "object",
+                                "description": "Acción {tool, input} que deshace este paso si el plan falla"
+                            },
+                            "optional": {
+                                "type": "boolean",
+                                "description": "Si falla, el plan continúa",
+                                "default": False
+                            }
+                        },
+                        "required": ["id", "tool"]
+                    }
+                }
+            },
+            "required": ["steps"]
+        }
     }
 ]
 
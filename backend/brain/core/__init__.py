@@ -5,9 +5,11 @@ Core Brain Module - Motor principal del cerebro autónomo
 from .brain_engine import ClaudeAutonomousBrain
 from .memory_system import BrainMemory
 from .action_executor import ActionExecutor
+from .event_aggregator import EventAggregator
 
 __all__ = [
     'ClaudeAutonomousBrain',
     'BrainMemory',
-    'ActionExecutor'
+    'ActionExecutor',
+    'EventAggregator'
 ]
@@ -1,16 +1,39 @@
 """
 Ejecutor de acciones del cerebro autónomo.
 Ejecuta las acciones decididas por Claude a través de las tools.
+
+Además de acciones sueltas ejecuta planes: un DAG de pasos devuelto en una
+sola respuesta del modelo, donde cada paso puede usar la salida de pasos
+anteriores ({{paso.campo}}). Las ramas independientes corren en paralelo
+respetando la concurrencia y el timeout de cada tool; si un paso falla se
+ejecutan las compensaciones de los pasos ya completados.
 """
 
-from typing import Dict, Any, Callable, Optional
+from typing import Dict, Any, Callable, List, Optional, Tuple, Union
 from datetime import datetime
 import asyncio
 import logging
+import re
 from dataclasses import dataclass, field
 
 logger = logging.getLogger(__name__)
 
+# Límites por tool: (concurrencia máxima, timeout en segundos)
+TOOL_LIMITS: Dict[str, Tuple[int, float]] = {
+    'send_whatsapp': (5, 15),
+    'query_database': (10, 10),
+    'trigger_ml_prediction': (4, 30),
+    'optimize_route': (4, 60),
+    'generate_report': (2, 120),
+}
+DEFAULT_TOOL_LIMIT: Tuple[int, float] = (8, 30)
+
+# Nombre de la tool con la que el modelo entrega un plan
+PLAN_TOOL = 'execute_plan'
+
+# Referencia a la salida de un paso: {{paso.campo.subcampo}}
+_REFERENCE = re.compile(r'\{\{\s*([A-Za-z_]\w*)((?:\.\w+)*)\s*\}\}')
+
 
 @dataclass
 class ActionResult:
@@ -23,6 +46,149 @@ class ActionResult:
     timestamp: datetime = field(default_factory=datetime.now)
 
 
+@dataclass
+class PlanStep:
+    """Paso de un plan de acciones"""
+    id: str
+    tool: str
+    input: Dict[str, Any] = field(default_factory=dict)
+    depends_on: List[str] = field(default_factory=list)
+    compensate: Optional[Dict[str, Any]] = None  # {'tool': ..., 'input': {...}}
+    optional: bool = False  # Si falla, el plan sigue (sus dependientes se omiten)
+
+
+@dataclass
+class PlanResult:
+    """Resultado de un plan completo (una sola entrada del historial)"""
+    plan_id: str
+    success: bool
+    steps: Dict[str, ActionResult] = field(default_factory=dict)
+    skipped: List[str] = field(default_factory=list)
+    compensated: List[str] = field(default_factory=list)
+    error: Optional[str] = None
+    execution_time_ms: float = 0
+    timestamp: datetime = field(default_factory=datetime.now)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'tool': PLAN_TOOL,
+            'plan_id': self.plan_id,
+            'success': self.success,
+            'steps': {
+                step_id: {
+                    'tool': r.tool,
+                    'success': r.success,
+                    'result': r.result,
+                    'error': r.error,
+                    'execution_time_ms': r.execution_time_ms
+                }
+                for step_id, r in self.steps.items()
+            },
+            'skipped': self.skipped,
+            'compensated': self.compensated,
+            'error': self.error,
+            'execution_time_ms': self.execution_time_ms
+        }
+
+
+def _lookup(results: Dict[str, ActionResult], step_id: str, path: str) -> Any:
+    """Valor de {{paso.campo}} en los resultados; KeyError si no existe"""
+    if step_id not in results:
+        raise KeyError(f"Paso sin resultado: {step_id}")
+    value = results[step_id].result
+    for key in filter(None, path.split('.')):
+        if isinstance(value, dict) and key in value:
+            value = value[key]
+        elif isinstance(value, list) and key.isdigit() and int(key) < len(value):
+            value = value[int(key)]
+        else:
+            raise KeyError(f"{step_id}{path} no existe")
+    return value
+
+
+def resolve_references(value: Any, results: Dict[str, ActionResult]) -> Any:
+    """
+    Reemplaza las referencias {{paso.campo}} por la salida de los pasos.
+
+    Un string que es solo una referencia toma el valor tal cual (número,
+    dict...); dentro de un texto se interpola como string.
+    """
+    if isinstance(value, dict):
+        return {k: resolve_references(v, results) for k, v in value.items()}
+    if isinstance(value, list):
+        return [resolve_references(v, results) for v in value]
+    if not isinstance(value, str):
+        return value
+
+    whole = _REFERENCE.fullmatch(value.strip())
+    if whole:
+        return _lookup(results, whole.group(1), whole.group(2))
+    return _REFERENCE.sub(lambda m: str(_lookup(results, m.group(1), m.group(2))), value)
+
+
+def _referenced_steps(value: Any) -> List[str]:
+    """Pasos referenciados dentro de un input"""
+    if isinstance(value, dict):
+        return [s for v in value.values() for s in _referenced_steps(v)]
+    if isinstance(value, list):
+        return [s for v in value for s in _referenced_steps(v)]
+    if isinstance(value, str):
+        return [m.group(1) for m in _REFERENCE.finditer(value)]
+    return []
+
+
+def parse_plan(plan: Union[Dict[str, Any], List[Dict[str, Any]]]) -> Dict[str, PlanStep]:
+    """
+    Valida un plan del modelo y lo convierte en pasos.
+
+    Acepta {'steps': [...]} o la lista de pasos. Las dependencias son las
+    declaradas en depends_on más los pasos referenciados en el input.
+
+    Raises:
+        ValueError: ids repetidos, dependencias desconocidas o ciclos
+    """
+    raw_steps = plan.get('steps', []) if isinstance(plan, dict) else plan
+    if not isinstance(raw_steps, list) or not raw_steps:
+        raise ValueError("El plan no tiene pasos")
+
+    steps: Dict[str, PlanStep] = {}
+    for i, raw in enumerate(raw_steps):
+        if not isinstance(raw, dict) or not raw.get('tool'):
+            raise ValueError(f"Paso {i} sin tool")
+        step_id = str(raw.get('id') or f"step_{i}")
+        if step_id in steps:
+            raise ValueError(f"Paso repetido: {step_id}")
+
+        params = raw.get('input') or {}
+        depends_on = list(dict.fromkeys(list(raw.get('depends_on') or []) + _referenced_steps(params)))
+        steps[step_id] = PlanStep(
+            id=step_id,
+            tool=raw['tool'],
+            input=params,
+            depends_on=depends_on,
+            compensate=raw.get('compensate'),
+            optional=bool(raw.get('optional', False))
+        )
+
+    for step in steps.values():
+        unknown = [d for d in step.depends_on if d not in steps]
+        if unknown:
+            raise ValueError(f"Paso {step.id} depende de pasos inexistentes: {unknown}")
+
+    # Orden topológico solo para detectar ciclos
+    remaining = {step_id: set(step.depends_on) for step_id, step in steps.items()}
+    while remaining:
+        ready = [step_id for step_id, deps in remaining.items() if not deps]
+        if not ready:
+            raise ValueError(f"El plan tiene un ciclo entre: {sorted(remaining)}")
+        for step_id in ready:
+            del remaining[step_id]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+
+    return steps
+
+
 class ActionExecutor:
     """
     Ejecuta acciones del cerebro autónomo.
@@ -32,6 +198,8 @@ class ActionExecutor:
     def __init__(self):
         """Inicializa el ejecutor con handlers por defecto."""
         self.handlers: Dict[str, Callable] = {}
+        self.limits: Dict[str, Tuple[int, float]] = dict(TOOL_LIMITS)
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
         self.pending_actions: asyncio.Queue = asyncio.Queue()
         self.action_history: list = []
         self.max_history = 1000
@@ -41,7 +209,11 @@ class ActionExecutor:
             'total_executed': 0,
             'successful': 0,
             'failed': 0,
-            'avg_execution_time_ms': 0
+            'timeouts': 0,
+            'avg_execution_time_ms': 0,
+            'plans_executed': 0,
+            'plans_failed': 0,
+            'compensations': 0
         }
 
         # Registrar handlers por defecto
@@ -286,17 +458,29 @@ class ActionExecutor:
                 'timestamp': datetime.now().isoformat()
             }
 
-    def register(self, tool_name: str):
+    def register(self,
+                 tool_name: str,
+                 concurrency: Optional[int] = None,
+                 timeout: Optional[float] = None):
         """
         Decorador para registrar un handler de tool.
 
+        Args:
+            tool_name: Nombre de la tool
+            concurrency: Ejecuciones simultáneas máximas de la tool
+            timeout: Segundos máximos por ejecución
+
         Usage:
-            @executor.register("my_tool")
+            @executor.register("my_tool", concurrency=2, timeout=10)
             async def my_handler(params: Dict) -> Dict:
                 ...
         """
         def decorator(func: Callable):
             self.handlers[tool_name] = func
+            if concurrency is not None or timeout is not None:
+                default_concurrency, default_timeout = self.limits.get(tool_name, DEFAULT_TOOL_LIMIT)
+                self.limits[tool_name] = (concurrency or default_concurrency, timeout or default_timeout)
+                self._semaphores.pop(tool_name, None)
             logger.debug(f"Handler registrado: {tool_name}")
             return func
         return decorator
@@ -314,63 +498,88 @@ class ActionExecutor:
         Returns:
             Resultado de la acción
         """
-        start_time = datetime.now()
+        result = await self._invoke(tool_name, params)
+
+        # Guardar en historial
+        self._add_to_history(result)
+
+        return result
+
+    async def _invoke(self, tool_name: str, params: Dict[str, Any]) -> ActionResult:
+        """Ejecuta el handler con el límite de concurrencia y el timeout de la tool."""
         self.stats['total_executed'] += 1
 
         # Verificar que existe el handler
         if tool_name not in self.handlers:
             logger.warning(f"⚠️ Handler no encontrado: {tool_name}")
-            result = ActionResult(
-                tool=tool_name,
-                success=False,
-                result=None,
-                error=f"Handler not found: {tool_name}"
-            )
             self.stats['failed'] += 1
-            return result
-
-        try:
-            # Ejecutar handler
-            handler = self.handlers[tool_name]
-            handler_result = await handler(params)
-
-            execution_time = (datetime.now() - start_time).total_seconds() * 1000
-
-            result = ActionResult(
-                tool=tool_name,
-                success=True,
-                result=handler_result,
-                execution_time_ms=execution_time
-            )
-
-            self.stats['successful'] += 1
-            self._update_avg_time(execution_time)
-
-            logger.info(f"✅ Acción {tool_name} ejecutada en {execution_time:.2f}ms")
-
-        except Exception as e:
-            execution_time = (datetime.now() - start_time).total_seconds() * 1000
-
-            result = ActionResult(
+            return ActionResult(
                 tool=tool_name,
                 success=False,
                 result=None,
-                error=str(e),
-                execution_time_ms=execution_time
+                error=f"Handler not found: {tool_name}"
             )
 
-            self.stats['failed'] += 1
-            logger.error(f"❌ Error en acción {tool_name}: {e}")
-
-        # Guardar en historial
-        self._add_to_history(result)
+        concurrency, timeout = self.limits.get(tool_name, DEFAULT_TOOL_LIMIT)
+        semaphore = self._semaphores.get(tool_name)
+        if semaphore is None:
+            semaphore = self._semaphores[tool_name] = asyncio.Semaphore(concurrency)
+
+        async with semaphore:
+            start_time = datetime.now()
+            try:
+                # Ejecutar handler
+                handler_result = await asyncio.wait_for(self.handlers[tool_name](params), timeout)
+
+                execution_time = (datetime.now() - start_time).total_seconds() * 1000
+
+                result = ActionResult(
+                    tool=tool_name,
+                    success=True,
+                    result=handler_result,
+                    execution_time_ms=execution_time
+                )
+
+                self.stats['successful'] += 1
+                self._update_avg_time(execution_time)
+
+                logger.info(f"✅ Acción {tool_name} ejecutada en {execution_time:.2f}ms")
+
+            except asyncio.TimeoutError:
+                result = ActionResult(
+                    tool=tool_name,
+                    success=False,
+                    result=None,
+                    error=f"Timeout tras {timeout}s",
+                    execution_time_ms=(datetime.now() - start_time).total_seconds() * 1000
+                )
+
+                self.stats['failed'] += 1
+                self.stats['timeouts'] += 1
+                logger.error(f"⏱️ Timeout en acción {tool_name} ({timeout}s)")
+
+            except Exception as e:
+                execution_time = (datetime.now() - start_time).total_seconds() * 1000
+
+                result = ActionResult(
+                    tool=tool_name,
+                    success=False,
+                    result=None,
+                    error=str(e),
+                    execution_time_ms=execution_time
+                )
+
+                self.stats['failed'] += 1
+                logger.error(f"❌ Error en acción {tool_name}: {e}")
 
         return result
 
     async def execute_batch(self,
                             actions: list[tuple[str, Dict]]) -> list[ActionResult]:
         """
-        Ejecuta múltiples acciones en paralelo.
+        Ejecuta múltiples acciones independientes en paralelo.
+
+        Cada tool respeta su límite de concurrencia y su timeout.
 
         Args:
             actions: Lista de (tool_name, params)
@@ -384,6 +593,133 @@ class ActionExecutor:
         ]
         return await asyncio.gather(*tasks)
 
+    async def execute_plan(self,
+                           plan: Union[Dict[str, Any], List[Dict[str, Any]]],
+                           plan_id: Optional[str] = None) -> PlanResult:
+        """
+        Ejecuta un plan de acciones con dependencias.
+
+        Cada paso arranca en cuanto terminan bien los pasos de los que
+        depende. Si falla un paso obligatorio no se lanzan pasos nuevos, se
+        esperan los que están en curso y se ejecutan en orden inverso las
+        compensaciones de los pasos completados. El plan queda en el
+        historial como una sola entrada.
+
+        Args:
+            plan: {'steps': [{'id', 'tool', 'input', 'depends_on', 'compensate', 'optional'}]}
+            plan_id: Identificador del plan (se genera si no se indica)
+
+        Returns:
+            Resultado del plan con el resultado de cada paso
+        """
+        start_time = datetime.now()
+        plan_id = plan_id or f"plan_{start_time.strftime('%Y%m%d%H%M%S%f')}"
+        self.stats['plans_executed'] += 1
+
+        try:
+            steps = parse_plan(plan)
+        except ValueError as e:
+            logger.warning(f"⚠️ Plan {plan_id} inválido: {e}")
+            return self._finish_plan(PlanResult(plan_id=plan_id, success=False, error=str(e)), start_time)
+
+        results: Dict[str, ActionResult] = {}
+        completed: List[str] = []
+        pending = dict(steps)
+        running: Dict[asyncio.Task, str] = {}
+        failed: Optional[str] = None
+
+        while pending or running:
+            if failed is None:
+                for step_id, step in list(pending.items()):
+                    if all(d in results and results[d].success for d in step.depends_on):
+                        del pending[step_id]
+                        task = asyncio.ensure_future(self._run_step(step, results))
+                        running[task] = step_id
+            if not running:
+                break  # Lo pendiente depende de pasos fallidos
+
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                step_id = running.pop(task)
+                results[step_id] = task.result()
+                if results[step_id].success:
+                    completed.append(step_id)
+                elif not steps[step_id].optional and failed is None:
+                    failed = step_id
+
+        skipped = list(pending)
+        required_skipped = [step_id for step_id in skipped if not steps[step_id].optional]
+        if failed is None and required_skipped:
+            failed = required_skipped[0]
+
+        result = PlanResult(plan_id=plan_id, success=failed is None, steps=results, skipped=skipped)
+        if failed is not None:
+            step_result = results.get(failed)
+            result.error = f"Paso {failed} " + (
+                f"falló: {step_result.error}" if step_result else "omitido por dependencias fallidas"
+            )
+            result.compensated = await self._compensate(steps, completed, results)
+
+        return self._finish_plan(result, start_time)
+
+    async def _run_step(self, step: PlanStep, results: Dict[str, ActionResult]) -> ActionResult:
+        """Resuelve las referencias del input y ejecuta el paso."""
+        try:
+            params = resolve_references(step.input, results)
+        except KeyError as e:
+            self.stats['total_executed'] += 1
+            self.stats['failed'] += 1
+            return ActionResult(tool=step.tool, success=False, result=None, error=f"Referencia inválida: {e}")
+        return await self._invoke(step.tool, params)
+
+    async def _compensate(self,
+                          steps: Dict[str, PlanStep],
+                          completed: List[str],
+                          results: Dict[str, ActionResult]) -> List[str]:
+        """Deshace los pasos completados, del más reciente al más antiguo."""
+        compensated = []
+        for step_id in reversed(completed):
+            compensation = steps[step_id].compensate
+            if not compensation or not compensation.get('tool'):
+                continue
+
+            try:
+                params = resolve_references(compensation.get('input') or {}, results)
+            except KeyError as e:
+                logger.error(f"❌ Compensación de {step_id} con referencia inválida: {e}")
+                continue
+
+            outcome = await self._invoke(compensation['tool'], params)
+            self.stats['compensations'] += 1
+            if outcome.success:
+                compensated.append(step_id)
+            else:
+                logger.error(f"❌ Compensación de {step_id} falló: {outcome.error}")
+        return compensated
+
+    def _finish_plan(self, result: PlanResult, start_time: datetime) -> PlanResult:
+        """Cierra el plan y lo agrega al historial como una sola entrada."""
+        result.execution_time_ms = (datetime.now() - start_time).total_seconds() * 1000
+        if not result.success:
+            self.stats['plans_failed'] += 1
+
+        self._add_to_history(ActionResult(
+            tool=PLAN_TOOL,
+            success=result.success,
+            result=result.to_dict(),
+            error=result.error,
+            execution_time_ms=result.execution_time_ms,
+            timestamp=result.timestamp
+        ))
+
+        icon = "✅" if result.success else "❌"
+        logger.info(
+            f"{icon} Plan {result.plan_id}: {len(result.steps)} pasos en "
+            f"{result.execution_time_ms:.2f}ms"
+            + (f", {len(result.compensated)} compensados" if result.compensated else "")
+        )
+        return result
+
     def _update_avg_time(self, new_time: float):
         """Actualiza tiempo promedio de ejecución."""
         total = self.stats['successful'] + self.stats['failed']
@@ -4,12 +4,16 @@ Este es el componente central que procesa eventos, toma decisiones y aprende.
 """
 
 from ..claude.client import ClaudeBrainClient, ClaudeConfig, ClaudeModel
+from ..claude.call_layer import semantic_key
 from ..claude.tools import BRAIN_TOOLS, get_tools_by_category
 from .memory_system import BrainMemory
-from .action_executor import ActionExecutor
-from typing import Dict, Any, List, Optional, Callable
+from .memory_store import create_memory_store
+from .action_executor import ActionExecutor, ActionResult, PLAN_TOOL
+from .event_aggregator import EventAggregator, EventGroup
+from typing import Dict, Any, List, Optional, Callable, Tuple
 import asyncio
 import json
+import uuid
 from datetime import datetime, timedelta
 import logging
 import os
@@ -65,7 +69,9 @@ class ClaudeAutonomousBrain:
                  api_key: str = None,
                  config: ClaudeConfig = None,
                  auto_learn: bool = True,
-                 learning_threshold: int = 10):
+                 learning_threshold: int = 10,
+                 batch_window_ms: float = 50,
+                 batch_max_items: int = 20):
         """
         Inicializa el cerebro autónomo.
 
@@ -74,13 +80,22 @@ class ClaudeAutonomousBrain:
             config: Configuración personalizada
             auto_learn: Si debe aprender automáticamente
             learning_threshold: Eventos antes de trigger aprendizaje
+            batch_window_ms: Ventana del agregador de eventos
+            batch_max_items: Eventos máximos por prompt multi-evento
         """
         self.api_key = api_key or os.getenv("ANTHROPIC_API_KEY")
         self.config = config or ClaudeConfig(api_key=self.api_key)
         self.claude = ClaudeBrainClient(self.config)
-        self.memory = BrainMemory()
+        self.memory = BrainMemory(store=create_memory_store())
         self.action_executor = ActionExecutor()
 
+        # Micro-batching: los eventos de la cola se agrupan antes de pensar
+        self.aggregator = EventAggregator(
+            self.process_event_group,
+            max_wait_ms=batch_window_ms,
+            max_items=batch_max_items
+        )
+
         # Configuración
         self.auto_learn = auto_learn
         self.learning_threshold = learning_threshold
@@ -106,6 +121,9 @@ class ClaudeAutonomousBrain:
         self.state = BrainState.RUNNING
         logger.info("🧠 Cerebro autónomo iniciado")
 
+        # Arranque en caliente de la memoria persistida
+        await self.memory.load()
+
         # Verificar conexión a Claude
         health = await self.claude.health_check()
         if health["status"] != "healthy":
@@ -119,6 +137,8 @@ class ClaudeAutonomousBrain:
     async def stop(self):
         """Detiene el cerebro autónomo."""
         self.state = BrainState.STOPPED
+        await self.aggregator.flush()
+        await self.memory.snapshot()
         logger.info("🧠 Cerebro autónomo detenido")
 
     async def pause(self):
@@ -162,27 +182,185 @@ CONTEXTO HISTÓRICO:
 
 Analiza el evento y decide qué acciones tomar.
 Si necesitas ejecutar una acción, usa las herramientas disponibles.
+Si necesitas varias acciones encadenadas, usa execute_plan con todos los pasos.
 Responde en formato JSON con tu decisión y razonamiento.
 """,
                 role='brain',
                 model=ClaudeModel.OPUS if event.priority == "critical" else ClaudeModel.SONNET,
-                tools=BRAIN_TOOLS
+                tools=BRAIN_TOOLS,
+                priority=event.priority,
+                # Mismo tipo de evento y misma guía en el mismo estado -> misma decisión
+                cache_key=semantic_key(event.type, event.data)
             )
 
             self.metrics.decisions_made += 1
 
-            # 3. Ejecutar acciones decididas por Claude
-            actions_results = []
-            if 'tool' in decision:
-                result = await self.action_executor.execute(
-                    tool_name=decision['tool'],
-                    params=decision.get('input', {})
-                )
-                actions_results.append(result)
-                self.metrics.actions_executed += 1
+            # 3. Ejecutar acciones (o plan de acciones) decididas por Claude
+            actions_results = await self._execute_decision(decision)
+
+            # 4-7. Aprendizaje, memoria y handlers
+            results = await self._record_events([(event, decision, actions_results)], start_time)
+            return results[event.id]
+
+        except Exception as e:
+            self.metrics.errors += 1
+            logger.error(f"Error procesando evento {event.id}: {e}")
+            return {
+                'event_id': event.id,
+                'error': str(e),
+                'success': False
+            }
+
+    async def process_event_group(self, group: EventGroup) -> Dict[str, Dict[str, Any]]:
+        """
+        Procesa un grupo del agregador con un solo prompt multi-evento.
+
+        Los grupos resueltos por reglas no llaman a Claude. Las entidades para
+        las que Claude no devuelve decisión se procesan evento por evento.
+
+        Args:
+            group: Eventos del mismo tipo agrupados por el agregador
+
+        Returns:
+            Resultado de cada evento (event.id -> resultado de process_event)
+        """
+        start_time = datetime.now()
+        self.metrics.last_activity = start_time
+
+        if group.rule_decisions:
+            self.metrics.events_processed += len(group.events)
+            return await self._record_events(
+                [(event, group.rule_decisions[event.id], []) for event in group.events],
+                start_time
+            )
+
+        if len(group.events) == 1:
+            event = group.events[0]
+            return {event.id: await self.process_event(event)}
+
+        entities = group.by_entity
+        try:
+            decisions = await self._decide_group(group, entities)
+        except Exception as e:
+            logger.error(f"Error decidiendo grupo {group.event_type}: {e}")
+            decisions = {}
+
+        # Sin decisión del grupo: cada evento sigue el camino individual
+        fallback = [e for key, events in entities.items() if key not in decisions for e in events]
+        results = {}
+        if fallback:
+            individual = await asyncio.gather(*(self.process_event(e) for e in fallback))
+            results.update({e.id: r for e, r in zip(fallback, individual)})
+
+        decided = [(key, events) for key, events in entities.items() if key in decisions]
+        if not decided:
+            return results
+
+        self.metrics.events_processed += sum(len(events) for _, events in decided)
+        self.metrics.decisions_made += len(decided)
+
+        # Una acción por entidad, compartida por sus eventos
+        actions = await asyncio.gather(*(self._execute_decision(decisions[key]) for key, _ in decided))
+
+        results.update(await self._record_events(
+            [
+                (event, decisions[key], entity_actions)
+                for (key, events), entity_actions in zip(decided, actions)
+                for event in events
+            ],
+            start_time,
+            batched=len(group.events)
+        ))
+        return results
+
+    async def _decide_group(self,
+                            group: EventGroup,
+                            entities: Dict[str, List[BrainEvent]]) -> Dict[str, Dict]:
+        """Una llamada a Claude para todo el grupo; retorna la decisión por entidad."""
+        context = await self._build_context(group.events[0])
+        payload = [
+            {'entity': key, 'events': [e.data for e in events]}
+            for key, events in entities.items()
+        ]
+
+        response = await self.claude.think(
+            context=f"""
+EVENTOS AGRUPADOS:
+Tipo: {group.event_type}
+Prioridad: {group.priority}
+Eventos: {len(group.events)} de {len(entities)} entidades
+Datos por entidad: {json.dumps(payload, ensure_ascii=False, indent=2)}
+
+CONTEXTO HISTÓRICO:
+{json.dumps(context, ensure_ascii=False, indent=2)}
+
+HERRAMIENTAS DISPONIBLES: {', '.join(tool['name'] for tool in BRAIN_TOOLS)}
+
+Decide qué hacer con cada entidad considerando todos sus eventos juntos.
+Para varias acciones encadenadas usa la tool execute_plan con input {{"steps": [...]}}.
+Responde SOLO en formato JSON:
+{{"decisions": [{{"entity": "...", "decision": "...", "confidence": 0-100, "reasoning": "...", "tool": "nombre o null", "input": {{}}}}]}}
+""",
+            role='brain',
+            model=ClaudeModel.SONNET,
+            priority=group.priority,
+            cache_key=semantic_key(group.event_type, payload)
+        )
+
+        decisions = response.get('decisions') if isinstance(response, dict) else None
+        if not isinstance(decisions, list):
+            return {}
+
+        return {
+            d['entity']: {**d, 'success': True}
+            for d in decisions
+            if isinstance(d, dict) and d.get('entity') in entities
+        }
+
+    async def _execute_decision(self, decision: Dict) -> List[Dict]:
+        """
+        Ejecuta la herramienta elegida en una decisión.
+
+        Un plan (tool execute_plan o clave 'plan' en la respuesta JSON) se
+        ejecuta completo y se registra como una sola acción.
+        """
+        tool = decision.get('tool')
+        plan = decision.get('input') if tool == PLAN_TOOL else decision.get('plan')
+        if plan:
+            plan_result = await self.action_executor.execute_plan(plan)
+            self.metrics.actions_executed += len(plan_result.steps)
+            return [plan_result.to_dict()]
+
+        if not tool or tool == 'null':
+            return []
+
+        result = await self.action_executor.execute(tool_name=tool, params=decision.get('input') or {})
+        self.metrics.actions_executed += 1
+        return [self._action_to_dict(result)]
+
+    @staticmethod
+    def _action_to_dict(result: ActionResult) -> Dict[str, Any]:
+        """ActionResult serializable para memoria y aprendizaje."""
+        return {
+            'tool': result.tool,
+            'success': result.success,
+            'result': result.result,
+            'error': result.error,
+            'execution_time_ms': result.execution_time_ms
+        }
+
+    async def _record_events(self,
+                             records: List[Tuple[BrainEvent, Dict, List[Dict]]],
+                             start_time: datetime,
+                             batched: int = 0) -> Dict[str, Dict[str, Any]]:
+        """
+        Guarda eventos ya decididos: aprendizaje, memoria (una sola escritura),
+        handlers y métricas. Retorna el resultado de cada evento.
+        """
+        processing_time = (datetime.now() - start_time).total_seconds() * 1000
 
-            # 4. Guardar para aprendizaje
-            learning_entry = {
+        for event, decision, actions_results in records:
+            self.learning_buffer.append({
                 'event': {
                     'id': event.id,
                     'type': event.type,
@@ -192,32 +370,24 @@ Responde en formato JSON con tu decisión y razonamiento.
                 'decision': decision,
                 'results': actions_results,
                 'timestamp': datetime.now().isoformat(),
-                'processing_time_ms': (datetime.now() - start_time).total_seconds() * 1000
-            }
-            self.learning_buffer.append(learning_entry)
+                'processing_time_ms': processing_time
+            })
 
-            # 5. Guardar en memoria
-            await self.memory.store_event(event, decision, actions_results)
+        await self.memory.store_events(records)
 
-            # 6. Trigger aprendizaje si hay suficientes ejemplos
-            if self.auto_learn and len(self.learning_buffer) >= self.learning_threshold:
-                asyncio.create_task(self._learn_from_buffer())
+        # Trigger aprendizaje si hay suficientes ejemplos
+        if self.auto_learn and len(self.learning_buffer) >= self.learning_threshold:
+            asyncio.create_task(self._learn_from_buffer())
 
-            # 7. Notificar handlers
+        results = {}
+        for event, decision, actions_results in records:
             await self._notify_handlers(event.type, event, decision)
 
-            # Actualizar métricas
-            processing_time = (datetime.now() - start_time).total_seconds() * 1000
-            self.metrics.avg_decision_time_ms = (
-                (self.metrics.avg_decision_time_ms * (self.metrics.events_processed - 1) + processing_time)
-                / self.metrics.events_processed
-            )
-
             # Marcar evento como procesado
             event.processed = True
             event.result = decision
 
-            return {
+            results[event.id] = {
                 'event_id': event.id,
                 'decision': decision,
                 'actions_taken': actions_results,
@@ -225,15 +395,18 @@ Responde en formato JSON con tu decisión y razonamiento.
                 'processing_time_ms': processing_time,
                 'success': True
             }
+            if batched:
+                results[event.id]['batched'] = batched
 
-        except Exception as e:
-            self.metrics.errors += 1
-            logger.error(f"Error procesando evento {event.id}: {e}")
-            return {
-                'event_id': event.id,
-                'error': str(e),
-                'success': False
-            }
+        # Promedio incremental con los eventos recién contados
+        total = self.metrics.events_processed
+        previous = total - len(records)
+        if total > 0:
+            self.metrics.avg_decision_time_ms = (
+                (self.metrics.avg_decision_time_ms * previous + processing_time * len(records)) / total
+            )
+
+        return results
 
     async def _build_context(self, event: BrainEvent) -> Dict:
         """Construye contexto relevante para el evento."""
@@ -297,7 +470,8 @@ Identifica:
 Responde en formato JSON estructurado.
 """,
                 role='learning',
-                model=ClaudeModel.SONNET
+                model=ClaudeModel.SONNET,
+                priority='low'
             )
 
             # Guardar aprendizajes
@@ -334,7 +508,8 @@ Responde en formato JSON estructurado.
                         self.event_queue.get(),
                         timeout=1.0
                     )
-                    await self.process_event(event)
+                    # No se espera el resultado: el agregador arma el lote
+                    self.aggregator.submit(event)
                 except asyncio.TimeoutError:
                     pass  # No hay eventos, continuar
 
@@ -383,7 +558,8 @@ Analiza tu propio rendimiento y genera:
 Sé autocrítico y específico.
 """,
                 role='learning',
-                model=ClaudeModel.OPUS
+                model=ClaudeModel.OPUS,
+                priority='low'
             )
 
             # Guardar plan de mejora
@@ -420,7 +596,7 @@ Sé autocrítico y específico.
             ID del evento
         """
         event = BrainEvent(
-            id=f"evt_{datetime.now().strftime('%Y%m%d%H%M%S%f')}",
+            id=f"evt_{datetime.now().strftime('%Y%m%d%H%M%S%f')}_{uuid.uuid4().hex[:6]}",
             type=event_type,
             data=data,
             priority=priority,
@@ -432,6 +608,26 @@ Sé autocrítico y específico.
 
         return event.id
 
+    async def submit_and_wait(self,
+                              event_type: str,
+                              data: Dict[str, Any],
+                              priority: str = "normal",
+                              source: str = "api") -> Dict[str, Any]:
+        """
+        Envía un evento al agregador y espera la decisión de su grupo.
+
+        Returns:
+            Resultado del evento (mismo formato que process_event)
+        """
+        event = BrainEvent(
+            id=f"evt_{datetime.now().strftime('%Y%m%d%H%M%S%f')}_{uuid.uuid4().hex[:6]}",
+            type=event_type,
+            data=data,
+            priority=priority,
+            source=source
+        )
+        return await self.aggregator.process(event)
+
     async def ask(self,
                   question: str,
                   context: Dict = None) -> str:
@@ -475,8 +671,7 @@ Responde de forma clara, concisa y profesional en español colombiano.
                                event: BrainEvent,
                                decision: Dict):
         """Notifica a los handlers registrados."""
-        handlers = self.event_handlers.get(event_type, [])
-        handlers += self.event_handlers.get('*', [])
+        handlers = self.event_handlers.get(event_type, []) + self.event_handlers.get('*', [])
 
         for handler in handlers:
             try:
@@ -498,6 +693,7 @@ Responde de forma clara, concisa y profesional en español colombiano.
                 'uptime_hours': round((datetime.now() - self.start_time).total_seconds() / 3600, 2)
             },
             'queue_size': self.event_queue.qsize(),
+            'aggregator': self.aggregator.get_stats(),
             'learning_buffer_size': len(self.learning_buffer),
             'claude_metrics': self.claude.get_metrics()
         }
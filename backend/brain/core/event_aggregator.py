@@ -0,0 +1,223 @@
+"""
+Agregador de eventos del cerebro autónomo.
+
+Se ubica delante del motor: acumula eventos durante unos milisegundos (o
+hasta un máximo de items), los agrupa por tipo y entidad (guía, pedido,
+cliente) y entrega cada grupo al motor para que lo resuelva con un solo
+prompt multi-evento. Cada llamador recibe la decisión de su evento.
+
+Los tipos de evento que no necesitan al modelo se resuelven con reglas
+baratas y no pasan por el LLM.
+"""
+
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+from dataclasses import dataclass, field
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Campos que identifican la entidad de un evento, en orden de preferencia
+ENTITY_KEYS = (
+    'guide', 'guia', 'numero_guia', 'tracking_number',
+    'order_id', 'pedido_id', 'customer_phone', 'phone'
+)
+
+# Orden de prioridades (mayor = más urgente)
+PRIORITY_ORDER = {'low': 0, 'normal': 1, 'high': 2, 'critical': 3}
+
+# Regla: recibe el evento y retorna una decisión, o None para delegar al modelo
+EventRule = Callable[[Any], Optional[Dict[str, Any]]]
+
+
+def _rule_decision(decision: str, reasoning: str) -> EventRule:
+    def rule(event) -> Dict[str, Any]:
+        return {
+            'decision': decision,
+            'confidence': 100,
+            'reasoning': reasoning,
+            'handled_by': 'rule',
+            'success': True
+        }
+    return rule
+
+
+# Estados que avanzan normalmente y no requieren decisión
+ROUTINE_STATUSES = frozenset({'en_transito', 'en_reparto', 'entregado'})
+
+
+def _routine_status_change(event) -> Optional[Dict[str, Any]]:
+    """Un cambio a un estado rutinario solo se registra; el resto va al modelo"""
+    if str(event.data.get('status', '')).lower() in ROUTINE_STATUSES:
+        return _rule_decision('registrar_estado', 'Cambio de estado sin novedad')(event)
+    return None
+
+
+# Eventos informativos que solo se registran
+DEFAULT_RULES: Dict[str, EventRule] = {
+    'order_created': _rule_decision('registrar_pedido', 'Pedido nuevo: solo se registra'),
+    'delivery_confirmed': _rule_decision('registrar_entrega', 'Entrega confirmada: no requiere análisis'),
+    'order_status_changed': _routine_status_change,
+}
+
+
+def entity_key(event) -> str:
+    """Entidad del evento; si no tiene, el evento es su propia entidad"""
+    data = event.data if isinstance(event.data, dict) else {}
+    for key in ENTITY_KEYS:
+        if data.get(key):
+            return f"{key}:{data[key]}"
+    return f"event:{event.id}"
+
+
+@dataclass
+class EventGroup:
+    """Eventos del mismo tipo que se resuelven juntos"""
+    event_type: str
+    events: List[Any]
+    rule_decisions: Dict[str, Dict[str, Any]] = field(default_factory=dict)  # event.id -> decisión
+
+    @property
+    def by_entity(self) -> Dict[str, List[Any]]:
+        """Eventos agrupados por entidad, en orden de llegada"""
+        entities: Dict[str, List[Any]] = {}
+        for event in self.events:
+            entities.setdefault(entity_key(event), []).append(event)
+        return entities
+
+    @property
+    def priority(self) -> str:
+        """La prioridad más alta del grupo"""
+        return max((e.priority for e in self.events), key=lambda p: PRIORITY_ORDER.get(p, 1))
+
+
+# Procesa un grupo y retorna el resultado de cada evento (event.id -> resultado)
+GroupProcessor = Callable[[EventGroup], Awaitable[Dict[str, Dict[str, Any]]]]
+
+
+class EventAggregator:
+    """
+    Micro-batching de eventos con fan-out de decisiones.
+
+    Ejemplo de uso:
+        aggregator = EventAggregator(brain.process_event_group, max_wait_ms=50, max_items=20)
+        result = await aggregator.process(event)   # espera la decisión de su grupo
+        future = aggregator.submit(event)          # o sin esperar
+    """
+
+    def __init__(self,
+                 processor: GroupProcessor,
+                 rules: Optional[Dict[str, EventRule]] = None,
+                 max_wait_ms: float = 50,
+                 max_items: int = 20):
+        self.processor = processor
+        self.rules = DEFAULT_RULES if rules is None else rules
+        self.max_wait = max_wait_ms / 1000
+        self.max_items = max_items
+
+        self._buffer: List[Any] = []
+        self._futures: Dict[str, asyncio.Future] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+        self.stats = {
+            'events': 0,
+            'groups': 0,
+            'rule_handled': 0,
+            'flushes': 0
+        }
+
+    def submit(self, event) -> asyncio.Future:
+        """Encola un evento; el future se resuelve con su resultado"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._futures[event.id] = future
+        self.stats['events'] += 1
+
+        # Lo crítico no espera la ventana
+        if event.priority == 'critical':
+            self._spawn(self._run_groups([EventGroup(event.type, [event])]))
+            return future
+
+        self._buffer.append(event)
+        if len(self._buffer) >= self.max_items:
+            self._flush_now()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush_now)
+        return future
+
+    async def process(self, event) -> Dict[str, Any]:
+        """Encola un evento y espera su resultado"""
+        return await self.submit(event)
+
+    async def flush(self):
+        """Procesa ya lo acumulado y espera a que terminen los grupos en curso"""
+        self._flush_now()
+        if self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    def _flush_now(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._buffer:
+            return
+
+        events, self._buffer = self._buffer, []
+        self.stats['flushes'] += 1
+        self._spawn(self._run_groups(self._group(events)))
+
+    def _spawn(self, coro):
+        task = asyncio.get_running_loop().create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _group(self, events: List[Any]) -> List[EventGroup]:
+        """Separa lo que resuelven las reglas y agrupa el resto por tipo"""
+        by_rule: Dict[str, EventGroup] = {}
+        by_type: Dict[str, List[Any]] = {}
+
+        for event in events:
+            rule = self.rules.get(event.type)
+            decision = rule(event) if rule else None
+            if decision is not None:
+                group = by_rule.setdefault(event.type, EventGroup(event.type, []))
+                group.events.append(event)
+                group.rule_decisions[event.id] = decision
+                self.stats['rule_handled'] += 1
+            else:
+                by_type.setdefault(event.type, []).append(event)
+
+        groups = list(by_rule.values())
+        for event_type, typed in by_type.items():
+            # Las entidades no se parten entre prompts
+            chunk: List[Any] = []
+            for entity_events in EventGroup(event_type, typed).by_entity.values():
+                if chunk and len(chunk) + len(entity_events) > self.max_items:
+                    groups.append(EventGroup(event_type, chunk))
+                    chunk = []
+                chunk.extend(entity_events)
+            if chunk:
+                groups.append(EventGroup(event_type, chunk))
+        return groups
+
+    async def _run_groups(self, groups: List[EventGroup]):
+        self.stats['groups'] += len(groups)
+        await asyncio.gather(*(self._run_group(group) for group in groups))
+
+    async def _run_group(self, group: EventGroup):
+        try:
+            results = await self.processor(group)
+        except Exception as e:
+            logger.error(f"❌ Error procesando grupo {group.event_type} ({len(group.events)} eventos): {e}")
+            results = {event.id: {'event_id': event.id, 'error': str(e), 'success': False} for event in group.events}
+
+        for event in group.events:
+            future = self._futures.pop(event.id, None)
+            if future is not None and not future.done():
+                future.set_result(results.get(event.id) or {
+                    'event_id': event.id, 'error': 'Sin resultado para el evento', 'success': False
+                })
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, 'buffered': len(self._buffer), 'groups_in_flight': len(self._tasks)}
@@ -0,0 +1,322 @@
+"""
+Persistencia de la memoria del cerebro autónomo.
+
+Las mutaciones de BrainMemory se agregan a un log append-only (write-ahead)
+y cada cierto número de operaciones se compactan en un snapshot que
+reemplaza al log anterior. Al arrancar, la memoria carga el snapshot y
+reproduce el log posterior. Varios workers comparten el mismo store: cada
+uno es un cache local que se pone al día leyendo el log.
+
+Backends:
+- SQLite (por defecto): archivo local en modo WAL
+- PostgreSQL (opcional): mismas tablas vía SQLAlchemy
+"""
+
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Ruta por defecto del archivo SQLite
+DEFAULT_SQLITE_PATH = Path(__file__).resolve().parents[2] / "data" / "brain_memory.db"
+
+# Operación del log: (op, entry_id, payload)
+LogOp = Tuple[str, str, Dict[str, Any]]
+
+
+@dataclass
+class LogRecord:
+    """Registro del log de mutaciones"""
+    seq: int
+    origin: str
+    op: str  # put, delete
+    entry_id: str
+    payload: Dict[str, Any]
+
+
+def _dumps(payload: Any) -> str:
+    return json.dumps(payload, default=str)
+
+
+class MemoryStore(ABC):
+    """
+    Interfaz de persistencia de la memoria.
+
+    Los métodos son síncronos; BrainMemory los invoca con asyncio.to_thread.
+    """
+
+    @abstractmethod
+    def append(self, origin: str, ops: List[LogOp]) -> int:
+        """Agrega operaciones al log; retorna el seq de la última"""
+
+    @abstractmethod
+    def read_since(self, seq: int) -> Tuple[int, List[LogRecord]]:
+        """Retorna (seq del snapshot vigente, registros con seq > seq en orden)"""
+
+    @abstractmethod
+    def load_snapshot(self) -> Tuple[int, List[Dict[str, Any]]]:
+        """Retorna (seq hasta el que llega el snapshot, registros en orden)"""
+
+    @abstractmethod
+    def write_snapshot(self, seq: int, records: List[Dict[str, Any]]) -> bool:
+        """
+        Reemplaza el snapshot por `records` (estado hasta `seq`) y trunca el
+        log hasta ese seq. No hace nada si ya hay un snapshot más nuevo.
+        """
+
+    def close(self):
+        """Libera conexiones"""
+
+
+class SQLiteMemoryStore(MemoryStore):
+    """
+    Store en un archivo SQLite compartido por los workers de la máquina.
+
+    Modo WAL con synchronous=NORMAL: los lectores no bloquean al escritor
+    y cada append no fuerza un fsync.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS brain_memory_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            origin TEXT NOT NULL,
+            op TEXT NOT NULL,
+            entry_id TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE TABLE IF NOT EXISTS brain_memory_snapshot (
+            position INTEGER PRIMARY KEY,
+            entry_id TEXT NOT NULL,
+            payload TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS brain_memory_meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        );
+    """
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = Path(path or DEFAULT_SQLITE_PATH)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=10.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.executescript(self.SCHEMA)
+
+    @contextmanager
+    def _read_transaction(self) -> Iterator[None]:
+        """Transacción de lectura explícita: snapshot y log se leen consistentes"""
+        self._conn.execute("BEGIN")
+        try:
+            yield
+        finally:
+            self._conn.commit()
+
+    def _snapshot_seq(self) -> int:
+        row = self._conn.execute(
+            "SELECT value FROM brain_memory_meta WHERE key = 'snapshot_seq'"
+        ).fetchone()
+        return row[0] if row else 0
+
+    def append(self, origin: str, ops: List[LogOp]) -> int:
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO brain_memory_log (origin, op, entry_id, payload) VALUES (?, ?, ?, ?)",
+                [(origin, op, entry_id, _dumps(payload)) for op, entry_id, payload in ops]
+            )
+            return self._conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+
+    def read_since(self, seq: int) -> Tuple[int, List[LogRecord]]:
+        with self._lock, self._read_transaction():
+            snapshot_seq = self._snapshot_seq()
+            rows = self._conn.execute(
+                "SELECT seq, origin, op, entry_id, payload FROM brain_memory_log "
+                "WHERE seq > ? ORDER BY seq",
+                (seq,)
+            ).fetchall()
+        return snapshot_seq, [LogRecord(s, o, op, e, json.loads(p)) for s, o, op, e, p in rows]
+
+    def load_snapshot(self) -> Tuple[int, List[Dict[str, Any]]]:
+        with self._lock, self._read_transaction():
+            snapshot_seq = self._snapshot_seq()
+            rows = self._conn.execute(
+                "SELECT payload FROM brain_memory_snapshot ORDER BY position"
+            ).fetchall()
+        return snapshot_seq, [json.loads(payload) for (payload,) in rows]
+
+    def write_snapshot(self, seq: int, records: List[Dict[str, Any]]) -> bool:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if self._snapshot_seq() >= seq:
+                    self._conn.rollback()
+                    return False
+                self._conn.execute("DELETE FROM brain_memory_snapshot")
+                self._conn.executemany(
+                    "INSERT INTO brain_memory_snapshot (position, entry_id, payload) VALUES (?, ?, ?)",
+                    [(i, r['entry']['id'], _dumps(r)) for i, r in enumerate(records)]
+                )
+                self._conn.execute(
+                    "INSERT INTO brain_memory_meta (key, value) VALUES ('snapshot_seq', ?) "
+                    "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                    (seq,)
+                )
+                self._conn.execute("DELETE FROM brain_memory_log WHERE seq <= ?", (seq,))
+                self._conn.commit()
+                return True
+            except Exception:
+                self._conn.rollback()
+                raise
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class PostgresMemoryStore(MemoryStore):
+    """
+    Store en PostgreSQL para workers en varias máquinas.
+
+    Los appends toman un advisory lock de transacción para que el orden de
+    los seq coincida con el orden de commit (una secuencia sola no lo
+    garantiza y un lector podría saltarse un registro).
+    """
+
+    SCHEMA = [
+        """CREATE TABLE IF NOT EXISTS brain_memory_log (
+            seq BIGSERIAL PRIMARY KEY,
+            origin VARCHAR(64) NOT NULL,
+            op VARCHAR(16) NOT NULL,
+            entry_id VARCHAR(64) NOT NULL,
+            payload JSONB NOT NULL,
+            created_at TIMESTAMP DEFAULT NOW()
+        )""",
+        """CREATE TABLE IF NOT EXISTS brain_memory_snapshot (
+            position INTEGER PRIMARY KEY,
+            entry_id VARCHAR(64) NOT NULL,
+            payload JSONB NOT NULL
+        )""",
+        """CREATE TABLE IF NOT EXISTS brain_memory_meta (
+            key VARCHAR(64) PRIMARY KEY,
+            value BIGINT NOT NULL
+        )""",
+    ]
+
+    # Clave arbitraria del advisory lock del log
+    LOCK_KEY = 7310421
+
+    def __init__(self, db_url: Optional[str] = None):
+        from sqlalchemy import create_engine, text
+        self._text = text
+
+        self.db_url = db_url or os.getenv('DATABASE_URL')
+        self._engine = create_engine(self.db_url, pool_pre_ping=True)
+        with self._engine.begin() as conn:
+            for statement in self.SCHEMA:
+                conn.execute(text(statement))
+
+    def _snapshot_seq(self, conn) -> int:
+        value = conn.execute(
+            self._text("SELECT value FROM brain_memory_meta WHERE key = 'snapshot_seq'")
+        ).scalar()
+        return value or 0
+
+    def append(self, origin: str, ops: List[LogOp]) -> int:
+        text = self._text
+        last = 0
+        with self._engine.begin() as conn:
+            conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {'key': self.LOCK_KEY})
+            for op, entry_id, payload in ops:
+                last = conn.execute(
+                    text(
+                        "INSERT INTO brain_memory_log (origin, op, entry_id, payload) "
+                        "VALUES (:origin, :op, :entry_id, CAST(:payload AS JSONB)) RETURNING seq"
+                    ),
+                    {'origin': origin, 'op': op, 'entry_id': entry_id, 'payload': _dumps(payload)}
+                ).scalar()
+        return last
+
+    def read_since(self, seq: int) -> Tuple[int, List[LogRecord]]:
+        text = self._text
+        with self._engine.connect().execution_options(isolation_level='REPEATABLE READ') as conn:
+            snapshot_seq = self._snapshot_seq(conn)
+            rows = conn.execute(
+                text(
+                    "SELECT seq, origin, op, entry_id, payload FROM brain_memory_log "
+                    "WHERE seq > :seq ORDER BY seq"
+                ),
+                {'seq': seq}
+            ).fetchall()
+        return snapshot_seq, [LogRecord(s, o, op, e, p) for s, o, op, e, p in rows]
+
+    def load_snapshot(self) -> Tuple[int, List[Dict[str, Any]]]:
+        text = self._text
+        with self._engine.connect().execution_options(isolation_level='REPEATABLE READ') as conn:
+            snapshot_seq = self._snapshot_seq(conn)
+            rows = conn.execute(
+                text("SELECT payload FROM brain_memory_snapshot ORDER BY position")
+            ).fetchall()
+        return snapshot_seq, [payload for (payload,) in rows]
+
+    def write_snapshot(self, seq: int, records: List[Dict[str, Any]]) -> bool:
+        text = self._text
+        with self._engine.begin() as conn:
+            conn.execute(text("LOCK TABLE brain_memory_snapshot IN EXCLUSIVE MODE"))
+            if self._snapshot_seq(conn) >= seq:
+                return False
+            conn.execute(text("DELETE FROM brain_memory_snapshot"))
+            if records:
+                conn.execute(
+                    text(
+                        "INSERT INTO brain_memory_snapshot (position, entry_id, payload) "
+                        "VALUES (:position, :entry_id, CAST(:payload AS JSONB))"
+                    ),
+                    [
+                        {'position': i, 'entry_id': r['entry']['id'], 'payload': _dumps(r)}
+                        for i, r in enumerate(records)
+                    ]
+                )
+            conn.execute(
+                text(
+                    "INSERT INTO brain_memory_meta (key, value) VALUES ('snapshot_seq', :seq) "
+                    "ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value"
+                ),
+                {'seq': seq}
+            )
+            conn.execute(text("DELETE FROM brain_memory_log WHERE seq <= :seq"), {'seq': seq})
+        return True
+
+    def close(self):
+        self._engine.dispose()
+
+
+def create_memory_store() -> Optional[MemoryStore]:
+    """
+    Crea el store según BRAIN_MEMORY_STORE: sqlite (default), postgres o none.
+
+    Si el backend elegido no se puede abrir, la memoria sigue funcionando
+    solo en proceso.
+    """
+    backend = os.getenv('BRAIN_MEMORY_STORE', 'sqlite').lower()
+
+    try:
+        if backend == 'none':
+            return None
+        if backend == 'postgres':
+            return PostgresMemoryStore(os.getenv('BRAIN_MEMORY_DATABASE_URL'))
+        return SQLiteMemoryStore(os.getenv('BRAIN_MEMORY_PATH'))
+    except Exception as e:
+        logger.error(f"❌ No se pudo abrir el store de memoria ({backend}): {e}")
+        return None
@@ -1,19 +1,37 @@
 """
 Sistema de memoria del cerebro autónomo.
 Implementa memoria a corto y largo plazo para contexto y aprendizaje.
+
+Búsqueda de similares sobre una matriz NumPy contigua (una fila por evento),
+índices invertidos por tipo y tag, y desalojo por importancia con un heap.
+
+Con un MemoryStore la memoria sobrevive a reinicios: cada mutación se agrega
+al log del store, `load()` hace el arranque en caliente (snapshot + replay)
+y las lecturas se ponen al día con lo que escribieron otros workers.
 """
 
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, Iterable, List, Optional, Set, Tuple
 from datetime import datetime, timedelta
 from dataclasses import dataclass, field
 import json
+import math
+import heapq
 import asyncio
 import logging
+import time
+import uuid
 from collections import deque
 import hashlib
 
+import numpy as np
+
+from .memory_store import LogOp, LogRecord, MemoryStore
+
 logger = logging.getLogger(__name__)
 
+# Características que se comparan para encontrar eventos similares
+FEATURE_KEYS = ('city', 'carrier', 'type', 'event_type', 'status', 'priority')
+
 
 @dataclass
 class MemoryEntry:
@@ -28,6 +46,147 @@ class MemoryEntry:
     tags: List[str] = field(default_factory=list)
     embedding: Optional[List[float]] = None  # Para búsqueda semántica
 
+    def to_dict(self) -> Dict[str, Any]:
+        """Serializa la entrada para el store"""
+        return {
+            'id': self.id,
+            'type': self.type,
+            'content': self.content,
+            'timestamp': self.timestamp.isoformat(),
+            'importance': self.importance,
+            'access_count': self.access_count,
+            'last_accessed': self.last_accessed.isoformat(),
+            'tags': self.tags,
+            'embedding': self.embedding
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'MemoryEntry':
+        """Reconstruye una entrada serializada con to_dict"""
+        return cls(
+            id=data['id'],
+            type=data['type'],
+            content=data['content'],
+            timestamp=datetime.fromisoformat(data['timestamp']),
+            importance=data.get('importance', 0.5),
+            access_count=data.get('access_count', 0),
+            last_accessed=datetime.fromisoformat(data['last_accessed']),
+            tags=data.get('tags', []),
+            embedding=data.get('embedding')
+        )
+
+
+class FeatureIndex:
+    """
+    Índice vectorial de características categóricas.
+
+    Cada entrada es un vector one-hot sobre los pares clave=valor de sus
+    características; se guarda compacto como una fila de códigos enteros
+    (uno por clave, 0 = ausente) en una matriz contigua. La similitud
+    coseno entre dos vectores one-hot es coincidencias / sqrt(n1 * n2),
+    así que se calcula para todas las filas de una vez sin colisiones.
+    """
+
+    def __init__(self, keys: Iterable[str] = FEATURE_KEYS, capacity: int = 1024):
+        self.keys = tuple(keys)
+        self._vocab: List[Dict[Any, int]] = [{} for _ in self.keys]
+
+        self._codes = np.zeros((capacity, len(self.keys)), dtype=np.int32)
+        self._counts = np.zeros(capacity, dtype=np.float32)
+        self._stamps = np.zeros(capacity, dtype=np.float64)
+        self._items: List[Any] = [None] * capacity
+
+        self._rows: Dict[str, int] = {}
+        self._free: List[int] = []
+        self._size = 0  # Filas usadas alguna vez (marca de agua)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._rows
+
+    def add(self, key: str, item: Any, features: Dict, stamp: float):
+        """Agrega (o reemplaza) un item con sus características"""
+        if key in self._rows:
+            self.remove(key)
+
+        if self._free:
+            row = self._free.pop()
+        else:
+            if self._size == len(self._items):
+                self._grow()
+            row = self._size
+            self._size += 1
+
+        codes = self._encode(features, create=True)
+        self._codes[row] = codes
+        self._counts[row] = np.count_nonzero(codes)
+        self._stamps[row] = stamp
+        self._items[row] = item
+        self._rows[key] = row
+
+    def remove(self, key: str) -> bool:
+        """Quita un item; su fila queda libre para reutilizarse"""
+        row = self._rows.pop(key, None)
+        if row is None:
+            return False
+        self._codes[row] = 0
+        self._counts[row] = 0
+        self._items[row] = None
+        self._free.append(row)
+        return True
+
+    def search(self, features: Dict, limit: int, threshold: float = 0.0) -> List[Tuple[Any, float]]:
+        """
+        Items con similitud > threshold, de mayor a menor (empates: más reciente primero).
+        """
+        query = self._encode(features, create=False)
+        presentes = np.flatnonzero(query)
+        if len(presentes) == 0 or not self._rows:
+            return []
+
+        n = self._size
+        coincidencias = (self._codes[:n, presentes] == query[presentes]).sum(axis=1)
+        similitudes = coincidencias / np.sqrt(len(presentes) * np.maximum(self._counts[:n], 1))
+
+        candidatos = np.flatnonzero(similitudes > threshold)
+        if len(candidatos) > limit:
+            mejores = np.argpartition(-similitudes[candidatos], limit - 1)[:limit]
+            candidatos = candidatos[mejores]
+        orden = np.lexsort((-self._stamps[candidatos], -similitudes[candidatos]))
+
+        return [(self._items[r], float(similitudes[r])) for r in candidatos[orden]]
+
+    def _encode(self, features: Dict, create: bool) -> np.ndarray:
+        """Códigos por clave; en consultas un valor desconocido es -1 (nunca coincide)"""
+        codes = np.zeros(len(self.keys), dtype=np.int32)
+        for i, key in enumerate(self.keys):
+            if key not in features:
+                continue
+            value = features[key]
+            if not isinstance(value, (str, int, float, bool, type(None))):
+                value = json.dumps(value, sort_keys=True, default=str)
+            vocab = self._vocab[i]
+            code = vocab.get(value)
+            if code is None:
+                if create:
+                    code = vocab[value] = len(vocab) + 1
+                else:
+                    code = -1
+            codes[i] = code
+        return codes
+
+    def _grow(self):
+        """Duplica la capacidad de la matriz"""
+        capacity = len(self._items) * 2
+        self._codes = np.resize(self._codes, (capacity, len(self.keys)))
+        self._codes[self._size:] = 0
+        self._counts = np.resize(self._counts, capacity)
+        self._counts[self._size:] = 0
+        self._stamps = np.resize(self._stamps, capacity)
+        self._items.extend([None] * (capacity - len(self._items)))
+
 
 class BrainMemory:
     """
@@ -40,7 +199,11 @@ class BrainMemory:
     def __init__(self,
                  short_term_size: int = 1000,
                  short_term_ttl_hours: int = 24,
-                 long_term_size: int = 10000):
+                 long_term_size: int = 10000,
+                 importance_half_life_hours: float = 24,
+                 store: Optional[MemoryStore] = None,
+                 snapshot_every: int = 1000,
+                 refresh_interval_seconds: float = 2.0):
         """
         Inicializa el sistema de memoria.
 
@@ -48,18 +211,28 @@ class BrainMemory:
             short_term_size: Tamaño máximo de memoria a corto plazo
             short_term_ttl_hours: Tiempo de vida en memoria corta
             long_term_size: Tamaño máximo de memoria a largo plazo
+            importance_half_life_hours: Horas sin acceso en que la importancia
+                efectiva de una entrada long-term cae a la mitad
+            store: Persistencia compartida (None = solo en proceso)
+            snapshot_every: Operaciones propias entre snapshots compactados
+            refresh_interval_seconds: Cada cuánto las lecturas consultan el
+                log del store por escrituras de otros workers
         """
-        # Memoria a corto plazo (eventos recientes)
-        self.short_term: deque = deque(maxlen=short_term_size)
+        self.short_term_size = short_term_size
         self.short_term_ttl = timedelta(hours=short_term_ttl_hours)
-
-        # Memoria a largo plazo (patrones y aprendizajes)
-        self.long_term: Dict[str, MemoryEntry] = {}
         self.long_term_size = long_term_size
-
-        # Índices para búsqueda rápida
-        self.type_index: Dict[str, List[str]] = {}
-        self.tag_index: Dict[str, List[str]] = {}
+        self._decay_rate = math.log(2) / (importance_half_life_hours * 3600)
+        self._reset_state()
+
+        # Persistencia: este proceso es un cache local del store
+        self.store = store
+        self.snapshot_every = snapshot_every
+        self.refresh_interval = refresh_interval_seconds
+        self._origin = uuid.uuid4().hex
+        self._applied_seq = 0
+        self._ops_since_snapshot = 0
+        self._last_refresh = 0.0
+        self._sync_lock = asyncio.Lock()
 
         # Estadísticas
         self.stats = {
@@ -69,12 +242,156 @@ class BrainMemory:
             'cache_misses': 0
         }
 
+        logger.info("💾 Sistema de memoria inicializado")
+
+    def _reset_state(self):
+        """(Re)crea las estructuras en memoria vacías."""
+        # Memoria a corto plazo (eventos recientes)
+        self.short_term: deque = deque(maxlen=self.short_term_size)
+        self._short_term_ids: Dict[str, int] = {}
+
+        # Memoria a largo plazo (patrones y aprendizajes)
+        self.long_term: Dict[str, MemoryEntry] = {}
+
+        # Índices para búsqueda rápida
+        self.type_index: Dict[str, Set[str]] = {}
+        self.tag_index: Dict[str, Set[str]] = {}
+
+        # Eventos de ambas memorias, vectorizados para find_similar
+        self.event_index = FeatureIndex(FEATURE_KEYS)
+
+        # Heap de desalojo (clave, id); las claves viejas se descartan al sacar
+        self._eviction_heap: List[Tuple[float, str]] = []
+        self._eviction_keys: Dict[str, float] = {}
+
         # Cache de búsquedas recientes
         self.search_cache: Dict[str, List[MemoryEntry]] = {}
         self.cache_ttl = timedelta(minutes=5)
         self.cache_timestamps: Dict[str, datetime] = {}
 
-        logger.info("💾 Sistema de memoria inicializado")
+    # =========================================================================
+    # PERSISTENCIA
+    # =========================================================================
+
+    async def load(self) -> int:
+        """
+        Arranque en caliente: carga el snapshot del store y reproduce el log.
+
+        Returns:
+            Número de entradas en memoria tras la carga
+        """
+        if not self.store:
+            return 0
+
+        async with self._sync_lock:
+            await self._reload()
+
+        total = len(self._short_term_ids.keys() | self.long_term.keys())
+        logger.info(f"💾 Memoria restaurada: {total} entradas (seq {self._applied_seq})")
+        return total
+
+    async def snapshot(self) -> bool:
+        """Compacta el estado actual en un snapshot y trunca el log."""
+        if not self.store:
+            return False
+
+        try:
+            async with self._sync_lock:
+                # Ponerse al día antes: el snapshot debe cubrir todo hasta su seq
+                await self._replay()
+                written = await asyncio.to_thread(
+                    self.store.write_snapshot, self._applied_seq, self._snapshot_records()
+                )
+            self._ops_since_snapshot = 0
+            if written:
+                logger.info(f"💾 Snapshot de memoria escrito (seq {self._applied_seq})")
+            return written
+        except Exception as e:
+            logger.error(f"❌ Error escribiendo snapshot de memoria: {e}")
+            return False
+
+    async def _reload(self):
+        """Reemplaza el estado local por snapshot + log del store."""
+        seq, records = await asyncio.to_thread(self.store.load_snapshot)
+        self._reset_state()
+        for record in records:
+            self._apply_put(record)
+        self._applied_seq = seq
+        # Tras un reset también hay que aplicar las operaciones propias
+        await self._replay(include_own=True)
+
+    async def _replay(self, include_own: bool = False):
+        """Aplica los registros del log posteriores al último aplicado."""
+        snapshot_seq, records = await asyncio.to_thread(self.store.read_since, self._applied_seq)
+
+        # Otro worker compactó por encima de lo aplicado: el log ya no alcanza
+        if snapshot_seq > self._applied_seq:
+            await self._reload()
+            return
+
+        for record in records:
+            if include_own or record.origin != self._origin:
+                self._apply(record)
+            self._applied_seq = record.seq
+
+    async def _refresh(self):
+        """Read-through: trae del store las escrituras de otros workers."""
+        if not self.store or time.monotonic() - self._last_refresh < self.refresh_interval:
+            return
+
+        try:
+            async with self._sync_lock:
+                await self._replay()
+            self._last_refresh = time.monotonic()
+        except Exception as e:
+            logger.error(f"❌ Error sincronizando memoria con el store: {e}")
+
+    async def _log(self, ops: List[LogOp]):
+        """Agrega mutaciones al log del store (write-ahead)."""
+        if not self.store or not ops:
+            return
+
+        try:
+            await asyncio.to_thread(self.store.append, self._origin, ops)
+        except Exception as e:
+            logger.error(f"❌ Error persistiendo memoria: {e}")
+            return
+
+        self._ops_since_snapshot += len(ops)
+        if self._ops_since_snapshot >= self.snapshot_every:
+            await self.snapshot()
+
+    def _apply(self, record: LogRecord):
+        """Aplica un registro del log al estado local (idempotente)."""
+        if record.op == 'put':
+            self._apply_put(record.payload)
+        elif record.op == 'delete' and record.entry_id in self.long_term:
+            self._remove_long_term(record.entry_id)
+
+    def _apply_put(self, payload: Dict[str, Any]):
+        entry = MemoryEntry.from_dict(payload['entry'])
+        tiers = payload.get('tiers', [])
+        if 'short' in tiers and entry.id not in self._short_term_ids:
+            self._store_short_term(entry)
+        if 'long' in tiers:
+            self._put_long_term(entry)
+
+    def _snapshot_records(self) -> List[Dict[str, Any]]:
+        """Estado actual como registros put (short-term en orden, luego long-term)."""
+        records = [
+            self._put_payload(entry, ['short', 'long'] if entry.id in self.long_term else ['short'])
+            for entry in self.short_term
+        ]
+        records.extend(
+            self._put_payload(entry, ['long'])
+            for entry_id, entry in self.long_term.items()
+            if entry_id not in self._short_term_ids
+        )
+        return records
+
+    @staticmethod
+    def _put_payload(entry: MemoryEntry, tiers: List[str]) -> Dict[str, Any]:
+        return {'entry': entry.to_dict(), 'tiers': tiers}
 
     async def store_event(self,
                           event: Any,
@@ -91,33 +408,56 @@ class BrainMemory:
         Returns:
             ID de la entrada en memoria
         """
-        # Calcular importancia basada en prioridad y resultados
-        importance = self._calculate_importance(event, decision, results)
+        return (await self.store_events([(event, decision, results)]))[0]
 
-        entry = MemoryEntry(
-            id=self._generate_id(event),
-            type='event',
-            content={
-                'event_type': event.type if hasattr(event, 'type') else 'unknown',
-                'event_data': event.data if hasattr(event, 'data') else event,
-                'decision': decision,
-                'results': results,
-                'success': all(r.get('success', True) for r in results)
-            },
-            importance=importance,
-            tags=self._extract_tags(event, decision)
-        )
+    async def store_events(self, items: List[Tuple[Any, Dict, List[Dict]]]) -> List[str]:
+        """
+        Almacena varios eventos procesados con una sola escritura al store.
 
-        # Guardar en short-term
-        self.short_term.append(entry)
+        Args:
+            items: Tuplas (evento, decisión, resultados)
 
-        # Si es importante, guardar en long-term
-        if importance > 0.7:
-            await self._store_long_term(entry)
+        Returns:
+            IDs de las entradas en memoria, en el mismo orden
+        """
+        ids = []
+        ops = []
+
+        for event, decision, results in items:
+            # Calcular importancia basada en prioridad y resultados
+            importance = self._calculate_importance(event, decision, results)
+
+            entry = MemoryEntry(
+                id=self._generate_id(event),
+                type='event',
+                content={
+                    'event_type': event.type if hasattr(event, 'type') else 'unknown',
+                    'event_data': event.data if hasattr(event, 'data') else event,
+                    'decision': decision,
+                    'results': results,
+                    'success': all(r.get('success', True) for r in results)
+                },
+                importance=importance,
+                tags=self._extract_tags(event, decision)
+            )
 
-        self.stats['total_stored'] += 1
+            # Guardar en short-term
+            self._store_short_term(entry)
+            tiers = ['short']
 
-        return entry.id
+            # Si es importante, guardar en long-term
+            if importance > 0.7:
+                await self._store_long_term(entry)
+                tiers.append('long')
+
+            ops.append(('put', entry.id, self._put_payload(entry, tiers)))
+            ids.append(entry.id)
+
+        await self._log(ops)
+
+        self.stats['total_stored'] += len(ids)
+
+        return ids
 
     async def store_learning(self, learning: Dict) -> str:
         """
@@ -138,6 +478,7 @@ class BrainMemory:
         )
 
         await self._store_long_term(entry)
+        await self._log([('put', entry.id, self._put_payload(entry, ['long']))])
 
         logger.info(f"💾 Aprendizaje almacenado: {entry.id}")
         return entry.id
@@ -166,35 +507,15 @@ class BrainMemory:
         self.stats['cache_misses'] += 1
         self.stats['total_retrieved'] += 1
 
-        # Buscar en short-term primero (más reciente)
-        similar = []
+        await self._refresh()
 
-        # Extraer características clave de la query
+        # Similitud coseno contra todos los eventos en una sola operación
         query_features = self._extract_features(query)
+        similar = self.event_index.search(query_features, limit, threshold=0.5)
 
-        # Buscar en short-term
-        for entry in reversed(list(self.short_term)):
-            if entry.type == 'event':
-                entry_features = self._extract_features(entry.content.get('event_data', {}))
-                similarity = self._calculate_similarity(query_features, entry_features)
-                if similarity > 0.5:
-                    similar.append((similarity, entry))
-                    entry.access_count += 1
-                    entry.last_accessed = datetime.now()
-
-        # Buscar en long-term
-        for entry in self.long_term.values():
-            if entry.type == 'event':
-                entry_features = self._extract_features(entry.content.get('event_data', {}))
-                similarity = self._calculate_similarity(query_features, entry_features)
-                if similarity > 0.5:
-                    similar.append((similarity, entry))
-                    entry.access_count += 1
-                    entry.last_accessed = datetime.now()
-
-        # Ordenar por similitud y tomar los mejores
-        similar.sort(key=lambda x: x[0], reverse=True)
-        results = [entry for _, entry in similar[:limit]]
+        results = [entry for entry, _ in similar]
+        for entry in results:
+            self._touch(entry)
 
         # Guardar en cache
         self.search_cache[cache_key] = results
@@ -217,20 +538,20 @@ class BrainMemory:
         """
         self.stats['total_retrieved'] += 1
 
-        learnings = []
+        await self._refresh()
 
-        for entry in self.long_term.values():
-            if entry.type == 'learning':
-                if category is None or category in entry.tags:
-                    learnings.append(entry)
+        ids = self.type_index.get('learning', set())
+        if category is not None:
+            ids = ids & self.tag_index.get(category, set())
 
         # Ordenar por importancia y recencia
-        learnings.sort(
-            key=lambda x: (x.importance, x.timestamp),
-            reverse=True
+        learnings = heapq.nlargest(
+            limit,
+            (self.long_term[entry_id] for entry_id in ids),
+            key=lambda x: (x.importance, x.timestamp)
         )
 
-        return [e.content for e in learnings[:limit]]
+        return [e.content for e in learnings]
 
     async def get_context(self,
                           event_type: str = None,
@@ -245,6 +566,8 @@ class BrainMemory:
         Returns:
             Contexto compilado
         """
+        await self._refresh()
+
         cutoff = datetime.now() - timedelta(hours=hours_back)
 
         recent_events = []
@@ -283,20 +606,30 @@ class BrainMemory:
 
         # Limpiar short-term expirado
         while self.short_term and (now - self.short_term[0].timestamp) > self.short_term_ttl:
-            self.short_term.popleft()
+            self._release_short_term(self.short_term.popleft())
             removed += 1
 
-        # Limpiar long-term si excede tamaño
-        if len(self.long_term) > self.long_term_size:
-            # Ordenar por importancia * recencia
-            entries = sorted(
-                self.long_term.items(),
-                key=lambda x: x[1].importance * (1 / max(1, (now - x[1].last_accessed).days + 1))
-            )
-            # Remover los menos importantes
-            for entry_id, _ in entries[:len(entries) - self.long_term_size]:
-                del self.long_term[entry_id]
-                removed += 1
+        # Limpiar long-term si excede tamaño: sacar del heap los de menor
+        # importancia decaída, O(k log n) en vez de ordenar todo
+        excess = len(self.long_term) - self.long_term_size
+        evicted = []
+        while excess > 0 and self._eviction_heap:
+            key, entry_id = heapq.heappop(self._eviction_heap)
+            if self._eviction_keys.get(entry_id) != key:
+                continue  # Clave obsoleta (la entrada se accedió después)
+            self._remove_long_term(entry_id)
+            evicted.append(('delete', entry_id, {}))
+            excess -= 1
+            removed += 1
+
+        # Los desalojos de long-term se comparten; la expiración de
+        # short-term la aplica cada worker según su propio reloj
+        await self._log(evicted)
+
+        # Compactar el heap si acumuló demasiadas claves obsoletas
+        if len(self._eviction_heap) > 2 * len(self._eviction_keys) + 64:
+            self._eviction_heap = [(key, entry_id) for entry_id, key in self._eviction_keys.items()]
+            heapq.heapify(self._eviction_heap)
 
         # Limpiar cache expirado
         expired_keys = [
@@ -316,19 +649,90 @@ class BrainMemory:
     # MÉTODOS PRIVADOS
     # =========================================================================
 
+    def _store_short_term(self, entry: MemoryEntry):
+        """Almacena en memoria a corto plazo, desalojando la más vieja si está llena."""
+        if len(self.short_term) == self.short_term.maxlen:
+            self._release_short_term(self.short_term.popleft())
+
+        self.short_term.append(entry)
+        self._short_term_ids[entry.id] = self._short_term_ids.get(entry.id, 0) + 1
+        self._index_event(entry)
+
+    def _release_short_term(self, entry: MemoryEntry):
+        """Registra la salida de una entrada de short-term."""
+        count = self._short_term_ids.get(entry.id, 0) - 1
+        if count > 0:
+            self._short_term_ids[entry.id] = count
+            return
+        self._short_term_ids.pop(entry.id, None)
+        if entry.id not in self.long_term:
+            self.event_index.remove(entry.id)
+
     async def _store_long_term(self, entry: MemoryEntry):
         """Almacena en memoria a largo plazo."""
+        self._put_long_term(entry)
+
+    def _put_long_term(self, entry: MemoryEntry):
+        if entry.id in self.long_term:
+            self._remove_long_term(entry.id)
         self.long_term[entry.id] = entry
 
         # Actualizar índices
-        if entry.type not in self.type_index:
-            self.type_index[entry.type] = []
-        self.type_index[entry.type].append(entry.id)
+        self.type_index.setdefault(entry.type, set()).add(entry.id)
+        for tag in entry.tags:
+            self.tag_index.setdefault(tag, set()).add(entry.id)
+
+        self._index_event(entry)
+        self._push_eviction_key(entry)
 
+    def _remove_long_term(self, entry_id: str):
+        """Quita una entrada de long-term y de sus índices."""
+        entry = self.long_term.pop(entry_id)
+        self._eviction_keys.pop(entry_id, None)
+
+        self._discard_from_index(self.type_index, entry.type, entry_id)
         for tag in entry.tags:
-            if tag not in self.tag_index:
-                self.tag_index[tag] = []
-            self.tag_index[tag].append(entry.id)
+            self._discard_from_index(self.tag_index, tag, entry_id)
+
+        if entry_id not in self._short_term_ids:
+            self.event_index.remove(entry_id)
+
+    @staticmethod
+    def _discard_from_index(index: Dict[str, Set[str]], key: str, entry_id: str):
+        ids = index.get(key)
+        if ids is not None:
+            ids.discard(entry_id)
+            if not ids:
+                del index[key]
+
+    def _index_event(self, entry: MemoryEntry):
+        """Agrega un evento al índice vectorial (una sola vez aunque esté en ambas memorias)."""
+        if entry.type != 'event' or entry.id in self.event_index:
+            return
+        features = self._extract_features(entry.content.get('event_data', {}))
+        self.event_index.add(entry.id, entry, features, entry.timestamp.timestamp())
+
+    def _touch(self, entry: MemoryEntry):
+        """Marca un acceso; en long-term refresca su clave de desalojo."""
+        entry.access_count += 1
+        entry.last_accessed = datetime.now()
+        if entry.id in self.long_term:
+            self._push_eviction_key(entry)
+
+    def _push_eviction_key(self, entry: MemoryEntry):
+        """
+        Clave de desalojo: log(importancia) + tasa * último acceso.
+
+        Con decaimiento exponencial, importancia * exp(-tasa * (ahora - acceso))
+        ordena igual que esta clave para cualquier "ahora", así que el heap
+        no necesita reordenarse con el paso del tiempo.
+        """
+        key = (
+            math.log(max(entry.importance, 1e-6))
+            + self._decay_rate * entry.last_accessed.timestamp()
+        )
+        self._eviction_keys[entry.id] = key
+        heapq.heappush(self._eviction_heap, (key, entry.id))
 
     def _calculate_importance(self,
                               event: Any,
@@ -375,28 +779,11 @@ class BrainMemory:
 
     def _extract_features(self, data: Dict) -> Dict:
         """Extrae características para comparación."""
-        features = {}
+        if not isinstance(data, dict):
+            return {}
 
         # Características comunes
-        for key in ['city', 'carrier', 'type', 'event_type', 'status', 'priority']:
-            if key in data:
-                features[key] = data[key]
-
-        return features
-
-    def _calculate_similarity(self, features1: Dict, features2: Dict) -> float:
-        """Calcula similitud entre dos conjuntos de características."""
-        if not features1 or not features2:
-            return 0.0
-
-        matches = 0
-        total = len(set(features1.keys()) | set(features2.keys()))
-
-        for key in features1:
-            if key in features2 and features1[key] == features2[key]:
-                matches += 1
-
-        return matches / total if total > 0 else 0.0
+        return {key: data[key] for key in FEATURE_KEYS if key in data}
 
     def _generate_id(self, data: Any) -> str:
         """Genera un ID único para una entrada."""
@@ -416,6 +803,7 @@ class BrainMemory:
             **self.stats,
             'short_term_size': len(self.short_term),
             'long_term_size': len(self.long_term),
+            'indexed_events': len(self.event_index),
             'cache_size': len(self.search_cache),
             'cache_hit_rate': (
                 self.stats['cache_hits'] /
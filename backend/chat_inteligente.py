@@ -7,20 +7,24 @@ import os
 import re
 import json
 import time
+import asyncio
 from datetime import datetime, timedelta
-from typing import Optional, Dict, List, Any, Tuple
+from typing import Optional, Dict, List, Any, Tuple, AsyncIterator
 from enum import Enum
+from types import SimpleNamespace
 
-from anthropic import Anthropic
-from sqlalchemy import func, and_, Integer
+from anthropic import AsyncAnthropic
+from sqlalchemy import func, and_, select, tuple_, Integer
 from sqlalchemy.orm import Session
 from loguru import logger
 from dotenv import load_dotenv
 
+from database import get_db_session
 from database.models import (
     GuiaHistorica,
     ConversacionChat,
 )
+from services.cache_service import cache_service
 
 load_dotenv()
 
@@ -42,6 +46,78 @@ class TipoConsulta(Enum):
     GENERAL = "general"
 
 
+# Patrones por tipo de consulta, en orden de prioridad. El valor a extraer
+# va en un grupo con nombre (parametro o parametro__n: Python no admite
+# nombres de grupo repetidos)
+PATRONES_CONSULTA: List[Tuple[TipoConsulta, List[str]]] = [
+    (TipoConsulta.BUSCAR_GUIA, [
+        r'guía?\s*(?:número|#|n[uú]mero)?\s*(?P<numero_guia>\d{8,15})',
+    ]),
+    (TipoConsulta.CONSULTAR_TRANSPORTADORA, [
+        r'(?:de\s*)?(?P<transportadora__1>interrapidisimo|envía?|coordinadora|tcc|servientrega|deprisa)',
+        r'transportadora\s+(?P<transportadora__2>\w+)',
+    ]),
+    (TipoConsulta.CONSULTAR_CIUDAD, [
+        r'(?:en|de|hacia|a)\s+(?P<ciudad__1>bogot[aá]|medell[ií]n|cali|barranquilla|bucaramanga|cartagena)',
+        r'ciudad\s+(?:de\s+)?(?P<ciudad__2>\w+)',
+    ]),
+    (TipoConsulta.CONSULTAR_PERIODO, [
+        r'(?:esta|la)\s*semana',
+        r'(?:este|el)\s*mes',
+        r'últimos?\s*(?P<dias>\d+)\s*días?',
+        r'hoy',
+        r'ayer',
+    ]),
+    (TipoConsulta.LISTAR_GUIAS, [
+        r'(?:lista|muestra|dame|ver|mostrar)\s*(?:las|los)?\s*(?:guías?|envíos?)',
+        r'(?:cuáles|cuántas)\s*guías?',
+    ]),
+    (TipoConsulta.COMPARAR_TRANSPORTADORAS, [
+        r'compara(?:r)?(?:ción)?',
+        r'(?:vs|versus|contra)',
+        r'mejor\s*transportadora',
+    ]),
+    (TipoConsulta.ANALISIS_RETRASOS, [
+        r'retrasos?',
+        r'demorad[ao]s?',
+        r'atrasad[ao]s?',
+        r'tard[eí]os?',
+        r'sin\s*movimiento',
+    ]),
+    (TipoConsulta.PREDICCION, [
+        r'predice',
+        r'predicción',
+        r'probabilidad',
+        r'va\s*a\s*(?:llegar|demorar|retrasar)',
+    ]),
+    (TipoConsulta.EJECUTAR_ACCION, [
+        r'exporta(?:r)?',
+        r'genera(?:r)?\s*(?:reporte|informe)',
+        r'descarga(?:r)?',
+        r'enví?a(?:r)?\s*(?:notificación|email|mensaje)',
+        r'crea(?:r)?\s*alerta',
+    ]),
+]
+
+# Una sola alternación con un grupo por tipo. Va dentro de un lookahead para
+# que finditer pruebe todas las posiciones aunque los matches se solapen: en
+# cada posición gana el tipo de mayor prioridad que coincide ahí.
+PATRON_CONSULTA = re.compile(
+    '(?=' + '|'.join(
+        f"(?P<{tipo.value}>{'|'.join(patrones)})" for tipo, patrones in PATRONES_CONSULTA
+    ) + ')'
+)
+PRIORIDAD_CONSULTA = {tipo.value: i for i, (tipo, _) in enumerate(PATRONES_CONSULTA)}
+
+# Segundos que se reutiliza el contexto de cada tipo de consulta
+TTL_CONTEXTO: Dict[TipoConsulta, int] = {
+    TipoConsulta.BUSCAR_GUIA: 15,
+    TipoConsulta.LISTAR_GUIAS: 15,
+    TipoConsulta.ANALISIS_RETRASOS: 30,
+}
+TTL_CONTEXTO_DEFAULT = int(os.getenv('CHAT_CONTEXTO_TTL', '60'))
+
+
 # System prompt para Claude
 SYSTEM_PROMPT = """Eres un asistente virtual experto en logística de Litper Colombia. Tu rol es:
 
@@ -74,6 +150,11 @@ ACCIONES DISPONIBLES QUE PUEDES SUGERIR:
 Cuando el usuario pida una acción, confirma que entiendes y describe qué se ejecutará."""
 
 
+def evento_sse(evento: str, datos: Dict[str, Any]) -> str:
+    """Formatea un evento Server-Sent Events"""
+    return f"event: {evento}\ndata: {json.dumps(datos, default=str, ensure_ascii=False)}\n\n"
+
+
 class ChatInteligente:
     """
     Sistema de chat inteligente que usa Claude API para responder
@@ -88,66 +169,12 @@ class ChatInteligente:
             logger.warning("CLAUDE_API_KEY no configurada - Chat IA no disponible")
             self.client = None
         else:
-            self.client = Anthropic(api_key=self.api_key)
+            self.client = AsyncAnthropic(api_key=self.api_key)
             logger.info("Cliente Claude inicializado correctamente")
 
         self.model = os.getenv('CLAUDE_MODEL', 'claude-sonnet-4-20250514')
         self.max_tokens = int(os.getenv('CHAT_MAX_TOKENS', '2000'))
 
-        # Patrones para detectar tipo de consulta
-        self.patrones = {
-            TipoConsulta.BUSCAR_GUIA: [
-                r'guía?\s*(?:número|#|n[uú]mero)?\s*(\d{8,15})',
-                r'busca(?:r)?\s*(?:la\s*)?guía?\s*(\d{8,15})',
-                r'información\s*(?:de\s*)?(?:la\s*)?guía?\s*(\d{8,15})',
-                r'estado\s*(?:de\s*)?(?:la\s*)?guía?\s*(\d{8,15})',
-            ],
-            TipoConsulta.CONSULTAR_TRANSPORTADORA: [
-                r'(?:de\s*)?(interrapidisimo|envía?|coordinadora|tcc|servientrega|deprisa)',
-                r'transportadora\s+(\w+)',
-            ],
-            TipoConsulta.CONSULTAR_CIUDAD: [
-                r'(?:en|de|hacia|a)\s+(bogot[aá]|medell[ií]n|cali|barranquilla|bucaramanga|cartagena)',
-                r'ciudad\s+(?:de\s+)?(\w+)',
-            ],
-            TipoConsulta.CONSULTAR_PERIODO: [
-                r'(?:esta|la)\s*semana',
-                r'(?:este|el)\s*mes',
-                r'últimos?\s*(\d+)\s*días?',
-                r'hoy',
-                r'ayer',
-            ],
-            TipoConsulta.LISTAR_GUIAS: [
-                r'(?:lista|muestra|dame|ver|mostrar)\s*(?:las|los)?\s*(?:guías?|envíos?)',
-                r'(?:cuáles|cuántas)\s*guías?',
-            ],
-            TipoConsulta.COMPARAR_TRANSPORTADORAS: [
-                r'compara(?:r)?(?:ción)?',
-                r'(?:vs|versus|contra)',
-                r'mejor\s*transportadora',
-            ],
-            TipoConsulta.ANALISIS_RETRASOS: [
-                r'retrasos?',
-                r'demorad[ao]s?',
-                r'atrasad[ao]s?',
-                r'tard[eí]os?',
-                r'sin\s*movimiento',
-            ],
-            TipoConsulta.PREDICCION: [
-                r'predice',
-                r'predicción',
-                r'probabilidad',
-                r'va\s*a\s*(?:llegar|demorar|retrasar)',
-            ],
-            TipoConsulta.EJECUTAR_ACCION: [
-                r'exporta(?:r)?',
-                r'genera(?:r)?\s*(?:reporte|informe)',
-                r'descarga(?:r)?',
-                r'enví?a(?:r)?\s*(?:notificación|email|mensaje)',
-                r'crea(?:r)?\s*alerta',
-            ],
-        }
-
     def _es_disponible(self) -> bool:
         """Verifica si el chat está disponible"""
         return self.client is not None
@@ -165,37 +192,43 @@ class ChatInteligente:
         pregunta_lower = pregunta.lower()
         parametros = {}
 
-        # Buscar patrones en orden de prioridad
-        for tipo, patrones in self.patrones.items():
-            for patron in patrones:
-                match = re.search(patron, pregunta_lower)
-                if match:
-                    # Extraer grupos capturados
-                    if match.groups():
-                        if tipo == TipoConsulta.BUSCAR_GUIA:
-                            parametros['numero_guia'] = match.group(1)
-                        elif tipo == TipoConsulta.CONSULTAR_TRANSPORTADORA:
-                            parametros['transportadora'] = match.group(1).upper()
-                        elif tipo == TipoConsulta.CONSULTAR_CIUDAD:
-                            parametros['ciudad'] = match.group(1).title()
-                        elif tipo == TipoConsulta.CONSULTAR_PERIODO:
-                            if 'días' in pregunta_lower or 'dias' in pregunta_lower:
-                                parametros['dias'] = int(match.group(1))
-
-                    # Detectar período implícito
-                    if 'hoy' in pregunta_lower:
-                        parametros['periodo'] = 'hoy'
-                    elif 'ayer' in pregunta_lower:
-                        parametros['periodo'] = 'ayer'
-                    elif 'semana' in pregunta_lower:
-                        parametros['periodo'] = 'semana'
-                    elif 'mes' in pregunta_lower:
-                        parametros['periodo'] = 'mes'
-
-                    return tipo, parametros
-
-        # Por defecto, estadísticas generales
-        return TipoConsulta.ESTADISTICAS_GENERALES, parametros
+        # Una pasada: el match del tipo de mayor prioridad, el primero en el texto
+        mejor = None
+        for match in PATRON_CONSULTA.finditer(pregunta_lower):
+            if mejor is None or PRIORIDAD_CONSULTA[match.lastgroup] < PRIORIDAD_CONSULTA[mejor.lastgroup]:
+                mejor = match
+                if PRIORIDAD_CONSULTA[match.lastgroup] == 0:
+                    break
+
+        if mejor is None:
+            # Por defecto, estadísticas generales
+            return TipoConsulta.ESTADISTICAS_GENERALES, parametros
+
+        # Extraer grupos capturados
+        for nombre, valor in mejor.groupdict().items():
+            if valor is None or nombre in PRIORIDAD_CONSULTA:
+                continue
+            parametro = nombre.split('__')[0]
+            if parametro == 'transportadora':
+                parametros['transportadora'] = valor.upper()
+            elif parametro == 'ciudad':
+                parametros['ciudad'] = valor.title()
+            elif parametro == 'dias':
+                parametros['dias'] = int(valor)
+            else:
+                parametros[parametro] = valor
+
+        # Detectar período implícito
+        if 'hoy' in pregunta_lower:
+            parametros['periodo'] = 'hoy'
+        elif 'ayer' in pregunta_lower:
+            parametros['periodo'] = 'ayer'
+        elif 'semana' in pregunta_lower:
+            parametros['periodo'] = 'semana'
+        elif 'mes' in pregunta_lower:
+            parametros['periodo'] = 'mes'
+
+        return TipoConsulta(mejor.lastgroup), parametros
 
     def preparar_contexto(
         self,
@@ -214,6 +247,12 @@ class ChatInteligente:
         Returns:
             Diccionario con datos relevantes para el contexto.
         """
+        # Mismo tipo y mismos parámetros dentro del TTL: se reutiliza
+        clave_cache = f"chat_contexto:{tipo_consulta.value}:{json.dumps(parametros, sort_keys=True, default=str)}"
+        cacheado = cache_service.get(clave_cache)
+        if cacheado is not None:
+            return cacheado
+
         contexto = {
             'tipo_consulta': tipo_consulta.value,
             'parametros': parametros,
@@ -252,73 +291,120 @@ class ChatInteligente:
             logger.error(f"Error preparando contexto: {e}")
             contexto['error'] = str(e)
 
+        if 'error' not in contexto and 'error' not in contexto['datos']:
+            cache_service.set(clave_cache, contexto, TTL_CONTEXTO.get(tipo_consulta, TTL_CONTEXTO_DEFAULT))
+
         return contexto
 
+    @staticmethod
+    def _conteos() -> List[Any]:
+        """Columnas de una pasada: total, entregadas, retraso y novedad (con FILTER) y promedio de días"""
+        conteo = func.count(GuiaHistorica.id)
+        return [
+            conteo.label('total'),
+            conteo.filter(GuiaHistorica.estatus.ilike('%entregad%')).label('entregadas'),
+            conteo.filter(GuiaHistorica.tiene_retraso).label('retraso'),
+            conteo.filter(GuiaHistorica.tiene_novedad).label('novedad'),
+            func.avg(GuiaHistorica.dias_transito).label('avg_dias'),
+        ]
+
+    @staticmethod
+    def _grupos_generales() -> Dict[str, Any]:
+        """Desgloses del resumen general: marca de grouping -> columna"""
+        return {
+            'todas_transportadoras': GuiaHistorica.transportadora,
+            'todas_ciudades': GuiaHistorica.ciudad_destino,
+        }
+
+    @classmethod
+    def consulta_agrupada(cls, grupos: Dict[str, Any], filtro=None):
+        """
+        Una sola consulta con GROUPING SETS (solo PostgreSQL): los totales y
+        un desglose por cada columna de `grupos`, con su marca grouping().
+        """
+        columnas = list(grupos.values())
+        consulta = select(
+            *columnas,
+            *(func.grouping(columna).label(marca) for marca, columna in grupos.items()),
+            *cls._conteos()
+        )
+        if filtro is not None:
+            consulta = consulta.where(filtro)
+        return consulta.group_by(func.grouping_sets(tuple_(), *columnas))
+
+    @classmethod
+    def consulta_estadisticas_generales(cls):
+        """
+        Una sola consulta para el resumen general: totales, top de
+        transportadoras y top de ciudades con GROUPING SETS.
+        """
+        return cls.consulta_agrupada(cls._grupos_generales())
+
+    def _filas_agrupadas(self, session: Session, grupos: Dict[str, Any], filtro=None) -> List[Any]:
+        """
+        Filas de consulta_agrupada en cualquier motor.
+
+        GROUPING SETS solo existe en PostgreSQL; en los demás (SQLite en
+        desarrollo) se hace una consulta de totales y otra por desglose, y
+        las filas se arman con las mismas columnas y marcas.
+        """
+        if session.get_bind().dialect.name == 'postgresql':
+            return session.execute(self.consulta_agrupada(grupos, filtro)).all()
+
+        def consultar(*agrupar):
+            consulta = select(*agrupar, *self._conteos())
+            if filtro is not None:
+                consulta = consulta.where(filtro)
+            return session.execute(consulta.group_by(*agrupar) if agrupar else consulta).all()
+
+        def fila(datos, marca_desglose=None):
+            valores = {columna.key: None for columna in grupos.values()}
+            valores.update({marca: int(marca != marca_desglose) for marca in grupos})
+            valores.update(datos._mapping)
+            return SimpleNamespace(**valores)
+
+        filas = [fila(f) for f in consultar()]
+        for marca, columna in grupos.items():
+            filas += [fila(f, marca) for f in consultar(columna)]
+        return filas
+
+    @staticmethod
+    def resumir_estadisticas_generales(filas: List[Any], top: int = 5) -> Dict[str, Any]:
+        """Arma el resumen general a partir de las filas de consulta_estadisticas_generales"""
+        totales = None
+        transportadoras = []
+        ciudades = []
+
+        for fila in filas:
+            if fila.todas_transportadoras and fila.todas_ciudades:
+                totales = fila
+            elif fila.todas_ciudades and fila.transportadora is not None:
+                transportadoras.append({'nombre': fila.transportadora, 'total': fila.total})
+            elif fila.todas_transportadoras and fila.ciudad_destino is not None:
+                ciudades.append({'ciudad': fila.ciudad_destino, 'total': fila.total})
+
+        total_guias = totales.total if totales else 0
+        guias_entregadas = totales.entregadas if totales else 0
+        guias_retraso = totales.retraso if totales else 0
+        avg_dias = (totales.avg_dias if totales else None) or 0
+
+        return {
+            'total_guias': total_guias,
+            'guias_entregadas': guias_entregadas,
+            'guias_en_retraso': guias_retraso,
+            'guias_con_novedad': totales.novedad if totales else 0,
+            'tasa_entrega': round(guias_entregadas / total_guias * 100, 1) if total_guias > 0 else 0,
+            'tasa_retraso': round(guias_retraso / total_guias * 100, 1) if total_guias > 0 else 0,
+            'promedio_dias_transito': round(float(avg_dias), 1),
+            'top_transportadoras': sorted(transportadoras, key=lambda t: -t['total'])[:top],
+            'top_ciudades': sorted(ciudades, key=lambda c: -c['total'])[:top],
+        }
+
     def _obtener_estadisticas_generales(self, session: Session) -> Dict[str, Any]:
         """Obtiene estadísticas generales del sistema"""
         try:
-            # Total de guías
-            total_guias = session.query(func.count(GuiaHistorica.id)).scalar() or 0
-
-            # Guías por estado
-            guias_entregadas = session.query(func.count(GuiaHistorica.id)).filter(
-                GuiaHistorica.estatus.ilike('%entregad%')
-            ).scalar() or 0
-
-            guias_retraso = session.query(func.count(GuiaHistorica.id)).filter(
-                GuiaHistorica.tiene_retraso
-            ).scalar() or 0
-
-            guias_novedad = session.query(func.count(GuiaHistorica.id)).filter(
-                GuiaHistorica.tiene_novedad
-            ).scalar() or 0
-
-            # Top transportadoras
-            top_transportadoras = session.query(
-                GuiaHistorica.transportadora,
-                func.count(GuiaHistorica.id).label('total')
-            ).filter(
-                GuiaHistorica.transportadora.isnot(None)
-            ).group_by(
-                GuiaHistorica.transportadora
-            ).order_by(
-                func.count(GuiaHistorica.id).desc()
-            ).limit(5).all()
-
-            # Top ciudades
-            top_ciudades = session.query(
-                GuiaHistorica.ciudad_destino,
-                func.count(GuiaHistorica.id).label('total')
-            ).filter(
-                GuiaHistorica.ciudad_destino.isnot(None)
-            ).group_by(
-                GuiaHistorica.ciudad_destino
-            ).order_by(
-                func.count(GuiaHistorica.id).desc()
-            ).limit(5).all()
-
-            # Promedio días tránsito
-            avg_dias = session.query(
-                func.avg(GuiaHistorica.dias_transito)
-            ).filter(
-                GuiaHistorica.dias_transito.isnot(None)
-            ).scalar() or 0
-
-            return {
-                'total_guias': total_guias,
-                'guias_entregadas': guias_entregadas,
-                'guias_en_retraso': guias_retraso,
-                'guias_con_novedad': guias_novedad,
-                'tasa_entrega': round(guias_entregadas / total_guias * 100, 1) if total_guias > 0 else 0,
-                'tasa_retraso': round(guias_retraso / total_guias * 100, 1) if total_guias > 0 else 0,
-                'promedio_dias_transito': round(avg_dias, 1),
-                'top_transportadoras': [
-                    {'nombre': t[0], 'total': t[1]} for t in top_transportadoras
-                ],
-                'top_ciudades': [
-                    {'ciudad': c[0], 'total': c[1]} for c in top_ciudades
-                ],
-            }
+            filas = self._filas_agrupadas(session, self._grupos_generales())
+            return self.resumir_estadisticas_generales(filas)
 
         except Exception as e:
             logger.error(f"Error obteniendo estadísticas: {e}")
@@ -352,20 +438,9 @@ class ChatInteligente:
         # Buscar con LIKE para ser flexible
         filtro = GuiaHistorica.transportadora.ilike(f'%{nombre}%')
 
-        total = session.query(func.count(GuiaHistorica.id)).filter(filtro).scalar() or 0
-        entregas = session.query(func.count(GuiaHistorica.id)).filter(
-            and_(filtro, GuiaHistorica.estatus.ilike('%entregad%'))
-        ).scalar() or 0
-        retrasos = session.query(func.count(GuiaHistorica.id)).filter(
-            and_(filtro, GuiaHistorica.tiene_retraso)
-        ).scalar() or 0
-        novedades = session.query(func.count(GuiaHistorica.id)).filter(
-            and_(filtro, GuiaHistorica.tiene_novedad)
-        ).scalar() or 0
-
-        avg_dias = session.query(func.avg(GuiaHistorica.dias_transito)).filter(
-            and_(filtro, GuiaHistorica.dias_transito.isnot(None))
-        ).scalar() or 0
+        fila = session.execute(select(*self._conteos()).where(filtro)).one()
+        total, entregas, retrasos, novedades = fila.total, fila.entregadas, fila.retraso, fila.novedad
+        avg_dias = fila.avg_dias or 0
 
         return {
             'transportadora': nombre,
@@ -375,7 +450,7 @@ class ChatInteligente:
             'guias_novedad': novedades,
             'tasa_entrega': round(entregas / total * 100, 1) if total > 0 else 0,
             'tasa_retraso': round(retrasos / total * 100, 1) if total > 0 else 0,
-            'promedio_dias': round(avg_dias, 1),
+            'promedio_dias': round(float(avg_dias), 1),
         }
 
     def _consultar_ciudad(self, ciudad: str, session: Session) -> Dict[str, Any]:
@@ -385,23 +460,19 @@ class ChatInteligente:
 
         filtro = GuiaHistorica.ciudad_destino.ilike(f'%{ciudad}%')
 
-        total = session.query(func.count(GuiaHistorica.id)).filter(filtro).scalar() or 0
-        entregas = session.query(func.count(GuiaHistorica.id)).filter(
-            and_(filtro, GuiaHistorica.estatus.ilike('%entregad%'))
-        ).scalar() or 0
-        retrasos = session.query(func.count(GuiaHistorica.id)).filter(
-            and_(filtro, GuiaHistorica.tiene_retraso)
-        ).scalar() or 0
+        # Totales de la ciudad y desglose por transportadora
+        filas = self._filas_agrupadas(
+            session, {'todas_transportadoras': GuiaHistorica.transportadora}, filtro
+        )
 
-        # Por transportadora en esta ciudad
-        por_transportadora = session.query(
-            GuiaHistorica.transportadora,
-            func.count(GuiaHistorica.id).label('total')
-        ).filter(
-            and_(filtro, GuiaHistorica.transportadora.isnot(None))
-        ).group_by(
-            GuiaHistorica.transportadora
-        ).all()
+        totales = next((f for f in filas if f.todas_transportadoras), None)
+        total = totales.total if totales else 0
+        entregas = totales.entregadas if totales else 0
+        retrasos = totales.retraso if totales else 0
+        por_transportadora = [
+            (f.transportadora, f.total) for f in filas
+            if not f.todas_transportadoras and f.transportadora is not None
+        ]
 
         return {
             'ciudad': ciudad,
@@ -540,6 +611,58 @@ class ChatInteligente:
             ],
         }
 
+    def _construir_mensaje(self, pregunta: str, contexto: Dict[str, Any]) -> str:
+        """Mensaje para Claude con la pregunta y los datos consultados"""
+        return f"""Pregunta del usuario: {pregunta}
+
+DATOS DEL SISTEMA (usa estos datos para responder):
+```json
+{json.dumps(contexto, indent=2, default=str, ensure_ascii=False)}
+```
+
+Responde de forma clara, específica y profesional. Si detectas problemas, sugiere acciones."""
+
+    async def _preparar(
+        self,
+        pregunta: str,
+        session: Session,
+        usar_contexto: bool
+    ) -> Tuple[TipoConsulta, Dict[str, Any]]:
+        """Analiza la pregunta y consulta el contexto fuera del event loop"""
+        tipo_consulta, parametros = self.analizar_pregunta(pregunta)
+        logger.info(f"Tipo de consulta detectado: {tipo_consulta.value}")
+
+        contexto = {}
+        if usar_contexto:
+            contexto = await asyncio.to_thread(self.preparar_contexto, tipo_consulta, parametros, session)
+        return tipo_consulta, contexto
+
+    @staticmethod
+    def _guardar_conversacion(
+        session: Session,
+        pregunta: str,
+        respuesta_texto: str,
+        tipo_consulta: TipoConsulta,
+        contexto: Dict[str, Any],
+        tiempo_respuesta_ms: float,
+        tokens_usados: int,
+        session_id: Optional[str],
+        usuario: Optional[str]
+    ) -> None:
+        """Guarda la conversación en BD"""
+        conversacion = ConversacionChat(
+            session_id=session_id,
+            usuario=usuario or 'anonimo',
+            pregunta_usuario=pregunta,
+            respuesta_ia=respuesta_texto,
+            tipo_consulta=tipo_consulta.value,
+            metricas_usadas=contexto.get('datos', {}),
+            tiempo_respuesta_segundos=tiempo_respuesta_ms / 1000,
+            tokens_usados=tokens_usados,
+        )
+        session.add(conversacion)
+        session.commit()
+
     async def responder(
         self,
         pregunta: str,
@@ -574,32 +697,16 @@ class ChatInteligente:
             }
 
         try:
-            # Analizar pregunta
-            tipo_consulta, parametros = self.analizar_pregunta(pregunta)
-            logger.info(f"Tipo de consulta detectado: {tipo_consulta.value}")
-
-            # Preparar contexto
-            contexto = {}
-            if usar_contexto:
-                contexto = self.preparar_contexto(tipo_consulta, parametros, session)
-
-            # Construir mensaje con contexto
-            mensaje_usuario = f"""Pregunta del usuario: {pregunta}
-
-DATOS DEL SISTEMA (usa estos datos para responder):
-```json
-{json.dumps(contexto, indent=2, default=str, ensure_ascii=False)}
-```
-
-Responde de forma clara, específica y profesional. Si detectas problemas, sugiere acciones."""
+            # Analizar pregunta y preparar contexto
+            tipo_consulta, contexto = await self._preparar(pregunta, session, usar_contexto)
 
             # Llamar a Claude API
-            response = self.client.messages.create(
+            response = await self.client.messages.create(
                 model=self.model,
                 max_tokens=self.max_tokens,
                 system=SYSTEM_PROMPT,
                 messages=[
-                    {"role": "user", "content": mensaje_usuario}
+                    {"role": "user", "content": self._construir_mensaje(pregunta, contexto)}
                 ]
             )
 
@@ -609,18 +716,11 @@ Responde de forma clara, específica y profesional. Si detectas problemas, sugie
             tiempo_respuesta = (time.time() - inicio) * 1000  # en ms
 
             # Guardar conversación en BD
-            conversacion = ConversacionChat(
-                session_id=session_id,
-                usuario=usuario or 'anonimo',
-                pregunta_usuario=pregunta,
-                respuesta_ia=respuesta_texto,
-                tipo_consulta=tipo_consulta.value,
-                metricas_usadas=contexto.get('datos', {}),
-                tiempo_respuesta_segundos=tiempo_respuesta / 1000,
-                tokens_usados=tokens_usados,
+            await asyncio.to_thread(
+                self._guardar_conversacion,
+                session, pregunta, respuesta_texto, tipo_consulta, contexto,
+                tiempo_respuesta, tokens_usados, session_id, usuario
             )
-            session.add(conversacion)
-            session.commit()
 
             # Generar sugerencias de seguimiento
             sugerencias = self._generar_sugerencias(tipo_consulta, contexto)
@@ -645,6 +745,82 @@ Responde de forma clara, específica y profesional. Si detectas problemas, sugie
                 'tiempo_respuesta_ms': (time.time() - inicio) * 1000,
             }
 
+    async def responder_stream(
+        self,
+        pregunta: str,
+        usar_contexto: bool = True,
+        session_id: Optional[str] = None,
+        usuario: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """
+        Genera la respuesta como eventos SSE a medida que Claude produce tokens.
+
+        Eventos: 'contexto' (tipo de consulta y datos), 'token' (texto
+        parcial), 'fin' (tokens, tiempo y sugerencias) o 'error'. La
+        conversación se guarda al completar el stream; si el cliente se
+        desconecta antes no se guarda.
+
+        Abre sus propias sesiones de BD porque el stream sigue después de
+        que termina el request que lo creó.
+        """
+        inicio = time.time()
+
+        if not self._es_disponible():
+            yield evento_sse('error', {
+                'respuesta': "El chat IA no está disponible. Por favor configura la API key de Claude."
+            })
+            return
+
+        try:
+            with get_db_session() as session:
+                tipo_consulta, contexto = await self._preparar(pregunta, session, usar_contexto)
+
+            yield evento_sse('contexto', {
+                'tipo_consulta': tipo_consulta.value,
+                'datos_consultados': contexto.get('datos', {}),
+            })
+
+            partes = []
+            async with self.client.messages.stream(
+                model=self.model,
+                max_tokens=self.max_tokens,
+                system=SYSTEM_PROMPT,
+                messages=[
+                    {"role": "user", "content": self._construir_mensaje(pregunta, contexto)}
+                ]
+            ) as stream:
+                async for texto in stream.text_stream:
+                    partes.append(texto)
+                    yield evento_sse('token', {'texto': texto})
+                final = await stream.get_final_message()
+
+            tokens_usados = final.usage.input_tokens + final.usage.output_tokens
+            tiempo_respuesta = (time.time() - inicio) * 1000
+
+            # Guardar conversación en BD (ya con la respuesta completa), fuera del event loop
+            def guardar():
+                with get_db_session() as session:
+                    self._guardar_conversacion(
+                        session, pregunta, ''.join(partes), tipo_consulta, contexto,
+                        tiempo_respuesta, tokens_usados, session_id, usuario
+                    )
+
+            await asyncio.to_thread(guardar)
+
+            yield evento_sse('fin', {
+                'tipo_consulta': tipo_consulta.value,
+                'sugerencias': self._generar_sugerencias(tipo_consulta, contexto),
+                'tokens_usados': tokens_usados,
+                'tiempo_respuesta_ms': round(tiempo_respuesta),
+            })
+
+        except Exception as e:
+            logger.error(f"Error en chat (stream): {e}")
+            yield evento_sse('error', {
+                'respuesta': f"Ocurrió un error procesando tu consulta: {str(e)}",
+                'sugerencias': ['Intenta reformular tu pregunta', 'Verifica la conexión'],
+            })
+
     def _generar_sugerencias(
         self,
         tipo_consulta: TipoConsulta,
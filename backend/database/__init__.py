@@ -25,6 +25,12 @@ from .models import (
     TrackingOrden,
     HistorialTrackingOrden,
     AlertaTracking,
+    # Rescate
+    ItemRescate,
+    # Webhooks
+    WebhookOutbox,
+    EventoWebhookEntrante,
+    EstadoEntregaWebhook,
 )
 
 from .config import (
@@ -60,6 +66,12 @@ __all__ = [
     'TrackingOrden',
     'HistorialTrackingOrden',
     'AlertaTracking',
+    # Rescate
+    'ItemRescate',
+    # Webhooks
+    'WebhookOutbox',
+    'EventoWebhookEntrante',
+    'EstadoEntregaWebhook',
     # Enums
     'EstadoArchivo',
     'NivelRiesgo',
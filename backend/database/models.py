@@ -50,6 +50,13 @@ class TipoAlerta(enum.Enum):
     AUTOMATICA = "AUTOMATICA"
 
 
+class EstadoEntregaWebhook(enum.Enum):
+    """Estados de una entrega en el outbox de webhooks"""
+    PENDIENTE = "PENDIENTE"
+    ENTREGADO = "ENTREGADO"
+    DEAD_LETTER = "DEAD_LETTER"
+
+
 # ==================== MODELOS ====================
 
 class GuiaHistorica(Base):
@@ -770,3 +777,145 @@ class AlertaTracking(Base):
             'estaActiva': self.esta_activa,
             'fechaCreacion': self.fecha_creacion.isoformat() if self.fecha_creacion else None,
         }
+
+
+# ==================== RESCATE DE GUÍAS ====================
+
+class ItemRescate(Base):
+    """
+    Cola persistente del sistema de rescate.
+    Las guías abiertas y las ya cerradas (recuperadas, perdidas o canceladas)
+    viven en la misma tabla; el índice por estado, prioridad y próxima acción
+    sirve tanto para cargar la cola como para reclamar los reagendados.
+    """
+    __tablename__ = 'cola_rescate'
+
+    id = Column(String(100), primary_key=True)
+    numero_guia = Column(String(100), nullable=False, index=True)
+    transportadora = Column(String(100), nullable=True)
+    nombre_cliente = Column(String(255), nullable=True)
+    telefono = Column(String(50), nullable=True)
+    ciudad_destino = Column(String(100), nullable=True)
+    direccion = Column(Text, nullable=True)
+
+    # Novedad
+    tipo_novedad = Column(String(50), nullable=False)
+    descripcion_novedad = Column(Text, nullable=True)
+    dias_sin_movimiento = Column(Integer, default=0)
+
+    # Prioridad (rango numérico: 0 = CRITICAL) y estado
+    prioridad = Column(String(20), nullable=False)
+    rango_prioridad = Column(Integer, nullable=False)
+    estado = Column(String(30), nullable=False)
+    probabilidad_recuperacion = Column(Float, default=0.5)
+
+    # Gestión
+    intentos = Column(Integer, default=0)
+    max_intentos = Column(Integer, default=3)
+    ultimo_contacto = Column(DateTime, nullable=True)
+    proxima_accion = Column(DateTime, nullable=True)
+    notas = Column(JSON, nullable=True)
+    whatsapp_enviado = Column(Boolean, default=False)
+    llamada_realizada = Column(Boolean, default=False)
+
+    # Reclamación por agentes (lease)
+    reclamado_por = Column(String(100), nullable=True)
+    reclamado_hasta = Column(DateTime, nullable=True)
+
+    # Fechas
+    fecha_creacion = Column(DateTime, default=datetime.utcnow)
+    fecha_cierre = Column(DateTime, nullable=True, index=True)
+    horas_recuperacion = Column(Float, nullable=True)
+
+    __table_args__ = (
+        Index('idx_rescate_estado_prioridad_accion', 'estado', 'rango_prioridad', 'proxima_accion'),
+    )
+
+    def __repr__(self):
+        return f"<ItemRescate(guia={self.numero_guia}, prioridad={self.prioridad}, estado={self.estado})>"
+
+
+# ==================== OUTBOX DE WEBHOOKS ====================
+
+class WebhookOutbox(Base):
+    """
+    Outbox transaccional de webhooks.
+    Una fila por evento y suscriptor, escrita en la misma transacción que el
+    cambio de negocio que la origina; el worker de entregas la envía después
+    respetando el orden de cada suscriptor.
+    """
+    __tablename__ = 'webhook_outbox'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    webhook_id = Column(Integer, nullable=False)
+    # URL al encolar: junto con webhook_id identifica al suscriptor (los ids
+    # del registro en memoria se reinician). El secret no se guarda aquí, se
+    # busca en el registro al enviar
+    url = Column(String(500), nullable=False)
+    event_type = Column(String(100), nullable=False)
+    payload = Column(JSON, nullable=True)
+
+    # Estado de la entrega
+    estado = Column(SQLEnum(EstadoEntregaWebhook), default=EstadoEntregaWebhook.PENDIENTE, nullable=False)
+    intentos = Column(Integer, default=0)
+    proximo_intento = Column(DateTime, default=datetime.utcnow)
+    ultimo_status_code = Column(Integer, nullable=True)
+    ultimo_error = Column(Text, nullable=True)
+
+    # Fechas
+    fecha_creacion = Column(DateTime, default=datetime.utcnow)
+    fecha_entrega = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index('idx_outbox_estado_webhook', 'estado', 'webhook_id', 'id'),
+    )
+
+    def __repr__(self):
+        return f"<WebhookOutbox(id={self.id}, webhook={self.webhook_id}, evento={self.event_type}, estado={self.estado})>"
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'webhook_id': self.webhook_id,
+            'event_type': self.event_type,
+            'estado': self.estado.value if self.estado else None,
+            'intentos': self.intentos,
+            'proximo_intento': self.proximo_intento.isoformat() if self.proximo_intento else None,
+            'ultimo_status_code': self.ultimo_status_code,
+            'ultimo_error': self.ultimo_error,
+            'fecha_creacion': self.fecha_creacion.isoformat() if self.fecha_creacion else None,
+            'fecha_entrega': self.fecha_entrega.isoformat() if self.fecha_entrega else None,
+        }
+
+
+class EventoWebhookEntrante(Base):
+    """
+    Historial persistente de eventos recibidos por webhook (Chatea Pro, N8N, Dropi).
+    El buffer en memoria guarda solo los más recientes; esta tabla conserva todo
+    para consultas por tipo y fecha.
+    """
+    __tablename__ = 'eventos_webhook_entrantes'
+
+    id = Column(String(50), primary_key=True)
+    clave_idempotencia = Column(String(128), nullable=True, unique=True)
+    evento = Column(String(100), nullable=False)
+    tipo = Column(String(50), nullable=False)
+    fuente = Column(String(50), nullable=True)
+    prioridad = Column(String(20), nullable=True)
+    datos = Column(JSON, nullable=True)
+
+    # Resultado del procesamiento
+    procesado = Column(Boolean, default=False)
+    resultado = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+
+    fecha = Column(DateTime, default=datetime.now, nullable=False)
+
+    __table_args__ = (
+        Index('idx_evento_entrante_tipo_fecha', 'tipo', 'fecha'),
+        Index('idx_evento_entrante_evento_fecha', 'evento', 'fecha'),
+        Index('idx_evento_entrante_fecha', 'fecha'),
+    )
+
+    def __repr__(self):
+        return f"<EventoWebhookEntrante(id={self.id}, evento={self.evento}, fuente={self.fuente})>"
@@ -1,30 +1,286 @@
 """
 Base de datos SQLite para LITPER Tracker
 Almacenamiento persistente de usuarios y rondas
+
+Las conexiones se toman de un pool pequeño en modo WAL con synchronous=NORMAL,
+de modo que las lecturas no bloquean a las escrituras y cada commit no fuerza
+un fsync. Las rutas async deben invocar estas funciones con `ejecutar()`,
+que las corre en un hilo sin bloquear el event loop.
 """
 
+import asyncio
+import queue
 import sqlite3
+import threading
 import json
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime, date
-from typing import Optional, List, Dict, Any
+from functools import partial
+from typing import Optional, List, Dict, Any, Callable, Iterator
 from pathlib import Path
 from loguru import logger
 
 # Ruta de la base de datos
 DB_PATH = Path(__file__).parent / "data" / "tracker.db"
 
+# Tamaño del pool de conexiones (y del pool de hilos que las usa)
+POOL_SIZE = 4
+
+# Tamaño del cache de sentencias preparadas por conexión
+STATEMENT_CACHE_SIZE = 128
+
+# ==================== SQL ====================
+# Sentencias fijas: sqlite3 reutiliza la sentencia compilada de su cache
+# por conexión cuando el texto SQL es idéntico.
+
+SQL_UPSERT_USUARIO = """
+    INSERT INTO usuarios (id, nombre, avatar, color, meta_diaria, password_hash, version)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(id) DO UPDATE SET
+        nombre = excluded.nombre,
+        avatar = excluded.avatar,
+        color = excluded.color,
+        meta_diaria = excluded.meta_diaria,
+        activo = 1,
+        version = excluded.version
+"""
+
+# Sincronización: last-writer-wins por versión. El último parámetro es la
+# versión que el cliente conocía; si el servidor ya tiene una más nueva,
+# la fila enviada se descarta.
+SQL_SYNC_USUARIO = """
+    INSERT INTO usuarios (id, nombre, avatar, color, meta_diaria, activo, version)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(id) DO UPDATE SET
+        nombre = excluded.nombre,
+        avatar = excluded.avatar,
+        color = excluded.color,
+        meta_diaria = excluded.meta_diaria,
+        activo = excluded.activo,
+        version = excluded.version
+    WHERE usuarios.version <= ?
+"""
+
+SQL_INSERT_RONDA_GUIAS = """
+    INSERT INTO rondas_guias (
+        id, usuario_id, usuario_nombre, numero, fecha, hora_inicio, hora_fin,
+        tiempo_usado, pedidos_iniciales, realizado, cancelado, agendado,
+        dificiles, pendientes, revisado, eliminado, version
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+SQL_SYNC_RONDA_GUIAS = SQL_INSERT_RONDA_GUIAS + """
+    ON CONFLICT(id) DO UPDATE SET
+        usuario_id = excluded.usuario_id,
+        usuario_nombre = excluded.usuario_nombre,
+        numero = excluded.numero,
+        fecha = excluded.fecha,
+        hora_inicio = excluded.hora_inicio,
+        hora_fin = excluded.hora_fin,
+        tiempo_usado = excluded.tiempo_usado,
+        pedidos_iniciales = excluded.pedidos_iniciales,
+        realizado = excluded.realizado,
+        cancelado = excluded.cancelado,
+        agendado = excluded.agendado,
+        dificiles = excluded.dificiles,
+        pendientes = excluded.pendientes,
+        revisado = excluded.revisado,
+        eliminado = excluded.eliminado,
+        version = excluded.version
+    WHERE rondas_guias.version <= ?
+"""
+
+SQL_INSERT_RONDA_NOVEDADES = """
+    INSERT INTO rondas_novedades (
+        id, usuario_id, usuario_nombre, numero, fecha, hora_inicio, hora_fin,
+        tiempo_usado, revisadas, solucionadas, devolucion, cliente,
+        transportadora, litper, eliminado, version
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+SQL_SYNC_RONDA_NOVEDADES = SQL_INSERT_RONDA_NOVEDADES + """
+    ON CONFLICT(id) DO UPDATE SET
+        usuario_id = excluded.usuario_id,
+        usuario_nombre = excluded.usuario_nombre,
+        numero = excluded.numero,
+        fecha = excluded.fecha,
+        hora_inicio = excluded.hora_inicio,
+        hora_fin = excluded.hora_fin,
+        tiempo_usado = excluded.tiempo_usado,
+        revisadas = excluded.revisadas,
+        solucionadas = excluded.solucionadas,
+        devolucion = excluded.devolucion,
+        cliente = excluded.cliente,
+        transportadora = excluded.transportadora,
+        litper = excluded.litper,
+        eliminado = excluded.eliminado,
+        version = excluded.version
+    WHERE rondas_novedades.version <= ?
+"""
+
+# Tablas sincronizables y su tipo en el protocolo de sync
+TABLAS_RONDAS = {'guias': 'rondas_guias', 'novedades': 'rondas_novedades'}
+
+# Contadores de resumen_usuario_dia que mantiene cada tabla de rondas:
+# columna del resumen -> expresión sobre la fila de la ronda
+CONTADORES_RESUMEN = {
+    'rondas_guias': {
+        'rondas_guias': '1',
+        'realizado': 'COALESCE({fila}.realizado, 0)',
+        'cancelado': 'COALESCE({fila}.cancelado, 0)',
+        'tiempo_guias': 'COALESCE({fila}.tiempo_usado, 0)',
+    },
+    'rondas_novedades': {
+        'rondas_novedades': '1',
+        'solucionadas': 'COALESCE({fila}.solucionadas, 0)',
+        'tiempo_novedades': 'COALESCE({fila}.tiempo_usado, 0)',
+    },
+}
+
+# Columnas del Excel exportado (unión de ambos tipos de ronda)
+CONTADORES_EXPORTACION_GUIAS = [
+    'pedidos_iniciales', 'realizado', 'cancelado', 'agendado', 'dificiles', 'pendientes', 'revisado',
+]
+CONTADORES_EXPORTACION_NOVEDADES = [
+    'revisadas', 'solucionadas', 'devolucion', 'cliente', 'transportadora', 'litper',
+]
+COLUMNAS_EXPORTACION = [
+    'fecha', 'hora_inicio', 'hora_fin', 'tipo', 'id', 'usuario_id', 'usuario_nombre',
+    'numero', 'tiempo_usado',
+] + CONTADORES_EXPORTACION_GUIAS + CONTADORES_EXPORTACION_NOVEDADES
+
 def get_connection():
-    """Obtiene conexión a la base de datos"""
+    """Obtiene conexión a la base de datos (WAL, synchronous=NORMAL)"""
     DB_PATH.parent.mkdir(parents=True, exist_ok=True)
-    conn = sqlite3.connect(str(DB_PATH), check_same_thread=False)
+    conn = sqlite3.connect(
+        str(DB_PATH),
+        check_same_thread=False,
+        cached_statements=STATEMENT_CACHE_SIZE,
+        timeout=10.0
+    )
     conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
     return conn
 
-def init_database():
+class PoolConexiones:
+    """
+    Pool pequeño de conexiones SQLite reutilizables.
+
+    Las conexiones se crean bajo demanda hasta `tamano`; cuando todas están
+    en uso, el hilo que pide una espera a que otra sea devuelta.
+    """
+
+    def __init__(self, tamano: int = POOL_SIZE):
+        self.tamano = tamano
+        self._libres: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._creadas = 0
+        self._lock = threading.Lock()
+        self._cerrado = False
+
+    def _tomar(self) -> sqlite3.Connection:
+        try:
+            return self._libres.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._creadas < self.tamano:
+                self._creadas += 1
+                try:
+                    return get_connection()
+                except Exception:
+                    # La conexión no se creó: liberar el cupo
+                    self._creadas -= 1
+                    raise
+
+        return self._libres.get()
+
+    def _devolver(self, conn: sqlite3.Connection) -> None:
+        if self._cerrado:
+            conn.close()
+            return
+        if conn.in_transaction:
+            conn.rollback()
+        self._libres.put(conn)
+
+    @contextmanager
+    def conexion(self) -> Iterator[sqlite3.Connection]:
+        """Presta una conexión del pool durante el bloque `with`"""
+        conn = self._tomar()
+        try:
+            yield conn
+        finally:
+            self._devolver(conn)
+
+    @contextmanager
+    def transaccion(self) -> Iterator[sqlite3.Connection]:
+        """Presta una conexión y ejecuta el bloque en una sola transacción"""
+        with self.conexion() as conn:
+            with conn:
+                yield conn
+
+    def cerrar(self) -> None:
+        """Cierra todas las conexiones libres del pool"""
+        self._cerrado = True
+        while True:
+            try:
+                self._libres.get_nowait().close()
+            except queue.Empty:
+                break
+
+_pool: Optional[PoolConexiones] = None
+_pool_lock = threading.Lock()
+_executor: Optional[ThreadPoolExecutor] = None
+
+def get_pool() -> PoolConexiones:
+    """Obtiene el pool global, inicializando la base de datos la primera vez"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                pool = PoolConexiones()
+                init_database(pool)
+                _pool = pool
+    return _pool
+
+def cerrar_pool() -> None:
+    """Cierra el pool global y el pool de hilos (shutdown o tests)"""
+    global _pool, _executor
+    with _pool_lock:
+        if _pool is not None:
+            _pool.cerrar()
+            _pool = None
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
+
+async def ejecutar(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Ejecuta una función de esta capa en un hilo dedicado.
+
+    El pool de hilos tiene el mismo tamaño que el pool de conexiones, así
+    ningún hilo queda bloqueado esperando una conexión.
+    """
+    global _executor
+    if _executor is None:
+        with _pool_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=POOL_SIZE, thread_name_prefix="tracker-db")
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, partial(func, *args, **kwargs))
+
+def init_database(pool: Optional[PoolConexiones] = None):
     """Inicializa las tablas de la base de datos"""
-    conn = get_connection()
-    cursor = conn.cursor()
+    pool = pool or get_pool()
+    with pool.transaccion() as conn:
+        _crear_esquema(conn)
+    logger.info(f"📦 Base de datos inicializada en {DB_PATH}")
 
+def _crear_esquema(conn: sqlite3.Connection):
+    """Crea tablas y usuarios iniciales si no existen"""
+    cursor = conn.cursor()
     # Tabla de usuarios
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS usuarios (
@@ -35,6 +291,7 @@ def init_database():
             meta_diaria INTEGER DEFAULT 50,
             activo INTEGER DEFAULT 1,
             password_hash TEXT,
+            version INTEGER DEFAULT 0,
             fecha_creacion TEXT DEFAULT CURRENT_TIMESTAMP
         )
     """)
@@ -57,6 +314,8 @@ def init_database():
             dificiles INTEGER DEFAULT 0,
             pendientes INTEGER DEFAULT 0,
             revisado INTEGER DEFAULT 0,
+            eliminado INTEGER DEFAULT 0,
+            version INTEGER DEFAULT 0,
             fecha_creacion TEXT DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY (usuario_id) REFERENCES usuarios(id)
         )
@@ -79,6 +338,8 @@ def init_database():
             cliente INTEGER DEFAULT 0,
             transportadora INTEGER DEFAULT 0,
             litper INTEGER DEFAULT 0,
+            eliminado INTEGER DEFAULT 0,
+            version INTEGER DEFAULT 0,
             fecha_creacion TEXT DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY (usuario_id) REFERENCES usuarios(id)
         )
@@ -92,7 +353,49 @@ def init_database():
         )
     """)
 
-    conn.commit()
+    # Contador global de versiones para la sincronización incremental
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS sync_estado (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        )
+    """)
+    cursor.execute("INSERT OR IGNORE INTO sync_estado (id, version) VALUES (1, 0)")
+
+    # Bases creadas antes del protocolo de sync no tienen estas columnas
+    _agregar_columna(cursor, 'usuarios', 'version', 'INTEGER DEFAULT 0')
+    for tabla in TABLAS_RONDAS.values():
+        _agregar_columna(cursor, tabla, 'eliminado', 'INTEGER DEFAULT 0')
+        _agregar_columna(cursor, tabla, 'version', 'INTEGER DEFAULT 0')
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{tabla}_version ON {tabla}(version)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_usuarios_version ON usuarios(version)")
+
+    # Resumen por (fecha, usuario) mantenido por triggers en la misma
+    # transacción que cada escritura de rondas. La PK agrupada (WITHOUT ROWID)
+    # hace de índice cubriente para ranking, resumen y estadísticas.
+    existia_resumen = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'resumen_usuario_dia'"
+    ).fetchone()
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS resumen_usuario_dia (
+            fecha TEXT NOT NULL,
+            usuario_id TEXT NOT NULL,
+            usuario_nombre TEXT,
+            rondas_guias INTEGER NOT NULL DEFAULT 0,
+            realizado INTEGER NOT NULL DEFAULT 0,
+            cancelado INTEGER NOT NULL DEFAULT 0,
+            tiempo_guias INTEGER NOT NULL DEFAULT 0,
+            rondas_novedades INTEGER NOT NULL DEFAULT 0,
+            solucionadas INTEGER NOT NULL DEFAULT 0,
+            tiempo_novedades INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (fecha, usuario_id)
+        ) WITHOUT ROWID
+    """)
+    for tabla in TABLAS_RONDAS.values():
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{tabla}_fecha_usuario ON {tabla}(fecha, usuario_id)")
+        _crear_triggers_resumen(cursor, tabla)
+    if not existia_resumen:
+        reconstruir_resumenes(conn)
 
     # Insertar usuarios iniciales si no existen
     usuarios_iniciales = [
@@ -107,73 +410,134 @@ def init_database():
         ("kar1", "KAREN", "😊", "#F59E0B", 50),
     ]
 
-    for uid, nombre, avatar, color, meta in usuarios_iniciales:
-        cursor.execute("""
-            INSERT OR IGNORE INTO usuarios (id, nombre, avatar, color, meta_diaria)
-            VALUES (?, ?, ?, ?, ?)
-        """, (uid, nombre, avatar, color, meta))
+    cursor.executemany("""
+        INSERT OR IGNORE INTO usuarios (id, nombre, avatar, color, meta_diaria)
+        VALUES (?, ?, ?, ?, ?)
+    """, usuarios_iniciales)
+
+
+def _agregar_columna(cursor: sqlite3.Cursor, tabla: str, columna: str, definicion: str):
+    """Agrega una columna si la tabla aún no la tiene"""
+    columnas = {row['name'] for row in cursor.execute(f"PRAGMA table_info({tabla})")}
+    if columna not in columnas:
+        cursor.execute(f"ALTER TABLE {tabla} ADD COLUMN {columna} {definicion}")
+
+def _sql_sumar_resumen(tabla: str, fila: str) -> str:
+    """UPSERT que suma la ronda `fila` (NEW/OLD) al resumen de su día y usuario"""
+    contadores = CONTADORES_RESUMEN[tabla]
+    columnas = ", ".join(contadores)
+    valores = ", ".join(expr.format(fila=fila) for expr in contadores.values())
+    sumas = ", ".join(f"{col} = {col} + excluded.{col}" for col in contadores)
+    return f"""
+        INSERT INTO resumen_usuario_dia (fecha, usuario_id, usuario_nombre, {columnas})
+        SELECT {fila}.fecha, {fila}.usuario_id, {fila}.usuario_nombre, {valores}
+        WHERE {fila}.eliminado = 0
+        ON CONFLICT(fecha, usuario_id) DO UPDATE SET
+            usuario_nombre = COALESCE(excluded.usuario_nombre, usuario_nombre), {sumas};
+    """
 
-    conn.commit()
-    conn.close()
-    logger.info(f"📦 Base de datos inicializada en {DB_PATH}")
+def _sql_restar_resumen(tabla: str, fila: str) -> str:
+    """UPDATE que descuenta la ronda `fila` (OLD) del resumen de su día y usuario"""
+    restas = ", ".join(
+        f"{col} = {col} - {expr.format(fila=fila)}" for col, expr in CONTADORES_RESUMEN[tabla].items()
+    )
+    return f"""
+        UPDATE resumen_usuario_dia SET {restas}
+        WHERE fecha = {fila}.fecha AND usuario_id = {fila}.usuario_id AND {fila}.eliminado = 0;
+    """
+
+def _crear_triggers_resumen(cursor: sqlite3.Cursor, tabla: str):
+    """Triggers que mantienen resumen_usuario_dia al insertar, actualizar o borrar rondas"""
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_{tabla}_resumen_insert AFTER INSERT ON {tabla}
+        BEGIN {_sql_sumar_resumen(tabla, 'NEW')} END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_{tabla}_resumen_update AFTER UPDATE ON {tabla}
+        BEGIN {_sql_restar_resumen(tabla, 'OLD')} {_sql_sumar_resumen(tabla, 'NEW')} END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_{tabla}_resumen_delete AFTER DELETE ON {tabla}
+        BEGIN {_sql_restar_resumen(tabla, 'OLD')} END
+    """)
+
+def reconstruir_resumenes(conn: sqlite3.Connection = None):
+    """Recalcula resumen_usuario_dia desde las rondas (migración o reparación)"""
+    if conn is None:
+        with get_pool().transaccion() as conn:
+            return reconstruir_resumenes(conn)
+
+    conn.execute("DELETE FROM resumen_usuario_dia")
+    for tabla, contadores in CONTADORES_RESUMEN.items():
+        columnas = ", ".join(contadores)
+        sumas = ", ".join(
+            "COUNT(*)" if expr == '1' else f"SUM({expr.format(fila=tabla)})"
+            for expr in contadores.values()
+        )
+        asignaciones = ", ".join(f"{col} = excluded.{col}" for col in contadores)
+        conn.execute(f"""
+            INSERT INTO resumen_usuario_dia (fecha, usuario_id, usuario_nombre, {columnas})
+            SELECT fecha, usuario_id, MAX(usuario_nombre), {sumas}
+            FROM {tabla} WHERE eliminado = 0
+            GROUP BY fecha, usuario_id
+            ON CONFLICT(fecha, usuario_id) DO UPDATE SET {asignaciones}
+        """)
+
+def _nueva_version(conn: sqlite3.Connection) -> int:
+    """
+    Reserva la siguiente versión de cambios.
+
+    Debe llamarse dentro de la transacción de escritura: el UPDATE toma el
+    lock de escritura, así las versiones quedan en el mismo orden que los commits.
+    """
+    conn.execute("UPDATE sync_estado SET version = version + 1 WHERE id = 1")
+    return conn.execute("SELECT version FROM sync_estado WHERE id = 1").fetchone()[0]
+
+def get_version_actual() -> int:
+    """Obtiene la última versión de cambios confirmada"""
+    with get_pool().conexion() as conn:
+        return conn.execute("SELECT version FROM sync_estado WHERE id = 1").fetchone()[0]
 
 # ==================== USUARIOS ====================
 
 def get_usuarios(activos_only: bool = True) -> List[Dict]:
     """Obtiene todos los usuarios"""
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    if activos_only:
-        cursor.execute("SELECT * FROM usuarios WHERE activo = 1")
-    else:
-        cursor.execute("SELECT * FROM usuarios")
-
-    rows = cursor.fetchall()
-    conn.close()
+    with get_pool().conexion() as conn:
+        if activos_only:
+            rows = conn.execute("SELECT * FROM usuarios WHERE activo = 1").fetchall()
+        else:
+            rows = conn.execute("SELECT * FROM usuarios").fetchall()
 
     return [dict(row) for row in rows]
 
+def _get_usuario(conn: sqlite3.Connection, usuario_id: str) -> Optional[Dict]:
+    row = conn.execute("SELECT * FROM usuarios WHERE id = ?", (usuario_id,)).fetchone()
+    return dict(row) if row else None
+
 def get_usuario(usuario_id: str) -> Optional[Dict]:
     """Obtiene un usuario por ID"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM usuarios WHERE id = ?", (usuario_id,))
-    row = cursor.fetchone()
-    conn.close()
-    return dict(row) if row else None
+    with get_pool().conexion() as conn:
+        return _get_usuario(conn, usuario_id)
+
+def _valores_usuario_sync(u: Dict, version: int) -> tuple:
+    # Clientes anteriores al protocolo de versiones no envían `version`:
+    # su escritura se aplica siempre, como antes
+    return (
+        u['id'], u.get('nombre', 'Usuario'), u.get('avatar', '😊'),
+        u.get('color', '#F59E0B'), u.get('meta_diaria', 50), int(u.get('activo', True)),
+        version, u['version'] if 'version' in u else version
+    )
 
 def crear_usuario(id: str, nombre: str, avatar: str = "😊", color: str = "#F59E0B",
                   meta_diaria: int = 50, password_hash: str = None) -> Dict:
     """Crea o actualiza un usuario"""
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    # Verificar si existe
-    cursor.execute("SELECT id FROM usuarios WHERE id = ?", (id,))
-    existe = cursor.fetchone()
-
-    if existe:
-        cursor.execute("""
-            UPDATE usuarios SET nombre=?, avatar=?, color=?, meta_diaria=?, activo=1
-            WHERE id=?
-        """, (nombre, avatar, color, meta_diaria, id))
-    else:
-        cursor.execute("""
-            INSERT INTO usuarios (id, nombre, avatar, color, meta_diaria, password_hash)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, (id, nombre, avatar, color, meta_diaria, password_hash))
-
-    conn.commit()
-    conn.close()
-
-    return get_usuario(id)
+    with get_pool().transaccion() as conn:
+        version = _nueva_version(conn)
+        conn.execute(SQL_UPSERT_USUARIO, (id, nombre, avatar, color, meta_diaria, password_hash, version))
+        return _get_usuario(conn, id)
 
 def actualizar_usuario(usuario_id: str, datos: Dict) -> Optional[Dict]:
     """Actualiza un usuario"""
-    conn = get_connection()
-    cursor = conn.cursor()
-
     campos = []
     valores = []
     for campo, valor in datos.items():
@@ -181,31 +545,27 @@ def actualizar_usuario(usuario_id: str, datos: Dict) -> Optional[Dict]:
             campos.append(f"{campo}=?")
             valores.append(valor)
 
-    if campos:
-        valores.append(usuario_id)
-        cursor.execute(f"UPDATE usuarios SET {', '.join(campos)} WHERE id=?", valores)
-        conn.commit()
-
-    conn.close()
-    return get_usuario(usuario_id)
+    with get_pool().transaccion() as conn:
+        if campos:
+            campos.append("version=?")
+            valores.extend([_nueva_version(conn), usuario_id])
+            conn.execute(f"UPDATE usuarios SET {', '.join(campos)} WHERE id=?", valores)
+        return _get_usuario(conn, usuario_id)
 
 def eliminar_usuario(usuario_id: str) -> bool:
     """Desactiva un usuario (soft delete)"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("UPDATE usuarios SET activo = 0 WHERE id = ?", (usuario_id,))
-    conn.commit()
-    affected = cursor.rowcount
-    conn.close()
-    return affected > 0
+    with get_pool().transaccion() as conn:
+        cursor = conn.execute(
+            "UPDATE usuarios SET activo = 0, version = ? WHERE id = ?", (_nueva_version(conn), usuario_id)
+        )
+        return cursor.rowcount > 0
 
 def verificar_password(usuario_id: str, password_hash: str) -> bool:
     """Verifica la contraseña de un usuario"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT password_hash FROM usuarios WHERE id = ? AND activo = 1", (usuario_id,))
-    row = cursor.fetchone()
-    conn.close()
+    with get_pool().conexion() as conn:
+        row = conn.execute(
+            "SELECT password_hash FROM usuarios WHERE id = ? AND activo = 1", (usuario_id,)
+        ).fetchone()
 
     if row and row['password_hash']:
         return row['password_hash'] == password_hash
@@ -213,37 +573,27 @@ def verificar_password(usuario_id: str, password_hash: str) -> bool:
 
 # ==================== RONDAS GUÍAS ====================
 
-def crear_ronda_guias(data: Dict) -> Dict:
-    """Crea una ronda de guías"""
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    cursor.execute("""
-        INSERT INTO rondas_guias (
-            id, usuario_id, usuario_nombre, numero, fecha, hora_inicio, hora_fin,
-            tiempo_usado, pedidos_iniciales, realizado, cancelado, agendado,
-            dificiles, pendientes, revisado
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, (
+def _valores_ronda_guias(data: Dict) -> tuple:
+    return (
         data.get('id'), data.get('usuario_id'), data.get('usuario_nombre'),
         data.get('numero'), data.get('fecha'), data.get('hora_inicio'),
         data.get('hora_fin'), data.get('tiempo_usado', 0),
         data.get('pedidos_iniciales', 0), data.get('realizado', 0),
         data.get('cancelado', 0), data.get('agendado', 0),
         data.get('dificiles', 0), data.get('pendientes', 0), data.get('revisado', 0)
-    ))
+    )
 
-    conn.commit()
-    conn.close()
+def crear_ronda_guias(data: Dict) -> Dict:
+    """Crea una ronda de guías"""
+    with get_pool().transaccion() as conn:
+        version = _nueva_version(conn)
+        conn.execute(SQL_INSERT_RONDA_GUIAS, _valores_ronda_guias(data) + (0, version))
 
-    return {**data, 'tipo': 'guias'}
+    return {**data, 'tipo': 'guias', 'version': version}
 
 def get_rondas_guias(fecha: str = None, usuario_id: str = None) -> List[Dict]:
     """Obtiene rondas de guías con filtros"""
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    query = "SELECT *, 'guias' as tipo FROM rondas_guias WHERE 1=1"
+    query = "SELECT *, 'guias' as tipo FROM rondas_guias WHERE eliminado = 0"
     params = []
 
     if fecha:
@@ -254,45 +604,34 @@ def get_rondas_guias(fecha: str = None, usuario_id: str = None) -> List[Dict]:
         params.append(usuario_id)
 
     query += " ORDER BY hora_inicio"
-    cursor.execute(query, params)
-    rows = cursor.fetchall()
-    conn.close()
+    with get_pool().conexion() as conn:
+        rows = conn.execute(query, params).fetchall()
 
     return [dict(row) for row in rows]
 
 # ==================== RONDAS NOVEDADES ====================
 
-def crear_ronda_novedades(data: Dict) -> Dict:
-    """Crea una ronda de novedades"""
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    cursor.execute("""
-        INSERT INTO rondas_novedades (
-            id, usuario_id, usuario_nombre, numero, fecha, hora_inicio, hora_fin,
-            tiempo_usado, revisadas, solucionadas, devolucion, cliente,
-            transportadora, litper
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, (
+def _valores_ronda_novedades(data: Dict) -> tuple:
+    return (
         data.get('id'), data.get('usuario_id'), data.get('usuario_nombre'),
         data.get('numero'), data.get('fecha'), data.get('hora_inicio'),
         data.get('hora_fin'), data.get('tiempo_usado', 0),
         data.get('revisadas', 0), data.get('solucionadas', 0),
         data.get('devolucion', 0), data.get('cliente', 0),
         data.get('transportadora', 0), data.get('litper', 0)
-    ))
+    )
 
-    conn.commit()
-    conn.close()
+def crear_ronda_novedades(data: Dict) -> Dict:
+    """Crea una ronda de novedades"""
+    with get_pool().transaccion() as conn:
+        version = _nueva_version(conn)
+        conn.execute(SQL_INSERT_RONDA_NOVEDADES, _valores_ronda_novedades(data) + (0, version))
 
-    return {**data, 'tipo': 'novedades'}
+    return {**data, 'tipo': 'novedades', 'version': version}
 
 def get_rondas_novedades(fecha: str = None, usuario_id: str = None) -> List[Dict]:
     """Obtiene rondas de novedades con filtros"""
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    query = "SELECT *, 'novedades' as tipo FROM rondas_novedades WHERE 1=1"
+    query = "SELECT *, 'novedades' as tipo FROM rondas_novedades WHERE eliminado = 0"
     params = []
 
     if fecha:
@@ -303,12 +642,131 @@ def get_rondas_novedades(fecha: str = None, usuario_id: str = None) -> List[Dict
         params.append(usuario_id)
 
     query += " ORDER BY hora_inicio"
-    cursor.execute(query, params)
-    rows = cursor.fetchall()
-    conn.close()
+    with get_pool().conexion() as conn:
+        rows = conn.execute(query, params).fetchall()
 
     return [dict(row) for row in rows]
 
+# ==================== ELIMINACIÓN DE RONDAS ====================
+
+def eliminar_ronda(tipo: str, ronda_id: str) -> bool:
+    """Marca una ronda como eliminada, dejando un tombstone para la sincronización"""
+    tabla = TABLAS_RONDAS.get(tipo)
+    if not tabla:
+        return False
+
+    with get_pool().transaccion() as conn:
+        cursor = conn.execute(
+            f"UPDATE {tabla} SET eliminado = 1, version = ? WHERE id = ? AND eliminado = 0",
+            (_nueva_version(conn), ronda_id)
+        )
+        return cursor.rowcount > 0
+
+# ==================== SINCRONIZACIÓN ====================
+
+def _filas_en_conflicto(conn: sqlite3.Connection, tabla: str, ids: List[str], version: int) -> List[Dict]:
+    """Filas enviadas que el servidor no aplicó porque ya tenía una versión más nueva"""
+    if not ids:
+        return []
+    marcas = ", ".join("?" * len(ids))
+    rows = conn.execute(
+        f"SELECT * FROM {tabla} WHERE id IN ({marcas}) AND version <> ?", (*ids, version)
+    ).fetchall()
+    return [dict(row) for row in rows]
+
+def sincronizar_lote(usuarios: List[Dict] = None, rondas: List[Dict] = None) -> Dict[str, Any]:
+    """
+    Guarda en una sola transacción los usuarios y rondas enviados por un cliente.
+
+    Todas las filas del lote reciben la misma versión nueva. Cada fila puede
+    traer la `version` que el cliente conocía: si el servidor ya tiene una
+    posterior, gana la del servidor (last-writer-wins) y se devuelve en
+    `conflictos` para que el cliente la adopte. Una ronda sin `version` solo
+    se inserta si es nueva, así reenviar un lote es idempotente.
+    """
+    usuarios = [u for u in (usuarios or []) if u.get('id')]
+    rondas_por_tipo = {
+        tipo: [r for r in (rondas or []) if r.get('tipo') == tipo]
+        for tipo in TABLAS_RONDAS
+    }
+
+    conflictos = []
+    with get_pool().transaccion() as conn:
+        version = _nueva_version(conn)
+
+        if usuarios:
+            conn.executemany(SQL_SYNC_USUARIO, [_valores_usuario_sync(u, version) for u in usuarios])
+            conflictos += [
+                {**u, 'tipo': 'usuario'}
+                for u in _filas_en_conflicto(conn, 'usuarios', [u['id'] for u in usuarios if 'version' in u], version)
+            ]
+
+        for tipo, sql, valores in (
+            ('guias', SQL_SYNC_RONDA_GUIAS, _valores_ronda_guias),
+            ('novedades', SQL_SYNC_RONDA_NOVEDADES, _valores_ronda_novedades),
+        ):
+            filas = rondas_por_tipo[tipo]
+            if not filas:
+                continue
+            conn.executemany(sql, [
+                valores(r) + (int(bool(r.get('eliminado'))), version, r.get('version') or 0)
+                for r in filas
+            ])
+            conflictos += [
+                {**r, 'tipo': tipo}
+                for r in _filas_en_conflicto(conn, TABLAS_RONDAS[tipo], [r['id'] for r in filas if 'version' in r], version)
+            ]
+
+    return {
+        'version': version,
+        'usuarios': len(usuarios),
+        'rondas_guias': len(rondas_por_tipo['guias']),
+        'rondas_novedades': len(rondas_por_tipo['novedades']),
+        'conflictos': conflictos,
+    }
+
+def obtener_cambios(desde_version: int, fecha: str = None) -> Dict[str, Any]:
+    """
+    Obtiene los usuarios y rondas modificados después de `desde_version`.
+
+    Los usuarios desactivados y las rondas eliminadas se devuelven como
+    tombstones en `eliminados`. La versión se lee antes que las filas, así un
+    commit concurrente a lo sumo se entrega dos veces, nunca se pierde.
+    """
+    filtro_fecha = " AND fecha = ?" if fecha else ""
+    params = (desde_version, fecha) if fecha else (desde_version,)
+
+    with get_pool().conexion() as conn:
+        version = conn.execute("SELECT version FROM sync_estado WHERE id = 1").fetchone()[0]
+        filas_usuarios = conn.execute(
+            "SELECT * FROM usuarios WHERE version > ? ORDER BY version", (desde_version,)
+        ).fetchall()
+        filas_rondas = []
+        for tipo, tabla in TABLAS_RONDAS.items():
+            filas_rondas += conn.execute(
+                f"SELECT *, '{tipo}' as tipo FROM {tabla} WHERE version > ?{filtro_fecha} ORDER BY version",
+                params
+            ).fetchall()
+
+    usuarios, rondas, eliminados = [], [], []
+    for row in filas_usuarios:
+        if row['activo']:
+            usuarios.append(dict(row))
+        else:
+            eliminados.append({'tipo': 'usuario', 'id': row['id'], 'version': row['version']})
+    for row in filas_rondas:
+        if row['eliminado']:
+            eliminados.append({'tipo': row['tipo'], 'id': row['id'], 'version': row['version']})
+        else:
+            rondas.append(dict(row))
+
+    return {
+        'version': max(version, desde_version),
+        'usuarios': usuarios,
+        'rondas': rondas,
+        'eliminados': eliminados,
+    }
+
 # ==================== TODAS LAS RONDAS ====================
 
 def get_todas_rondas(fecha: str = None, usuario_id: str = None) -> List[Dict]:
@@ -322,13 +780,10 @@ def get_todas_rondas(fecha: str = None, usuario_id: str = None) -> List[Dict]:
 
 def get_historial_rondas(usuario_id: str = None, dias: int = 30) -> List[Dict]:
     """Obtiene historial de rondas de los últimos N días"""
-    conn = get_connection()
-    cursor = conn.cursor()
-
     # Guías
     query_guias = """
         SELECT *, 'guias' as tipo FROM rondas_guias
-        WHERE fecha >= date('now', ?)
+        WHERE fecha >= date('now', ?) AND eliminado = 0
     """
     params_guias = [f'-{dias} days']
 
@@ -336,13 +791,10 @@ def get_historial_rondas(usuario_id: str = None, dias: int = 30) -> List[Dict]:
         query_guias += " AND usuario_id = ?"
         params_guias.append(usuario_id)
 
-    cursor.execute(query_guias, params_guias)
-    guias = [dict(row) for row in cursor.fetchall()]
-
     # Novedades
     query_novedades = """
         SELECT *, 'novedades' as tipo FROM rondas_novedades
-        WHERE fecha >= date('now', ?)
+        WHERE fecha >= date('now', ?) AND eliminado = 0
     """
     params_novedades = [f'-{dias} days']
 
@@ -350,10 +802,9 @@ def get_historial_rondas(usuario_id: str = None, dias: int = 30) -> List[Dict]:
         query_novedades += " AND usuario_id = ?"
         params_novedades.append(usuario_id)
 
-    cursor.execute(query_novedades, params_novedades)
-    novedades = [dict(row) for row in cursor.fetchall()]
-
-    conn.close()
+    with get_pool().conexion() as conn:
+        guias = [dict(row) for row in conn.execute(query_guias, params_guias).fetchall()]
+        novedades = [dict(row) for row in conn.execute(query_novedades, params_novedades).fetchall()]
 
     todas = guias + novedades
     todas.sort(key=lambda x: (x.get('fecha', ''), x.get('hora_inicio', '')), reverse=True)
@@ -363,71 +814,51 @@ def get_historial_rondas(usuario_id: str = None, dias: int = 30) -> List[Dict]:
 
 def get_estadisticas_usuario(usuario_id: str, fecha: str = None) -> Dict:
     """Obtiene estadísticas de un usuario"""
-    conn = get_connection()
-    cursor = conn.cursor()
-
     fecha_filtro = fecha or date.today().isoformat()
 
-    # Guías del día
-    cursor.execute("""
-        SELECT COUNT(*) as rondas, SUM(realizado) as total_realizado,
-               SUM(cancelado) as total_cancelado, SUM(tiempo_usado) as tiempo_total
-        FROM rondas_guias WHERE usuario_id = ? AND fecha = ?
-    """, (usuario_id, fecha_filtro))
-    guias = dict(cursor.fetchone())
-
-    # Novedades del día
-    cursor.execute("""
-        SELECT COUNT(*) as rondas, SUM(solucionadas) as total_solucionadas,
-               SUM(tiempo_usado) as tiempo_total
-        FROM rondas_novedades WHERE usuario_id = ? AND fecha = ?
-    """, (usuario_id, fecha_filtro))
-    novedades = dict(cursor.fetchone())
-
-    conn.close()
+    with get_pool().conexion() as conn:
+        row = conn.execute("""
+            SELECT * FROM resumen_usuario_dia WHERE fecha = ? AND usuario_id = ?
+        """, (fecha_filtro, usuario_id)).fetchone()
+    resumen = dict(row) if row else {}
 
     return {
         'usuario_id': usuario_id,
         'fecha': fecha_filtro,
         'guias': {
-            'rondas': guias['rondas'] or 0,
-            'realizado': guias['total_realizado'] or 0,
-            'cancelado': guias['total_cancelado'] or 0,
-            'tiempo': guias['tiempo_total'] or 0,
+            'rondas': resumen.get('rondas_guias', 0),
+            'realizado': resumen.get('realizado', 0),
+            'cancelado': resumen.get('cancelado', 0),
+            'tiempo': resumen.get('tiempo_guias', 0),
         },
         'novedades': {
-            'rondas': novedades['rondas'] or 0,
-            'solucionadas': novedades['total_solucionadas'] or 0,
-            'tiempo': novedades['tiempo_total'] or 0,
+            'rondas': resumen.get('rondas_novedades', 0),
+            'solucionadas': resumen.get('solucionadas', 0),
+            'tiempo': resumen.get('tiempo_novedades', 0),
         }
     }
 
 def get_ranking(fecha: str = None, tipo: str = 'guias') -> List[Dict]:
     """Obtiene ranking de usuarios por tipo de proceso"""
-    conn = get_connection()
-    cursor = conn.cursor()
-
     fecha_filtro = fecha or date.today().isoformat()
 
     if tipo == 'guias':
-        cursor.execute("""
-            SELECT usuario_id, usuario_nombre, COUNT(*) as rondas,
-                   SUM(realizado) as total, SUM(tiempo_usado) as tiempo
-            FROM rondas_guias WHERE fecha = ?
-            GROUP BY usuario_id
+        query = """
+            SELECT usuario_id, usuario_nombre, rondas_guias as rondas,
+                   realizado as total, tiempo_guias as tiempo
+            FROM resumen_usuario_dia WHERE fecha = ? AND rondas_guias > 0
             ORDER BY total DESC
-        """, (fecha_filtro,))
+        """
     else:
-        cursor.execute("""
-            SELECT usuario_id, usuario_nombre, COUNT(*) as rondas,
-                   SUM(solucionadas) as total, SUM(tiempo_usado) as tiempo
-            FROM rondas_novedades WHERE fecha = ?
-            GROUP BY usuario_id
+        query = """
+            SELECT usuario_id, usuario_nombre, rondas_novedades as rondas,
+                   solucionadas as total, tiempo_novedades as tiempo
+            FROM resumen_usuario_dia WHERE fecha = ? AND rondas_novedades > 0
             ORDER BY total DESC
-        """, (fecha_filtro,))
+        """
 
-    rows = cursor.fetchall()
-    conn.close()
+    with get_pool().conexion() as conn:
+        rows = conn.execute(query, (fecha_filtro,)).fetchall()
 
     ranking = []
     for i, row in enumerate(rows):
@@ -444,51 +875,69 @@ def get_ranking(fecha: str = None, tipo: str = 'guias') -> List[Dict]:
 
 def get_resumen_dia(fecha: str = None) -> Dict:
     """Obtiene resumen del día"""
-    conn = get_connection()
-    cursor = conn.cursor()
-
     fecha_filtro = fecha or date.today().isoformat()
 
-    # Total guías
-    cursor.execute("""
-        SELECT COUNT(*) as rondas, SUM(realizado) as total, SUM(cancelado) as cancelados
-        FROM rondas_guias WHERE fecha = ?
-    """, (fecha_filtro,))
-    guias = dict(cursor.fetchone())
-
-    # Total novedades
-    cursor.execute("""
-        SELECT COUNT(*) as rondas, SUM(solucionadas) as total
-        FROM rondas_novedades WHERE fecha = ?
-    """, (fecha_filtro,))
-    novedades = dict(cursor.fetchone())
-
-    # Usuarios activos
-    cursor.execute("""
-        SELECT COUNT(DISTINCT usuario_id) as usuarios
-        FROM (
-            SELECT usuario_id FROM rondas_guias WHERE fecha = ?
-            UNION
-            SELECT usuario_id FROM rondas_novedades WHERE fecha = ?
-        )
-    """, (fecha_filtro, fecha_filtro))
-    usuarios = cursor.fetchone()['usuarios']
-
-    conn.close()
+    with get_pool().conexion() as conn:
+        totales = dict(conn.execute("""
+            SELECT SUM(rondas_guias > 0 OR rondas_novedades > 0) as usuarios,
+                   SUM(rondas_guias) as rondas_guias, SUM(realizado) as realizado,
+                   SUM(cancelado) as cancelado, SUM(rondas_novedades) as rondas_novedades,
+                   SUM(solucionadas) as solucionadas
+            FROM resumen_usuario_dia WHERE fecha = ?
+        """, (fecha_filtro,)).fetchone())
 
     return {
         'fecha': fecha_filtro,
-        'usuarios_activos': usuarios or 0,
+        'usuarios_activos': totales['usuarios'] or 0,
         'guias': {
-            'rondas': guias['rondas'] or 0,
-            'realizado': guias['total'] or 0,
-            'cancelado': guias['cancelados'] or 0,
+            'rondas': totales['rondas_guias'] or 0,
+            'realizado': totales['realizado'] or 0,
+            'cancelado': totales['cancelado'] or 0,
         },
         'novedades': {
-            'rondas': novedades['rondas'] or 0,
-            'solucionadas': novedades['total'] or 0,
+            'rondas': totales['rondas_novedades'] or 0,
+            'solucionadas': totales['solucionadas'] or 0,
         }
     }
 
-# Inicializar base de datos al importar
-init_database()
+# ==================== EXPORTACIÓN ====================
+
+def iterar_rondas_exportacion(fecha_inicio: str, fecha_fin: str = None,
+                              usuario_id: str = None) -> Iterator[tuple]:
+    """
+    Recorre las rondas de ambos tipos en orden de fecha, fila por fila.
+
+    Devuelve tuplas en el orden de COLUMNAS_EXPORTACION directamente del
+    cursor, sin cargar el rango completo en memoria.
+    """
+    filtros = ""
+    params = [fecha_inicio]
+    if fecha_fin:
+        filtros += " AND fecha <= ?"
+        params.append(fecha_fin)
+    if usuario_id:
+        filtros += " AND usuario_id = ?"
+        params.append(usuario_id)
+
+    def _select(tabla: str, tipo: str, ajenas: set) -> str:
+        campos = ", ".join(
+            f"'{tipo}'" if col == 'tipo' else ("NULL" if col in ajenas else col)
+            for col in COLUMNAS_EXPORTACION
+        )
+        return f"SELECT {campos} FROM {tabla} WHERE eliminado = 0 AND fecha >= ?{filtros}"
+
+    query = (
+        _select('rondas_guias', 'guias', set(CONTADORES_EXPORTACION_NOVEDADES))
+        + " UNION ALL "
+        + _select('rondas_novedades', 'novedades', set(CONTADORES_EXPORTACION_GUIAS))
+        + " ORDER BY fecha, hora_inicio"
+    )
+
+    with get_pool().conexion() as conn:
+        cursor = conn.execute(query, params * 2)
+        while True:
+            filas = cursor.fetchmany(500)
+            if not filas:
+                break
+            for fila in filas:
+                yield tuple(fila)
@@ -34,6 +34,8 @@ from dataclasses import dataclass, field
 from datetime import datetime
 from enum import Enum
 
+from services.outbound_dispatcher import OutboundDispatcher, is_transient_error, outbound_dispatcher, parse_retry_after
+
 
 class OrderStatus(str, Enum):
     """Estados posibles de un pedido en Dropi."""
@@ -192,12 +194,14 @@ class ChateaProClient:
                     return {
                         "success": False,
                         "status": response.status,
-                        "error": text
+                        "error": text,
+                        "retry_after": parse_retry_after(response.headers.get("Retry-After"))
                     }
         except Exception as e:
             return {
                 "success": False,
-                "error": str(e)
+                "error": str(e),
+                "transient": is_transient_error(e)
             }
 
     async def send_alert(
@@ -261,6 +265,29 @@ class ChateaProClient:
             }
         )
 
+    async def send_bulk_messages(
+        self,
+        messages: List[Dict[str, str]],
+        dispatcher: OutboundDispatcher = None
+    ) -> Dict[str, Any]:
+        """
+        Envia mensajes a muchos clientes en paralelo.
+
+        Usa el despachador compartido: concurrencia y tasa limitadas para
+        Chatea Pro, reintentos con backoff y estado por destinatario.
+
+        Args:
+            messages: Lista de {"phone", "message", "template" (opcional)}
+            dispatcher: Despachador a usar (por defecto el compartido)
+        """
+        async def send(item: Dict[str, str]) -> Dict[str, Any]:
+            return await self.send_message(item["phone"], item["message"], item.get("template"))
+
+        report = await (dispatcher or outbound_dispatcher).dispatch(
+            "chatea_pro", messages, send, recipient_id=lambda item: item["phone"]
+        )
+        return report.to_dict()
+
     async def send_order_update(
         self,
         order: Order,
@@ -8,35 +8,48 @@ Este modulo maneja los eventos que llegan desde:
 - Dropi (actualizaciones de estado via Chatea Pro)
 
 Cuando llega un evento, el handler:
-1. Valida el evento
-2. Lo clasifica por tipo
-3. Lo envia al Cerebro IA para analisis
-4. Ejecuta acciones automaticas si es necesario
-5. Guarda en el historial para analytics
+1. Valida la firma y descarta duplicados (clave de idempotencia)
+2. Lo clasifica por tipo y responde de inmediato
+3. Lo encola (cola acotada) para los workers
+4. Ejecuta los handlers registrados en paralelo, cada uno con su timeout
+5. Guarda en el historial (buffer circular + tabla) y actualiza contadores
 
 USO:
     from integrations import WebhookHandler
 
     handler = WebhookHandler()
 
-    # Procesar un evento entrante
+    # Aceptar un evento entrante (se procesa en segundo plano)
+    event, duplicate = handler.accept_event(event_data, source="n8n")
+
+    # Procesar un evento esperando el resultado
     result = await handler.process_event(event_data)
 
     # Obtener historial de eventos
-    history = handler.get_event_history(limit=100)
+    history = await handler.get_event_history(limit=100)
 """
 
 import os
 import json
 import hashlib
 import hmac
-from typing import Dict, Any, List, Optional, Callable
+from typing import Dict, Any, List, Optional, Callable, Tuple
 from dataclasses import dataclass, field
-from datetime import datetime
+from datetime import datetime, timedelta
 from enum import Enum
-from collections import deque
+from collections import Counter, OrderedDict, deque
 import asyncio
 
+from loguru import logger
+from sqlalchemy.exc import IntegrityError
+
+# Historial persistente (opcional)
+try:
+    from database import get_db_session, EventoWebhookEntrante
+    DB_AVAILABLE = True
+except ImportError:
+    DB_AVAILABLE = False
+
 
 class EventType(str, Enum):
     """Tipos de eventos que podemos recibir."""
@@ -90,10 +103,13 @@ class WebhookEvent:
     processed: bool = False
     result: Optional[Dict[str, Any]] = None
     error: Optional[str] = None
+    name: str = ""  # Nombre original del evento (p. ej. "order_status_changed")
+    idempotency_key: Optional[str] = None
 
     def to_dict(self) -> Dict[str, Any]:
         return {
             "id": self.id,
+            "event": self.name or self.type.value,
             "type": self.type.value,
             "data": self.data,
             "source": self.source,
@@ -105,25 +121,73 @@ class WebhookEvent:
         }
 
 
+class WebhookQueueFull(Exception):
+    """La cola de eventos entrantes está llena (el emisor debe reintentar)"""
+
+
+# Eventos que cuentan como criticos en el resumen de analytics
+ANALYTICS_CRITICAL_EVENTS = ("delay_detected", "issue_reported", "delivery_failed")
+
+ISSUE_TYPES = (
+    EventType.DELAY_DETECTED,
+    EventType.ISSUE_REPORTED,
+    EventType.DELIVERY_FAILED,
+    EventType.CUSTOMER_COMPLAINT
+)
+
+
 class WebhookHandler:
     """
     Manejador central de webhooks.
 
     Recibe eventos de Chatea Pro, N8N y otros servicios,
     los procesa y ejecuta acciones automaticas.
+
+    Los eventos aceptados van a una cola acotada que consumen varios workers;
+    los handlers de un evento corren en paralelo y aislados (timeout y errores
+    por handler). El historial reciente vive en un buffer circular y el
+    completo en la tabla eventos_webhook_entrantes.
     """
 
-    def __init__(self):
+    def __init__(
+        self,
+        queue_size: int = None,
+        workers: int = None,
+        handler_timeout: float = None,
+        history_size: int = 1000,
+        session_factory: Callable = None
+    ):
         self.secret = os.getenv("N8N_WEBHOOK_SECRET", "litper_webhook_secret_2024")
-        self._event_history: deque = deque(maxlen=1000)  # Ultimos 1000 eventos
-        self._handlers: Dict[EventType, List[Callable]] = {}
+        self.require_signature = os.getenv("N8N_WEBHOOK_REQUIRE_SIGNATURE", "false").lower() == "true"
+        self.queue_size = queue_size or int(os.getenv("WEBHOOK_INBOUND_QUEUE_SIZE", "1000"))
+        self.workers = workers or int(os.getenv("WEBHOOK_INBOUND_WORKERS", "4"))
+        self.handler_timeout = handler_timeout or float(os.getenv("WEBHOOK_HANDLER_TIMEOUT", "30"))
+        self.session_factory = session_factory or (get_db_session if DB_AVAILABLE else None)
+
+        self._event_history: deque = deque(maxlen=history_size)  # Ultimos N eventos
+        self._handlers: Dict[Optional[EventType], List[Callable]] = {}
+
+        # Idempotencia: claves vistas recientemente -> id del evento
+        self._seen_keys: "OrderedDict[str, str]" = OrderedDict()
+        self._seen_max = 10000
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker_tasks: List[asyncio.Task] = []
+
         self._stats = {
             "total_received": 0,
             "total_processed": 0,
             "total_errors": 0,
+            "total_duplicates": 0,
+            "total_rejected": 0,
+            "handler_timeouts": 0,
             "by_type": {},
             "by_source": {}
         }
+        # Contadores para analytics (se actualizan al aceptar cada evento)
+        self._by_event: Counter = Counter()
+        self._critical_count = 0
+        self._recent_critical: deque = deque(maxlen=10)
 
         # Registrar handlers por defecto
         self._register_default_handlers()
@@ -135,20 +199,31 @@ class WebhookHandler:
 
     def register_handler(
         self,
-        event_type: EventType,
+        event_type: Optional[EventType],
         handler: Callable
     ):
         """
         Registra un handler para un tipo de evento.
 
         Args:
-            event_type: Tipo de evento
+            event_type: Tipo de evento (None = todos los eventos)
             handler: Funcion async que procesa el evento
         """
         if event_type not in self._handlers:
             self._handlers[event_type] = []
         self._handlers[event_type].append(handler)
 
+    def check_signature(self, payload: bytes, signature: Optional[str]) -> bool:
+        """
+        Valida la firma de un request entrante.
+
+        Sin cabecera de firma se acepta salvo que
+        N8N_WEBHOOK_REQUIRE_SIGNATURE=true; con cabecera, debe coincidir.
+        """
+        if not signature:
+            return not self.require_signature
+        return self.verify_signature(payload, signature)
+
     def verify_signature(
         self,
         payload: bytes,
@@ -243,109 +318,353 @@ class WebhookHandler:
         import uuid
         return f"evt_{datetime.now().strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex[:8]}"
 
-    async def process_event(
+    def _build_event(
         self,
         raw_data: Dict[str, Any],
-        source: str = "webhook"
+        source: str,
+        idempotency_key: Optional[str] = None
     ) -> WebhookEvent:
+        event_type = self._classify_event(raw_data)
+        data = raw_data.get("data", raw_data)
+        return WebhookEvent(
+            id=self._generate_event_id(),
+            type=event_type,
+            data=data,
+            source=source,
+            priority=self._determine_priority(event_type, data),
+            timestamp=datetime.now(),
+            name=str(raw_data.get("event", raw_data.get("type", "")) or event_type.value),
+            idempotency_key=idempotency_key or raw_data.get("idempotency_key")
+        )
+
+    def _count(self, event: WebhookEvent):
+        """Actualiza los contadores incrementales al aceptar un evento"""
+        self._stats["total_received"] += 1
+        self._stats["by_type"][event.type.value] = \
+            self._stats["by_type"].get(event.type.value, 0) + 1
+        self._stats["by_source"][event.source] = \
+            self._stats["by_source"].get(event.source, 0) + 1
+
+        self._by_event[event.name] += 1
+        if event.name in ANALYTICS_CRITICAL_EVENTS:
+            self._critical_count += 1
+            self._recent_critical.appendleft(event)
+
+    def _remember_key(self, key: Optional[str], event_id: str) -> Optional[str]:
+        """Registra la clave de idempotencia; devuelve el id previo si ya se vio"""
+        if not key:
+            return None
+        if key in self._seen_keys:
+            self._seen_keys.move_to_end(key)
+            return self._seen_keys[key]
+        self._seen_keys[key] = event_id
+        if len(self._seen_keys) > self._seen_max:
+            self._seen_keys.popitem(last=False)
+        return None
+
+    def accept_event(
+        self,
+        raw_data: Dict[str, Any],
+        source: str = "webhook",
+        idempotency_key: Optional[str] = None
+    ) -> Tuple[WebhookEvent, bool]:
         """
-        Procesa un evento entrante.
+        Acepta un evento entrante y lo encola para procesarlo en segundo plano.
+
+        Debe llamarse desde el event loop (arranca los workers si hace falta).
 
         Args:
             raw_data: Datos del evento
             source: Fuente del evento (chatea_pro, n8n, etc)
+            idempotency_key: Clave de idempotencia del emisor
 
         Returns:
-            WebhookEvent procesado
+            (evento, duplicado). Si es duplicado no se encola de nuevo y el
+            id es el del evento original.
+
+        Raises:
+            WebhookQueueFull: La cola está llena
         """
-        self._stats["total_received"] += 1
+        self._ensure_workers()
+        event = self._build_event(raw_data, source, idempotency_key)
 
-        # Clasificar evento
-        event_type = self._classify_event(raw_data)
-        data = raw_data.get("data", raw_data)
-        priority = self._determine_priority(event_type, data)
+        previous_id = self._remember_key(event.idempotency_key, event.id)
+        if previous_id:
+            self._stats["total_duplicates"] += 1
+            event.id = previous_id
+            return event, True
 
-        # Crear objeto evento
-        event = WebhookEvent(
-            id=self._generate_event_id(),
-            type=event_type,
-            data=data,
-            source=source,
-            priority=priority,
-            timestamp=datetime.now()
-        )
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self._seen_keys.pop(event.idempotency_key, None)
+            self._stats["total_rejected"] += 1
+            raise WebhookQueueFull(f"Cola de webhooks llena ({self.queue_size})")
+
+        self._count(event)
+        self._event_history.append(event)
+        return event, False
+
+    def accept_events(
+        self,
+        items: List[Tuple[Dict[str, Any], str, Optional[str]]]
+    ) -> List[Tuple[WebhookEvent, bool]]:
+        """
+        Acepta un lote de eventos: se encolan todos o ninguno.
 
-        # Actualizar stats
-        self._stats["by_type"][event_type.value] = \
-            self._stats["by_type"].get(event_type.value, 0) + 1
-        self._stats["by_source"][source] = \
-            self._stats["by_source"].get(source, 0) + 1
+        Así un 503 por cola llena nunca deja el lote a medias y el reintento
+        del emisor no duplica los que sí habían entrado.
 
+        Args:
+            items: Tuplas (raw_data, source, idempotency_key)
+
+        Returns:
+            (evento, duplicado) por cada item, en el mismo orden
+
+        Raises:
+            WebhookQueueFull: El lote no cabe entero en la cola
+        """
+        self._ensure_workers()
+        free = self._queue.maxsize - self._queue.qsize()
+        if len(items) > free:
+            self._stats["total_rejected"] += len(items)
+            raise WebhookQueueFull(f"Cola de webhooks sin espacio para {len(items)} eventos ({free} libres)")
+
+        # Sin awaits de por medio: nada más puede ocupar la cola entre la
+        # comprobación y los put_nowait
+        return [self.accept_event(raw, source, key) for raw, source, key in items]
+
+    async def process_event(
+        self,
+        raw_data: Dict[str, Any],
+        source: str = "webhook"
+    ) -> WebhookEvent:
+        """
+        Procesa un evento entrante esperando a sus handlers.
+
+        Args:
+            raw_data: Datos del evento
+            source: Fuente del evento (chatea_pro, n8n, etc)
+
+        Returns:
+            WebhookEvent procesado
+        """
+        event = self._build_event(raw_data, source)
+        self._count(event)
+        self._event_history.append(event)
+        await self._handle(event)
+        return event
+
+    async def _run_handler(self, handler: Callable, event: WebhookEvent) -> Any:
+        """Ejecuta un handler aislado: su timeout o su error no afectan a los demás"""
+        name = getattr(handler, "__name__", repr(handler))
         try:
-            # Ejecutar handlers registrados
-            handlers = self._handlers.get(event_type, [])
-            results = []
+            return await asyncio.wait_for(handler(event), timeout=self.handler_timeout)
+        except asyncio.TimeoutError:
+            self._stats["handler_timeouts"] += 1
+            logger.warning(f"Handler {name} excedió {self.handler_timeout}s con {event.id}")
+            return {"handler": name, "error": "timeout"}
+        except Exception as e:
+            logger.error(f"Handler {name} falló con {event.id}: {e}")
+            return {"handler": name, "error": str(e)}
+
+    async def _handle(self, event: WebhookEvent):
+        """Ejecuta en paralelo los handlers del tipo y los globales, y persiste el evento"""
+        if await self._already_persisted(event):
+            # Reenvío tras un reinicio o recibido por otra instancia: ya se procesó
+            self._stats["total_duplicates"] += 1
+            event.processed = True
+            event.result = {"handlers_executed": 0, "duplicate": True}
+            logger.info(f"Evento {event.id} duplicado (clave {event.idempotency_key}), no se procesa")
+            return
 
-            for handler in handlers:
-                try:
-                    result = await handler(event)
-                    results.append(result)
-                except Exception as e:
-                    results.append({"error": str(e)})
+        handlers = self._handlers.get(event.type, []) + self._handlers.get(None, [])
 
+        try:
+            results = list(await asyncio.gather(*(
+                self._run_handler(handler, event) for handler in handlers
+            )))
             event.processed = True
             event.result = {
                 "handlers_executed": len(handlers),
                 "results": results
             }
             self._stats["total_processed"] += 1
-
+            if any(isinstance(r, dict) and "error" in r for r in results):
+                self._stats["total_errors"] += 1
         except Exception as e:
             event.error = str(e)
             self._stats["total_errors"] += 1
 
-        # Guardar en historial
-        self._event_history.append(event)
-
-        return event
-
-    def get_event_history(
+        if self.session_factory is not None:
+            try:
+                await asyncio.to_thread(self._persist, event)
+            except IntegrityError:
+                # La clave de idempotencia ya estaba guardada (reenvío tras un reinicio)
+                self._stats["total_duplicates"] += 1
+                logger.info(f"Evento {event.id} duplicado (clave {event.idempotency_key}), no se guarda")
+            except Exception as e:
+                # Fallo puntual: este evento queda solo en memoria, los siguientes se reintentan
+                logger.warning(f"No se pudo guardar el evento {event.id} en el historial: {e}")
+
+    async def _already_persisted(self, event: WebhookEvent) -> bool:
+        """La clave de idempotencia ya está en eventos_webhook_entrantes"""
+        if self.session_factory is None or not event.idempotency_key:
+            return False
+        try:
+            return await asyncio.to_thread(self._key_exists, event.idempotency_key)
+        except Exception as e:
+            # Sin BD no se puede saber: se procesa (la memoria ya filtró lo reciente)
+            logger.warning(f"No se pudo consultar la clave {event.idempotency_key}: {e}")
+            return False
+
+    def _key_exists(self, key: str) -> bool:
+        with self.session_factory() as session:
+            return session.query(EventoWebhookEntrante.id).filter(
+                EventoWebhookEntrante.clave_idempotencia == key
+            ).first() is not None
+
+    def _persist(self, event: WebhookEvent):
+        with self.session_factory() as session:
+            session.merge(EventoWebhookEntrante(
+                id=event.id,
+                clave_idempotencia=event.idempotency_key,
+                evento=event.name,
+                tipo=event.type.value,
+                fuente=event.source,
+                prioridad=event.priority.value,
+                datos=event.data,
+                procesado=event.processed,
+                resultado=json.loads(json.dumps(event.result, default=str)) if event.result else None,
+                error=event.error,
+                fecha=event.timestamp
+            ))
+
+    # === Cola y workers ===
+
+    def _ensure_workers(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._worker_tasks = [t for t in self._worker_tasks if not t.done()]
+        while len(self._worker_tasks) < self.workers:
+            self._worker_tasks.append(asyncio.create_task(self._worker()))
+
+    async def _worker(self):
+        while True:
+            event = await self._queue.get()
+            try:
+                await self._handle(event)
+            except Exception as e:
+                logger.error(f"Error procesando evento {event.id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def drain(self):
+        """Espera a que la cola se vacíe"""
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def close(self, timeout: float = 10.0):
+        """Procesa lo pendiente (con límite de tiempo) y detiene los workers"""
+        if self._queue is not None and self._worker_tasks:
+            try:
+                await asyncio.wait_for(self.drain(), timeout=timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Se descartan {self._queue.qsize()} eventos de webhook sin procesar")
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+        self._queue = None
+
+    # === Consultas ===
+
+    async def get_event_history(
         self,
         limit: int = 100,
         event_type: EventType = None,
-        source: str = None
+        source: str = None,
+        event_name: str = None
     ) -> List[Dict[str, Any]]:
         """
-        Obtiene el historial de eventos.
+        Obtiene el historial de eventos (más recientes primero).
+
+        Sale del buffer en memoria; si no alcanza para `limit`, se completa
+        con la tabla persistente (consulta en un hilo aparte).
 
         Args:
             limit: Maximo de eventos a retornar
             event_type: Filtrar por tipo
             source: Filtrar por fuente
+            event_name: Filtrar por nombre original del evento
         """
-        events = list(self._event_history)
-
-        if event_type:
-            events = [e for e in events if e.type == event_type]
-
-        if source:
-            events = [e for e in events if e.source == source]
-
-        # Ordenar por timestamp descendente
-        events.sort(key=lambda x: x.timestamp, reverse=True)
-
-        return [e.to_dict() for e in events[:limit]]
+        events = [
+            e for e in reversed(self._event_history)
+            if (not event_type or e.type == event_type)
+            and (not source or e.source == source)
+            and (not event_name or e.name == event_name)
+        ][:limit]
+        history = [e.to_dict() for e in events]
+
+        full = len(self._event_history) == self._event_history.maxlen
+        if len(history) < limit and full and self.session_factory is not None:
+            oldest = self._event_history[0].timestamp
+            try:
+                history += await asyncio.to_thread(
+                    self._load_history, limit - len(history), oldest, event_type, source, event_name
+                )
+            except Exception as e:
+                logger.error(f"No se pudo leer el historial persistente: {e}")
+
+        return history
+
+    def _load_history(self, limit, before, event_type, source, event_name) -> List[Dict[str, Any]]:
+        with self.session_factory() as session:
+            query = session.query(EventoWebhookEntrante).filter(EventoWebhookEntrante.fecha < before)
+            if event_type:
+                query = query.filter(EventoWebhookEntrante.tipo == event_type.value)
+            if source:
+                query = query.filter(EventoWebhookEntrante.fuente == source)
+            if event_name:
+                query = query.filter(EventoWebhookEntrante.evento == event_name)
+            rows = query.order_by(EventoWebhookEntrante.fecha.desc()).limit(limit).all()
+
+            return [
+                {
+                    "id": r.id,
+                    "event": r.evento,
+                    "type": r.tipo,
+                    "data": r.datos,
+                    "source": r.fuente,
+                    "priority": r.prioridad,
+                    "timestamp": r.fecha.isoformat(),
+                    "processed": r.procesado,
+                    "result": r.resultado,
+                    "error": r.error
+                }
+                for r in rows
+            ]
 
     def get_stats(self) -> Dict[str, Any]:
         """Obtiene estadisticas del handler."""
         return {
             **self._stats,
             "history_size": len(self._event_history),
+            "queue_size": self._queue.qsize() if self._queue else 0,
             "registered_handlers": {
-                k.value: len(v) for k, v in self._handlers.items()
+                (k.value if k else "*"): len(v) for k, v in self._handlers.items()
             }
         }
 
+    def get_analytics_summary(self) -> Dict[str, Any]:
+        """Resumen de analytics desde los contadores (sin recorrer el historial)"""
+        return {
+            "total_events": self._stats["total_received"],
+            "events_by_type": dict(self._by_event),
+            "critical_events_count": self._critical_count,
+            "recent_critical": [e.to_dict() for e in self._recent_critical]
+        }
+
     def get_pending_alerts(self) -> List[Dict[str, Any]]:
         """Obtiene eventos de alta prioridad no procesados."""
         return [
@@ -356,19 +675,11 @@ class WebhookHandler:
 
     def get_recent_issues(self, hours: int = 24) -> List[Dict[str, Any]]:
         """Obtiene problemas reportados en las ultimas N horas."""
-        from datetime import timedelta
-
         cutoff = datetime.now() - timedelta(hours=hours)
-        issue_types = [
-            EventType.DELAY_DETECTED,
-            EventType.ISSUE_REPORTED,
-            EventType.DELIVERY_FAILED,
-            EventType.CUSTOMER_COMPLAINT
-        ]
 
         return [
             e.to_dict() for e in self._event_history
-            if e.type in issue_types and e.timestamp >= cutoff
+            if e.type in ISSUE_TYPES and e.timestamp >= cutoff
         ]
 
 
@@ -382,3 +693,10 @@ def get_webhook_handler() -> WebhookHandler:
     if _webhook_handler is None:
         _webhook_handler = WebhookHandler()
     return _webhook_handler
+
+
+async def cerrar_webhook_handler():
+    """Procesa lo pendiente y detiene los workers (shutdown de la app)."""
+    global _webhook_handler
+    if _webhook_handler is not None:
+        await _webhook_handler.close()
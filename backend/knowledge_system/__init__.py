@@ -9,8 +9,11 @@ Módulos:
 - knowledge_manager: Gestor principal del sistema
 - web_scraper: Extracción de contenido web
 - youtube_processor: Procesamiento de videos YouTube
-- document_parser: Parser de documentos (PDF, DOCX, TXT)
+- document_parser: Parser de documentos (PDF, DOCX, XLSX, TXT) por bloques
 - classifier: Clasificación automática con IA
+- embeddings: Embeddings por chunks con cache y proveedores intercambiables
+- retrieval: Búsqueda híbrida (léxica + vectorial) con fusión RRF
+- ingestion: Ingesta de fuentes por lotes en segundo plano (jobs)
 
 Uso:
     from knowledge_system import KnowledgeManager
@@ -27,13 +30,15 @@ from .web_scraper import WebScraper
 from .youtube_processor import YouTubeProcessor
 from .document_parser import DocumentParser
 from .classifier import ContentClassifier
+from .embeddings import EmbeddingPipeline
 
 __all__ = [
     'KnowledgeManager',
     'WebScraper',
     'YouTubeProcessor',
     'DocumentParser',
-    'ContentClassifier'
+    'ContentClassifier',
+    'EmbeddingPipeline'
 ]
 
 __version__ = "1.0.0"
@@ -8,6 +8,9 @@ Endpoints disponibles:
 - POST /admin/login          - Autenticacion
 - POST /admin/upload         - Cargar documentos
 - GET  /admin/documents      - Listar documentos cargados
+- POST /admin/ingest         - Ingesta de conocimiento por lotes (job)
+- GET  /admin/ingest/{id}    - Progreso de un job de ingesta
+- POST /admin/ingest/{id}/retry - Reintentar items fallidos
 - GET  /admin/financial      - Obtener analisis financiero
 - POST /admin/analyze        - Analizar archivo financiero
 - GET  /admin/config         - Obtener configuracion
@@ -54,6 +57,11 @@ router = APIRouter(
 ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD", "Sacrije2020?08")
 # En produccion, usar hash y tokens JWT
 
+# Tipos que /admin/ingest acepta desde HTTP. Los de ruta de archivo
+# (archivo, documento) leerian cualquier archivo del servidor; los
+# documentos se suben por /admin/upload.
+TIPOS_INGESTA_HTTP = ("web", "youtube", "texto")
+
 
 # ==================== MODELOS PYDANTIC ====================
 
@@ -86,6 +94,19 @@ class AnalisisFinancieroRequest(BaseModel):
     periodo_fin: Optional[str] = None
 
 
+class FuenteIngesta(BaseModel):
+    """Fuente a cargar dentro de un lote de ingesta."""
+    fuente: str = Field(..., description="URL, ID de video o texto")
+    tipo: str = Field(..., description="web, youtube, texto")
+    metadata: Optional[dict] = None
+    opciones: Optional[dict] = None
+
+
+class IngestaRequest(BaseModel):
+    """Request de ingesta por lotes."""
+    fuentes: List[FuenteIngesta] = Field(..., min_length=1, max_length=500)
+
+
 class FiltroFecha(BaseModel):
     """Filtro de fechas."""
     tipo: str = Field("hoy", description="hoy, ayer, 7dias, 14dias, 30dias, todo")
@@ -330,6 +351,83 @@ async def listar_documentos(
     }
 
 
+@router.post(
+    "/ingest",
+    summary="Ingesta por lotes",
+    description="Encola un lote de fuentes de conocimiento y retorna el id del job."
+)
+async def crear_ingesta(
+    request: IngestaRequest,
+    _: bool = Depends(verificar_token)
+):
+    """
+    Crea un job de ingesta en segundo plano.
+
+    No acepta rutas de archivo del servidor: los documentos se cargan
+    por /admin/upload.
+    """
+    from .ingestion import get_ingestion_runner
+
+    no_permitidos = sorted({f.tipo for f in request.fuentes if f.tipo not in TIPOS_INGESTA_HTTP})
+    if no_permitidos:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Tipo de fuente no permitido: {', '.join(no_permitidos)} "
+                   f"(usar {', '.join(TIPOS_INGESTA_HTTP)}; documentos por /admin/upload)"
+        )
+
+    try:
+        job_id = await get_ingestion_runner().enviar([f.dict() for f in request.fuentes])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return {"job_id": job_id, "total": len(request.fuentes), "estado": "en_curso"}
+
+
+@router.get(
+    "/ingest/{job_id}",
+    summary="Progreso de ingesta",
+    description="Retorna el progreso del job y el estado de cada fuente."
+)
+async def progreso_ingesta(
+    job_id: str,
+    _: bool = Depends(verificar_token)
+):
+    """
+    Progreso de un job de ingesta.
+    """
+    from .ingestion import get_ingestion_runner
+
+    progreso = get_ingestion_runner().obtener(job_id)
+    if progreso is None:
+        raise HTTPException(status_code=404, detail="Job no encontrado")
+    return progreso
+
+
+@router.post(
+    "/ingest/{job_id}/retry",
+    summary="Reintentar ingesta",
+    description="Relanza las fuentes fallidas sin repetir las etapas ya completadas."
+)
+async def reintentar_ingesta(
+    job_id: str,
+    _: bool = Depends(verificar_token)
+):
+    """
+    Reintenta los items fallidos de un job.
+    """
+    from .ingestion import get_ingestion_runner
+
+    try:
+        relanzados = await get_ingestion_runner().reintentar(job_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Job no encontrado")
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    return {"job_id": job_id, "relanzados": relanzados}
+
+
 @router.post(
     "/analyze",
     summary="Analizar archivo financiero",
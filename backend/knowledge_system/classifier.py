@@ -11,14 +11,22 @@ El clasificador asigna:
 - Tags relevantes
 - Nivel de relevancia para Litper
 
+Primero puntúa todas las categorías en una sola pasada con un matcher
+de keywords compilado (regex única, sin tildes, keywords con peso);
+Claude solo se consulta cuando la confianza de las reglas es baja.
+
 Autor: Litper IA System
 Versión: 1.0.0
 """
 
 import os
+import asyncio
 import json
+import math
 import re
-from typing import Dict, List, Optional
+import unicodedata
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
 from loguru import logger
 
 try:
@@ -33,6 +41,125 @@ from dotenv import load_dotenv
 load_dotenv()
 
 
+# Confianza mínima de las reglas para no consultar a Claude
+UMBRAL_CONFIANZA_REGLAS = float(os.getenv('CLASIFICADOR_UMBRAL_REGLAS', '0.6'))
+
+# Marcas diacríticas que quedan sueltas tras la descomposición NFKD
+_DIACRITICOS = re.compile('[\u0300-\u036f]')
+
+
+def normalizar(texto: str) -> str:
+    """Minúsculas y sin tildes (ñ -> n), para comparar sin importar acentos"""
+    return _DIACRITICOS.sub('', unicodedata.normalize('NFKD', texto.lower()))
+
+
+def _regex_trie(terminos: List[str]) -> str:
+    """
+    Alternación de los términos factorizada por prefijos comunes.
+
+    El motor de regex de Python prueba las alternativas una por una en
+    cada posición; con el trie descarta todas las que no comparten el
+    primer carácter de un solo vistazo. Los sufijos opcionales son
+    codiciosos, así que gana la coincidencia más larga.
+    """
+    raiz: Dict = {}
+    for termino in terminos:
+        nodo = raiz
+        for caracter in termino:
+            nodo = nodo.setdefault(caracter, {})
+        nodo[''] = {}
+
+    def construir(nodo: Dict) -> str:
+        ramas = [re.escape(c) + construir(hijo) for c, hijo in sorted(nodo.items()) if c]
+        if not ramas:
+            return ''
+        patron = ramas[0] if len(ramas) == 1 else '(?:' + '|'.join(ramas) + ')'
+        return f'(?:{patron})?' if '' in nodo else patron
+
+    return construir(raiz)
+
+
+class KeywordMatcher:
+    """
+    Matcher compilado de keywords por categoría.
+
+    Todas las keywords (y los nombres de subcategoría) se compilan en una
+    única regex (un trie de prefijos) con límites de palabra y plural
+    opcional; cada coincidencia se resuelve con un diccionario a sus
+    (categoría, peso). Así el texto se recorre una sola vez sin importar
+    cuántas categorías o keywords haya.
+
+    Ejemplo de uso:
+        matcher = KeywordMatcher(taxonomia)
+        puntajes = matcher.puntuar("Envío con Coordinadora a Bogotá")
+        print(puntajes.categorias)   # {'Logística': 3.0, 'Mercados': 1.0}
+    """
+
+    def __init__(self, taxonomia: Dict[str, Dict]):
+        self._keywords: Dict[str, List[Tuple[str, float]]] = {}
+        self._subcategorias: Dict[str, List[Tuple[str, str]]] = {}
+
+        for categoria, info in taxonomia.items():
+            # Cada keyword es un string (peso 1) o una tupla (keyword, peso)
+            for keyword in info.get('keywords', []):
+                termino, peso = (keyword, 1.0) if isinstance(keyword, str) else keyword
+                self._keywords.setdefault(normalizar(termino), []).append((categoria, float(peso)))
+            for sub in info.get('subcategorias', []):
+                self._subcategorias.setdefault(normalizar(sub), []).append((categoria, sub))
+
+        # El grupo captura el término base; el plural (-s / -es) se acepta
+        # fuera del grupo para que "envíos" o "devoluciones" cuenten como
+        # "envío" y "devolución"
+        terminos = set(self._keywords) | set(self._subcategorias)
+        self._patron = re.compile(r'\b(' + _regex_trie(sorted(terminos)) + r')(?:e?s)?\b')
+
+    def puntuar(self, texto: str) -> "PuntajesMatcher":
+        """Recorre el texto una vez y acumula puntajes por categoría y subcategoría"""
+        frecuencias = Counter(self._patron.findall(normalizar(texto)))
+
+        puntajes = PuntajesMatcher()
+        for termino, veces in frecuencias.items():
+            # Repeticiones suman con rendimiento decreciente
+            factor = 1.0 + math.log(veces)
+            for categoria, peso in self._keywords.get(termino, ()):
+                puntajes.categorias[categoria] = puntajes.categorias.get(categoria, 0.0) + peso * factor
+                puntajes.keywords[categoria] = puntajes.keywords.get(categoria, 0) + 1
+            for categoria, sub in self._subcategorias.get(termino, ()):
+                clave = (categoria, sub)
+                puntajes.subcategorias[clave] = puntajes.subcategorias.get(clave, 0) + veces
+
+        return puntajes
+
+
+class PuntajesMatcher:
+    """Resultado de una pasada del matcher"""
+
+    def __init__(self):
+        self.categorias: Dict[str, float] = {}
+        self.keywords: Dict[str, int] = {}
+        self.subcategorias: Dict[Tuple[str, str], int] = {}
+
+    def mejor_subcategoria(self, categoria: str) -> Optional[str]:
+        """Subcategoría de la categoría con más menciones (None si ninguna)"""
+        candidatas = [(veces, sub) for (cat, sub), veces in self.subcategorias.items() if cat == categoria]
+        return max(candidatas)[1] if candidatas else None
+
+    def confianza(self) -> float:
+        """
+        Confianza de la categoría ganadora (0-0.95).
+
+        Combina qué tanto domina sobre las demás con cuánta evidencia
+        hay (un solo match no da confianza alta aunque sea el único).
+        """
+        if not self.categorias:
+            return 0.0
+        total = sum(self.categorias.values())
+        mejor = max(self.categorias.values())
+        dominio = mejor / total
+        evidencia = 1 - math.exp(-mejor / 4)
+        return min(0.95, dominio * evidencia)
+
+
 class ContentClassifier:
     """
     Clasificador automático de contenido usando IA.
@@ -86,9 +213,10 @@ class ContentClassifier:
                 ],
                 "keywords": [
                     "envío", "transporte", "entrega", "guía", "paquete",
-                    "tracking", "rastreo", "novedad", "retraso", "fulfillment",
-                    "coordinadora", "servientrega", "interrapidisimo", "envia",
-                    "deprisa", "tcc", "fedex", "dhl", "última milla"
+                    ("tracking", 1.5), ("rastreo", 1.5), ("novedad", 1.5), "retraso",
+                    ("fulfillment", 2.0), ("coordinadora", 2.0), ("servientrega", 2.0),
+                    ("interrapidisimo", 2.0), ("envia", 2.0), ("deprisa", 2.0),
+                    ("tcc", 2.0), ("fedex", 2.0), ("dhl", 2.0), ("última milla", 2.0)
                 ]
             },
             "Dropshipping": {
@@ -103,10 +231,10 @@ class ContentClassifier:
                     "Plataformas"
                 ],
                 "keywords": [
-                    "dropshipping", "proveedor", "producto", "tienda",
-                    "shopify", "woocommerce", "mercado libre", "e-commerce",
-                    "cliente", "pedido", "orden", "inventario", "catálogo",
-                    "margen", "precio", "marketing", "ventas"
+                    ("dropshipping", 3.0), "proveedor", "producto", "tienda",
+                    ("shopify", 2.0), ("woocommerce", 2.0), ("mercado libre", 2.0),
+                    ("e-commerce", 2.0), ("cliente", 0.5), "pedido", ("orden", 0.5),
+                    "inventario", "catálogo", "margen", "precio", "marketing", "ventas"
                 ]
             },
             "Tecnología": {
@@ -121,10 +249,10 @@ class ContentClassifier:
                     "Seguridad"
                 ],
                 "keywords": [
-                    "api", "webhook", "integración", "código", "desarrollo",
-                    "python", "javascript", "react", "fastapi", "base de datos",
-                    "automatización", "bot", "ia", "machine learning", "modelo",
-                    "endpoint", "rest", "json", "token", "autenticación"
+                    ("api", 1.5), ("webhook", 2.0), "integración", "código", "desarrollo",
+                    ("python", 2.0), ("javascript", 2.0), "react", ("fastapi", 2.0),
+                    "base de datos", "automatización", "bot", "ia", ("machine learning", 2.0),
+                    ("modelo", 0.5), ("endpoint", 1.5), "rest", "json", "token", "autenticación"
                 ]
             },
             "Operaciones": {
@@ -158,8 +286,8 @@ class ContentClassifier:
                 ],
                 "keywords": [
                     "legal", "contrato", "regulación", "ley", "norma",
-                    "aduana", "importación", "exportación", "impuesto", "iva",
-                    "privacidad", "datos personales", "habeas data", "gdpr",
+                    ("aduana", 1.5), "importación", "exportación", "impuesto", "iva",
+                    "privacidad", ("datos personales", 2.0), ("habeas data", 3.0), ("gdpr", 2.0),
                     "términos", "política", "devolución", "garantía"
                 ]
             },
@@ -176,13 +304,17 @@ class ContentClassifier:
                 ],
                 "keywords": [
                     "colombia", "chile", "ecuador", "bogotá", "medellín",
-                    "santiago", "quito", "guayaquil", "mercado", "competencia",
-                    "tendencia", "análisis", "expansión", "latinoamérica",
-                    "región", "ciudad", "cobertura"
+                    "santiago", "quito", "guayaquil", ("mercado", 0.5), "competencia",
+                    "tendencia", ("análisis", 0.5), "expansión", "latinoamérica",
+                    "región", ("ciudad", 0.5), "cobertura"
                 ]
             }
         }
 
+        # Matcher compilado una sola vez a partir de la taxonomía
+        self.matcher = KeywordMatcher(self.taxonomia)
+        self.umbral_confianza = UMBRAL_CONFIANZA_REGLAS
+
     async def clasificar(
         self,
         titulo: str,
@@ -207,16 +339,18 @@ class ContentClassifier:
                 'relevancia_litper': int (0-10)
             }
 
-        Tip: El sistema usa IA para clasificación precisa.
-        Si Claude no está disponible, usa reglas basadas en keywords.
+        Tip: Las reglas (una pasada del matcher) resuelven los casos claros;
+        Claude solo se consulta si su confianza queda bajo el umbral.
         """
 
         logger.debug(f"Clasificando: {titulo[:50]}...")
 
-        if self.claude:
-            return await self._clasificar_con_ia(titulo, contenido, metadata)
-        else:
-            return self._clasificar_con_reglas(titulo, contenido)
+        reglas = self._clasificar_con_reglas(titulo, contenido)
+
+        if not self.claude or reglas['confianza'] >= self.umbral_confianza:
+            return reglas
+
+        return await self._clasificar_con_ia(titulo, contenido, metadata)
 
     async def _clasificar_con_ia(
         self,
@@ -235,7 +369,8 @@ class ContentClassifier:
         taxonomia_str = self._formatear_taxonomia()
 
         try:
-            response = self.claude.messages.create(
+            response = await asyncio.to_thread(
+                self.claude.messages.create,
                 model=os.getenv('CLAUDE_MODEL', 'claude-sonnet-4-20250514'),
                 max_tokens=1000,
                 system=f"""
@@ -309,54 +444,40 @@ class ContentClassifier:
 
     def _clasificar_con_reglas(self, titulo: str, contenido: str) -> Dict:
         """
-        Clasificación basada en reglas cuando IA no está disponible.
+        Clasificación basada en reglas con el matcher compilado.
 
-        Usa matching de keywords para determinar la categoría.
+        Una sola pasada sobre el texto puntúa todas las categorías y
+        subcategorías a la vez, sin importar tildes.
 
         Tip: Menos preciso que IA pero funciona sin conexión.
         """
 
-        texto_completo = f"{titulo} {contenido}".lower()
-
-        # Contar matches por categoría
-        scores = {}
+        texto_completo = f"{titulo} {contenido}"
+        puntajes = self.matcher.puntuar(texto_completo)
 
-        for categoria, info in self.taxonomia.items():
-            keywords = info.get('keywords', [])
-            score = sum(1 for kw in keywords if kw.lower() in texto_completo)
-            scores[categoria] = score
-
-        # Categoría con más matches
-        if max(scores.values()) > 0:
-            categoria = max(scores, key=scores.get)
-            max_score = scores[categoria]
+        # Categoría con mayor puntaje
+        if puntajes.categorias:
+            categoria = max(puntajes.categorias, key=puntajes.categorias.get)
         else:
             categoria = "Operaciones"  # Default
-            max_score = 0
-
-        # Determinar subcategoría
-        subcategorias = self.taxonomia[categoria]['subcategorias']
-        subcategoria = subcategorias[0]  # Primera por defecto
 
-        # Buscar subcategoría por keywords
-        for sub in subcategorias:
-            if sub.lower() in texto_completo:
-                subcategoria = sub
-                break
+        # Subcategoría más mencionada, o la primera por defecto
+        subcategoria = (
+            puntajes.mejor_subcategoria(categoria)
+            or self.taxonomia[categoria]['subcategorias'][0]
+        )
 
         # Extraer tags (palabras frecuentes relevantes)
         tags = self._extraer_tags_simples(texto_completo)
 
-        # Calcular confianza basada en matches
-        total_keywords = sum(len(info.get('keywords', [])) for info in self.taxonomia.values())
-        confianza = min(0.8, max_score / (total_keywords * 0.1)) if total_keywords > 0 else 0.3
+        coincidencias = puntajes.keywords.get(categoria, 0)
 
         return {
             'categoria': categoria,
             'subcategoria': subcategoria,
             'tags': tags[:8],
-            'confianza': round(confianza, 2),
-            'razonamiento': f"Clasificado por {max_score} keywords coincidentes",
+            'confianza': round(puntajes.confianza(), 2),
+            'razonamiento': f"Clasificado por {coincidencias} keywords coincidentes",
             'relevancia_litper': 5,  # Default medio
             'aplicaciones': []
         }
@@ -466,30 +587,23 @@ class ContentClassifier:
         Tip: Útil para autocompletar mientras el usuario escribe.
         """
 
-        texto_lower = texto.lower()
+        puntajes = self.matcher.puntuar(texto)
         sugerencias = []
 
-        for categoria, info in self.taxonomia.items():
-            keywords = info.get('keywords', [])
-            matches = sum(1 for kw in keywords if kw.lower() in texto_lower)
-
-            if matches > 0:
-                prob = min(0.95, matches * 0.15)
-                subcategoria = info['subcategorias'][0]
-
-                # Buscar subcategoría más específica
-                for sub in info['subcategorias']:
-                    if sub.lower() in texto_lower:
-                        subcategoria = sub
-                        prob = min(0.98, prob + 0.1)
-                        break
-
-                sugerencias.append({
-                    'categoria': categoria,
-                    'subcategoria': subcategoria,
-                    'probabilidad': round(prob, 2),
-                    'matches': matches
-                })
+        for categoria, puntaje in puntajes.categorias.items():
+            prob = min(0.95, puntaje * 0.15)
+            subcategoria = puntajes.mejor_subcategoria(categoria)
+
+            # Mencionar la subcategoría da más certeza
+            if subcategoria:
+                prob = min(0.98, prob + 0.1)
+
+            sugerencias.append({
+                'categoria': categoria,
+                'subcategoria': subcategoria or self.taxonomia[categoria]['subcategorias'][0],
+                'probabilidad': round(prob, 2),
+                'matches': puntajes.keywords[categoria]
+            })
 
         # Ordenar por probabilidad
         sugerencias.sort(key=lambda x: x['probabilidad'], reverse=True)
@@ -500,8 +614,6 @@ class ContentClassifier:
 # ==================== PARA TESTING ====================
 
 if __name__ == "__main__":
-    import asyncio
-
     async def test():
         classifier = ContentClassifier()
 
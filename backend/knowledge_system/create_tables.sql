@@ -7,7 +7,7 @@
 --
 -- REQUISITOS:
 -- 1. PostgreSQL 14+ instalado
--- 2. Extensión pgvector instalada
+-- 2. Extensión pgvector 0.5+ instalada (índices HNSW)
 --
 -- INSTALACIÓN DE PGVECTOR:
 -- sudo apt install postgresql-14-pgvector  (Ubuntu/Debian)
@@ -84,11 +84,12 @@ CREATE INDEX IF NOT EXISTS idx_conocimiento_hash
 ON conocimiento(hash_fuente);
 
 -- Índice para búsqueda vectorial (coseno)
--- Usa IVFFlat para mejor rendimiento en datasets grandes
-CREATE INDEX IF NOT EXISTS idx_conocimiento_embedding
+-- HNSW: mejor recall que IVFFlat y no requiere re-entrenar listas al crecer
+DROP INDEX IF EXISTS idx_conocimiento_embedding;
+CREATE INDEX IF NOT EXISTS idx_conocimiento_embedding_hnsw
 ON conocimiento
-USING ivfflat (contenido_embedding vector_cosine_ops)
-WITH (lists = 100);
+USING hnsw (contenido_embedding vector_cosine_ops)
+WITH (m = 16, ef_construction = 64);
 
 -- Índice para filtrar por categoría
 CREATE INDEX IF NOT EXISTS idx_conocimiento_categoria
@@ -114,6 +115,54 @@ ON conocimiento(fecha_carga DESC);
 CREATE INDEX IF NOT EXISTS idx_conocimiento_metadata
 ON conocimiento USING GIN(metadata);
 
+-- ============================================================
+-- TABLA: conocimiento_chunks
+-- ============================================================
+--
+-- Fragmentos solapados de cada documento con su propio embedding.
+-- La búsqueda semántica se hace sobre chunks para cubrir el
+-- documento completo (sin truncar).
+--
+-- TIP: hash_contenido es el SHA-256 del texto normalizado; sirve
+-- de cache para no volver a embeber pasajes repetidos.
+-- ============================================================
+
+CREATE TABLE IF NOT EXISTS conocimiento_chunks (
+    id BIGSERIAL PRIMARY KEY,
+    conocimiento_id INTEGER NOT NULL REFERENCES conocimiento(id) ON DELETE CASCADE,
+
+    -- Posición del chunk dentro del documento
+    indice INTEGER NOT NULL,
+    contenido TEXT NOT NULL,
+    hash_contenido VARCHAR(64) NOT NULL,
+    tokens INTEGER NOT NULL,
+
+    -- Proveedor/modelo que generó el embedding (solo se comparan vectores del mismo modelo)
+    modelo VARCHAR(100) NOT NULL,
+    embedding VECTOR(1536) NOT NULL,
+
+    -- Texto indexado para la rama léxica de la búsqueda híbrida
+    contenido_tsv TSVECTOR GENERATED ALWAYS AS (to_tsvector('spanish', contenido)) STORED,
+
+    fecha_carga TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+
+    UNIQUE (conocimiento_id, indice)
+);
+
+-- Índice para reutilizar embeddings por hash de contenido
+CREATE INDEX IF NOT EXISTS idx_chunks_hash_modelo
+ON conocimiento_chunks(hash_contenido, modelo);
+
+-- Índice ANN (HNSW, coseno) para la rama vectorial sobre chunks
+CREATE INDEX IF NOT EXISTS idx_chunks_embedding_hnsw
+ON conocimiento_chunks
+USING hnsw (embedding vector_cosine_ops)
+WITH (m = 16, ef_construction = 64);
+
+-- Índice GIN para la rama léxica (texto completo en español)
+CREATE INDEX IF NOT EXISTS idx_chunks_tsv
+ON conocimiento_chunks USING GIN(contenido_tsv);
+
 -- ============================================================
 -- FUNCIONES AUXILIARES
 -- ============================================================
@@ -242,9 +291,10 @@ INSERT INTO conocimiento (
 
 COMMENT ON TABLE conocimiento IS 'Almacena conocimiento de múltiples fuentes para agentes IA de Litper';
 COMMENT ON COLUMN conocimiento.hash_fuente IS 'Hash SHA256 de la fuente original para evitar duplicados';
-COMMENT ON COLUMN conocimiento.contenido_embedding IS 'Vector de 1536 dimensiones para búsqueda semántica (OpenAI ada-002)';
+COMMENT ON COLUMN conocimiento.contenido_embedding IS 'Centroide normalizado (1536 dimensiones) de los embeddings de sus chunks';
 COMMENT ON COLUMN conocimiento.tags IS 'Array de etiquetas para clasificación y filtrado';
 COMMENT ON COLUMN conocimiento.metadata IS 'Información adicional en formato JSON';
+COMMENT ON TABLE conocimiento_chunks IS 'Fragmentos solapados de cada documento con su embedding';
 
 -- ============================================================
 -- GRANT PERMISOS
@@ -253,6 +303,8 @@ COMMENT ON COLUMN conocimiento.metadata IS 'Información adicional en formato JS
 -- Asegurar que el usuario de la aplicación tenga permisos
 GRANT ALL PRIVILEGES ON conocimiento TO litper_user;
 GRANT ALL PRIVILEGES ON SEQUENCE conocimiento_id_seq TO litper_user;
+GRANT ALL PRIVILEGES ON conocimiento_chunks TO litper_user;
+GRANT ALL PRIVILEGES ON SEQUENCE conocimiento_chunks_id_seq TO litper_user;
 GRANT SELECT ON v_conocimiento_stats TO litper_user;
 GRANT SELECT ON v_conocimiento_popular TO litper_user;
 GRANT SELECT ON v_conocimiento_reciente TO litper_user;
@@ -270,6 +322,7 @@ BEGIN
     RAISE NOTICE '';
     RAISE NOTICE 'Tablas creadas:';
     RAISE NOTICE '  - conocimiento (principal)';
+    RAISE NOTICE '  - conocimiento_chunks (fragmentos con embedding)';
     RAISE NOTICE '';
     RAISE NOTICE 'Vistas creadas:';
     RAISE NOTICE '  - v_conocimiento_stats';
@@ -278,7 +331,8 @@ BEGIN
     RAISE NOTICE '';
     RAISE NOTICE 'Índices creados:';
     RAISE NOTICE '  - idx_conocimiento_hash';
-    RAISE NOTICE '  - idx_conocimiento_embedding (IVFFlat)';
+    RAISE NOTICE '  - idx_conocimiento_embedding_hnsw (HNSW)';
+    RAISE NOTICE '  - idx_chunks_embedding_hnsw (HNSW) / idx_chunks_tsv (GIN)';
     RAISE NOTICE '  - idx_conocimiento_categoria';
     RAISE NOTICE '  - idx_conocimiento_tags (GIN)';
     RAISE NOTICE '';
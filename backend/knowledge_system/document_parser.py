@@ -5,23 +5,32 @@ PARSER DE DOCUMENTOS
 Procesa y extrae texto de múltiples formatos de documento:
 - PDF
 - DOCX (Word)
+- XLSX (Excel)
 - TXT
 - CSV
 - JSON
 - Markdown
 
+El parseo corre en un pool de hilos acotado (nunca en el hilo del event
+loop) y produce el texto por bloques: página a página en PDF, por
+bloques de filas en CSV/XLSX y por trozos en texto plano.
+
 Dependencias:
-    pip install PyPDF2 python-docx chardet
+    pip install PyPDF2 python-docx chardet openpyxl
 
 Autor: Litper IA System
 Versión: 1.0.0
 """
 
+import os
+import re
 import json
 import csv
 import io
+import codecs
 import asyncio
-from typing import Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, BinaryIO, Dict, Iterator, Union
 from pathlib import Path
 from loguru import logger
 
@@ -39,6 +48,13 @@ except ImportError:
     logger.warning("python-docx no instalado, DOCX no soportados")
     DOCX_AVAILABLE = False
 
+try:
+    from openpyxl import load_workbook
+    OPENPYXL_AVAILABLE = True
+except ImportError:
+    logger.debug("openpyxl no instalado, XLSX no soportados")
+    OPENPYXL_AVAILABLE = False
+
 try:
     import chardet
     CHARDET_AVAILABLE = True
@@ -47,6 +63,18 @@ except ImportError:
     CHARDET_AVAILABLE = False
 
 
+# Hilos dedicados al parseo de documentos
+PARSER_WORKERS = int(os.getenv('PARSER_WORKERS', '2'))
+
+# Bytes por trozo al leer texto plano
+BLOQUE_TEXTO_BYTES = 64 * 1024
+
+# Fuente de un documento: ruta en disco o bytes ya en memoria
+FuenteDocumento = Union[Path, bytes]
+
+_FIN = object()
+
+
 class DocumentParser:
     """
     Parser universal de documentos.
@@ -66,15 +94,26 @@ class DocumentParser:
             nombre="documento.docx"
         )
 
+        # Por bloques (memoria acotada en archivos grandes)
+        async for bloque in parser.iterar("/ruta/reporte.csv"):
+            procesar(bloque)
+
     Tip: Para PDFs escaneados (imágenes), considera usar OCR.
     Este parser solo extrae texto embebido.
     """
 
-    def __init__(self):
+    def __init__(self, max_workers: int = PARSER_WORKERS):
         """Inicializa el parser con configuraciones por defecto."""
         self.max_file_size = 50 * 1024 * 1024  # 50 MB
+        self.max_paginas = 500                  # PDF
+        self.max_filas = 1000                   # CSV / XLSX
+        self.filas_por_bloque = 200
         self.encodings_fallback = ['utf-8', 'latin-1', 'cp1252', 'iso-8859-1']
 
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="parser-docs")
+
+    # ==================== API ====================
+
     async def parsear(self, ruta_archivo: str) -> str:
         """
         Parsea un archivo desde una ruta.
@@ -86,25 +125,9 @@ class DocumentParser:
             Texto extraído del documento
 
         Tip: El tipo de archivo se detecta automáticamente
-        por la extensión.
+        por la extensión. El archivo se lee por partes, no entero.
         """
-
-        ruta = Path(ruta_archivo)
-
-        if not ruta.exists():
-            raise FileNotFoundError(f"Archivo no encontrado: {ruta_archivo}")
-
-        if ruta.stat().st_size > self.max_file_size:
-            raise ValueError(f"Archivo muy grande (max {self.max_file_size // 1024 // 1024}MB)")
-
-        extension = ruta.suffix.lower()
-        logger.info(f"📄 Parseando archivo {extension}: {ruta.name}")
-
-        # Leer contenido
-        with open(ruta, 'rb') as f:
-            contenido = f.read()
-
-        return await self.parsear_bytes(contenido, ruta.name)
+        return await self._unir(self.iterar(ruta_archivo))
 
     async def parsear_archivo(self, ruta_archivo: str) -> str:
         """Alias de parsear() para compatibilidad."""
@@ -127,22 +150,84 @@ class DocumentParser:
 
         Tip: Útil cuando recibes archivos desde uploads HTTP.
         """
+        return await self._unir(self.iterar_bytes(contenido, nombre))
+
+    async def iterar(self, ruta_archivo: str) -> AsyncIterator[str]:
+        """
+        Produce el texto de un archivo por bloques.
+
+        Los bloques traen sus propios separadores: concatenarlos da el
+        texto completo. Valida existencia y tamaño antes de leer.
+        """
+        ruta = Path(ruta_archivo)
+
+        if not ruta.exists():
+            raise FileNotFoundError(f"Archivo no encontrado: {ruta_archivo}")
+
+        if ruta.stat().st_size > self.max_file_size:
+            raise ValueError(f"Archivo muy grande (max {self.max_file_size // 1024 // 1024}MB)")
+
+        logger.info(f"📄 Parseando archivo {ruta.suffix.lower()}: {ruta.name}")
+
+        async for bloque in self._iterar_en_pool(ruta, ruta.name):
+            yield bloque
+
+    async def iterar_bytes(self, contenido: bytes, nombre: str) -> AsyncIterator[str]:
+        """Produce el texto de un documento en memoria por bloques."""
+        if len(contenido) > self.max_file_size:
+            raise ValueError(f"Archivo muy grande (max {self.max_file_size // 1024 // 1024}MB)")
+
+        async for bloque in self._iterar_en_pool(contenido, nombre):
+            yield bloque
+
+    def cerrar(self):
+        """Libera el pool de hilos."""
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    # ==================== EJECUCIÓN EN EL POOL ====================
+
+    async def _iterar_en_pool(self, fuente: FuenteDocumento, nombre: str) -> AsyncIterator[str]:
+        """
+        Avanza el generador síncrono del formato dentro del pool de hilos.
 
+        Cada bloque (página, grupo de filas) se calcula en un hilo, así el
+        event loop sigue atendiendo otras peticiones entre bloques.
+        """
+        loop = asyncio.get_running_loop()
+        bloques = self._bloques(fuente, nombre)
+
+        try:
+            while True:
+                bloque = await loop.run_in_executor(self._pool, next, bloques, _FIN)
+                if bloque is _FIN:
+                    break
+                yield bloque
+        finally:
+            await loop.run_in_executor(self._pool, bloques.close)
+
+    @staticmethod
+    async def _unir(bloques: AsyncIterator[str]) -> str:
+        partes = [bloque async for bloque in bloques]
+        return ''.join(partes).strip()
+
+    def _bloques(self, fuente: FuenteDocumento, nombre: str) -> Iterator[str]:
+        """Selecciona el generador según la extensión"""
         extension = Path(nombre).suffix.lower()
 
         # Selector de parser según extensión
         parsers = {
-            '.pdf': self._parsear_pdf,
-            '.docx': self._parsear_docx,
-            '.doc': self._parsear_docx,  # Intentar como docx
-            '.txt': self._parsear_texto,
-            '.md': self._parsear_texto,
-            '.markdown': self._parsear_texto,
-            '.csv': self._parsear_csv,
-            '.json': self._parsear_json,
-            '.xml': self._parsear_xml,
-            '.html': self._parsear_html,
-            '.htm': self._parsear_html,
+            '.pdf': self._bloques_pdf,
+            '.docx': self._bloques_docx,
+            '.doc': self._bloques_docx,  # Intentar como docx
+            '.xlsx': self._bloques_xlsx,
+            '.txt': self._bloques_texto,
+            '.md': self._bloques_texto,
+            '.markdown': self._bloques_texto,
+            '.csv': self._bloques_csv,
+            '.json': self._bloques_json,
+            '.xml': self._bloques_xml,
+            '.html': self._bloques_html,
+            '.htm': self._bloques_html,
         }
 
         parser = parsers.get(extension)
@@ -150,18 +235,22 @@ class DocumentParser:
         if not parser:
             # Intentar como texto plano
             logger.warning(f"Extensión {extension} no reconocida, intentando como texto")
-            return await self._parsear_texto(contenido)
+            return self._bloques_texto(fuente)
 
-        return await parser(contenido)
+        return parser(fuente)
 
-    async def _parsear_pdf(self, contenido: bytes) -> str:
-        """
-        Extrae texto de un PDF.
+    @staticmethod
+    def _abrir(fuente: FuenteDocumento) -> BinaryIO:
+        """Abre la fuente como archivo binario (sin cargar rutas en memoria)"""
+        if isinstance(fuente, bytes):
+            return io.BytesIO(fuente)
+        return open(fuente, 'rb')
+
+    # ==================== FORMATOS ====================
 
-        Proceso:
-        1. Lee el PDF página por página
-        2. Extrae texto de cada página
-        3. Concatena todo con separadores
+    def _bloques_pdf(self, fuente: FuenteDocumento) -> Iterator[str]:
+        """
+        Extrae texto de un PDF página por página.
 
         Limitación: No extrae texto de imágenes (necesita OCR).
 
@@ -172,42 +261,41 @@ class DocumentParser:
         if not PYPDF2_AVAILABLE:
             raise ImportError("PyPDF2 no está instalado. Instala con: pip install PyPDF2")
 
-        try:
-            # Crear reader desde bytes
-            pdf_file = io.BytesIO(contenido)
-            reader = PyPDF2.PdfReader(pdf_file)
-
-            textos = []
-            total_paginas = len(reader.pages)
+        with self._abrir(fuente) as pdf_file:
+            try:
+                reader = PyPDF2.PdfReader(pdf_file)
+                total_paginas = len(reader.pages)
+            except PyPDF2.errors.PdfReadError as e:
+                raise ValueError(f"PDF corrupto o protegido: {e}")
 
             logger.debug(f"PDF tiene {total_paginas} páginas")
+            paginas = min(total_paginas, self.max_paginas)
+            con_texto = 0
 
-            for i, pagina in enumerate(reader.pages):
+            for i in range(paginas):
                 try:
-                    texto = pagina.extract_text()
-                    if texto and texto.strip():
-                        textos.append(f"[Página {i + 1}]")
-                        textos.append(texto.strip())
-                        textos.append("")  # Línea vacía entre páginas
+                    texto = reader.pages[i].extract_text()
                 except Exception as e:
                     logger.warning(f"Error en página {i + 1}: {e}")
                     continue
 
-            if not textos:
+                if texto and texto.strip():
+                    con_texto += 1
+                    yield f"[Página {i + 1}]\n{texto.strip()}\n"
+
+            if not con_texto:
                 raise ValueError(
                     "No se pudo extraer texto del PDF. "
                     "Puede ser un PDF escaneado (imágenes) que requiere OCR."
                 )
 
-            texto_final = '\n'.join(textos)
-            logger.success(f"✅ PDF parseado ({len(texto_final)} chars, {total_paginas} páginas)")
-
-            return texto_final
+            if total_paginas > paginas:
+                logger.warning(f"PDF truncado a {paginas} de {total_paginas} páginas")
+                yield f"... y {total_paginas - paginas} páginas más (límite {self.max_paginas})\n"
 
-        except PyPDF2.errors.PdfReadError as e:
-            raise ValueError(f"PDF corrupto o protegido: {e}")
+            logger.success(f"✅ PDF parseado ({con_texto} páginas con texto de {total_paginas})")
 
-    async def _parsear_docx(self, contenido: bytes) -> str:
+    def _bloques_docx(self, fuente: FuenteDocumento) -> Iterator[str]:
         """
         Extrae texto de un documento Word (DOCX).
 
@@ -216,119 +304,168 @@ class DocumentParser:
         - Texto de tablas
         - Encabezados
 
-        Tip: Las imágenes y gráficos no se extraen.
+        Tip: python-docx carga el documento completo; el límite de
+        tamaño de archivo acota la memoria.
         """
 
         if not DOCX_AVAILABLE:
             raise ImportError("python-docx no está instalado. Instala con: pip install python-docx")
 
         try:
-            doc_file = io.BytesIO(contenido)
-            doc = DocxDocument(doc_file)
-
-            textos = []
+            with self._abrir(fuente) as doc_file:
+                doc = DocxDocument(doc_file)
+        except Exception as e:
+            raise ValueError(f"Error procesando DOCX: {e}")
 
-            # Extraer párrafos
-            for para in doc.paragraphs:
-                texto = para.text.strip()
-                if texto:
-                    textos.append(texto)
+        hubo_texto = False
 
-            # Extraer texto de tablas
-            for tabla in doc.tables:
-                for fila in tabla.rows:
-                    celdas = [celda.text.strip() for celda in fila.cells]
-                    if any(celdas):
-                        textos.append(' | '.join(celdas))
+        # Párrafos
+        textos = []
+        for para in doc.paragraphs:
+            texto = para.text.strip()
+            if texto:
+                textos.append(texto)
+                if len(textos) >= self.filas_por_bloque:
+                    hubo_texto = True
+                    yield '\n\n'.join(textos) + '\n\n'
+                    textos = []
 
-            if not textos:
-                raise ValueError("El documento DOCX está vacío")
+        # Texto de tablas
+        for tabla in doc.tables:
+            for fila in tabla.rows:
+                celdas = [celda.text.strip() for celda in fila.cells]
+                if any(celdas):
+                    textos.append(' | '.join(celdas))
 
-            texto_final = '\n\n'.join(textos)
-            logger.success(f"✅ DOCX parseado ({len(texto_final)} chars)")
+        if textos:
+            hubo_texto = True
+            yield '\n\n'.join(textos) + '\n\n'
 
-            return texto_final
+        if not hubo_texto:
+            raise ValueError("El documento DOCX está vacío")
 
-        except Exception as e:
-            raise ValueError(f"Error procesando DOCX: {e}")
+        logger.success("✅ DOCX parseado")
 
-    async def _parsear_texto(self, contenido: bytes) -> str:
+    def _bloques_texto(self, fuente: FuenteDocumento) -> Iterator[str]:
         """
-        Parsea texto plano con detección de encoding.
+        Lee texto plano por trozos con detección de encoding.
 
-        Intenta múltiples encodings si el primero falla.
+        El encoding se detecta con una muestra inicial y se decodifica
+        de forma incremental (nunca se carga el archivo completo).
 
         Tip: Archivos Markdown (.md) también se procesan aquí.
         """
 
-        # Detectar encoding
-        encoding = 'utf-8'
+        with self._abrir(fuente) as archivo:
+            muestra = archivo.read(BLOQUE_TEXTO_BYTES)
+            encoding = self._detectar_encoding(muestra)
+            decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+
+            bloque = muestra
+            while bloque:
+                texto = decoder.decode(bloque)
+                if texto:
+                    yield texto
+                bloque = archivo.read(BLOQUE_TEXTO_BYTES)
+
+            final = decoder.decode(b'', final=True)
+            if final:
+                yield final
+
+        logger.success(f"✅ Texto parseado con {encoding}")
+
+    def _detectar_encoding(self, muestra: bytes) -> str:
+        """Elige el primer encoding que decodifica la muestra"""
+        candidatos = []
 
         if CHARDET_AVAILABLE:
-            detected = chardet.detect(contenido)
+            detected = chardet.detect(muestra)
             if detected and detected.get('encoding'):
-                encoding = detected['encoding']
-                logger.debug(f"Encoding detectado: {encoding}")
+                candidatos.append(detected['encoding'])
+                logger.debug(f"Encoding detectado: {detected['encoding']}")
 
-        # Intentar decodificar
-        for enc in [encoding] + self.encodings_fallback:
+        for enc in candidatos + self.encodings_fallback:
             try:
-                texto = contenido.decode(enc)
-                logger.success(f"✅ Texto parseado con {enc}")
-                return texto
-            except UnicodeDecodeError:
+                # Un carácter multibyte puede quedar cortado al final de la muestra
+                codecs.getincrementaldecoder(enc)().decode(muestra)
+                return enc
+            except (UnicodeDecodeError, LookupError):
                 continue
 
         raise ValueError("No se pudo decodificar el archivo de texto")
 
-    async def _parsear_csv(self, contenido: bytes) -> str:
+    def _bloques_csv(self, fuente: FuenteDocumento) -> Iterator[str]:
         """
-        Convierte CSV a texto tabular legible.
+        Convierte CSV a texto tabular legible, por bloques de filas.
 
         Formato de salida:
-            Columna1 | Columna2 | Columna3
-            Valor1   | Valor2   | Valor3
+            ENCABEZADOS: Columna1 | Columna2 | Columna3
+            Valor1 | Valor2 | Valor3
             ...
 
-        Tip: Para CSVs grandes, considera cargar solo
-        las primeras N filas.
+        Solo se conservan `max_filas` filas; el resto solo se cuenta.
         """
 
-        try:
-            # Decodificar
-            texto = contenido.decode('utf-8', errors='replace')
-
-            # Parsear CSV
-            reader = csv.reader(io.StringIO(texto))
-            filas = list(reader)
-
-            if not filas:
-                raise ValueError("CSV vacío")
-
-            # Formatear como tabla
-            lineas = []
+        with self._abrir(fuente) as archivo:
+            texto = io.TextIOWrapper(archivo, encoding='utf-8', errors='replace', newline='')
+            try:
+                yield from self._bloques_filas(csv.reader(texto), "CSV")
+            except csv.Error as e:
+                raise ValueError(f"Error procesando CSV: {e}")
+            finally:
+                texto.detach()
 
-            # Headers
-            if len(filas) > 0:
-                lineas.append("ENCABEZADOS: " + ' | '.join(filas[0]))
-                lineas.append("-" * 50)
+    def _bloques_xlsx(self, fuente: FuenteDocumento) -> Iterator[str]:
+        """
+        Convierte cada hoja de un XLSX a texto tabular, por bloques de filas.
 
-            # Datos (máximo 1000 filas)
-            for fila in filas[1:1001]:
-                lineas.append(' | '.join(fila))
+        Usa openpyxl en modo read_only (lectura en streaming).
+        """
 
-            if len(filas) > 1001:
-                lineas.append(f"... y {len(filas) - 1001} filas más")
+        if not OPENPYXL_AVAILABLE:
+            raise ImportError("openpyxl no está instalado. Instala con: pip install openpyxl")
 
-            texto_final = '\n'.join(lineas)
-            logger.success(f"✅ CSV parseado ({len(filas)} filas)")
+        with self._abrir(fuente) as archivo:
+            libro = load_workbook(archivo, read_only=True, data_only=True)
+            try:
+                for hoja in libro.worksheets:
+                    yield f"[Hoja {hoja.title}]\n"
+                    filas = (
+                        ['' if v is None else str(v) for v in fila]
+                        for fila in hoja.iter_rows(values_only=True)
+                    )
+                    yield from self._bloques_filas(filas, f"Hoja {hoja.title}")
+            finally:
+                libro.close()
+
+    def _bloques_filas(self, filas: Iterator[list], nombre: str) -> Iterator[str]:
+        """Agrupa filas tabulares en bloques y cuenta las que exceden el límite"""
+        encabezados = next(filas, None)
+        if encabezados is None:
+            raise ValueError(f"{nombre} vacío")
+
+        lineas = ["ENCABEZADOS: " + ' | '.join(encabezados), "-" * 50]
+        conservadas = 0
+        omitidas = 0
+
+        for fila in filas:
+            if conservadas >= self.max_filas:
+                omitidas += 1
+                continue
+            lineas.append(' | '.join(fila))
+            conservadas += 1
+            if len(lineas) >= self.filas_por_bloque:
+                yield '\n'.join(lineas) + '\n'
+                lineas = []
 
-            return texto_final
+        if omitidas:
+            lineas.append(f"... y {omitidas} filas más")
+        if lineas:
+            yield '\n'.join(lineas) + '\n'
 
-        except Exception as e:
-            raise ValueError(f"Error procesando CSV: {e}")
+        logger.success(f"✅ {nombre} parseado ({conservadas + omitidas + 1} filas)")
 
-    async def _parsear_json(self, contenido: bytes) -> str:
+    def _bloques_json(self, fuente: FuenteDocumento) -> Iterator[str]:
         """
         Convierte JSON a texto legible.
 
@@ -337,48 +474,33 @@ class DocumentParser:
         Tip: Útil para cargar configuraciones o datos estructurados.
         """
 
-        try:
-            texto = contenido.decode('utf-8')
-            datos = json.loads(texto)
-
-            # Formatear JSON legible
-            texto_formateado = json.dumps(
-                datos,
-                indent=2,
-                ensure_ascii=False
-            )
-
-            logger.success("✅ JSON parseado")
-            return texto_formateado
+        with self._abrir(fuente) as archivo:
+            try:
+                datos = json.load(io.TextIOWrapper(archivo, encoding='utf-8'))
+            except (json.JSONDecodeError, UnicodeDecodeError) as e:
+                raise ValueError(f"JSON inválido: {e}")
 
-        except json.JSONDecodeError as e:
-            raise ValueError(f"JSON inválido: {e}")
+        logger.success("✅ JSON parseado")
+        yield json.dumps(datos, indent=2, ensure_ascii=False)
 
-    async def _parsear_xml(self, contenido: bytes) -> str:
+    def _bloques_xml(self, fuente: FuenteDocumento) -> Iterator[str]:
         """
         Extrae texto de XML.
 
         Elimina tags y conserva solo el contenido textual.
         """
 
-        try:
-            import re
-
-            texto = contenido.decode('utf-8', errors='replace')
+        with self._abrir(fuente) as archivo:
+            texto = archivo.read().decode('utf-8', errors='replace')
 
-            # Eliminar tags XML
-            texto_limpio = re.sub(r'<[^>]+>', ' ', texto)
+        # Eliminar tags XML y limpiar espacios
+        texto_limpio = re.sub(r'<[^>]+>', ' ', texto)
+        texto_limpio = re.sub(r'\s+', ' ', texto_limpio).strip()
 
-            # Limpiar espacios
-            texto_limpio = re.sub(r'\s+', ' ', texto_limpio).strip()
+        logger.success("✅ XML parseado")
+        yield texto_limpio
 
-            logger.success("✅ XML parseado")
-            return texto_limpio
-
-        except Exception as e:
-            raise ValueError(f"Error procesando XML: {e}")
-
-    async def _parsear_html(self, contenido: bytes) -> str:
+    def _bloques_html(self, fuente: FuenteDocumento) -> Iterator[str]:
         """
         Extrae texto de HTML.
 
@@ -387,10 +509,12 @@ class DocumentParser:
         Tip: Para páginas web complejas, usa WebScraper en su lugar.
         """
 
+        with self._abrir(fuente) as archivo:
+            html = archivo.read().decode('utf-8', errors='replace')
+
         try:
             from bs4 import BeautifulSoup
 
-            html = contenido.decode('utf-8', errors='replace')
             soup = BeautifulSoup(html, 'html.parser')
 
             # Eliminar scripts y estilos
@@ -398,20 +522,16 @@ class DocumentParser:
                 script.decompose()
 
             texto = soup.get_text(separator='\n', strip=True)
-            logger.success("✅ HTML parseado")
-            return texto
 
         except ImportError:
             # Fallback sin BeautifulSoup
-            import re
-
-            texto = contenido.decode('utf-8', errors='replace')
-            texto = re.sub(r'<script[^>]*>.*?</script>', '', texto, flags=re.DOTALL)
+            texto = re.sub(r'<script[^>]*>.*?</script>', '', html, flags=re.DOTALL)
             texto = re.sub(r'<style[^>]*>.*?</style>', '', texto, flags=re.DOTALL)
             texto = re.sub(r'<[^>]+>', ' ', texto)
             texto = re.sub(r'\s+', ' ', texto).strip()
 
-            return texto
+        logger.success("✅ HTML parseado")
+        yield texto
 
     def get_formatos_soportados(self) -> Dict[str, str]:
         """
@@ -431,6 +551,7 @@ class DocumentParser:
             '.pdf': 'disponible' if PYPDF2_AVAILABLE else 'requiere PyPDF2',
             '.docx': 'disponible' if DOCX_AVAILABLE else 'requiere python-docx',
             '.doc': 'limitado' if DOCX_AVAILABLE else 'requiere python-docx',
+            '.xlsx': 'disponible' if OPENPYXL_AVAILABLE else 'requiere openpyxl',
             '.txt': 'disponible',
             '.md': 'disponible',
             '.csv': 'disponible',
@@ -0,0 +1,428 @@
+"""
+PIPELINE DE EMBEDDINGS
+======================
+
+Genera los embeddings del sistema de conocimiento por fragmentos (chunks)
+en lugar de un único vector por documento truncado.
+
+FUNCIONALIDADES:
+- Divide el contenido en chunks acotados por tokens y con solapamiento
+- Agrupa los chunks en lotes para una sola llamada de embeddings
+- Cachea vectores por SHA-256 del texto normalizado
+- Proveedores intercambiables: OpenAI (async) y hashing local determinista
+
+Uso:
+    from knowledge_system.embeddings import crear_pipeline_embeddings
+
+    pipeline = crear_pipeline_embeddings()
+    chunks = await pipeline.procesar(contenido)
+    for chunk in chunks:
+        print(chunk.indice, chunk.tokens, chunk.modelo, len(chunk.embedding))
+
+Autor: Litper IA System
+Versión: 1.0.0
+"""
+
+import os
+import re
+import math
+import hashlib
+import unicodedata
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+from loguru import logger
+
+try:
+    from openai import AsyncOpenAI
+    OPENAI_AVAILABLE = True
+except ImportError:
+    OPENAI_AVAILABLE = False
+
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+
+
+# Dimensión de la columna VECTOR(1536) en la tabla de chunks
+DIMENSION_EMBEDDING = 1536
+
+# Tamaño de chunk por defecto (tokens) y solapamiento entre chunks consecutivos
+MAX_TOKENS_CHUNK = 500
+SOLAPAMIENTO_TOKENS = 60
+
+# Busca vectores ya persistidos: (modelo, hashes) -> {hash: vector}
+BuscadorPersistidos = Callable[[str, List[str]], Awaitable[Dict[str, List[float]]]]
+
+
+@dataclass
+class Chunk:
+    """Fragmento de un documento con su embedding"""
+    indice: int
+    contenido: str
+    tokens: int
+    hash_contenido: str
+    embedding: Optional[List[float]] = None
+    modelo: Optional[str] = None
+
+
+# ==================== CHUNKING ====================
+
+def normalizar_texto(texto: str) -> str:
+    """Normaliza el texto para calcular la clave de cache (unicode, espacios, minúsculas)"""
+    texto = unicodedata.normalize('NFKC', texto)
+    return re.sub(r'\s+', ' ', texto).strip().lower()
+
+
+def hash_texto(texto: str) -> str:
+    """SHA-256 del texto normalizado"""
+    return hashlib.sha256(normalizar_texto(texto).encode('utf-8')).hexdigest()
+
+
+_ENCODING = None
+
+
+def _encoding():
+    """Carga el tokenizador cl100k_base bajo demanda"""
+    global _ENCODING
+    if _ENCODING is None:
+        _ENCODING = tiktoken.get_encoding('cl100k_base')
+    return _ENCODING
+
+
+def _tokens_palabra(palabra: str) -> int:
+    """Estimación de tokens de una palabra cuando tiktoken no está instalado (~4 chars/token)"""
+    return max(1, math.ceil(len(palabra) / 4))
+
+
+def _ventanas(costos: Sequence[int], max_tokens: int, solapamiento: int) -> List[Tuple[int, int, int]]:
+    """
+    Calcula ventanas [inicio, fin) sobre una secuencia de piezas con costo en tokens.
+
+    Cada ventana suma como máximo `max_tokens` (salvo una pieza que por sí sola
+    lo supere) y la siguiente retrocede hasta cubrir `solapamiento` tokens.
+    """
+    ventanas = []
+    inicio = 0
+    total = len(costos)
+
+    while inicio < total:
+        fin = inicio
+        tokens = 0
+        while fin < total and (fin == inicio or tokens + costos[fin] <= max_tokens):
+            tokens += costos[fin]
+            fin += 1
+        ventanas.append((inicio, fin, tokens))
+
+        if fin >= total:
+            break
+
+        # Retroceder para solapar, garantizando avance
+        siguiente = fin
+        solapados = 0
+        while siguiente - 1 > inicio and solapados + costos[siguiente - 1] <= solapamiento:
+            siguiente -= 1
+            solapados += costos[siguiente]
+        inicio = siguiente
+
+    return ventanas
+
+
+def dividir_en_chunks(
+    texto: str,
+    max_tokens: int = MAX_TOKENS_CHUNK,
+    solapamiento: int = SOLAPAMIENTO_TOKENS
+) -> List[Chunk]:
+    """
+    Divide el texto completo en chunks solapados acotados por tokens.
+
+    Usa tiktoken (cl100k_base) si está instalado; si no, cuenta tokens
+    por palabra de forma aproximada. Nunca trunca: todo el documento
+    queda cubierto por algún chunk.
+    """
+    if not texto or not texto.strip():
+        return []
+
+    if solapamiento >= max_tokens:
+        raise ValueError("El solapamiento debe ser menor que max_tokens")
+
+    chunks = []
+
+    if TIKTOKEN_AVAILABLE:
+        encoding = _encoding()
+        ids = encoding.encode(texto)
+        for inicio, fin, tokens in _ventanas([1] * len(ids), max_tokens, solapamiento):
+            contenido = encoding.decode(ids[inicio:fin]).strip()
+            if contenido:
+                chunks.append(Chunk(len(chunks), contenido, tokens, hash_texto(contenido)))
+    else:
+        palabras = texto.split()
+        costos = [_tokens_palabra(p) for p in palabras]
+        for inicio, fin, tokens in _ventanas(costos, max_tokens, solapamiento):
+            contenido = ' '.join(palabras[inicio:fin])
+            chunks.append(Chunk(len(chunks), contenido, tokens, hash_texto(contenido)))
+
+    return chunks
+
+
+# ==================== PROVEEDORES ====================
+
+class EmbeddingProvider(ABC):
+    """Interfaz de un proveedor de embeddings"""
+
+    nombre: str = "base"
+    dimension: int = DIMENSION_EMBEDDING
+    max_lote: int = 256
+
+    @abstractmethod
+    async def embed(self, textos: List[str]) -> List[List[float]]:
+        """Genera un embedding por texto, en el mismo orden"""
+
+
+class OpenAIEmbeddingProvider(EmbeddingProvider):
+    """Embeddings de OpenAI con el cliente async (una llamada por lote)"""
+
+    max_lote = 512
+
+    def __init__(
+        self,
+        modelo: Optional[str] = None,
+        api_key: Optional[str] = None,
+        dimension: int = DIMENSION_EMBEDDING
+    ):
+        if not OPENAI_AVAILABLE:
+            raise RuntimeError("openai no instalado")
+
+        self.nombre = modelo or os.getenv('EMBEDDING_MODEL', 'text-embedding-ada-002')
+        self.dimension = dimension
+        self.client = AsyncOpenAI(api_key=api_key or os.getenv('OPENAI_API_KEY'))
+
+    async def embed(self, textos: List[str]) -> List[List[float]]:
+        response = await self.client.embeddings.create(model=self.nombre, input=textos)
+        datos = sorted(response.data, key=lambda d: d.index)
+        return [list(d.embedding) for d in datos]
+
+
+class HashingEmbeddingProvider(EmbeddingProvider):
+    """
+    Vectorizador local por hashing (determinista y sin red).
+
+    Proyecta palabras y bigramas en `dimension` cubetas con signo usando
+    blake2b, pondera con 1 + log(tf) y normaliza L2. Sirve para tests
+    offline y como modo degradado cuando no hay proveedor remoto.
+    """
+
+    max_lote = 4096
+
+    def __init__(self, dimension: int = DIMENSION_EMBEDDING):
+        self.dimension = dimension
+        self.nombre = f"hashing-{dimension}"
+
+    def _vectorizar(self, texto: str) -> List[float]:
+        palabras = re.findall(r'\w+', normalizar_texto(texto))
+        terminos = palabras + [f"{a} {b}" for a, b in zip(palabras, palabras[1:])]
+
+        frecuencias: Dict[str, int] = {}
+        for termino in terminos:
+            frecuencias[termino] = frecuencias.get(termino, 0) + 1
+
+        vector = [0.0] * self.dimension
+        for termino, tf in frecuencias.items():
+            digest = hashlib.blake2b(termino.encode('utf-8'), digest_size=8).digest()
+            valor = int.from_bytes(digest, 'little')
+            signo = 1.0 if valor & 1 else -1.0
+            vector[(valor >> 1) % self.dimension] += signo * (1.0 + math.log(tf))
+
+        norma = math.sqrt(sum(v * v for v in vector))
+        if norma > 0:
+            vector = [v / norma for v in vector]
+        return vector
+
+    async def embed(self, textos: List[str]) -> List[List[float]]:
+        return [self._vectorizar(t) for t in textos]
+
+
+# ==================== CACHE ====================
+
+class EmbeddingCache:
+    """Cache LRU en memoria de vectores por (modelo, SHA-256 del texto normalizado)"""
+
+    def __init__(self, max_entradas: int = 20000):
+        self.max_entradas = max_entradas
+        self._datos: "OrderedDict[Tuple[str, str], List[float]]" = OrderedDict()
+
+    def obtener(self, modelo: str, hash_contenido: str) -> Optional[List[float]]:
+        clave = (modelo, hash_contenido)
+        vector = self._datos.get(clave)
+        if vector is not None:
+            self._datos.move_to_end(clave)
+        return vector
+
+    def guardar(self, modelo: str, hash_contenido: str, vector: List[float]):
+        clave = (modelo, hash_contenido)
+        self._datos[clave] = vector
+        self._datos.move_to_end(clave)
+        while len(self._datos) > self.max_entradas:
+            self._datos.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._datos)
+
+
+# ==================== PIPELINE ====================
+
+class EmbeddingPipeline:
+    """
+    Orquesta chunking, cache y llamadas por lote al proveedor.
+
+    Si el proveedor principal falla y hay uno de respaldo, el documento
+    completo se embebe con el respaldo (todos sus chunks quedan con el
+    mismo modelo). Sin respaldo el error se propaga: nunca se guardan
+    vectores en cero.
+    """
+
+    def __init__(
+        self,
+        proveedor: EmbeddingProvider,
+        respaldo: Optional[EmbeddingProvider] = None,
+        cache: Optional[EmbeddingCache] = None,
+        max_tokens: int = MAX_TOKENS_CHUNK,
+        solapamiento: int = SOLAPAMIENTO_TOKENS
+    ):
+        self.proveedor = proveedor
+        self.respaldo = respaldo
+        self.cache = cache or EmbeddingCache()
+        self.max_tokens = max_tokens
+        self.solapamiento = solapamiento
+
+        self.stats = {
+            'llamadas': 0,
+            'textos_embebidos': 0,
+            'aciertos_cache': 0,
+            'aciertos_persistidos': 0,
+            'fallos_proveedor': 0
+        }
+
+    async def procesar(
+        self,
+        texto: str,
+        buscar_persistidos: Optional[BuscadorPersistidos] = None
+    ) -> List[Chunk]:
+        """Divide el texto en chunks y les asigna embedding"""
+        chunks = dividir_en_chunks(texto, self.max_tokens, self.solapamiento)
+        return await self.embed_chunks(chunks, buscar_persistidos)
+
+    async def embed_chunks(
+        self,
+        chunks: List[Chunk],
+        buscar_persistidos: Optional[BuscadorPersistidos] = None
+    ) -> List[Chunk]:
+        """Asigna embedding y modelo a cada chunk (modifica y retorna la lista)"""
+        if not chunks:
+            return chunks
+
+        try:
+            await self._embed_con(self.proveedor, chunks, buscar_persistidos)
+        except Exception as e:
+            self.stats['fallos_proveedor'] += 1
+            if not self.respaldo:
+                raise
+            logger.warning(
+                f"Proveedor de embeddings {self.proveedor.nombre} falló ({e}), "
+                f"usando respaldo {self.respaldo.nombre}"
+            )
+            await self._embed_con(self.respaldo, chunks, buscar_persistidos)
+
+        return chunks
+
+    async def embed_consulta(self, texto: str) -> Tuple[List[float], str]:
+        """Embedding de una consulta de búsqueda; retorna (vector, modelo)"""
+        chunk = Chunk(0, texto, 0, hash_texto(texto))
+        await self.embed_chunks([chunk])
+        return chunk.embedding, chunk.modelo
+
+    async def _embed_con(
+        self,
+        proveedor: EmbeddingProvider,
+        chunks: List[Chunk],
+        buscar_persistidos: Optional[BuscadorPersistidos]
+    ):
+        modelo = proveedor.nombre
+        vectores: Dict[str, List[float]] = {}
+        pendientes: Dict[str, str] = {}
+
+        # 1. Cache en memoria (y deduplicación de pasajes repetidos)
+        for chunk in chunks:
+            if chunk.hash_contenido in vectores or chunk.hash_contenido in pendientes:
+                continue
+            vector = self.cache.obtener(modelo, chunk.hash_contenido)
+            if vector is not None:
+                vectores[chunk.hash_contenido] = vector
+                self.stats['aciertos_cache'] += 1
+            else:
+                pendientes[chunk.hash_contenido] = chunk.contenido
+
+        # 2. Vectores ya persistidos en BD (re-importaciones)
+        if pendientes and buscar_persistidos:
+            try:
+                persistidos = await buscar_persistidos(modelo, list(pendientes))
+            except Exception as e:
+                logger.debug(f"Error buscando embeddings persistidos: {e}")
+                persistidos = {}
+            for hash_contenido, vector in persistidos.items():
+                if hash_contenido in pendientes:
+                    del pendientes[hash_contenido]
+                    vectores[hash_contenido] = vector
+                    self.cache.guardar(modelo, hash_contenido, vector)
+                    self.stats['aciertos_persistidos'] += 1
+
+        # 3. Llamadas por lote al proveedor para el resto
+        hashes = list(pendientes)
+        for i in range(0, len(hashes), proveedor.max_lote):
+            lote = hashes[i:i + proveedor.max_lote]
+            resultado = await proveedor.embed([pendientes[h] for h in lote])
+            if len(resultado) != len(lote):
+                raise ValueError(
+                    f"El proveedor {modelo} retornó {len(resultado)} vectores para {len(lote)} textos"
+                )
+            self.stats['llamadas'] += 1
+            self.stats['textos_embebidos'] += len(lote)
+            for hash_contenido, vector in zip(lote, resultado):
+                vectores[hash_contenido] = vector
+                self.cache.guardar(modelo, hash_contenido, vector)
+
+        for chunk in chunks:
+            chunk.embedding = vectores[chunk.hash_contenido]
+            chunk.modelo = modelo
+
+
+def centroide(vectores: List[List[float]]) -> List[float]:
+    """Promedio normalizado de varios vectores (embedding agregado del documento)"""
+    if not vectores:
+        return []
+    dimension = len(vectores[0])
+    suma = [0.0] * dimension
+    for vector in vectores:
+        for i, v in enumerate(vector):
+            suma[i] += v
+    norma = math.sqrt(sum(v * v for v in suma))
+    return [v / norma for v in suma] if norma > 0 else suma
+
+
+def crear_pipeline_embeddings() -> EmbeddingPipeline:
+    """
+    Crea el pipeline según el entorno.
+
+    Con openai y OPENAI_API_KEY usa OpenAI con respaldo local por hashing;
+    sin ellos trabaja en modo degradado solo con hashing local.
+    """
+    local = HashingEmbeddingProvider()
+
+    if OPENAI_AVAILABLE and os.getenv('OPENAI_API_KEY'):
+        return EmbeddingPipeline(OpenAIEmbeddingProvider(), respaldo=local)
+
+    logger.warning("OpenAI no disponible para embeddings, usando hashing local (modo degradado)")
+    return EmbeddingPipeline(local)
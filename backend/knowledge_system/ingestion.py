@@ -0,0 +1,404 @@
+"""
+RUNNER DE INGESTA POR LOTES
+===========================
+
+Procesa lotes de fuentes (URLs, archivos, videos, texto) en segundo plano
+para que las cargas masivas no dependan de una sola petición HTTP.
+
+FUNCIONALIDADES:
+- Recibe un lote de fuentes y retorna un job id de inmediato
+- Extracción con concurrencia acotada por tipo de fuente
+  (navegador Playwright compartido para web, pool de hilos del parser para documentos)
+- Etapas encadenadas: extracción -> análisis IA -> embeddings -> guardado
+- Progreso por item y reintentos que retoman desde la etapa que falló
+
+Uso:
+    from knowledge_system.ingestion import get_ingestion_runner
+
+    runner = get_ingestion_runner()
+    job_id = await runner.enviar([
+        {'fuente': 'https://docs.ejemplo.com', 'tipo': 'web'},
+        {'fuente': '/data/manual.pdf', 'tipo': 'archivo'},
+    ])
+    print(runner.obtener(job_id)['progreso'])
+
+Autor: Litper IA System
+Versión: 1.0.0
+"""
+
+import asyncio
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from enum import Enum
+from typing import Any, Dict, List, Optional
+from loguru import logger
+
+from .embeddings import Chunk
+
+
+# Extracciones simultáneas por tipo de fuente
+LIMITES_EXTRACCION = {
+    'web': 4,
+    'youtube': 3,
+    'archivo': 2,
+    'documento': 2,
+    'texto': 16,
+}
+
+# Contenido mínimo aceptado (igual que cargar_conocimiento)
+MIN_CARACTERES_CONTENIDO = 50
+
+# Jobs finalizados que se conservan en memoria para consultar su progreso
+MAX_JOBS_HISTORIAL = 100
+
+
+class EstadoItem(str, Enum):
+    """Estados de un item de ingesta"""
+    PENDIENTE = "pendiente"
+    EN_PROCESO = "en_proceso"
+    COMPLETADO = "completado"
+    DUPLICADO = "duplicado"
+    FALLIDO = "fallido"
+
+
+class EtapaIngesta(str, Enum):
+    """Etapas del pipeline de ingesta, en orden"""
+    EXTRACCION = "extraccion"
+    ANALISIS = "analisis"
+    EMBEDDINGS = "embeddings"
+    GUARDADO = "guardado"
+
+
+@dataclass
+class ItemIngesta:
+    """Una fuente dentro de un job, con el resultado de cada etapa ya completada"""
+    indice: int
+    fuente: str
+    tipo: str
+    metadata: Dict = field(default_factory=dict)
+    opciones: Dict = field(default_factory=dict)
+    estado: EstadoItem = EstadoItem.PENDIENTE
+    etapa: Optional[EtapaIngesta] = None
+    intentos: int = 0
+    error: Optional[str] = None
+
+    # Resultados intermedios (permiten reintentar sin repetir etapas)
+    hash_fuente: Optional[str] = None
+    contenido: Optional[str] = None
+    analisis: Optional[Dict] = None
+    chunks: Optional[List[Chunk]] = None
+    resultado: Optional[Dict] = None
+
+    def to_dict(self) -> Dict:
+        resumen = None
+        if self.resultado:
+            resumen = {k: self.resultado.get(k) for k in ('id', 'titulo', 'categoria', 'chunks')}
+        return {
+            'indice': self.indice,
+            'fuente': self.fuente,
+            'tipo': self.tipo,
+            'estado': self.estado.value,
+            'etapa': self.etapa.value if self.etapa else None,
+            'intentos': self.intentos,
+            'error': self.error,
+            'resultado': resumen,
+        }
+
+
+@dataclass
+class TrabajoIngesta:
+    """Job de ingesta con sus items"""
+    id: str
+    items: List[ItemIngesta]
+    creado: datetime = field(default_factory=datetime.now)
+    finalizado: Optional[datetime] = None
+
+    def to_dict(self, incluir_items: bool = True) -> Dict:
+        conteo = {estado: 0 for estado in EstadoItem}
+        for item in self.items:
+            conteo[item.estado] += 1
+
+        terminados = conteo[EstadoItem.COMPLETADO] + conteo[EstadoItem.DUPLICADO] + conteo[EstadoItem.FALLIDO]
+        total = len(self.items)
+
+        if terminados < total:
+            estado = 'en_curso'
+        elif conteo[EstadoItem.FALLIDO]:
+            estado = 'completado_con_errores'
+        else:
+            estado = 'completado'
+
+        datos = {
+            'id': self.id,
+            'estado': estado,
+            'total': total,
+            'completados': conteo[EstadoItem.COMPLETADO],
+            'duplicados': conteo[EstadoItem.DUPLICADO],
+            'fallidos': conteo[EstadoItem.FALLIDO],
+            'en_proceso': conteo[EstadoItem.EN_PROCESO],
+            'pendientes': conteo[EstadoItem.PENDIENTE],
+            'progreso': round(terminados / total * 100, 1) if total else 100.0,
+            'creado': self.creado.isoformat(),
+            'finalizado': self.finalizado.isoformat() if self.finalizado else None,
+        }
+        if incluir_items:
+            datos['items'] = [item.to_dict() for item in self.items]
+        return datos
+
+
+class IngestionRunner:
+    """
+    Ejecuta jobs de ingesta en segundo plano sobre un KnowledgeManager.
+
+    Cada item recorre las etapas con su propio límite de concurrencia,
+    así mientras unos items se descargan otros se analizan o embeben.
+    Los fallos se reintentan retomando desde la etapa que falló.
+    """
+
+    def __init__(
+        self,
+        knowledge_manager,
+        limites_extraccion: Optional[Dict[str, int]] = None,
+        concurrencia_analisis: int = 4,
+        concurrencia_embeddings: int = 2,
+        max_reintentos: int = 2,
+        espera_reintento: float = 2.0
+    ):
+        self.km = knowledge_manager
+        self.max_reintentos = max_reintentos
+        self.espera_reintento = espera_reintento
+
+        limites = {**LIMITES_EXTRACCION, **(limites_extraccion or {})}
+        self._sem_extraccion = {tipo: asyncio.Semaphore(n) for tipo, n in limites.items()}
+        self._sem_analisis = asyncio.Semaphore(concurrencia_analisis)
+        self._sem_embeddings = asyncio.Semaphore(concurrencia_embeddings)
+
+        self.trabajos: "OrderedDict[str, TrabajoIngesta]" = OrderedDict()
+        self._tareas: Dict[str, asyncio.Task] = {}
+
+    # ==================== API ====================
+
+    async def enviar(self, fuentes: List[Dict[str, Any]]) -> str:
+        """
+        Crea un job con las fuentes y lo lanza en segundo plano.
+
+        Args:
+            fuentes: [{'fuente': str, 'tipo': str, 'metadata': dict?, 'opciones': dict?}]
+
+        Returns:
+            ID del job para consultar progreso
+        """
+        if not fuentes:
+            raise ValueError("El lote de fuentes está vacío")
+
+        items = []
+        for i, f in enumerate(fuentes):
+            if f.get('tipo') not in self._sem_extraccion:
+                raise ValueError(f"Tipo de fuente no soportado: {f.get('tipo')}")
+            items.append(ItemIngesta(
+                indice=i,
+                fuente=f['fuente'],
+                tipo=f['tipo'],
+                metadata=f.get('metadata') or {},
+                opciones=f.get('opciones') or {}
+            ))
+
+        trabajo = TrabajoIngesta(id=uuid.uuid4().hex, items=items)
+        self.trabajos[trabajo.id] = trabajo
+        self._purgar_historial()
+        self._lanzar(trabajo, items)
+
+        logger.info(f"📦 Job de ingesta {trabajo.id} creado con {len(items)} fuentes")
+        return trabajo.id
+
+    def obtener(self, job_id: str, incluir_items: bool = True) -> Optional[Dict]:
+        """Progreso del job (None si no existe)"""
+        trabajo = self.trabajos.get(job_id)
+        return trabajo.to_dict(incluir_items) if trabajo else None
+
+    async def reintentar(self, job_id: str) -> int:
+        """
+        Relanza los items fallidos de un job terminado.
+
+        Las etapas que ya completaron no se repiten (p. ej. no se vuelve
+        a descargar una URL que falló al guardar). Retorna cuántos items
+        se relanzaron.
+        """
+        trabajo = self.trabajos.get(job_id)
+        if trabajo is None:
+            raise KeyError(job_id)
+        if job_id in self._tareas:
+            raise ValueError("El job todavía está en curso")
+
+        fallidos = [item for item in trabajo.items if item.estado == EstadoItem.FALLIDO]
+        for item in fallidos:
+            item.estado = EstadoItem.PENDIENTE
+            item.error = None
+            item.intentos = 0
+
+        if fallidos:
+            trabajo.finalizado = None
+            self._lanzar(trabajo, fallidos)
+        return len(fallidos)
+
+    async def esperar(self, job_id: str) -> Optional[Dict]:
+        """Espera a que el job termine y retorna su progreso final"""
+        tarea = self._tareas.get(job_id)
+        if tarea:
+            await asyncio.shield(tarea)
+        return self.obtener(job_id)
+
+    async def cerrar(self):
+        """Cancela jobs en curso y libera navegador y pool del parser"""
+        for tarea in list(self._tareas.values()):
+            tarea.cancel()
+        if self._tareas:
+            await asyncio.gather(*self._tareas.values(), return_exceptions=True)
+
+        if self.km._web_scraper is not None:
+            await self.km._web_scraper.cerrar()
+        if self.km._document_parser is not None:
+            self.km._document_parser.cerrar()
+
+    # ==================== EJECUCIÓN ====================
+
+    def _lanzar(self, trabajo: TrabajoIngesta, items: List[ItemIngesta]):
+        tarea = asyncio.create_task(self._ejecutar(trabajo, items))
+        self._tareas[trabajo.id] = tarea
+        tarea.add_done_callback(lambda _: self._tareas.pop(trabajo.id, None))
+
+    async def _ejecutar(self, trabajo: TrabajoIngesta, items: List[ItemIngesta]):
+        # hash de fuente -> futuro con el resultado del item que la procesa
+        # (True si quedó guardada); los ya completados vienen resueltos
+        loop = asyncio.get_running_loop()
+        vistos: Dict[str, asyncio.Future] = {}
+        for item in trabajo.items:
+            if item.estado == EstadoItem.COMPLETADO:
+                vistos[item.hash_fuente] = loop.create_future()
+                vistos[item.hash_fuente].set_result(True)
+        try:
+            await asyncio.gather(*[self._procesar_con_reintentos(item, vistos) for item in items])
+        finally:
+            trabajo.finalizado = datetime.now()
+
+        resumen = trabajo.to_dict(incluir_items=False)
+        logger.info(
+            f"📦 Job {trabajo.id} terminado: {resumen['completados']} ok, "
+            f"{resumen['duplicados']} duplicados, {resumen['fallidos']} fallidos"
+        )
+
+    async def _procesar_con_reintentos(self, item: ItemIngesta, vistos: Dict[str, asyncio.Future]):
+        item.estado = EstadoItem.EN_PROCESO
+
+        # Repetido dentro del lote: espera al primero y solo cuenta como
+        # duplicado si ese quedó guardado; si falló, este toma su lugar
+        hash_fuente = item.hash_fuente or self.km._generar_hash(item.fuente)
+        while hash_fuente in vistos:
+            if await asyncio.shield(vistos[hash_fuente]):
+                item.estado = EstadoItem.DUPLICADO
+                return
+        resultado = vistos[hash_fuente] = asyncio.get_running_loop().create_future()
+
+        try:
+            await self._reintentar_etapas(item)
+        finally:
+            guardado = item.estado in (EstadoItem.COMPLETADO, EstadoItem.DUPLICADO)
+            if not guardado:
+                del vistos[hash_fuente]
+            resultado.set_result(guardado)
+
+    async def _reintentar_etapas(self, item: ItemIngesta):
+        while True:
+            item.intentos += 1
+            try:
+                await self._procesar(item)
+                return
+            except asyncio.CancelledError:
+                item.estado = EstadoItem.FALLIDO
+                item.error = "Cancelado"
+                raise
+            except Exception as e:
+                item.error = f"{item.etapa.value if item.etapa else 'inicio'}: {e}"
+                if item.intentos > self.max_reintentos:
+                    item.estado = EstadoItem.FALLIDO
+                    logger.warning(f"❌ Ingesta fallida [{item.tipo}] {item.fuente[:80]}: {item.error}")
+                    return
+                logger.debug(f"Reintentando [{item.tipo}] {item.fuente[:80]} ({item.error})")
+                await asyncio.sleep(self.espera_reintento * item.intentos)
+
+    async def _procesar(self, item: ItemIngesta):
+        """Recorre las etapas pendientes del item"""
+        if item.hash_fuente is None:
+            hash_fuente = self.km._generar_hash(item.fuente)
+            if await self.km._existe_en_db(hash_fuente):
+                item.estado = EstadoItem.DUPLICADO
+                return
+            item.hash_fuente = hash_fuente
+
+        if item.contenido is None:
+            item.etapa = EtapaIngesta.EXTRACCION
+            async with self._sem_extraccion[item.tipo]:
+                contenido = await self.km._procesar_fuente(item.fuente, item.tipo, item.opciones)
+            if not contenido or len(contenido.strip()) < MIN_CARACTERES_CONTENIDO:
+                raise ValueError("Contenido extraído muy corto o vacío")
+            item.contenido = contenido
+
+        if item.analisis is None:
+            item.etapa = EtapaIngesta.ANALISIS
+            async with self._sem_analisis:
+                item.analisis = await self.km.analizar_contenido(item.contenido, item.fuente)
+
+        if item.chunks is None:
+            item.etapa = EtapaIngesta.EMBEDDINGS
+            async with self._sem_embeddings:
+                item.chunks = await self.km.generar_chunks(item.contenido)
+
+        item.etapa = EtapaIngesta.GUARDADO
+        item.resultado = await self.km.guardar_conocimiento(
+            hash_fuente=item.hash_fuente,
+            tipo=item.tipo,
+            fuente=item.fuente,
+            analisis=item.analisis,
+            chunks=item.chunks,
+            metadata=item.metadata
+        )
+
+        # Liberar memoria de los intermedios ya persistidos
+        item.contenido = item.analisis = item.chunks = None
+        item.estado = EstadoItem.COMPLETADO
+        item.error = None
+
+    def _purgar_historial(self):
+        """Descarta los jobs finalizados más antiguos por encima del máximo"""
+        while len(self.trabajos) > MAX_JOBS_HISTORIAL:
+            antiguo = next(
+                (job_id for job_id, t in self.trabajos.items() if t.finalizado is not None),
+                None
+            )
+            if antiguo is None:
+                break
+            del self.trabajos[antiguo]
+
+
+# ==================== SINGLETON ====================
+
+_ingestion_runner_instance = None
+
+
+def get_ingestion_runner() -> IngestionRunner:
+    """Obtiene instancia singleton del runner de ingesta."""
+    global _ingestion_runner_instance
+    if _ingestion_runner_instance is None:
+        from .knowledge_manager import get_knowledge_manager
+        _ingestion_runner_instance = IngestionRunner(get_knowledge_manager())
+    return _ingestion_runner_instance
+
+
+async def cerrar_ingestion_runner():
+    """Cierra el runner si fue creado (shutdown de la app)."""
+    global _ingestion_runner_instance
+    if _ingestion_runner_instance is not None:
+        await _ingestion_runner_instance.cerrar()
+        _ingestion_runner_instance = None
@@ -148,7 +148,7 @@ async def upload_file(
     logger.info(f"📁 Recibiendo archivo: {archivo.filename}")
 
     # Validar extensión
-    extensiones_validas = {'.pdf', '.docx', '.doc', '.txt', '.md', '.csv', '.json', '.xml', '.html'}
+    extensiones_validas = {'.pdf', '.docx', '.doc', '.xlsx', '.txt', '.md', '.csv', '.json', '.xml', '.html'}
     extension = os.path.splitext(archivo.filename)[1].lower()
 
     if extension not in extensiones_validas:
@@ -0,0 +1,267 @@
+"""
+RECUPERACIÓN HÍBRIDA (LÉXICA + VECTORIAL)
+=========================================
+
+Combina una búsqueda léxica (términos exactos: transportadoras, números
+de guía) con una vectorial (semántica) mediante Reciprocal Rank Fusion.
+
+FUNCIONALIDADES:
+- Fusión RRF de varias listas ordenadas, a nivel de documento
+- Índice en memoria con NumPy (coseno) + BM25 para trabajar sin Postgres
+
+En producción las dos ramas corren en Postgres (tsvector + HNSW); el
+índice en memoria replica el mismo contrato para tests y modo sin BD.
+
+Autor: Litper IA System
+Versión: 1.0.0
+"""
+
+import re
+import math
+import unicodedata
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .embeddings import Chunk
+
+
+# Constante k de RRF (valor estándar de la literatura)
+RRF_K = 60
+
+# Chunks a traer por rama por cada resultado pedido
+CHUNKS_POR_RESULTADO = 4
+
+# Campos del documento que se exponen en los resultados de búsqueda
+CAMPOS_RESULTADO = (
+    'id', 'titulo', 'resumen', 'categoria', 'subcategoria', 'tags',
+    'fuente_tipo', 'fuente_url', 'fecha_carga'
+)
+
+
+@dataclass
+class Coincidencia:
+    """Chunk encontrado por una de las ramas de búsqueda"""
+    documento_id: int
+    documento: Dict
+    fragmento: str
+    similitud: Optional[float] = None
+
+
+def tokenizar(texto: str) -> List[str]:
+    """Tokeniza para BM25: minúsculas, sin tildes, palabras alfanuméricas"""
+    texto = unicodedata.normalize('NFKD', texto.lower())
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return re.findall(r'\w+', texto)
+
+
+def fusionar_rrf(ramas: Sequence[Sequence[Coincidencia]], limite: int, k: int = RRF_K) -> List[Dict]:
+    """
+    Fusiona las ramas con Reciprocal Rank Fusion a nivel de documento.
+
+    Cada rama debe venir ordenada de mejor a peor; un documento cuenta
+    una vez por rama (su mejor chunk). El fragmento mostrado es el del
+    primer chunk visto siguiendo el orden de las ramas.
+    """
+    puntajes: Dict[int, float] = {}
+    resultados: Dict[int, Dict] = {}
+
+    for rama in ramas:
+        vistos = set()
+        for coincidencia in rama:
+            doc_id = coincidencia.documento_id
+            if doc_id in vistos:
+                continue
+            vistos.add(doc_id)
+
+            puntajes[doc_id] = puntajes.get(doc_id, 0.0) + 1.0 / (k + len(vistos))
+            resultado = resultados.setdefault(doc_id, {
+                **coincidencia.documento,
+                'similitud': None,
+                'fragmento': coincidencia.fragmento
+            })
+            if coincidencia.similitud is not None and resultado['similitud'] is None:
+                resultado['similitud'] = round(coincidencia.similitud, 3)
+
+    ordenados = sorted(puntajes.items(), key=lambda x: x[1], reverse=True)[:limite]
+    return [{**resultados[doc_id], 'relevancia': round(puntaje, 5)} for doc_id, puntaje in ordenados]
+
+
+class IndiceMemoria:
+    """
+    Índice híbrido en memoria: matriz NumPy de embeddings + BM25 sobre chunks.
+
+    Ejemplo de uso:
+        indice = IndiceMemoria()
+        doc_id = indice.agregar({'titulo': 'Guía Servientrega', ...}, chunks)
+        resultados = indice.buscar("servientrega", query_vec, modelo, limite=5)
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+
+        self.documentos: Dict[int, Dict] = {}
+        self._siguiente_id = 1
+
+        # Chunks en orden de inserción (posición = fila de la matriz)
+        self._chunk_doc: List[int] = []
+        self._chunk_texto: List[str] = []
+        self._chunk_modelo: List[str] = []
+        self._vectores: List[np.ndarray] = []
+        self._matriz: Optional[np.ndarray] = None
+
+        # BM25: término -> {posición chunk: tf}
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._longitudes: List[int] = []
+
+    def __len__(self) -> int:
+        return len(self.documentos)
+
+    # ==================== ESCRITURA ====================
+
+    def agregar(self, documento: Dict, chunks: List[Chunk]) -> int:
+        """Agrega un documento con sus chunks embebidos; retorna su ID"""
+        doc_id = self._siguiente_id
+        self._siguiente_id += 1
+        self.documentos[doc_id] = {
+            **documento,
+            'id': doc_id,
+            'fecha_carga': documento.get('fecha_carga') or datetime.now().isoformat()
+        }
+
+        for chunk in chunks:
+            self._agregar_chunk(doc_id, chunk.contenido, chunk.modelo, chunk.embedding)
+        self._matriz = None
+        return doc_id
+
+    def eliminar(self, doc_id: int) -> bool:
+        """Elimina un documento y reconstruye los índices de chunks"""
+        if self.documentos.pop(doc_id, None) is None:
+            return False
+
+        conservar = [
+            (d, t, m, v)
+            for d, t, m, v in zip(self._chunk_doc, self._chunk_texto, self._chunk_modelo, self._vectores)
+            if d != doc_id
+        ]
+        self._chunk_doc, self._chunk_texto, self._chunk_modelo, self._vectores = [], [], [], []
+        self._postings, self._longitudes = {}, []
+        for d, t, m, v in conservar:
+            self._agregar_chunk(d, t, m, v)
+        self._matriz = None
+        return True
+
+    def buscar_por_hash(self, hash_fuente: str) -> Optional[int]:
+        """ID del documento con ese hash de fuente, si existe"""
+        for doc_id, documento in self.documentos.items():
+            if documento.get('hash_fuente') == hash_fuente:
+                return doc_id
+        return None
+
+    def _agregar_chunk(self, doc_id: int, texto: str, modelo: str, embedding):
+        posicion = len(self._chunk_doc)
+        vector = np.asarray(embedding, dtype=np.float32)
+        norma = np.linalg.norm(vector)
+
+        self._chunk_doc.append(doc_id)
+        self._chunk_texto.append(texto)
+        self._chunk_modelo.append(modelo)
+        self._vectores.append(vector / norma if norma > 0 else vector)
+
+        terminos = tokenizar(texto)
+        self._longitudes.append(len(terminos))
+        for termino in terminos:
+            posting = self._postings.setdefault(termino, {})
+            posting[posicion] = posting.get(posicion, 0) + 1
+
+    # ==================== BÚSQUEDA ====================
+
+    def _filtro(self, categoria: Optional[str]) -> np.ndarray:
+        """Máscara de chunks cuyo documento pasa el filtro de categoría"""
+        if not categoria:
+            return np.ones(len(self._chunk_doc), dtype=bool)
+        return np.array(
+            [self.documentos[d].get('categoria') == categoria for d in self._chunk_doc],
+            dtype=bool
+        )
+
+    def _coincidencia(self, posicion: int, similitud: Optional[float] = None) -> Coincidencia:
+        doc_id = self._chunk_doc[posicion]
+        documento = {campo: self.documentos[doc_id].get(campo) for campo in CAMPOS_RESULTADO}
+        return Coincidencia(doc_id, documento, self._chunk_texto[posicion], similitud)
+
+    def buscar_vectorial(
+        self,
+        query_embedding: List[float],
+        modelo: str,
+        limite: int,
+        umbral: float = 0.0,
+        categoria: Optional[str] = None
+    ) -> List[Coincidencia]:
+        """Chunks más similares (coseno) del mismo modelo, con umbral aplicado antes del límite"""
+        if not self._vectores:
+            return []
+
+        if self._matriz is None:
+            self._matriz = np.vstack(self._vectores)
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norma = np.linalg.norm(query)
+        if norma == 0:
+            return []
+
+        similitudes = self._matriz @ (query / norma)
+        mascara = self._filtro(categoria) & (np.array(self._chunk_modelo) == modelo) & (similitudes >= umbral)
+
+        candidatos = np.flatnonzero(mascara)
+        if len(candidatos) > limite:
+            mejores = np.argpartition(-similitudes[candidatos], limite - 1)[:limite]
+            candidatos = candidatos[mejores]
+        candidatos = candidatos[np.argsort(-similitudes[candidatos], kind='stable')]
+
+        return [self._coincidencia(int(p), float(similitudes[p])) for p in candidatos]
+
+    def buscar_lexica(self, query: str, limite: int, categoria: Optional[str] = None) -> List[Coincidencia]:
+        """Chunks ordenados por BM25 contra los términos de la consulta"""
+        total = len(self._longitudes)
+        if total == 0:
+            return []
+
+        promedio = sum(self._longitudes) / total
+        puntajes: Dict[int, float] = {}
+
+        for termino in set(tokenizar(query)):
+            posting = self._postings.get(termino)
+            if not posting:
+                continue
+            idf = math.log(1 + (total - len(posting) + 0.5) / (len(posting) + 0.5))
+            for posicion, tf in posting.items():
+                longitud = self._longitudes[posicion] / promedio if promedio else 1.0
+                peso = tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * longitud))
+                puntajes[posicion] = puntajes.get(posicion, 0.0) + idf * peso
+
+        mascara = self._filtro(categoria)
+        ordenados = sorted(
+            (p for p in puntajes if mascara[p]),
+            key=lambda p: puntajes[p],
+            reverse=True
+        )[:limite]
+        return [self._coincidencia(p) for p in ordenados]
+
+    def buscar(
+        self,
+        query: str,
+        query_embedding: List[float],
+        modelo: str,
+        limite: int = 10,
+        categoria: Optional[str] = None,
+        umbral_similitud: float = 0.0
+    ) -> List[Dict]:
+        """Búsqueda híbrida: rama vectorial + rama BM25 fusionadas con RRF"""
+        por_rama = limite * CHUNKS_POR_RESULTADO
+        vectorial = self.buscar_vectorial(query_embedding, modelo, por_rama, umbral_similitud, categoria)
+        lexica = self.buscar_lexica(query, por_rama, categoria)
+        return fusionar_rrf([vectorial, lexica], limite)
@@ -67,7 +67,9 @@ class WebScraper:
         )
 
     Tip: El scraper intenta primero con requests (más rápido).
-    Si falla, usa Playwright para renderizar JavaScript.
+    Si falla, usa Playwright para renderizar JavaScript. El navegador
+    se lanza una sola vez y cada extracción usa su propio contexto;
+    llama a `cerrar()` al terminar.
     """
 
     def __init__(self):
@@ -79,6 +81,42 @@ class WebScraper:
         )
         self.timeout = 30  # segundos
 
+        # Navegador Playwright compartido (lazy)
+        self._playwright = None
+        self._browser = None
+        self._lock_browser = asyncio.Lock()
+
+    async def _obtener_browser(self):
+        """
+        Lanza el navegador compartido la primera vez que se necesita.
+
+        Tip: Lanzar Chromium cuesta ~1s; un contexto nuevo por página
+        cuesta milisegundos y mantiene aisladas cookies y sesiones.
+        """
+        async with self._lock_browser:
+            if self._browser is None or not self._browser.is_connected():
+                if self._playwright is None:
+                    self._playwright = await async_playwright().start()
+                self._browser = await self._playwright.chromium.launch(
+                    headless=True,
+                    args=['--no-sandbox', '--disable-setuid-sandbox']
+                )
+                logger.debug("Navegador Playwright compartido lanzado")
+        return self._browser
+
+    async def cerrar(self) -> None:
+        """Cierra el navegador compartido y Playwright."""
+        async with self._lock_browser:
+            if self._browser is not None:
+                try:
+                    await self._browser.close()
+                except Exception as e:
+                    logger.debug(f"Error cerrando navegador: {e}")
+                self._browser = None
+            if self._playwright is not None:
+                await self._playwright.stop()
+                self._playwright = None
+
     async def extraer(
         self,
         url: str,
@@ -188,39 +226,34 @@ class WebScraper:
         if not PLAYWRIGHT_AVAILABLE:
             raise Exception("Playwright no está instalado")
 
-        async with async_playwright() as p:
-            browser = await p.chromium.launch(
-                headless=True,
-                args=['--no-sandbox', '--disable-setuid-sandbox']
-            )
+        browser = await self._obtener_browser()
+        context = await browser.new_context(user_agent=self.user_agent)
 
-            try:
-                page = await browser.new_page(
-                    user_agent=self.user_agent
-                )
+        try:
+            page = await context.new_page()
 
-                # Navegar y esperar
-                await page.goto(url, wait_until='networkidle', timeout=self.timeout * 1000)
+            # Navegar y esperar
+            await page.goto(url, wait_until='networkidle', timeout=self.timeout * 1000)
 
-                # Esperar un poco más para contenido dinámico
-                await page.wait_for_timeout(2000)
+            # Esperar un poco más para contenido dinámico
+            await page.wait_for_timeout(2000)
 
-                # Scroll para cargar contenido lazy
-                await self._scroll_page(page)
+            # Scroll para cargar contenido lazy
+            await self._scroll_page(page)
 
-                # Extraer HTML
-                html = await page.content()
+            # Extraer HTML
+            html = await page.content()
 
-                if BeautifulSoup:
-                    soup = BeautifulSoup(html, 'html.parser')
-                    contenido = self._limpiar_html(soup)
-                    logger.success(f"✅ Contenido Playwright ({len(contenido)} chars)")
-                    return contenido
-                else:
-                    return html
+            if BeautifulSoup:
+                soup = BeautifulSoup(html, 'html.parser')
+                contenido = self._limpiar_html(soup)
+                logger.success(f"✅ Contenido Playwright ({len(contenido)} chars)")
+                return contenido
+            else:
+                return html
 
-            finally:
-                await browser.close()
+        finally:
+            await context.close()
 
     async def _extraer_con_login(
         self,
@@ -246,78 +279,72 @@ class WebScraper:
 
         logger.info(f"🔐 Extrayendo {url} con autenticación")
 
-        async with async_playwright() as p:
-            browser = await p.chromium.launch(
-                headless=True,
-                args=['--no-sandbox']
-            )
+        browser = await self._obtener_browser()
+        context = await browser.new_context(user_agent=self.user_agent)
 
-            try:
-                context = await browser.new_context(
-                    user_agent=self.user_agent
-                )
-                page = await context.new_page()
+        try:
+            page = await context.new_page()
 
-                # PASO 1: Ir a página de login
-                login_url = credenciales.get('login_url')
-                if not login_url:
-                    raise ValueError("login_url es requerido en credenciales")
+            # PASO 1: Ir a página de login
+            login_url = credenciales.get('login_url')
+            if not login_url:
+                raise ValueError("login_url es requerido en credenciales")
 
-                logger.debug(f"Navegando a login: {login_url}")
-                await page.goto(login_url, wait_until='networkidle')
+            logger.debug(f"Navegando a login: {login_url}")
+            await page.goto(login_url, wait_until='networkidle')
 
-                # PASO 2: Selectores de formulario
-                username_selector = credenciales.get(
-                    'username_selector',
-                    'input[name="username"], input[name="email"], input[type="email"], #username, #email'
-                )
-                password_selector = credenciales.get(
-                    'password_selector',
-                    'input[name="password"], input[type="password"], #password'
-                )
-                submit_selector = credenciales.get(
-                    'submit_selector',
-                    'button[type="submit"], input[type="submit"], button:has-text("Login"), button:has-text("Iniciar")'
-                )
+            # PASO 2: Selectores de formulario
+            username_selector = credenciales.get(
+                'username_selector',
+                'input[name="username"], input[name="email"], input[type="email"], #username, #email'
+            )
+            password_selector = credenciales.get(
+                'password_selector',
+                'input[name="password"], input[type="password"], #password'
+            )
+            submit_selector = credenciales.get(
+                'submit_selector',
+                'button[type="submit"], input[type="submit"], button:has-text("Login"), button:has-text("Iniciar")'
+            )
 
-                # PASO 3: Llenar formulario
-                username = credenciales.get('username')
-                password = credenciales.get('password')
+            # PASO 3: Llenar formulario
+            username = credenciales.get('username')
+            password = credenciales.get('password')
 
-                if not username or not password:
-                    raise ValueError("username y password son requeridos")
+            if not username or not password:
+                raise ValueError("username y password son requeridos")
 
-                await page.fill(username_selector, username)
-                await page.fill(password_selector, password)
+            await page.fill(username_selector, username)
+            await page.fill(password_selector, password)
 
-                # PASO 4: Submit
-                await page.click(submit_selector)
-                await page.wait_for_load_state('networkidle')
-                await page.wait_for_timeout(2000)
+            # PASO 4: Submit
+            await page.click(submit_selector)
+            await page.wait_for_load_state('networkidle')
+            await page.wait_for_timeout(2000)
 
-                # Verificar si el login fue exitoso
-                current_url = page.url
-                if 'login' in current_url.lower() or 'error' in current_url.lower():
-                    logger.warning("Login posiblemente falló")
+            # Verificar si el login fue exitoso
+            current_url = page.url
+            if 'login' in current_url.lower() or 'error' in current_url.lower():
+                logger.warning("Login posiblemente falló")
 
-                # PASO 5: Navegar a URL objetivo
-                logger.debug(f"Navegando a: {url}")
-                await page.goto(url, wait_until='networkidle')
-                await page.wait_for_timeout(2000)
+            # PASO 5: Navegar a URL objetivo
+            logger.debug(f"Navegando a: {url}")
+            await page.goto(url, wait_until='networkidle')
+            await page.wait_for_timeout(2000)
 
-                # PASO 6: Extraer contenido
-                html = await page.content()
+            # PASO 6: Extraer contenido
+            html = await page.content()
 
-                if BeautifulSoup:
-                    soup = BeautifulSoup(html, 'html.parser')
-                    contenido = self._limpiar_html(soup)
-                    logger.success(f"✅ Contenido con login ({len(contenido)} chars)")
-                    return contenido
-                else:
-                    return html
+            if BeautifulSoup:
+                soup = BeautifulSoup(html, 'html.parser')
+                contenido = self._limpiar_html(soup)
+                logger.success(f"✅ Contenido con login ({len(contenido)} chars)")
+                return contenido
+            else:
+                return html
 
-            finally:
-                await browser.close()
+        finally:
+            await context.close()
 
     async def _scroll_page(self, page) -> None:
         """
@@ -11,6 +11,7 @@ from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 from sqlalchemy import func, Integer, cast
 from sqlalchemy.orm import Session
@@ -241,6 +242,10 @@ async def lifespan(app: FastAPI):
         logger.success("Conexión a base de datos establecida")
         init_database()
         crear_configuraciones_default()
+
+        # Worker de entregas de webhooks (outbox); uno por proceso, las colas se reclaman con lease
+        from services.webhook_service import webhook_service
+        webhook_service.start_worker()
     else:
         logger.error("No se pudo conectar a la base de datos")
 
@@ -256,6 +261,25 @@ async def lifespan(app: FastAPI):
     logger.info("Deteniendo aplicación...")
     sistema_reentrenamiento.detener()
 
+    if TRACKER_SYSTEM_AVAILABLE:
+        from database_tracker import cerrar_pool
+        cerrar_pool()
+
+    if ADMIN_SYSTEM_AVAILABLE:
+        from knowledge_system.ingestion import cerrar_ingestion_runner
+        await cerrar_ingestion_runner()
+
+    from services.webhook_service import webhook_service
+    await webhook_service.stop_worker()
+
+    from integrations.webhook_handler import cerrar_webhook_handler
+    await cerrar_webhook_handler()
+
+    # Eventos de auditoría que sigan en el buffer
+    audit_service = getattr(app.state, "audit_service", None)
+    if audit_service is not None:
+        await audit_service.close()
+
 
 # ==================== APP ====================
 
@@ -268,6 +292,23 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Rate limiting (opcional). Con REDIS_URL el límite es compartido entre workers.
+# Se agrega antes que CORS para quedar por dentro: los 429 llevan cabeceras CORS.
+# RATE_LIMIT_ROUTES acepta JSON: {"/api/chat": "30/minute"}
+if os.getenv("RATE_LIMIT_ENABLED", "false").lower() == "true":
+    import json
+    from security.rate_limit import RateLimitMiddleware, RouteLimit, RedisStore
+
+    app.add_middleware(
+        RateLimitMiddleware,
+        default=os.getenv("RATE_LIMIT_DEFAULT", "300/minute"),
+        routes=[RouteLimit(path, rate) for path, rate in json.loads(os.getenv("RATE_LIMIT_ROUTES", "{}")).items()],
+        algorithm=os.getenv("RATE_LIMIT_ALGORITHM", "gcra"),
+        store=RedisStore.from_url(os.environ["REDIS_URL"]) if os.getenv("REDIS_URL") else None,
+        trust_forwarded=os.getenv("RATE_LIMIT_TRUST_FORWARDED", "false").lower() == "true",
+    )
+    logger.success("🚦 Rate limiting activado")
+
 # Configurar CORS con whitelist
 app.add_middleware(
     CORSMiddleware,
@@ -619,6 +660,24 @@ async def chat_preguntar(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/chat/preguntar/stream")
+async def chat_preguntar_stream(request: PreguntaChatRequest):
+    """
+    Igual que /chat/preguntar pero la respuesta llega token a token (SSE).
+    """
+    logger.info(f"Pregunta recibida (stream): {request.pregunta[:50]}...")
+
+    return StreamingResponse(
+        chat_inteligente.responder_stream(
+            pregunta=request.pregunta,
+            usar_contexto=request.usar_contexto,
+            session_id=request.session_id
+        ),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @app.get("/chat/historial")
 async def get_chat_historial(
     limite: int = Query(50, ge=1, le=200),
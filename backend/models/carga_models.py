@@ -145,7 +145,7 @@ class ActividadUsuario(Base):
     # Metadata
     ip_address = Column(String(50))
     user_agent = Column(String(500))
-    metadata = Column(JSON)
+    metadata_ = Column("metadata", JSON)  # "metadata" está reservado en Declarative
 
     # Timestamp
     created_at = Column(DateTime, default=datetime.utcnow, index=True)
@@ -36,6 +36,8 @@ from security.authentication import (
     create_access_token,
     create_refresh_token,
     decode_token,
+    revoke_token,
+    revoke_user_tokens,
     verify_refresh_token,
     get_current_user,
     require_role,
@@ -394,6 +396,8 @@ def _revoke_all_user_tokens(user_id: str):
 
     _tokens_cache = tokens
     _persist_tokens()
+    # Los access tokens ya emitidos tampoco valen (ni desde el cache)
+    revoke_user_tokens(user_id)
     logger.info(f"🔐 Revocados {count} refresh tokens para usuario {user_id}")
 
 
@@ -716,13 +720,17 @@ async def refresh_tokens(request: Request, response: Response):
 @router.post("/logout")
 async def logout(request: Request, response: Response):
     """
-    Cierra sesión revocando refresh token.
+    Cierra sesión revocando refresh token y access token.
     """
     jti = request.cookies.get("token_jti")
 
     if jti:
         _revoke_refresh_token(jti)
 
+    access_token = _get_access_token_from_cookie(request)
+    if access_token:
+        revoke_token(access_token)
+
     _clear_auth_cookies(response)
 
     logger.info("👋 Logout exitoso")
@@ -74,8 +74,9 @@ def obtener_cargas_dia(
     """Obtener cargas de un día específico"""
     service = CargaServiceDB(db)
     cargas = service.obtener_cargas_del_dia(fecha, usuario_id)
+    nombres = service.nombres_usuarios(c.usuario_id for c in cargas)
 
-    return [_carga_to_list_response(c, db) for c in cargas]
+    return [_carga_to_list_response(c, nombres.get(c.usuario_id)) for c in cargas]
 
 
 @router.get("/{carga_id}", response_model=CargaResponse)
@@ -271,6 +272,21 @@ def limpiar_cargas_antiguas(
     }
 
 
+@router.post("/reconciliar-stats")
+def reconciliar_stats(
+    carga_id: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """Recalcular desde las guías las stats de una carga (o de todas)"""
+    service = CargaServiceDB(db)
+    corregidas = service.recalcular_stats([carga_id] if carga_id else None)
+
+    return {
+        "message": f"{corregidas} cargas corregidas",
+        "corregidas": corregidas
+    }
+
+
 # ==================== HELPERS ====================
 
 def _carga_to_response(carga, db: Session) -> CargaResponse:
@@ -309,18 +325,14 @@ def _carga_to_response(carga, db: Session) -> CargaResponse:
     )
 
 
-def _carga_to_list_response(carga, db: Session) -> CargaListResponse:
-    """Convertir modelo Carga a CargaListResponse"""
-    from ..models.carga_models import Usuario
-
-    usuario = db.query(Usuario).filter(Usuario.id == carga.usuario_id).first()
-
+def _carga_to_list_response(carga, usuario_nombre: Optional[str]) -> CargaListResponse:
+    """Convertir modelo Carga a CargaListResponse (nombres de usuario ya resueltos en lote)"""
     return CargaListResponse(
         id=carga.id,
         fecha=carga.fecha,
         numero_carga=carga.numero_carga,
         nombre=carga.nombre,
-        usuario_nombre=usuario.nombre if usuario else "Desconocido",
+        usuario_nombre=usuario_nombre or "Desconocido",
         total_guias=carga.total_guias or 0,
         entregadas=carga.entregadas or 0,
         con_novedad=carga.con_novedad or 0,
@@ -25,7 +25,7 @@ EJEMPLO DE PAYLOAD:
 }
 """
 
-from fastapi import APIRouter, HTTPException, Request, BackgroundTasks, Query
+from fastapi import APIRouter, HTTPException, Request, Query, status
 from pydantic import BaseModel, Field
 from typing import Dict, Any, List, Optional
 from datetime import datetime
@@ -39,7 +39,7 @@ router = APIRouter(prefix="/api/chatea-pro", tags=["Chatea Pro - Integracion Dro
 # Instancias globales (lazy loading)
 _chatea_client = None
 _brain_client = None
-_event_history = []  # Historial de eventos en memoria
+_event_handler = None
 
 
 def get_chatea_client():
@@ -50,6 +50,16 @@ def get_chatea_client():
     return _chatea_client
 
 
+def get_event_handler():
+    """Pipeline de eventos entrantes (cola, handlers en paralelo, historial)"""
+    global _event_handler
+    if _event_handler is None:
+        from integrations.webhook_handler import get_webhook_handler
+        _event_handler = get_webhook_handler()
+        _event_handler.register_handler(None, brain_event_handler)
+    return _event_handler
+
+
 def get_brain():
     global _brain_client
     if _brain_client is None:
@@ -122,8 +132,7 @@ class AnalyzeRequest(BaseModel):
 @router.post("/webhook")
 async def receive_chatea_pro_webhook(
     event: ChateaProEvent,
-    request: Request,
-    background_tasks: BackgroundTasks
+    request: Request
 ):
     """
     ENDPOINT PRINCIPAL - Recibe eventos de Chatea Pro via N8N.
@@ -131,6 +140,10 @@ async def receive_chatea_pro_webhook(
     Configura este URL en N8N:
     https://tu-servidor.com/api/chatea-pro/webhook
 
+    El evento se confirma apenas se valida la firma (X-Webhook-Signature) y
+    se descartan duplicados (cabecera Idempotency-Key); el analisis con IA de
+    los eventos criticos corre en segundo plano.
+
     Eventos soportados:
     - order_created: Nuevo pedido creado
     - order_status_changed: Cambio de estado
@@ -139,55 +152,39 @@ async def receive_chatea_pro_webhook(
     - delivery_confirmed: Entrega confirmada
     - issue_reported: Novedad reportada
     """
-    # Guardar en historial
-    event_record = {
-        "id": f"evt_{datetime.now().strftime('%Y%m%d%H%M%S')}_{len(_event_history)}",
-        "event": event.event,
-        "data": event.data,
-        "source": event.source,
-        "timestamp": event.timestamp or datetime.now().isoformat(),
-        "processed": True
-    }
-    _event_history.insert(0, event_record)
-
-    # Mantener solo ultimos 500 eventos
-    if len(_event_history) > 500:
-        _event_history.pop()
-
-    # Determinar prioridad y analizar si es critico
-    priority = determine_priority(event.event, event.data)
-    brain_analysis = None
+    handler = get_event_handler()
+    await verify_request_signature(request, handler)
 
-    if priority in ["high", "critical"]:
-        brain_analysis = await analyze_with_brain(event)
+    [(accepted, duplicate)] = accept_or_503(
+        handler, [event], request.headers.get("Idempotency-Key")
+    )
 
     return {
         "success": True,
-        "event_id": event_record["id"],
+        "event_id": accepted.id,
         "event_type": event.event,
-        "priority": priority,
-        "brain_analysis": brain_analysis,
-        "message": f"Evento '{event.event}' procesado correctamente"
+        "priority": accepted.priority.value,
+        "duplicate": duplicate,
+        "message": f"Evento '{event.event}' recibido"
     }
 
 
 @router.post("/webhook/batch")
-async def receive_batch_events(events: List[ChateaProEvent]):
+async def receive_batch_events(events: List[ChateaProEvent], request: Request):
     """
     Recibe multiples eventos en una sola llamada.
     Util para sincronizacion masiva.
+
+    El lote se encola completo o se rechaza completo (503), asi que el
+    emisor puede reintentarlo sin duplicar eventos.
     """
-    results = []
+    handler = get_event_handler()
+    await verify_request_signature(request, handler)
 
-    for event in events:
-        event_record = {
-            "id": f"evt_{datetime.now().strftime('%Y%m%d%H%M%S')}_{len(_event_history)}",
-            "event": event.event,
-            "data": event.data,
-            "timestamp": datetime.now().isoformat()
-        }
-        _event_history.insert(0, event_record)
-        results.append({"event_id": event_record["id"], "event": event.event})
+    results = [
+        {"event_id": accepted.id, "event": event.event, "duplicate": duplicate}
+        for event, (accepted, duplicate) in zip(events, accept_or_503(handler, events))
+    ]
 
     return {
         "success": True,
@@ -231,6 +228,19 @@ async def send_whatsapp_message(request: SendMessageRequest):
     }
 
 
+@router.post("/send-bulk")
+async def send_bulk_messages(messages: List[SendMessageRequest]):
+    """
+    Envia mensajes a muchos clientes via Chatea Pro.
+
+    Los envios salen en paralelo con limite de tasa y reintentos; la
+    respuesta trae el estado de entrega de cada telefono.
+    """
+    chatea = get_chatea_client()
+
+    return await chatea.send_bulk_messages([m.dict() for m in messages])
+
+
 @router.post("/send-alert")
 async def send_alert_to_chatea(
     title: str = Query(...),
@@ -347,26 +357,9 @@ async def get_analytics_summary():
     - Eventos criticos recientes
     - Tendencias
     """
-    # Contar eventos por tipo
-    events_by_type = {}
-    critical_events = []
-
-    for event in _event_history[:200]:
-        event_type = event.get("event", "unknown")
-        events_by_type[event_type] = events_by_type.get(event_type, 0) + 1
-
-        # Identificar eventos criticos
-        if event_type in ["delay_detected", "issue_reported", "delivery_failed"]:
-            critical_events.append(event)
-
     return {
         "success": True,
-        "summary": {
-            "total_events": len(_event_history),
-            "events_by_type": events_by_type,
-            "critical_events_count": len(critical_events),
-            "recent_critical": critical_events[:10]
-        },
+        "summary": get_event_handler().get_analytics_summary(),
         "timestamp": datetime.now().isoformat()
     }
 
@@ -381,7 +374,8 @@ async def get_ai_insights():
     - Problemas recurrentes
     - Recomendaciones de mejora
     """
-    if len(_event_history) < 5:
+    recent_events = await get_event_handler().get_event_history(limit=50)
+    if len(recent_events) < 5:
         return {
             "success": True,
             "message": "No hay suficientes eventos para generar insights",
@@ -392,7 +386,7 @@ async def get_ai_insights():
 
     # Preparar resumen de eventos para el analisis
     events_summary = []
-    for event in _event_history[:50]:
+    for event in recent_events:
         events_summary.append(f"- {event.get('event')}: {event.get('data', {})}")
 
     prompt = f"""
@@ -413,7 +407,7 @@ async def get_ai_insights():
         return {
             "success": True,
             "insights": response.get("response", ""),
-            "events_analyzed": min(len(_event_history), 50),
+            "events_analyzed": len(recent_events),
             "timestamp": datetime.now().isoformat()
         }
     except Exception as e:
@@ -435,10 +429,7 @@ async def get_event_history(
     """
     Obtiene historial de eventos recibidos.
     """
-    events = _event_history
-
-    if event_type:
-        events = [e for e in events if e.get("event") == event_type]
+    events = await get_event_handler().get_event_history(limit=limit, event_name=event_type)
 
     return {
         "success": True,
@@ -458,7 +449,7 @@ async def get_integration_status():
     return {
         "status": "active",
         "chatea_pro": health,
-        "events_in_history": len(_event_history),
+        "events_in_history": get_event_handler().get_stats()["history_size"],
         "webhook_url": os.getenv("CHATEA_PRO_WEBHOOK_URL", "")[:50] + "...",
         "api_key_configured": bool(os.getenv("CHATEA_PRO_API_KEY")),
         "timestamp": datetime.now().isoformat()
@@ -479,21 +470,33 @@ async def health_check():
 # HELPER FUNCTIONS
 # =============================================================================
 
-def determine_priority(event_type: str, data: Dict[str, Any]) -> str:
-    """Determina la prioridad de un evento."""
-    critical_events = ["delivery_failed", "customer_complaint", "return_initiated"]
-    high_events = ["delay_detected", "issue_reported", "customer_inquiry"]
-
-    if event_type in critical_events:
-        return "critical"
-    if event_type in high_events:
-        return "high"
-    if data.get("days_delayed", 0) >= 5:
-        return "high"
-    if data.get("days_delayed", 0) >= 3:
-        return "normal"
-
-    return "normal"
+async def verify_request_signature(request: Request, handler) -> None:
+    """Rechaza el request si trae una firma invalida (o no la trae y es obligatoria)"""
+    body = await request.body()
+    if not handler.check_signature(body, request.headers.get("X-Webhook-Signature")):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Firma invalida")
+
+
+def accept_or_503(handler, events: List[ChateaProEvent], idempotency_key: Optional[str] = None):
+    """Encola los eventos (todos o ninguno); si la cola esta llena el emisor debe reintentar"""
+    from integrations.webhook_handler import WebhookQueueFull
+
+    items = [({"event": e.event, "data": e.data}, e.source, idempotency_key) for e in events]
+    try:
+        return handler.accept_events(items)
+    except WebhookQueueFull as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": "5"}
+        )
+
+
+async def brain_event_handler(event) -> Optional[Dict[str, Any]]:
+    """Handler en segundo plano: analiza con IA los eventos de prioridad alta o critica"""
+    if event.priority.value not in ("high", "critical"):
+        return None
+    return await analyze_with_brain(ChateaProEvent(event=event.name, data=event.data, source=event.source))
 
 
 async def analyze_with_brain(event: ChateaProEvent) -> Dict[str, Any]:
@@ -53,6 +53,9 @@ class TestNotificationRequest(BaseModel):
 
 _subscriptions: dict = {}  # endpoint -> subscription_data
 
+# Las suscripciones que responden 404/410 al enviar se eliminan solas
+push_service.on_subscription_gone = lambda endpoint: _subscriptions.pop(endpoint, None)
+
 
 # ==================== ENDPOINTS ====================
 
@@ -194,11 +197,6 @@ async def send_test_notification(
     subscriptions_list = list(_subscriptions.values())
     result = await push_service.broadcast_notification(subscriptions_list, payload)
 
-    # Limpiar suscripciones expiradas
-    for expired_endpoint in result.get("expired", []):
-        if expired_endpoint in _subscriptions:
-            del _subscriptions[expired_endpoint]
-
     return {
         "success": result["success"] > 0,
         "message": f"Enviado a {result['success']}/{result['total']} suscriptores",
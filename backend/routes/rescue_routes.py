@@ -18,6 +18,8 @@ from services.rescue_service import (
 )
 
 
+# Las rutas que solo usan la cola son `def`: FastAPI las corre en su
+# threadpool y las consultas a la BD no bloquean el event loop
 router = APIRouter(prefix="/rescue", tags=["Sistema de Rescate"])
 
 
@@ -86,7 +88,7 @@ class RescheduleRequest(BaseModel):
 # ==================== ENDPOINTS ====================
 
 @router.post("/queue/add", response_model=RescueItemResponse)
-async def add_to_queue(request: AddToQueueRequest):
+def add_to_queue(request: AddToQueueRequest):
     """
     Añade una guía a la cola de rescate
 
@@ -113,7 +115,7 @@ async def add_to_queue(request: AddToQueueRequest):
 
 
 @router.post("/queue/bulk-add")
-async def bulk_add_to_queue(request: BulkAddRequest):
+def bulk_add_to_queue(request: BulkAddRequest):
     """
     Añade múltiples guías a la cola de rescate
     """
@@ -133,7 +135,7 @@ async def bulk_add_to_queue(request: BulkAddRequest):
 
 
 @router.get("/queue", response_model=List[RescueItemResponse])
-async def get_queue(
+def get_queue(
     priority: Optional[str] = Query(None, description="Filtrar por prioridad: CRITICAL, HIGH, MEDIUM, LOW"),
     status: Optional[str] = Query(None, description="Filtrar por estado"),
     limit: int = Query(100, ge=1, le=500)
@@ -173,8 +175,23 @@ async def get_queue(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/queue/claim", response_model=List[RescueItemResponse])
+def claim_due(
+    agent_id: str = Query(..., description="Agente que toma las guías"),
+    limit: int = Query(10, ge=1, le=100)
+):
+    """
+    Reclama guías reagendadas cuya próxima acción ya venció
+
+    Cada guía queda reservada al agente durante unos minutos; otros agentes
+    no la reciben mientras tanto.
+    """
+    items = rescue_service.claim_due(agent_id, limit)
+    return [_item_to_response(i) for i in items]
+
+
 @router.get("/queue/{tracking_number}", response_model=RescueItemResponse)
-async def get_queue_item(tracking_number: str):
+def get_queue_item(tracking_number: str):
     """
     Obtiene un item específico de la cola
     """
@@ -217,7 +234,7 @@ async def send_bulk_whatsapp(
 
 
 @router.get("/queue/{tracking_number}/call-script", response_model=CallScriptResponse)
-async def get_call_script(tracking_number: str):
+def get_call_script(tracking_number: str):
     """
     Obtiene el script de llamada para una guía
     """
@@ -230,7 +247,7 @@ async def get_call_script(tracking_number: str):
 
 
 @router.post("/queue/{tracking_number}/call-completed")
-async def mark_call_completed(tracking_number: str, request: MarkCallRequest):
+def mark_call_completed(tracking_number: str, request: MarkCallRequest):
     """
     Marca una llamada como completada
     """
@@ -247,7 +264,7 @@ async def mark_call_completed(tracking_number: str, request: MarkCallRequest):
 
 
 @router.post("/queue/{tracking_number}/recovered")
-async def mark_recovered(
+def mark_recovered(
     tracking_number: str,
     notes: str = Query("", description="Notas sobre la recuperación")
 ):
@@ -263,7 +280,7 @@ async def mark_recovered(
 
 
 @router.post("/queue/{tracking_number}/lost")
-async def mark_lost(
+def mark_lost(
     tracking_number: str,
     reason: str = Query("", description="Razón de pérdida")
 ):
@@ -279,7 +296,7 @@ async def mark_lost(
 
 
 @router.post("/queue/{tracking_number}/reschedule")
-async def reschedule(tracking_number: str, request: RescheduleRequest):
+def reschedule(tracking_number: str, request: RescheduleRequest):
     """
     Reagenda una acción de rescate
     """
@@ -296,7 +313,7 @@ async def reschedule(tracking_number: str, request: RescheduleRequest):
 
 
 @router.get("/stats")
-async def get_stats():
+def get_stats():
     """
     Obtiene estadísticas del sistema de rescate
     """
@@ -313,12 +330,13 @@ async def get_stats():
         "recovered_today": stats.recovered_today,
         "recovered_week": stats.recovered_week,
         "lost_today": stats.lost_today,
-        "recovery_rate": stats.recovery_rate
+        "recovery_rate": stats.recovery_rate,
+        "avg_recovery_time_hours": stats.avg_recovery_time_hours
     }
 
 
 @router.get("/export/csv")
-async def export_csv():
+def export_csv():
     """
     Exporta la cola de rescate a CSV
     """
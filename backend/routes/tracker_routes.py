@@ -3,7 +3,7 @@ API Routes para LITPER Tracker - Sincronización con app de escritorio y web
 Ahora con base de datos SQLite persistente
 """
 
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 from typing import Optional, List
 from fastapi import APIRouter, HTTPException, Query
 from fastapi.responses import StreamingResponse
@@ -12,13 +12,16 @@ from loguru import logger
 import hashlib
 import uuid
 import io
+import tempfile
 
 # Importar funciones de base de datos
 from database_tracker import (
     get_usuarios, get_usuario, crear_usuario, actualizar_usuario, eliminar_usuario,
     verificar_password, crear_ronda_guias, crear_ronda_novedades,
     get_rondas_guias, get_rondas_novedades, get_todas_rondas,
-    get_historial_rondas, get_estadisticas_usuario, get_ranking, get_resumen_dia
+    get_historial_rondas, get_estadisticas_usuario, get_ranking, get_resumen_dia,
+    sincronizar_lote, obtener_cambios, eliminar_ronda, get_version_actual, ejecutar,
+    iterar_rondas_exportacion, COLUMNAS_EXPORTACION
 )
 
 # ==================== MODELOS PYDANTIC ====================
@@ -81,11 +84,16 @@ class SyncRequest(BaseModel):
     usuarios: Optional[List[dict]] = None
     rondas: Optional[List[dict]] = None
     ultima_sync: Optional[str] = None
+    since_version: Optional[int] = Field(default=None, ge=0)
 
 class SyncResponse(BaseModel):
     usuarios: List[dict]
     rondas_hoy: List[dict]
     ultima_sync: str
+    version: int = 0
+    completo: bool = True
+    eliminados: List[dict] = []
+    conflictos: List[dict] = []
 
 # ==================== HELPERS ====================
 
@@ -107,13 +115,13 @@ router = APIRouter(prefix="/tracker", tags=["Tracker"])
 @router.get("/usuarios", response_model=List[dict])
 async def listar_usuarios():
     """Lista todos los usuarios activos del tracker"""
-    usuarios = get_usuarios(activos_only=True)
+    usuarios = await ejecutar(get_usuarios, activos_only=True)
     return usuarios
 
 @router.get("/usuarios/{usuario_id}")
 async def obtener_usuario(usuario_id: str):
     """Obtiene un usuario por ID"""
-    usuario = get_usuario(usuario_id)
+    usuario = await ejecutar(get_usuario, usuario_id)
     if not usuario:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
     return usuario
@@ -124,7 +132,8 @@ async def crear_usuario_endpoint(usuario: UsuarioTrackerCreate):
     usuario_id = usuario.id if usuario.id else _generar_id()
     password_hash = _hash_password(usuario.password) if usuario.password else None
 
-    nuevo = crear_usuario(
+    nuevo = await ejecutar(
+        crear_usuario,
         id=usuario_id,
         nombre=usuario.nombre,
         avatar=usuario.avatar,
@@ -138,7 +147,7 @@ async def crear_usuario_endpoint(usuario: UsuarioTrackerCreate):
 @router.put("/usuarios/{usuario_id}", response_model=dict)
 async def actualizar_usuario_endpoint(usuario_id: str, datos: UsuarioTrackerUpdate):
     """Actualiza un usuario existente"""
-    usuario = get_usuario(usuario_id)
+    usuario = await ejecutar(get_usuario, usuario_id)
     if not usuario:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
 
@@ -148,13 +157,13 @@ async def actualizar_usuario_endpoint(usuario_id: str, datos: UsuarioTrackerUpda
     elif 'password' in update_data:
         del update_data['password']
 
-    actualizado = actualizar_usuario(usuario_id, update_data)
+    actualizado = await ejecutar(actualizar_usuario, usuario_id, update_data)
     return actualizado
 
 @router.delete("/usuarios/{usuario_id}")
 async def eliminar_usuario_endpoint(usuario_id: str):
     """Desactiva un usuario (soft delete)"""
-    if eliminar_usuario(usuario_id):
+    if await ejecutar(eliminar_usuario, usuario_id):
         return {"exito": True, "mensaje": "Usuario desactivado"}
     raise HTTPException(status_code=404, detail="Usuario no encontrado")
 
@@ -163,12 +172,12 @@ async def eliminar_usuario_endpoint(usuario_id: str):
 @router.post("/auth/login")
 async def login(request: LoginRequest):
     """Verifica credenciales de usuario"""
-    usuario = get_usuario(request.usuario_id)
+    usuario = await ejecutar(get_usuario, request.usuario_id)
     if not usuario:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
 
     if usuario.get('password_hash'):
-        if not verificar_password(request.usuario_id, _hash_password(request.password)):
+        if not await ejecutar(verificar_password, request.usuario_id, _hash_password(request.password)):
             raise HTTPException(status_code=401, detail="Contraseña incorrecta")
 
     return {
@@ -180,11 +189,11 @@ async def login(request: LoginRequest):
 @router.post("/auth/set-password/{usuario_id}")
 async def set_password(usuario_id: str, password: str = Query(...)):
     """Establece contraseña para un usuario"""
-    usuario = get_usuario(usuario_id)
+    usuario = await ejecutar(get_usuario, usuario_id)
     if not usuario:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
 
-    actualizar_usuario(usuario_id, {'password_hash': _hash_password(password)})
+    await ejecutar(actualizar_usuario, usuario_id, {'password_hash': _hash_password(password)})
     return {"exito": True, "mensaje": "Contraseña establecida"}
 
 # ==================== RONDAS ====================
@@ -199,11 +208,11 @@ async def listar_rondas(
     fecha_filtro = fecha or _hoy()
 
     if tipo == 'guias':
-        return get_rondas_guias(fecha_filtro, usuario_id)
+        return await ejecutar(get_rondas_guias, fecha_filtro, usuario_id)
     elif tipo == 'novedades':
-        return get_rondas_novedades(fecha_filtro, usuario_id)
+        return await ejecutar(get_rondas_novedades, fecha_filtro, usuario_id)
     else:
-        return get_todas_rondas(fecha_filtro, usuario_id)
+        return await ejecutar(get_todas_rondas, fecha_filtro, usuario_id)
 
 @router.post("/rondas/guias", response_model=dict)
 async def crear_ronda_guias_endpoint(ronda: RondaGuiasCreate):
@@ -211,7 +220,7 @@ async def crear_ronda_guias_endpoint(ronda: RondaGuiasCreate):
     data = ronda.dict()
     data['id'] = _generar_id()
 
-    nueva = crear_ronda_guias(data)
+    nueva = await ejecutar(crear_ronda_guias, data)
     logger.info(f"Ronda guías guardada: Usuario {ronda.usuario_nombre}, Realizado: {ronda.realizado}")
     return nueva
 
@@ -221,10 +230,19 @@ async def crear_ronda_novedades_endpoint(ronda: RondaNovedadesCreate):
     data = ronda.dict()
     data['id'] = _generar_id()
 
-    nueva = crear_ronda_novedades(data)
+    nueva = await ejecutar(crear_ronda_novedades, data)
     logger.info(f"Ronda novedades guardada: Usuario {ronda.usuario_nombre}, Solucionadas: {ronda.solucionadas}")
     return nueva
 
+@router.delete("/rondas/{tipo}/{ronda_id}")
+async def eliminar_ronda_endpoint(tipo: str, ronda_id: str):
+    """Elimina una ronda (queda como tombstone para la sincronización)"""
+    if tipo not in ('guias', 'novedades'):
+        raise HTTPException(status_code=400, detail="Tipo de ronda inválido")
+    if await ejecutar(eliminar_ronda, tipo, ronda_id):
+        return {"exito": True, "mensaje": "Ronda eliminada"}
+    raise HTTPException(status_code=404, detail="Ronda no encontrada")
+
 # ==================== HISTORIAL ====================
 
 @router.get("/historial")
@@ -233,7 +251,7 @@ async def obtener_historial(
     dias: int = Query(default=30, ge=1, le=365)
 ):
     """Obtiene historial de rondas"""
-    historial = get_historial_rondas(usuario_id, dias)
+    historial = await ejecutar(get_historial_rondas, usuario_id, dias)
     return {
         "dias": dias,
         "total_rondas": len(historial),
@@ -244,40 +262,49 @@ async def obtener_historial(
 
 @router.post("/sync", response_model=SyncResponse)
 async def sincronizar(request: SyncRequest):
-    """Endpoint principal de sincronización bidireccional"""
+    """
+    Endpoint principal de sincronización bidireccional.
+
+    Si el cliente envía `since_version`, solo se devuelven los usuarios y
+    rondas del día modificados después de esa versión, más los tombstones
+    de lo eliminado. Sin `since_version` se devuelve el estado completo.
+    El cliente debe guardar `version` y enviarla en la siguiente llamada.
+    """
     fecha_hoy = _hoy()
 
-    # Procesar usuarios enviados
-    if request.usuarios:
-        for u in request.usuarios:
-            if u.get('id'):
-                crear_usuario(
-                    id=u['id'],
-                    nombre=u.get('nombre', 'Usuario'),
-                    avatar=u.get('avatar', '😊'),
-                    color=u.get('color', '#F59E0B'),
-                    meta_diaria=u.get('meta_diaria', 50)
-                )
-
-    # Procesar rondas enviadas
-    if request.rondas:
-        for r in request.rondas:
-            if r.get('tipo') == 'guias':
-                crear_ronda_guias(r)
-            elif r.get('tipo') == 'novedades':
-                crear_ronda_novedades(r)
+    # Procesar usuarios y rondas enviados en una sola transacción
+    conflictos = []
+    if request.usuarios or request.rondas:
+        resultado = await ejecutar(sincronizar_lote, request.usuarios, request.rondas)
+        conflictos = resultado['conflictos']
+
+    if request.since_version is not None:
+        cambios = await ejecutar(obtener_cambios, request.since_version, fecha_hoy)
+        return SyncResponse(
+            usuarios=cambios['usuarios'],
+            rondas_hoy=cambios['rondas'],
+            ultima_sync=datetime.now().isoformat(),
+            version=cambios['version'],
+            completo=False,
+            eliminados=cambios['eliminados'],
+            conflictos=conflictos
+        )
 
+    # La versión se lee antes que el estado completo (ver obtener_cambios)
+    version = await ejecutar(get_version_actual)
     return SyncResponse(
-        usuarios=get_usuarios(),
-        rondas_hoy=get_todas_rondas(fecha_hoy),
-        ultima_sync=datetime.now().isoformat()
+        usuarios=await ejecutar(get_usuarios),
+        rondas_hoy=await ejecutar(get_todas_rondas, fecha_hoy),
+        ultima_sync=datetime.now().isoformat(),
+        version=version,
+        conflictos=conflictos
     )
 
 @router.get("/sync/estado")
 async def estado_sync():
     """Verifica el estado de sincronización"""
-    usuarios = get_usuarios()
-    rondas_hoy = get_todas_rondas(_hoy())
+    usuarios = await ejecutar(get_usuarios)
+    rondas_hoy = await ejecutar(get_todas_rondas, _hoy())
 
     return {
         "online": True,
@@ -291,7 +318,7 @@ async def estado_sync():
 @router.get("/reportes/resumen-dia")
 async def resumen_dia(fecha: Optional[str] = None):
     """Obtiene resumen del día"""
-    return get_resumen_dia(fecha)
+    return await ejecutar(get_resumen_dia, fecha)
 
 @router.get("/reportes/ranking")
 async def ranking_dia(fecha: Optional[str] = None, tipo: str = "guias"):
@@ -299,57 +326,70 @@ async def ranking_dia(fecha: Optional[str] = None, tipo: str = "guias"):
     return {
         "fecha": fecha or _hoy(),
         "tipo": tipo,
-        "ranking": get_ranking(fecha, tipo)
+        "ranking": await ejecutar(get_ranking, fecha, tipo)
     }
 
 @router.get("/reportes/estadisticas/{usuario_id}")
 async def estadisticas_usuario(usuario_id: str, fecha: Optional[str] = None):
     """Obtiene estadísticas de un usuario"""
-    return get_estadisticas_usuario(usuario_id, fecha)
+    return await ejecutar(get_estadisticas_usuario, usuario_id, fecha)
 
 # ==================== EXPORTAR EXCEL ====================
 
+def _escribir_excel_rondas(fecha_inicio: str, fecha_fin: Optional[str], usuario_id: Optional[str]):
+    """
+    Escribe las rondas en un xlsx en modo write-only, fila por fila desde SQL.
+
+    Devuelve un archivo temporal posicionado al inicio, o None si no hay filas.
+    """
+    from openpyxl import Workbook
+
+    filas = iterar_rondas_exportacion(fecha_inicio, fecha_fin, usuario_id)
+    primera = next(filas, None)
+    if primera is None:
+        return None
+
+    libro = Workbook(write_only=True)
+    hoja = libro.create_sheet('Rondas')
+    hoja.append(COLUMNAS_EXPORTACION)
+    hoja.append(primera)
+    for fila in filas:
+        hoja.append(fila)
+
+    salida = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    libro.save(salida)
+    salida.seek(0)
+    return salida
+
+def _leer_por_bloques(archivo, tamano: int = 64 * 1024):
+    try:
+        while bloque := archivo.read(tamano):
+            yield bloque
+    finally:
+        archivo.close()
+
 @router.get("/exportar/excel")
 async def exportar_excel(
     fecha_inicio: Optional[str] = None,
     fecha_fin: Optional[str] = None,
     usuario_id: Optional[str] = None
 ):
-    """Exporta rondas a Excel"""
+    """Exporta rondas a Excel (por defecto, el último año)"""
     try:
-        import pandas as pd
-        from io import BytesIO
-
-        # Obtener datos
-        historial = get_historial_rondas(usuario_id, dias=365)
-
-        if fecha_inicio:
-            historial = [r for r in historial if r.get('fecha', '') >= fecha_inicio]
-        if fecha_fin:
-            historial = [r for r in historial if r.get('fecha', '') <= fecha_fin]
-
-        if not historial:
-            raise HTTPException(status_code=404, detail="No hay datos para exportar")
-
-        # Crear DataFrame
-        df = pd.DataFrame(historial)
-
-        # Crear archivo Excel
-        output = BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df.to_excel(writer, sheet_name='Rondas', index=False)
-
-        output.seek(0)
+        desde = fecha_inicio or (date.today() - timedelta(days=365)).isoformat()
+        salida = await ejecutar(_escribir_excel_rondas, desde, fecha_fin, usuario_id)
+    except ImportError:
+        raise HTTPException(status_code=500, detail="openpyxl no instalado")
 
-        filename = f"reporte_tracker_{_hoy()}.xlsx"
-        return StreamingResponse(
-            output,
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers={"Content-Disposition": f"attachment; filename={filename}"}
-        )
+    if salida is None:
+        raise HTTPException(status_code=404, detail="No hay datos para exportar")
 
-    except ImportError:
-        raise HTTPException(status_code=500, detail="pandas/openpyxl no instalados")
+    filename = f"reporte_tracker_{_hoy()}.xlsx"
+    return StreamingResponse(
+        _leer_por_bloques(salida),
+        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
 
 # ==================== NOTIFICACIONES ====================
 
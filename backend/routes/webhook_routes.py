@@ -18,6 +18,8 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from database import get_session
 from services.webhook_service import webhook_service
 
+# Las rutas que usan la BD (outbox, dead-letter) son `def`: FastAPI las corre
+# en su threadpool y la sesión síncrona no bloquea el event loop
 router = APIRouter(prefix="/api/webhooks", tags=["Webhooks"])
 
 
@@ -29,6 +31,7 @@ class WebhookCreate(BaseModel):
     url: str = Field(..., min_length=10)
     events: List[str] = Field(..., min_items=1)
     description: Optional[str] = None
+    batch_size: int = Field(1, ge=1, le=100, description="Eventos por POST (1 = sin lotes)")
 
 
 class WebhookUpdate(BaseModel):
@@ -38,6 +41,7 @@ class WebhookUpdate(BaseModel):
     events: Optional[List[str]] = None
     is_active: Optional[bool] = None
     description: Optional[str] = None
+    batch_size: Optional[int] = Field(None, ge=1, le=100)
 
 
 class WebhookResponse(BaseModel):
@@ -83,6 +87,11 @@ def _get_next_id() -> int:
     return _webhook_counter
 
 
+# El worker del outbox toma url, secret y batch_size del registro al enviar;
+# las filas de un webhook que no está registrado esperan pendientes
+webhook_service.subscriber_lookup = _webhooks.get
+
+
 # ==================== ENDPOINTS ====================
 
 @router.get("/events")
@@ -137,7 +146,8 @@ async def create_webhook(
         "created_at": datetime.utcnow().isoformat(),
         "last_triggered": None,
         "failure_count": 0,
-        "description": webhook.description
+        "description": webhook.description,
+        "batch_size": webhook.batch_size
     }
 
     _webhooks[webhook_id] = webhook_data
@@ -187,6 +197,44 @@ async def list_webhooks(
     }
 
 
+@router.get("/dead-letter")
+def list_dead_letter_deliveries(
+    webhook_id: Optional[int] = None,
+    limit: int = Query(default=50, le=500)
+):
+    """
+    Lista las entregas que agotaron sus reintentos.
+
+    Args:
+        webhook_id: Filtrar por webhook (opcional)
+        limit: Máximo de entregas a retornar
+
+    Returns:
+        Lista de entregas en dead-letter
+    """
+    deliveries = webhook_service.list_dead_letters(webhook_id=webhook_id, limit=limit)
+    return {"total": len(deliveries), "deliveries": deliveries}
+
+
+@router.post("/dead-letter/{delivery_id}/replay")
+def replay_dead_letter_delivery(delivery_id: int):
+    """
+    Reencola una entrega en dead-letter.
+
+    Args:
+        delivery_id: ID de la entrega en el outbox
+
+    Returns:
+        Confirmación del reencolado
+    """
+    if not webhook_service.replay(delivery_ids=[delivery_id]):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Entrega no encontrada en dead-letter"
+        )
+    return {"success": True, "replayed": 1}
+
+
 @router.get("/{webhook_id}")
 async def get_webhook(
     webhook_id: int,
@@ -263,6 +311,8 @@ async def update_webhook(
         wh["is_active"] = update.is_active
     if update.description is not None:
         wh["description"] = update.description
+    if update.batch_size is not None:
+        wh["batch_size"] = update.batch_size
 
     logger.info(f"Webhook actualizado: {wh['name']} (ID: {webhook_id})")
 
@@ -280,7 +330,7 @@ async def update_webhook(
 
 
 @router.delete("/{webhook_id}")
-async def delete_webhook(
+def delete_webhook(
     webhook_id: int,
     session: Session = Depends(get_session)
 ):
@@ -299,10 +349,13 @@ async def delete_webhook(
             detail="Webhook no encontrado"
         )
 
-    webhook_name = _webhooks[webhook_id]["name"]
-    del _webhooks[webhook_id]
+    webhook = _webhooks.pop(webhook_id)
+
+    # Sus entregas pendientes ya no tienen destino: quedan en dead-letter
+    discarded = webhook_service.discard_pending(session, webhook_id, webhook["url"])
+    session.commit()
 
-    logger.info(f"Webhook eliminado: {webhook_name} (ID: {webhook_id})")
+    logger.info(f"Webhook eliminado: {webhook['name']} (ID: {webhook_id}, {discarded} entregas descartadas)")
 
     return {"success": True, "message": "Webhook eliminado"}
 
@@ -373,6 +426,27 @@ async def test_webhook(
     }
 
 
+@router.post("/{webhook_id}/dead-letter/replay")
+def replay_webhook_dead_letters(webhook_id: int):
+    """
+    Reencola todas las entregas en dead-letter de un webhook, en su orden original.
+
+    Args:
+        webhook_id: ID del webhook
+
+    Returns:
+        Número de entregas reencoladas
+    """
+    if webhook_id not in _webhooks:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Webhook no encontrado"
+        )
+
+    replayed = webhook_service.replay(webhook_id=webhook_id)
+    return {"success": True, "replayed": replayed}
+
+
 @router.get("/{webhook_id}/deliveries")
 async def get_webhook_deliveries(
     webhook_id: int,
@@ -407,7 +481,7 @@ async def get_webhook_deliveries(
 
 
 @router.post("/dispatch/{event_type}")
-async def dispatch_event(
+def dispatch_event(
     event_type: str,
     payload: dict,
     session: Session = Depends(get_session)
@@ -441,24 +515,15 @@ async def dispatch_event(
             "dispatched": 0
         }
 
-    result = await webhook_service.dispatch(
-        event_type=event_type,
-        payload=payload,
-        webhooks=subscribed_webhooks
-    )
-
-    # Actualizar estados de webhooks
-    for r in result.get("results", []):
-        wh_id = r.get("webhook_id")
-        if wh_id and wh_id in _webhooks:
-            _webhooks[wh_id]["last_triggered"] = datetime.utcnow().isoformat()
-            if not r.get("success"):
-                _webhooks[wh_id]["failure_count"] += 1
+    # Se encola en la misma transacción; el worker entrega con reintentos
+    rows = webhook_service.enqueue(session, event_type, payload, subscribed_webhooks)
+    session.commit()
 
     return {
         "success": True,
-        "message": f"Evento despachado a {result['success']}/{result['total']} webhooks",
-        "details": result
+        "message": f"Evento encolado para {len(rows)} webhooks",
+        "queued": len(rows),
+        "delivery_ids": [r.id for r in rows]
     }
 
 
@@ -6,7 +6,8 @@ Este paquete contiene los componentes de seguridad:
 - Autenticación (JWT + API Keys)
 - Autorización (RBAC)
 - Encriptación de datos sensibles
-- Auditoría de accesos
+- Auditoría de accesos (buffer por lotes, sinks Mongo/SQLite/JSONL)
+- Rate limiting (middleware ASGI, memoria o Redis)
 
 Uso:
     from security.authentication import get_current_user, require_permission, Permission
@@ -31,18 +32,38 @@ from .authentication import (
     generate_api_key,
     validate_api_key,
     APIKey,
+    token_cache,
+    revoke_token,
+    revoke_user_tokens,
 )
 
 from .encryption import (
     EncryptionService,
     PII_FIELDS,
     init_encryption,
+    derive_key,
+)
+
+from .rate_limit import (
+    RateLimit,
+    RateLimitMiddleware,
+    RouteLimit,
+    FixedWindow,
+    SlidingWindowLog,
+    GCRA,
+    MemoryStore,
+    RedisStore,
 )
 
 from .audit import (
     AuditAction,
     AuditLog,
     AuditService,
+    AuditSink,
+    MongoAuditSink,
+    SQLiteAuditSink,
+    JSONLAuditSink,
+    AnomalyDetector,
     audit_action,
 )
 
@@ -64,13 +85,31 @@ __all__ = [
     "generate_api_key",
     "validate_api_key",
     "APIKey",
+    "token_cache",
+    "revoke_token",
+    "revoke_user_tokens",
     # Encryption
     "EncryptionService",
     "PII_FIELDS",
     "init_encryption",
+    "derive_key",
+    # Rate limiting
+    "RateLimit",
+    "RateLimitMiddleware",
+    "RouteLimit",
+    "FixedWindow",
+    "SlidingWindowLog",
+    "GCRA",
+    "MemoryStore",
+    "RedisStore",
     # Audit
     "AuditAction",
     "AuditLog",
     "AuditService",
+    "AuditSink",
+    "MongoAuditSink",
+    "SQLiteAuditSink",
+    "JSONLAuditSink",
+    "AnomalyDetector",
     "audit_action",
 ]
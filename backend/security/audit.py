@@ -3,10 +3,11 @@ Sistema de auditoría para Litper
 ================================
 
 Implementa:
-- Logging de accesos y acciones
-- Detección de anomalías
+- Logging de accesos y acciones (buffer asíncrono, escritura por lotes)
+- Detección de anomalías en streaming (count-min y ventanas deslizantes)
 - Compliance con regulaciones (Ley 1581 Colombia)
 - Historial de cambios
+- Sinks intercambiables: MongoDB, SQLite o archivo JSONL local
 
 Uso:
     from security.audit import AuditService, AuditAction, audit_action
@@ -22,13 +23,38 @@ Uso:
         user_id=user.id,
         ...
     )
+
+    # Al apagar la app: escribe lo que quede en el buffer
+    await audit_service.close()
+
+log() no toca la base de datos: encola el evento y un flusher en segundo
+plano lo escribe en lotes de `batch_size` o cada `flush_interval`
+segundos, lo que ocurra primero. Sin Mongo (db=None) los eventos van a un
+archivo SQLite local (AUDIT_SQLITE_PATH).
 """
 
+from abc import ABC, abstractmethod
+from collections import Counter, OrderedDict, deque
 from datetime import datetime, timedelta
-from typing import Optional, Any, Dict, List
+from typing import Optional, Any, Callable, Deque, Dict, List, Tuple
+from pathlib import Path
 from pydantic import BaseModel
 from enum import Enum
 from functools import wraps
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# pymongo (vía motor) es opcional: solo lo usa MongoAuditSink
+try:
+    from pymongo.errors import BulkWriteError
+    PYMONGO_AVAILABLE = True
+except ImportError:
+    PYMONGO_AVAILABLE = False
 
 # ═══════════════════════════════════════════
 # TIPOS DE ACCIONES AUDITABLES
@@ -139,6 +165,500 @@ class AuditSummary(BaseModel):
     anomalies_detected: int
 
 
+# ═══════════════════════════════════════════
+# SINKS DE AUDITORÍA
+# ═══════════════════════════════════════════
+
+# Ruta por defecto del sink local cuando no hay MongoDB
+DEFAULT_SQLITE_PATH = Path(__file__).resolve().parents[1] / "data" / "audit.db"
+
+# Marca de fin para el flusher
+_STOP = object()
+
+# Formato fijo de timestamp: las comparaciones de texto respetan el orden
+_TS_FORMAT = "%Y-%m-%dT%H:%M:%S.%f"
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.strftime(_TS_FORMAT)
+    return str(value)
+
+
+def _matches(doc: Dict[str, Any], where: Dict[str, Any]) -> bool:
+    """Evalúa en memoria el mismo filtro que SQLiteAuditSink traduce a SQL"""
+    for key, value in where.items():
+        if key == "since":
+            if doc["timestamp"] < value.strftime(_TS_FORMAT):
+                return False
+        elif key == "until":
+            if doc["timestamp"] > value.strftime(_TS_FORMAT):
+                return False
+        elif key == "action":
+            if doc["action"] not in value:
+                return False
+        elif doc.get(key) != value:
+            return False
+    return True
+
+
+class AuditSink(ABC):
+    """
+    Destino de los lotes de auditoría.
+
+    `find` acepta filtros por igualdad (user_id, resource_type, resource_id,
+    success), `action` (lista de valores) y rango `since`/`until`. Retorna
+    documentos del más reciente al más antiguo.
+    """
+
+    @abstractmethod
+    async def write(self, docs: List[Dict[str, Any]]):
+        """Guarda un lote de documentos"""
+
+    @abstractmethod
+    async def find(self, where: Dict[str, Any], limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Documentos que cumplen el filtro"""
+
+    async def close(self):
+        """Libera conexiones"""
+
+
+class MongoAuditSink(AuditSink):
+    """
+    Colección `audit_logs` de MongoDB (motor): un insert_many por lote.
+
+    El `_id` de cada documento es el id del evento, así reintentar un lote
+    que falló a medias no duplica lo que ya se había insertado.
+    """
+
+    DUPLICATE_KEY = 11000
+
+    def __init__(self, db):
+        self.collection = db.audit_logs
+
+    async def write(self, docs: List[Dict[str, Any]]):
+        # Copias: insert_many agrega `_id` a los documentos que recibe
+        try:
+            await self.collection.insert_many([{**doc, "_id": doc["id"]} for doc in docs], ordered=False)
+        except Exception as e:
+            if not self._only_duplicates(e):
+                raise
+
+    @classmethod
+    def _only_duplicates(cls, error: Exception) -> bool:
+        """El lote falló solo por documentos que ya estaban guardados"""
+        if not PYMONGO_AVAILABLE or not isinstance(error, BulkWriteError):
+            return False
+        details = error.details or {}
+        write_errors = details.get("writeErrors", [])
+        return (
+            bool(write_errors)
+            and not details.get("writeConcernErrors")
+            and all(err.get("code") == cls.DUPLICATE_KEY for err in write_errors)
+        )
+
+    async def find(self, where: Dict[str, Any], limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        query: Dict[str, Any] = {}
+        for key, value in where.items():
+            if key == "since":
+                query.setdefault("timestamp", {})["$gte"] = value
+            elif key == "until":
+                query.setdefault("timestamp", {})["$lte"] = value
+            elif key == "action":
+                query["action"] = {"$in": list(value)}
+            else:
+                query[key] = value
+
+        cursor = self.collection.find(query).sort("timestamp", -1)
+        if limit:
+            cursor = cursor.limit(limit)
+        return [doc async for doc in cursor]
+
+
+class SQLiteAuditSink(AuditSink):
+    """
+    Archivo SQLite local (modo WAL). Las columnas de filtro van indexadas y
+    el evento completo se guarda como JSON. Los métodos síncronos corren en
+    asyncio.to_thread para no bloquear el event loop.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS audit_logs (
+            id TEXT PRIMARY KEY,
+            timestamp TEXT NOT NULL,
+            action TEXT NOT NULL,
+            user_id TEXT,
+            ip_address TEXT,
+            resource_type TEXT,
+            resource_id TEXT,
+            success INTEGER NOT NULL,
+            doc TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_audit_user_ts ON audit_logs (user_id, timestamp);
+        CREATE INDEX IF NOT EXISTS idx_audit_resource ON audit_logs (resource_type, resource_id);
+        CREATE INDEX IF NOT EXISTS idx_audit_ts ON audit_logs (timestamp);
+    """
+
+    COLUMNS = ("user_id", "resource_type", "resource_id", "success")
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = Path(path or DEFAULT_SQLITE_PATH)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=10.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.executescript(self.SCHEMA)
+
+    def _write(self, docs: List[Dict[str, Any]]):
+        rows = []
+        for doc in docs:
+            rows.append((
+                doc["id"], doc["timestamp"].strftime(_TS_FORMAT), str(doc["action"].value),
+                doc["user_id"], doc["ip_address"], doc["resource_type"], doc["resource_id"],
+                int(doc["success"]), json.dumps(doc, default=_json_default)
+            ))
+        with self._lock, self._conn:
+            # OR IGNORE: reintentar un lote ya escrito no duplica eventos
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO audit_logs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows
+            )
+
+    def _find(self, where: Dict[str, Any], limit: Optional[int]) -> List[Dict[str, Any]]:
+        clauses, params = [], []
+        for key, value in where.items():
+            if key == "since":
+                clauses.append("timestamp >= ?")
+                params.append(value.strftime(_TS_FORMAT))
+            elif key == "until":
+                clauses.append("timestamp <= ?")
+                params.append(value.strftime(_TS_FORMAT))
+            elif key == "action":
+                value = list(value)
+                clauses.append(f"action IN ({', '.join('?' * len(value))})")
+                params.extend(value)
+            elif key in self.COLUMNS:
+                clauses.append(f"{key} = ?")
+                params.append(int(value) if key == "success" else value)
+            else:
+                raise ValueError(f"Filtro de auditoría no soportado: {key}")
+
+        sql = "SELECT doc FROM audit_logs"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY timestamp DESC"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [json.loads(doc) for (doc,) in rows]
+
+    async def write(self, docs: List[Dict[str, Any]]):
+        await asyncio.to_thread(self._write, docs)
+
+    async def find(self, where: Dict[str, Any], limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        return await asyncio.to_thread(self._find, where, limit)
+
+    async def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class JSONLAuditSink(AuditSink):
+    """
+    Archivo local append-only, un evento JSON por línea.
+
+    Pensado como respaldo o para entornos mínimos: `find` recorre el
+    archivo completo.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def _write(self, docs: List[Dict[str, Any]]):
+        lines = "".join(json.dumps(doc, default=_json_default) + "\n" for doc in docs)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(lines)
+
+    def _find(self, where: Dict[str, Any], limit: Optional[int]) -> List[Dict[str, Any]]:
+        if not self.path.exists():
+            return []
+        with self._lock, open(self.path, encoding="utf-8") as f:
+            docs = [doc for doc in map(json.loads, f) if _matches(doc, where)]
+        docs.sort(key=lambda doc: doc["timestamp"], reverse=True)
+        return docs[:limit] if limit else docs
+
+    async def write(self, docs: List[Dict[str, Any]]):
+        await asyncio.to_thread(self._write, docs)
+
+    async def find(self, where: Dict[str, Any], limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        return await asyncio.to_thread(self._find, where, limit)
+
+
+# ═══════════════════════════════════════════
+# DETECCIÓN EN STREAMING
+# ═══════════════════════════════════════════
+
+class CountMinSketch:
+    """
+    Conteo aproximado por clave en memoria fija (width x depth contadores).
+
+    Nunca subestima; con actualización conservadora la sobreestimación
+    queda muy por debajo de la cota clásica (total * e / width).
+    """
+
+    def __init__(self, width: int = 2048, depth: int = 4):
+        self.width = width
+        self.depth = depth
+        self.rows = [[0] * width for _ in range(depth)]
+
+    def _indexes(self, key: str) -> List[int]:
+        digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+        h1 = int.from_bytes(digest[:4], "little")
+        h2 = int.from_bytes(digest[4:], "little") | 1
+        return [(h1 + i * h2) % self.width for i in range(self.depth)]
+
+    def add(self, key: str, count: int = 1) -> int:
+        """Suma `count` a la clave y retorna la nueva estimación"""
+        indexes = self._indexes(key)
+        estimate = min(row[i] for row, i in zip(self.rows, indexes)) + count
+        for row, i in zip(self.rows, indexes):
+            if row[i] < estimate:
+                row[i] = estimate
+        return estimate
+
+    def estimate(self, key: str) -> int:
+        return min(row[i] for row, i in zip(self.rows, self._indexes(key)))
+
+
+class WindowedCountMin:
+    """
+    Tasa por clave en una ventana deslizante aproximada.
+
+    Mantiene el sketch de la ventana actual y el de la anterior; el conteo
+    es actual + anterior ponderado por la fracción de la ventana anterior
+    que sigue dentro del rango.
+    """
+
+    def __init__(self, window: float, width: int = 2048, depth: int = 4,
+                 clock: Callable[[], float] = time.monotonic):
+        self.window = window
+        self.width = width
+        self.depth = depth
+        self.clock = clock
+        self.current = CountMinSketch(width, depth)
+        self.previous = CountMinSketch(width, depth)
+        self.started = clock()
+
+    def _rotate(self, now: float):
+        elapsed = now - self.started
+        if elapsed < self.window:
+            return
+        if elapsed >= 2 * self.window:
+            self.previous = CountMinSketch(self.width, self.depth)
+        else:
+            self.previous = self.current
+        self.current = CountMinSketch(self.width, self.depth)
+        self.started += (elapsed // self.window) * self.window
+
+    def _weight(self, now: float) -> float:
+        return 1 - (now - self.started) / self.window
+
+    def add(self, key: str) -> int:
+        """Registra un evento y retorna el conteo estimado en la ventana"""
+        now = self.clock()
+        self._rotate(now)
+        return round(self.current.add(key) + self.previous.estimate(key) * self._weight(now))
+
+    def estimate(self, key: str) -> int:
+        now = self.clock()
+        self._rotate(now)
+        return round(self.current.estimate(key) + self.previous.estimate(key) * self._weight(now))
+
+
+class SlidingWindowCounter:
+    """
+    Conteo exacto por clave en una ventana deslizante dividida en buckets.
+
+    Cada clave guarda a lo sumo `buckets` contadores; las claves inactivas
+    salen por LRU al pasar de `max_keys`.
+    """
+
+    def __init__(self, window: float, buckets: int = 60, max_keys: int = 100_000,
+                 clock: Callable[[], float] = time.monotonic):
+        self.window = window
+        self.bucket_size = window / buckets
+        self.max_keys = max_keys
+        self.clock = clock
+        self._counts: "OrderedDict[str, Deque[List[int]]]" = OrderedDict()
+
+    def _prune(self, buckets: Deque[List[int]], current: int):
+        oldest = current - int(self.window / self.bucket_size) + 1
+        while buckets and buckets[0][0] < oldest:
+            buckets.popleft()
+
+    def add(self, key: str) -> int:
+        """Registra un evento y retorna el total de la clave en la ventana"""
+        current = int(self.clock() // self.bucket_size)
+        buckets = self._counts.get(key)
+        if buckets is None:
+            buckets = self._counts[key] = deque()
+            if len(self._counts) > self.max_keys:
+                self._counts.popitem(last=False)
+        else:
+            self._counts.move_to_end(key)
+
+        self._prune(buckets, current)
+        if buckets and buckets[-1][0] == current:
+            buckets[-1][1] += 1
+        else:
+            buckets.append([current, 1])
+        return sum(count for _, count in buckets)
+
+    def count(self, key: str) -> int:
+        buckets = self._counts.get(key)
+        if not buckets:
+            return 0
+        self._prune(buckets, int(self.clock() // self.bucket_size))
+        return sum(count for _, count in buckets)
+
+
+class AnomalyDetector:
+    """
+    Detección de anomalías sobre el flujo de eventos, sin consultar historial.
+
+    - Fuerza bruta: logins fallidos por IP en la última hora (ventana deslizante)
+    - Exportación masiva: exportaciones por usuario en el último día (count-min)
+    - Tasa alta: eventos por usuario y por IP por minuto (count-min)
+    - IP inusual: IP fuera de las más frecuentes del usuario (top-k space-saving)
+
+    Cada alerta se emite una vez por clave y ventana.
+    """
+
+    EXPORT_ACTIONS = (AuditAction.CUSTOMER_EXPORT, AuditAction.KNOWLEDGE_EXPORT)
+
+    def __init__(
+        self,
+        failed_login_threshold: int = 5,
+        failed_login_window: float = 3600,
+        export_threshold: int = 10,
+        export_window: float = 86400,
+        rate_threshold: int = 300,
+        rate_window: float = 60,
+        known_ips_per_user: int = 10,
+        max_keys: int = 100_000,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.failed_login_threshold = failed_login_threshold
+        self.export_threshold = export_threshold
+        self.rate_threshold = rate_threshold
+        self.known_ips_per_user = known_ips_per_user
+        self.max_keys = max_keys
+        self.clock = clock
+        self.windows = {
+            "multiple_failed_logins": failed_login_window,
+            "mass_data_export": export_window,
+            "high_request_rate": rate_window,
+            "unusual_ip": export_window,
+        }
+
+        self.failed_logins = SlidingWindowCounter(failed_login_window, max_keys=max_keys, clock=clock)
+        self.exports = WindowedCountMin(export_window, clock=clock)
+        self.rates = WindowedCountMin(rate_window, clock=clock)
+        self.known_ips: "OrderedDict[str, Dict[str, int]]" = OrderedDict()
+
+        self._fired: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self._recent: Deque[Tuple[float, Dict[str, Any]]] = deque(maxlen=1000)
+
+    def observe(self, audit_log: AuditLog) -> List[Dict[str, Any]]:
+        """Actualiza los contadores con el evento y retorna las anomalías nuevas"""
+        anomalies = []
+
+        if audit_log.action == AuditAction.LOGIN_FAILED:
+            count = self.failed_logins.add(audit_log.ip_address)
+            if count >= self.failed_login_threshold:
+                anomalies.append(self._fire(
+                    "multiple_failed_logins", audit_log.ip_address, "high",
+                    ip_address=audit_log.ip_address, count=count
+                ))
+
+        if audit_log.action in self.EXPORT_ACTIONS:
+            count = self.exports.add(audit_log.user_id)
+            if count >= self.export_threshold:
+                anomalies.append(self._fire(
+                    "mass_data_export", audit_log.user_id, "critical",
+                    user_id=audit_log.user_id, count=count
+                ))
+
+        for field, key in (("user_id", audit_log.user_id), ("ip_address", audit_log.ip_address)):
+            count = self.rates.add(f"{field}:{key}")
+            if count >= self.rate_threshold:
+                anomalies.append(self._fire(
+                    "high_request_rate", f"{field}:{key}", "medium", **{field: key, "count": count}
+                ))
+
+        frequent = self._track_ip(audit_log)
+        if frequent and audit_log.ip_address not in frequent:
+            anomalies.append(self._fire(
+                "unusual_ip", f"{audit_log.user_id}:{audit_log.ip_address}", "medium",
+                user_id=audit_log.user_id, ip_address=audit_log.ip_address,
+                frequent_ips=sorted(frequent, key=frequent.get, reverse=True)[:3]
+            ))
+
+        return [a for a in anomalies if a]
+
+    def _track_ip(self, audit_log: AuditLog) -> Dict[str, int]:
+        """
+        IPs frecuentes del usuario antes de este evento; los eventos exitosos
+        actualizan el top-k (space-saving: la IP nueva hereda el mínimo + 1).
+        """
+        counters = self.known_ips.get(audit_log.user_id)
+        frequent = dict(counters) if counters else {}
+        if not audit_log.success:
+            return frequent
+
+        if counters is None:
+            counters = self.known_ips[audit_log.user_id] = {}
+            if len(self.known_ips) > self.max_keys:
+                self.known_ips.popitem(last=False)
+        else:
+            self.known_ips.move_to_end(audit_log.user_id)
+
+        ip = audit_log.ip_address
+        if ip in counters or len(counters) < self.known_ips_per_user:
+            counters[ip] = counters.get(ip, 0) + 1
+        else:
+            weakest = min(counters, key=counters.get)
+            counters[ip] = counters.pop(weakest) + 1
+        return frequent
+
+    def _fire(self, anomaly_type: str, key: str, severity: str, **fields) -> Optional[Dict[str, Any]]:
+        now = self.clock()
+        expires = self._fired.get((anomaly_type, key))
+        if expires is not None and expires > now:
+            return None
+
+        window = self.windows[anomaly_type]
+        self._fired[(anomaly_type, key)] = now + window
+        self._fired.move_to_end((anomaly_type, key))
+        if len(self._fired) > self.max_keys:
+            self._fired.popitem(last=False)
+
+        anomaly = {"type": anomaly_type, "severity": severity, **fields, "detected_at": datetime.utcnow()}
+        self._recent.append((now + window, anomaly))
+        return anomaly
+
+    def active_anomalies(self) -> List[Dict[str, Any]]:
+        """Anomalías cuya ventana sigue abierta"""
+        now = self.clock()
+        return [anomaly for expires, anomaly in self._recent if expires > now]
+
+
 # ═══════════════════════════════════════════
 # SERVICIO DE AUDITORÍA
 # ═══════════════════════════════════════════
@@ -149,18 +669,59 @@ class AuditService:
 
     Registra todas las acciones importantes del sistema
     para compliance y seguridad.
+
+    log() solo encola: un flusher en segundo plano escribe los eventos en
+    lotes. Si el buffer se llena, log() espera a que el flusher libere
+    espacio (backpressure) en vez de descartar eventos.
     """
 
-    def __init__(self, db, logger):
+    def __init__(
+        self,
+        db,
+        logger,
+        sink: Optional[AuditSink] = None,
+        buffer_size: int = 10_000,
+        batch_size: int = 500,
+        flush_interval: float = 1.0,
+        max_retries: int = 3,
+        fallback_sink: Optional[AuditSink] = None,
+        detector: Optional[AnomalyDetector] = None
+    ):
         """
         Inicializar servicio.
 
         Args:
-            db: Conexión a base de datos
+            db: Conexión a base de datos (MongoDB); None usa un sink local
             logger: Logger para registro adicional
+            sink: Destino de los eventos (por defecto Mongo o SQLite local)
+            buffer_size: Eventos máximos en memoria a la espera de escritura
+            batch_size: Eventos por escritura
+            flush_interval: Segundos máximos que un evento espera en el buffer
+            max_retries: Intentos por lote antes de pasar al respaldo
+            fallback_sink: Destino si el sink principal sigue fallando
+            detector: Detector de anomalías en streaming
         """
         self.db = db
         self.logger = logger
+        if sink is None:
+            if db is not None:
+                sink = MongoAuditSink(db)
+            else:
+                sink = SQLiteAuditSink(os.getenv("AUDIT_SQLITE_PATH") or DEFAULT_SQLITE_PATH)
+        self.sink = sink
+        self.fallback_sink = fallback_sink
+        self.detector = detector or AnomalyDetector()
+
+        self.buffer_size = buffer_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._flusher: Optional[asyncio.Task] = None
+        self._batch: List[Dict[str, Any]] = []
+        self._write_lock: Optional[asyncio.Lock] = None
+        self.stats = {"logged": 0, "written": 0, "batches": 0, "write_errors": 0, "lost": 0, "anomalies": 0}
 
         # Acciones consideradas sensibles
         self.sensitive_actions = [
@@ -233,11 +794,8 @@ class AuditService:
             duration_ms=duration_ms
         )
 
-        # Guardar en DB
-        try:
-            await self.db.audit_logs.insert_one(audit_log.dict())
-        except Exception as e:
-            self.logger.error(f"Error guardando audit log: {e}")
+        # Encolar para escritura por lotes
+        await self._enqueue(audit_log.dict())
 
         # Log estructurado
         log_method = self.logger.info if success else self.logger.warning
@@ -256,11 +814,125 @@ class AuditService:
         if not success and action in self.sensitive_actions:
             await self._alert_security_team(audit_log)
 
-        # Detectar anomalías en tiempo real
-        await self._check_realtime_anomalies(audit_log)
+        # Detectar anomalías en tiempo real (sin consultar historial)
+        for anomaly in self.detector.observe(audit_log):
+            self._report_anomaly(anomaly)
 
         return audit_log
 
+    # ═══════════════════════════════════════════
+    # BUFFER Y ESCRITURA POR LOTES
+    # ═══════════════════════════════════════════
+
+    def start(self):
+        """Arranca el flusher en el event loop actual (log() lo hace solo)"""
+        if self._flusher is None or self._flusher.done():
+            self._queue = asyncio.Queue(maxsize=self.buffer_size)
+            self._write_lock = asyncio.Lock()
+            self._flusher = asyncio.create_task(self._run_flusher())
+
+    async def _enqueue(self, doc: Dict[str, Any]):
+        self.start()
+        self.stats["logged"] += 1
+        await self._queue.put(doc)
+
+    async def _run_flusher(self):
+        """Junta eventos hasta `batch_size` o `flush_interval` y escribe el lote"""
+        loop = asyncio.get_running_loop()
+        stopping = False
+
+        while not stopping:
+            doc = await self._queue.get()
+            if doc is _STOP:
+                break
+            self._batch.append(doc)
+            deadline = loop.time() + self.flush_interval
+
+            while len(self._batch) < self.batch_size:
+                if self._queue.empty():
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        doc = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    doc = self._queue.get_nowait()
+                if doc is _STOP:
+                    stopping = True
+                    break
+                self._batch.append(doc)
+
+            async with self._write_lock:
+                batch, self._batch = self._batch, []
+                if batch:
+                    await self._write(batch)
+
+    async def _write(self, batch: List[Dict[str, Any]]):
+        """Escribe un lote con reintentos; si el sink sigue caído, usa el respaldo"""
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                await self.sink.write(batch)
+                self.stats["written"] += len(batch)
+                self.stats["batches"] += 1
+                return
+            except Exception as e:
+                self.stats["write_errors"] += 1
+                self.logger.error(f"Error guardando {len(batch)} audit logs (intento {attempt}): {e}")
+                if attempt < self.max_retries:
+                    await asyncio.sleep(min(0.5 * 2 ** (attempt - 1), 5))
+
+        if self.fallback_sink is not None:
+            try:
+                await self.fallback_sink.write(batch)
+                self.stats["written"] += len(batch)
+                return
+            except Exception as e:
+                self.logger.error(f"Error guardando audit logs en respaldo: {e}")
+
+        self.stats["lost"] += len(batch)
+        self.logger.critical(
+            f"AUDIT LOST: {len(batch)} eventos sin persistir",
+            event_type="audit_write_failed",
+            audit_ids=[doc["id"] for doc in batch[:20]]
+        )
+
+    async def flush(self):
+        """Escribe ya todo lo que esté en el buffer"""
+        if self._queue is None:
+            return
+
+        async with self._write_lock:
+            pending, self._batch = self._batch, []
+            stop = False
+            while not self._queue.empty():
+                doc = self._queue.get_nowait()
+                if doc is _STOP:
+                    stop = True
+                else:
+                    pending.append(doc)
+            if stop:
+                # La marca es de close(): se devuelve para que el flusher termine
+                self._queue.put_nowait(_STOP)
+
+            for i in range(0, len(pending), self.batch_size):
+                await self._write(pending[i:i + self.batch_size])
+
+    async def close(self):
+        """Detiene el flusher, escribe lo pendiente y libera el sink (llamar al apagar)"""
+        if self._flusher is not None and not self._flusher.done():
+            await self._queue.put(_STOP)
+            await self._flusher
+        await self.flush()
+        await self.sink.close()
+        if self.fallback_sink is not None:
+            await self.fallback_sink.close()
+
+    # ═══════════════════════════════════════════
+    # ALERTAS
+    # ═══════════════════════════════════════════
+
     async def _alert_security_team(self, audit_log: AuditLog):
         """
         Alertar equipo de seguridad por evento sospechoso.
@@ -280,100 +952,49 @@ class AuditService:
         # TODO: Enviar notificación a equipo de seguridad
         # await notification_service.send_security_alert(audit_log)
 
-    async def _check_realtime_anomalies(self, audit_log: AuditLog):
-        """
-        Verificar anomalías en tiempo real.
-
-        Args:
-            audit_log: Log del evento actual
-        """
-        # Múltiples login fallidos
-        if audit_log.action == AuditAction.LOGIN_FAILED:
-            await self._check_brute_force(audit_log)
-
-        # Exportaciones masivas
-        if audit_log.action in [AuditAction.CUSTOMER_EXPORT, AuditAction.KNOWLEDGE_EXPORT]:
-            await self._check_mass_export(audit_log)
-
-        # Acceso desde IP inusual
-        await self._check_unusual_ip(audit_log)
-
-    async def _check_brute_force(self, audit_log: AuditLog):
-        """Detectar posible ataque de fuerza bruta."""
-        one_hour_ago = datetime.utcnow() - timedelta(hours=1)
-
-        count = await self.db.audit_logs.count_documents({
-            "action": AuditAction.LOGIN_FAILED.value,
-            "ip_address": audit_log.ip_address,
-            "timestamp": {"$gte": one_hour_ago}
-        })
+    def _report_anomaly(self, anomaly: Dict[str, Any]):
+        """Registra una anomalía detectada por el detector en streaming."""
+        self.stats["anomalies"] += 1
+        anomaly_type = anomaly["type"]
 
-        if count >= 5:
+        if anomaly_type == "multiple_failed_logins":
             self.logger.critical(
-                f"BRUTE FORCE DETECTED: {count} failed logins from {audit_log.ip_address}",
+                f"BRUTE FORCE DETECTED: {anomaly['count']} failed logins from {anomaly['ip_address']}",
                 event_type="brute_force_detected",
-                ip_address=audit_log.ip_address,
-                count=count
+                ip_address=anomaly["ip_address"],
+                count=anomaly["count"]
             )
-
-    async def _check_mass_export(self, audit_log: AuditLog):
-        """Detectar exportaciones masivas sospechosas."""
-        one_day_ago = datetime.utcnow() - timedelta(days=1)
-
-        count = await self.db.audit_logs.count_documents({
-            "action": {"$in": [AuditAction.CUSTOMER_EXPORT.value, AuditAction.KNOWLEDGE_EXPORT.value]},
-            "user_id": audit_log.user_id,
-            "timestamp": {"$gte": one_day_ago}
-        })
-
-        if count >= 10:
+        elif anomaly_type == "mass_data_export":
             self.logger.critical(
-                f"MASS EXPORT DETECTED: {count} exports by user {audit_log.user_id}",
+                f"MASS EXPORT DETECTED: {anomaly['count']} exports by user {anomaly['user_id']}",
                 event_type="mass_export_detected",
-                user_id=audit_log.user_id,
-                count=count
+                user_id=anomaly["user_id"],
+                count=anomaly["count"]
             )
-
-    async def _check_unusual_ip(self, audit_log: AuditLog):
-        """Detectar acceso desde IP inusual."""
-        # Obtener IPs frecuentes del usuario
-        seven_days_ago = datetime.utcnow() - timedelta(days=7)
-
-        pipeline = [
-            {
-                "$match": {
-                    "user_id": audit_log.user_id,
-                    "success": True,
-                    "timestamp": {"$gte": seven_days_ago}
-                }
-            },
-            {
-                "$group": {
-                    "_id": "$ip_address",
-                    "count": {"$sum": 1}
-                }
-            },
-            {"$sort": {"count": -1}},
-            {"$limit": 10}
-        ]
-
-        frequent_ips = await self.db.audit_logs.aggregate(pipeline).to_list(10)
-        frequent_ip_list = [ip["_id"] for ip in frequent_ips]
-
-        # Si hay historial y la IP actual no está en las frecuentes
-        if frequent_ip_list and audit_log.ip_address not in frequent_ip_list:
+        elif anomaly_type == "unusual_ip":
             self.logger.warning(
-                f"UNUSUAL IP: {audit_log.ip_address} for user {audit_log.user_id}",
+                f"UNUSUAL IP: {anomaly['ip_address']} for user {anomaly['user_id']}",
                 event_type="unusual_ip_detected",
-                user_id=audit_log.user_id,
-                ip_address=audit_log.ip_address,
-                frequent_ips=frequent_ip_list[:3]
+                user_id=anomaly["user_id"],
+                ip_address=anomaly["ip_address"],
+                frequent_ips=anomaly["frequent_ips"]
+            )
+        else:
+            self.logger.warning(
+                f"HIGH REQUEST RATE: {anomaly['count']} events/window",
+                event_type="high_request_rate_detected",
+                **{k: v for k, v in anomaly.items() if k in ("user_id", "ip_address", "count")}
             )
 
     # ═══════════════════════════════════════════
     # CONSULTAS DE AUDITORÍA
     # ═══════════════════════════════════════════
 
+    async def _find(self, where: Dict[str, Any], limit: Optional[int] = None) -> List[AuditLog]:
+        """Consulta el sink tras vaciar el buffer, para leer lo recién registrado."""
+        await self.flush()
+        return [AuditLog(**doc) for doc in await self.sink.find(where, limit)]
+
     async def get_user_activity(
         self,
         user_id: str,
@@ -393,12 +1014,7 @@ class AuditService:
         Returns:
             Lista de eventos de auditoría
         """
-        cursor = self.db.audit_logs.find({
-            "user_id": user_id,
-            "timestamp": {"$gte": start_date, "$lte": end_date}
-        }).sort("timestamp", -1).limit(limit)
-
-        return [AuditLog(**doc) async for doc in cursor]
+        return await self._find({"user_id": user_id, "since": start_date, "until": end_date}, limit)
 
     async def get_resource_history(
         self,
@@ -417,12 +1033,7 @@ class AuditService:
         Returns:
             Lista de eventos de auditoría
         """
-        cursor = self.db.audit_logs.find({
-            "resource_type": resource_type,
-            "resource_id": resource_id
-        }).sort("timestamp", -1).limit(limit)
-
-        return [AuditLog(**doc) async for doc in cursor]
+        return await self._find({"resource_type": resource_type, "resource_id": resource_id}, limit)
 
     async def get_failed_actions(
         self,
@@ -439,89 +1050,24 @@ class AuditService:
         Returns:
             Lista de eventos fallidos
         """
-        query = {
-            "success": False,
-            "timestamp": {"$gte": datetime.utcnow() - timedelta(hours=hours)}
-        }
+        where = {"success": False, "since": datetime.utcnow() - timedelta(hours=hours)}
 
         if action_filter:
-            query["action"] = {"$in": [a.value for a in action_filter]}
+            where["action"] = [a.value for a in action_filter]
 
-        cursor = self.db.audit_logs.find(query).sort("timestamp", -1)
-
-        return [AuditLog(**doc) async for doc in cursor]
+        return await self._find(where)
 
     async def detect_anomalies(self) -> List[Dict[str, Any]]:
         """
-        Detectar patrones anómalos en los logs.
+        Anomalías vigentes según el detector en streaming.
+
+        No consulta la base de datos: los contadores se actualizan en cada
+        log() y aquí solo se listan las alertas cuya ventana sigue abierta.
 
         Returns:
             Lista de anomalías detectadas
         """
-        anomalies = []
-        one_hour_ago = datetime.utcnow() - timedelta(hours=1)
-        one_day_ago = datetime.utcnow() - timedelta(days=1)
-
-        # Múltiples login fallidos por IP
-        pipeline = [
-            {
-                "$match": {
-                    "action": AuditAction.LOGIN_FAILED.value,
-                    "timestamp": {"$gte": one_hour_ago}
-                }
-            },
-            {
-                "$group": {
-                    "_id": "$ip_address",
-                    "count": {"$sum": 1}
-                }
-            },
-            {"$match": {"count": {"$gte": 5}}}
-        ]
-
-        failed_logins = await self.db.audit_logs.aggregate(pipeline).to_list(100)
-
-        for item in failed_logins:
-            anomalies.append({
-                "type": "multiple_failed_logins",
-                "ip_address": item["_id"],
-                "count": item["count"],
-                "severity": "high",
-                "detected_at": datetime.utcnow()
-            })
-
-        # Exportaciones masivas de datos
-        pipeline = [
-            {
-                "$match": {
-                    "action": {"$in": [AuditAction.CUSTOMER_EXPORT.value, AuditAction.KNOWLEDGE_EXPORT.value]},
-                    "timestamp": {"$gte": one_day_ago}
-                }
-            },
-            {
-                "$group": {
-                    "_id": "$user_id",
-                    "count": {"$sum": 1}
-                }
-            },
-            {"$match": {"count": {"$gte": 10}}}
-        ]
-
-        mass_exports = await self.db.audit_logs.aggregate(pipeline).to_list(100)
-
-        for item in mass_exports:
-            anomalies.append({
-                "type": "mass_data_export",
-                "user_id": item["_id"],
-                "count": item["count"],
-                "severity": "critical",
-                "detected_at": datetime.utcnow()
-            })
-
-        # Accesos fuera de horario (opcional, ajustar según necesidad)
-        # ...
-
-        return anomalies
+        return self.detector.active_anomalies()
 
     async def generate_summary(
         self,
@@ -538,17 +1084,22 @@ class AuditService:
         Returns:
             Resumen de auditoría
         """
+        if not isinstance(self.sink, MongoAuditSink):
+            return await self._generate_local_summary(start_date, end_date)
+
+        await self.flush()
+        audit_logs = self.sink.collection
         base_query = {"timestamp": {"$gte": start_date, "$lte": end_date}}
 
         # Total de eventos
-        total_events = await self.db.audit_logs.count_documents(base_query)
+        total_events = await audit_logs.count_documents(base_query)
 
         # Eventos por acción
         pipeline = [
             {"$match": base_query},
             {"$group": {"_id": "$action", "count": {"$sum": 1}}}
         ]
-        by_action = {doc["_id"]: doc["count"] async for doc in self.db.audit_logs.aggregate(pipeline)}
+        by_action = {doc["_id"]: doc["count"] async for doc in audit_logs.aggregate(pipeline)}
 
         # Eventos por usuario
         pipeline = [
@@ -557,10 +1108,10 @@ class AuditService:
             {"$sort": {"count": -1}},
             {"$limit": 20}
         ]
-        by_user = {doc["_id"]: doc["count"] async for doc in self.db.audit_logs.aggregate(pipeline)}
+        by_user = {doc["_id"]: doc["count"] async for doc in audit_logs.aggregate(pipeline)}
 
         # Eventos fallidos
-        failed_events = await self.db.audit_logs.count_documents({
+        failed_events = await audit_logs.count_documents({
             **base_query,
             "success": False
         })
@@ -578,6 +1129,21 @@ class AuditService:
             anomalies_detected=len(anomalies)
         )
 
+    async def _generate_local_summary(self, start_date: datetime, end_date: datetime) -> AuditSummary:
+        """Resumen sobre un sink local: agrega en memoria los eventos del período."""
+        logs = await self._find({"since": start_date, "until": end_date})
+        by_user = Counter(log.user_id for log in logs)
+
+        return AuditSummary(
+            period_start=start_date,
+            period_end=end_date,
+            total_events=len(logs),
+            events_by_action=dict(Counter(log.action.value for log in logs)),
+            events_by_user=dict(by_user.most_common(20)),
+            failed_events=sum(1 for log in logs if not log.success),
+            anomalies_detected=len(await self.detect_anomalies())
+        )
+
 
 # ═══════════════════════════════════════════
 # DECORADOR DE AUDITORÍA
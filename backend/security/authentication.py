@@ -7,6 +7,8 @@ Implementa:
 - RBAC (Role-Based Access Control)
 - API Keys para integraciones
 - Rate limiting por usuario
+- Cache de tokens verificados (respeta exp y revocación)
+- Revocación compartida entre workers (Redis con REDIS_URL, si no en memoria)
 
 Uso:
     from security.authentication import get_current_user, require_permission, Permission
@@ -26,15 +28,26 @@ Uso:
         ...
 """
 
+from abc import ABC, abstractmethod
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from pydantic import BaseModel, EmailStr
+import hashlib
 import secrets
+import threading
+import time
 from enum import Enum
 import os
 
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
 # ═══════════════════════════════════════════
 # CONFIGURACIÓN
 # ═══════════════════════════════════════════
@@ -44,6 +57,7 @@ SECRET_KEY = os.getenv("JWT_SECRET_KEY", secrets.token_urlsafe(32))
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
 REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "7"))
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
@@ -237,7 +251,8 @@ def create_access_token(user: User, additional_claims: Dict[str, Any] = None) ->
         "country": user.country,
         "exp": expire,
         "type": "access",
-        "iat": datetime.utcnow(),
+        # Con fracción de segundo: revoke_user_tokens corta justo en el instante
+        "iat": time.time(),
     }
 
     if additional_claims:
@@ -262,22 +277,184 @@ def create_refresh_token(user: User) -> str:
         "sub": user.id,
         "exp": expire,
         "type": "refresh",
-        "iat": datetime.utcnow(),
+        "iat": time.time(),
     }
 
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
+class RevocationStore(ABC):
+    """Registro de revocaciones (tokens sueltos y usuarios completos)"""
+
+    @abstractmethod
+    def revoke_token(self, key: str, exp: float):
+        """Revoca el token con hash `key` hasta su expiración"""
+
+    @abstractmethod
+    def revoke_user(self, user_id: str, before: float):
+        """Revoca los tokens del usuario emitidos hasta `before`"""
+
+    @abstractmethod
+    def is_revoked(self, key: str, user_id: Optional[str], iat: float) -> bool:
+        """El token está revocado o se emitió antes de revocar a su usuario"""
+
+
+class MemoryRevocationStore(RevocationStore):
+    """Revocaciones en memoria: solo valen dentro del proceso"""
+
+    def __init__(self):
+        self._revoked: Dict[str, float] = {}          # hash -> exp
+        self._revoked_users: Dict[str, float] = {}    # user_id -> revocado antes de (timestamp)
+        self._lock = threading.Lock()
+
+    def revoke_token(self, key: str, exp: float):
+        with self._lock:
+            now = time.time()
+            self._revoked = {k: e for k, e in self._revoked.items() if e > now}
+            self._revoked[key] = exp
+
+    def revoke_user(self, user_id: str, before: float):
+        with self._lock:
+            self._revoked_users[user_id] = before
+
+    def is_revoked(self, key: str, user_id: Optional[str], iat: float) -> bool:
+        if key in self._revoked:
+            return True
+        revoked_before = self._revoked_users.get(user_id)
+        return revoked_before is not None and iat <= revoked_before
+
+
+class RedisRevocationStore(RevocationStore):
+    """
+    Revocaciones en Redis, compartidas por todos los workers y réplicas.
+
+    Cada clave expira sola: la de un token con su `exp` y la de un usuario
+    cuando ya no puede quedar vivo ningún token emitido antes del corte.
+    """
+
+    def __init__(self, client: "redis.Redis", prefix: str = "auth:revoked:"):
+        self.client = client
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs) -> "RedisRevocationStore":
+        if not REDIS_AVAILABLE:
+            raise RuntimeError("redis no instalado: pip install redis")
+        return cls(redis.from_url(url), **kwargs)
+
+    def revoke_token(self, key: str, exp: float):
+        ttl = max(1, int(exp - time.time()) + 1)
+        self.client.set(f"{self.prefix}token:{key}", 1, ex=ttl)
+
+    def revoke_user(self, user_id: str, before: float):
+        ttl = REFRESH_TOKEN_EXPIRE_DAYS * 86400
+        self.client.set(f"{self.prefix}user:{user_id}", repr(before), ex=ttl)
+
+    def is_revoked(self, key: str, user_id: Optional[str], iat: float) -> bool:
+        token, revoked_before = self.client.mget(
+            f"{self.prefix}token:{key}", f"{self.prefix}user:{user_id}"
+        )
+        return token is not None or (revoked_before is not None and iat <= float(revoked_before))
+
+
+def _revocation_store_from_env() -> RevocationStore:
+    """Redis si hay REDIS_URL (y cliente instalado); si no, memoria del proceso"""
+    url = os.getenv("REDIS_URL")
+    if url and REDIS_AVAILABLE:
+        return RedisRevocationStore.from_url(url)
+    return MemoryRevocationStore()
+
+
+class TokenCache:
+    """
+    Cache LRU acotado de tokens ya verificados.
+
+    La clave es el SHA-256 del token (el token no queda en memoria). Una
+    entrada vale hasta su `exp`; la revocación (de un token o de todos los
+    tokens de un usuario emitidos antes de cierto momento) se consulta en
+    cada lectura, también para tokens que no están en cache, contra el
+    RevocationStore compartido: revocar en un worker vale en todos.
+    """
+
+    def __init__(self, max_size: int = TOKEN_CACHE_SIZE, revocations: Optional[RevocationStore] = None):
+        self.max_size = max_size
+        self.revocations = revocations or MemoryRevocationStore()
+        self._entries: "OrderedDict[str, Tuple[TokenData, float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[TokenData]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            token_data, exp, iat = entry
+        if exp <= time.time() or self.is_revoked(key, token_data.user_id, iat):
+            with self._lock:
+                self._entries.pop(key, None)
+                self.misses += 1
+            return None
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            self.hits += 1
+        return token_data
+
+    def put(self, key: str, token_data: TokenData, exp: float, iat: float):
+        with self._lock:
+            self._entries[key] = (token_data, exp, iat)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def is_revoked(self, key: str, user_id: Optional[str], iat: float) -> bool:
+        return self.revocations.is_revoked(key, user_id, iat)
+
+    def revoke(self, token: str, exp: Optional[float] = None):
+        """Revoca un token hasta su expiración"""
+        key = self.key(token)
+        with self._lock:
+            self._entries.pop(key, None)
+        self.revocations.revoke_token(key, exp or time.time() + ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+
+    def revoke_user(self, user_id: str):
+        """Revoca todos los tokens del usuario emitidos hasta ahora"""
+        self.revocations.revoke_user(user_id, time.time())
+        with self._lock:
+            for key in [k for k, (data, _, _) in self._entries.items() if data.user_id == user_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+token_cache = TokenCache(revocations=_revocation_store_from_env())
+
+
 def decode_token(token: str) -> Optional[TokenData]:
     """
     Decodificar y validar token JWT.
 
+    Los tokens ya verificados salen del cache hasta su expiración.
+
     Args:
         token: Token JWT
 
     Returns:
         TokenData si válido, None si inválido
     """
+    key = TokenCache.key(token)
+    cached = token_cache.get(key)
+    if cached is not None:
+        return cached
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
 
@@ -285,7 +462,11 @@ def decode_token(token: str) -> Optional[TokenData]:
         if payload.get("type") not in ["access", "refresh"]:
             return None
 
-        return TokenData(
+        iat = payload.get("iat") or 0
+        if token_cache.is_revoked(key, payload.get("sub"), iat):
+            return None
+
+        token_data = TokenData(
             user_id=payload.get("sub"),
             email=payload.get("email"),
             role=Role(payload.get("role")),
@@ -293,10 +474,26 @@ def decode_token(token: str) -> Optional[TokenData]:
             country=payload.get("country"),
             exp=datetime.fromtimestamp(payload.get("exp"))
         )
+        token_cache.put(key, token_data, payload.get("exp"), iat)
+        return token_data
     except JWTError:
         return None
 
 
+def revoke_token(token: str):
+    """Revoca un token (p. ej. al cerrar sesión) antes de su expiración."""
+    try:
+        exp = jwt.get_unverified_claims(token).get("exp")
+    except JWTError:
+        exp = None
+    token_cache.revoke(token, exp)
+
+
+def revoke_user_tokens(user_id: str):
+    """Revoca todos los tokens emitidos a un usuario hasta este momento."""
+    token_cache.revoke_user(user_id)
+
+
 def verify_refresh_token(token: str) -> Optional[str]:
     """
     Verificar token de refresh y retornar user_id.
@@ -519,11 +716,12 @@ async def get_api_key_user(
 # MIDDLEWARE DE RATE LIMITING
 # ═══════════════════════════════════════════
 
-from collections import defaultdict
-import time
+from .rate_limit import MemoryStore, RateLimit, SlidingWindowLog
 
-# Rate limit storage (en producción usar Redis)
-rate_limit_storage: Dict[str, List[float]] = defaultdict(list)
+# Contadores por usuario en memoria, acotados con desalojo LRU. Para límites
+# compartidos entre workers usar RateLimitMiddleware con RedisStore.
+rate_limit_store = MemoryStore(max_keys=50_000)
+_sliding_window = SlidingWindowLog()
 
 
 def check_rate_limit(user_id: str, limit: int = 100, window_seconds: int = 60) -> bool:
@@ -538,21 +736,10 @@ def check_rate_limit(user_id: str, limit: int = 100, window_seconds: int = 60) -
     Returns:
         True si permitido, False si excede límite
     """
-    now = time.time()
-    window_start = now - window_seconds
-
-    # Limpiar requests viejos
-    rate_limit_storage[user_id] = [
-        ts for ts in rate_limit_storage[user_id] if ts > window_start
-    ]
-
-    # Verificar límite
-    if len(rate_limit_storage[user_id]) >= limit:
-        return False
-
-    # Agregar request actual
-    rate_limit_storage[user_id].append(now)
-    return True
+    result = rate_limit_store.check(
+        _sliding_window, f"user:{user_id}", RateLimit(limit, window_seconds)
+    )
+    return result.allowed
 
 
 async def rate_limit_dependency(
@@ -3,7 +3,8 @@ Encriptación de datos sensibles para Litper
 ============================================
 
 Implementa:
-- Encriptación simétrica (Fernet/AES)
+- Encriptación simétrica (Fernet/AES) con rotación de keys (MultiFernet)
+- Encriptación por lotes (registros o columnas de DataFrame)
 - Hashing para búsquedas
 - Enmascaramiento de PII
 - Gestión segura de keys
@@ -17,18 +18,64 @@ Uso:
     # Usar servicio
     encrypted = encryption_service.encrypt("datos sensibles")
     decrypted = encryption_service.decrypt(encrypted)
+
+    # Lotes: un llamado para muchos registros
+    clientes = encryption_service.encrypt_records(clientes, PII_FIELDS["customer"])
+
+Rotación: init_encryption(nueva_key, previous_keys=[key_anterior]) encripta
+con la nueva y sigue leyendo lo encriptado con la anterior; rotate()
+reencripta un valor con la key actual.
 """
 
-from cryptography.fernet import Fernet
+from functools import lru_cache
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 from cryptography.hazmat.backends import default_backend
 import base64
 import os
-from typing import Optional, Dict, List, Any
+import time
+from typing import Optional, Dict, List, Any, Iterable, Sequence
 import hashlib
 import re
 
+# pandas es opcional: solo se usa para reconocer sus nulos (NaN, NaT, NA)
+try:
+    import pandas as pd
+    PANDAS_AVAILABLE = True
+except ImportError:
+    PANDAS_AVAILABLE = False
+
+PBKDF2_ITERATIONS = 100000
+
+
+def _is_empty(value: Any) -> bool:
+    """Valor vacío o nulo (None, "", NaN...): se deja sin encriptar"""
+    if PANDAS_AVAILABLE:
+        if pd.api.types.is_scalar(value) and pd.isna(value):
+            return True
+    elif isinstance(value, float) and value != value:
+        return True
+    return not value
+
+
+@lru_cache(maxsize=16)
+def derive_key(master_key: str, salt: bytes, iterations: int = PBKDF2_ITERATIONS) -> bytes:
+    """
+    Derivar key Fernet desde la clave maestra con PBKDF2-SHA256.
+
+    Memoizada: cada combinación (clave, salt) se deriva una sola vez por
+    proceso, aunque se creen varios EncryptionService.
+    """
+    kdf = PBKDF2HMAC(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=salt,
+        iterations=iterations,
+        backend=default_backend()
+    )
+    return base64.urlsafe_b64encode(kdf.derive(master_key.encode()))
+
 # ═══════════════════════════════════════════
 # CONFIGURACIÓN DE ENCRIPTACIÓN
 # ═══════════════════════════════════════════
@@ -38,30 +85,28 @@ class EncryptionService:
     Servicio de encriptación para datos sensibles.
 
     Usa Fernet (AES-128-CBC) con key derivada usando PBKDF2.
+    Encripta siempre con la key actual y desencripta con cualquiera de las
+    keys configuradas (actual + anteriores).
     """
 
-    def __init__(self, master_key: str, salt: bytes = None):
+    def __init__(self, master_key: str, salt: bytes = None, previous_keys: Sequence[str] = ()):
         """
         Inicializar servicio con master key.
 
         Args:
             master_key: Clave maestra (obtener de Vault/env var)
             salt: Salt para derivación (único por ambiente)
+            previous_keys: Claves maestras anteriores (solo para desencriptar)
         """
         # Usar salt único por ambiente
         if salt is None:
             salt = os.getenv("ENCRYPTION_SALT", "litper_encryption_salt_v1").encode()
 
-        # Derivar key usando PBKDF2
-        kdf = PBKDF2HMAC(
-            algorithm=hashes.SHA256(),
-            length=32,
-            salt=salt,
-            iterations=100000,
-            backend=default_backend()
-        )
-        key = base64.urlsafe_b64encode(kdf.derive(master_key.encode()))
-        self.fernet = Fernet(key)
+        self.fernets = [Fernet(derive_key(key, salt)) for key in (master_key, *previous_keys)]
+        self.fernet = MultiFernet(self.fernets)
+        self._primary = self.fernets[0]
+        # Con una sola key se evita el recorrido de MultiFernet
+        self._decryptor = self._primary if len(self.fernets) == 1 else self.fernet
 
     def encrypt(self, data: str) -> str:
         """
@@ -75,7 +120,7 @@ class EncryptionService:
         """
         if not data:
             return data
-        return self.fernet.encrypt(data.encode()).decode()
+        return self._primary.encrypt(data.encode()).decode()
 
     def decrypt(self, encrypted_data: str) -> str:
         """
@@ -90,11 +135,103 @@ class EncryptionService:
         if not encrypted_data:
             return encrypted_data
         try:
-            return self.fernet.decrypt(encrypted_data.encode()).decode()
+            return self._decryptor.decrypt(encrypted_data.encode()).decode()
         except Exception:
             # Si falla, retornar como está (puede no estar encriptado)
             return encrypted_data
 
+    def rotate(self, encrypted_data: str) -> str:
+        """
+        Reencriptar con la key actual un valor encriptado con cualquier key.
+
+        Args:
+            encrypted_data: Texto encriptado
+
+        Returns:
+            Texto encriptado con la key actual (o el original si no se puede leer)
+        """
+        if not encrypted_data:
+            return encrypted_data
+        try:
+            return self.fernet.rotate(encrypted_data.encode()).decode()
+        except InvalidToken:
+            return encrypted_data
+
+    # ═══════════════════════════════════════════
+    # LOTES
+    # ═══════════════════════════════════════════
+
+    def encrypt_values(self, values: Iterable[Any]) -> List[Any]:
+        """
+        Encriptar muchos valores en un llamado.
+
+        Todos los tokens del lote comparten la marca de tiempo; los valores
+        vacíos o nulos (incluido NaN de pandas) se devuelven sin cambios.
+        """
+        encrypt_at_time = self._primary.encrypt_at_time
+        now = int(time.time())
+        return [
+            v if _is_empty(v) else encrypt_at_time(str(v).encode(), now).decode()
+            for v in values
+        ]
+
+    def decrypt_values(self, values: Iterable[Any]) -> List[Any]:
+        """Desencriptar muchos valores; los que no se pueden leer quedan como están."""
+        decrypt = self._decryptor.decrypt
+        result = []
+        for v in values:
+            if not _is_empty(v):
+                try:
+                    v = decrypt(v.encode()).decode()
+                except Exception:
+                    pass  # Campo no estaba encriptado
+            result.append(v)
+        return result
+
+    def encrypt_records(self, records: Sequence[Dict[str, Any]], fields: List[str]) -> List[Dict[str, Any]]:
+        """
+        Encriptar campos PII de muchos registros (copias; los originales no cambian).
+
+        Args:
+            records: Lista de diccionarios
+            fields: Campos a encriptar
+        """
+        return self._map_records(records, fields, self.encrypt_values)
+
+    def decrypt_records(self, records: Sequence[Dict[str, Any]], fields: List[str]) -> List[Dict[str, Any]]:
+        """Desencriptar campos PII de muchos registros."""
+        return self._map_records(records, fields, self.decrypt_values)
+
+    @staticmethod
+    def _map_records(records, fields, transform) -> List[Dict[str, Any]]:
+        result = [dict(r) for r in records]
+        for field in fields:
+            rows = [r for r in result if not _is_empty(r.get(field))]
+            for row, value in zip(rows, transform([r[field] for r in rows])):
+                row[field] = value
+        return result
+
+    def encrypt_dataframe(self, df, columns: List[str]):
+        """
+        Encriptar columnas de un DataFrame de pandas.
+
+        Returns:
+            Copia del DataFrame con las columnas encriptadas
+        """
+        result = df.copy()
+        for column in columns:
+            if column in result.columns:
+                result[column] = self.encrypt_values(result[column].tolist())
+        return result
+
+    def decrypt_dataframe(self, df, columns: List[str]):
+        """Desencriptar columnas de un DataFrame de pandas (copia)."""
+        result = df.copy()
+        for column in columns:
+            if column in result.columns:
+                result[column] = self.decrypt_values(result[column].tolist())
+        return result
+
     def encrypt_pii(self, data: Dict[str, Any], fields: List[str]) -> Dict[str, Any]:
         """
         Encriptar campos PII específicos en un diccionario.
@@ -112,11 +249,7 @@ class EncryptionService:
                 ["name", "phone"]
             )
         """
-        result = data.copy()
-        for field in fields:
-            if field in result and result[field]:
-                result[field] = self.encrypt(str(result[field]))
-        return result
+        return self.encrypt_records([data], fields)[0]
 
     def decrypt_pii(self, data: Dict[str, Any], fields: List[str]) -> Dict[str, Any]:
         """
@@ -129,14 +262,7 @@ class EncryptionService:
         Returns:
             Diccionario con campos desencriptados
         """
-        result = data.copy()
-        for field in fields:
-            if field in result and result[field]:
-                try:
-                    result[field] = self.decrypt(result[field])
-                except Exception:
-                    pass  # Campo no estaba encriptado
-        return result
+        return self.decrypt_records([data], fields)[0]
 
     @staticmethod
     def hash_for_search(data: str, truncate: int = 16) -> str:
@@ -286,7 +412,7 @@ PII_FIELDS = {
 encryption_service: Optional[EncryptionService] = None
 
 
-def init_encryption(master_key: str):
+def init_encryption(master_key: str, previous_keys: Optional[Sequence[str]] = None):
     """
     Inicializar servicio de encriptación.
 
@@ -294,9 +420,15 @@ def init_encryption(master_key: str):
 
     Args:
         master_key: Clave maestra (obtener de Vault/env var)
+        previous_keys: Claves anteriores aún válidas para desencriptar
+            (por defecto PREVIOUS_ENCRYPTION_KEYS, separadas por coma)
     """
     global encryption_service
-    encryption_service = EncryptionService(master_key)
+    # No dejar en memoria las keys derivadas de claves que salieron de rotación
+    derive_key.cache_clear()
+    if previous_keys is None:
+        previous_keys = [k for k in os.getenv("PREVIOUS_ENCRYPTION_KEYS", "").split(",") if k]
+    encryption_service = EncryptionService(master_key, previous_keys=previous_keys)
 
 
 def get_encryption_service() -> EncryptionService:
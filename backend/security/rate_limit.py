@@ -0,0 +1,464 @@
+"""
+Rate limiting para Litper
+=========================
+
+Implementa:
+- Middleware ASGI con límites por ruta y por API key
+- Algoritmos intercambiables: ventana fija, log de ventana deslizante y GCRA
+- Stores intercambiables: memoria (con desalojo LRU) y Redis (scripts Lua atómicos)
+- Cabeceras estándar RateLimit-* y Retry-After
+
+Uso:
+    from security.rate_limit import RateLimitMiddleware, RouteLimit, GCRA, RedisStore
+
+    app.add_middleware(
+        RateLimitMiddleware,
+        default="300/minute",
+        routes=[RouteLimit("/api/chat", "20/minute")],
+        api_key_limits={"ltpr_abc1234": "1000/minute"},
+        algorithm=GCRA(),
+        store=RedisStore.from_url(os.getenv("REDIS_URL")),
+    )
+
+Con RedisStore el límite es compartido por todos los workers y réplicas;
+MemoryStore solo limita dentro del proceso.
+"""
+
+import hashlib
+import json
+import logging
+import math
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+try:
+    import redis.asyncio as redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+# ═══════════════════════════════════════════
+# LÍMITES Y RESULTADOS
+# ═══════════════════════════════════════════
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    """Límite de `limit` requests por `period` segundos"""
+    limit: int
+    period: float
+
+    @classmethod
+    def parse(cls, value: Union[str, "RateLimit"]) -> "RateLimit":
+        """Acepta "100/minute", "10/second", "5000/hour" o "20/30" (segundos)"""
+        if isinstance(value, RateLimit):
+            return value
+        count, _, period = value.strip().partition("/")
+        period = period.strip().lower().rstrip("s") or "minute"
+        seconds = PERIODS.get(period)
+        if seconds is None:
+            seconds = float(period)
+        return cls(int(count), float(seconds))
+
+    @property
+    def policy(self) -> str:
+        """Valor de la cabecera RateLimit-Policy"""
+        return f"{self.limit};w={int(self.period)}"
+
+
+@dataclass
+class RateLimitResult:
+    """Decisión para un request"""
+    allowed: bool
+    limit: int
+    remaining: int
+    reset_after: float    # Segundos hasta recuperar la cuota completa
+    retry_after: float = 0.0  # Segundos hasta poder reintentar (si se rechazó)
+
+    def headers(self, rate: RateLimit) -> List[Tuple[bytes, bytes]]:
+        headers = [
+            (b"ratelimit-limit", str(self.limit).encode()),
+            (b"ratelimit-remaining", str(max(0, self.remaining)).encode()),
+            (b"ratelimit-reset", str(math.ceil(self.reset_after)).encode()),
+            (b"ratelimit-policy", rate.policy.encode()),
+        ]
+        if not self.allowed:
+            headers.append((b"retry-after", str(max(1, math.ceil(self.retry_after))).encode()))
+        return headers
+
+
+# ═══════════════════════════════════════════
+# ALGORITMOS
+# ═══════════════════════════════════════════
+#
+# Cada algoritmo tiene dos implementaciones equivalentes: `check` opera sobre
+# el estado en memoria de una clave y `LUA` hace lo mismo dentro de Redis de
+# forma atómica. Los scripts usan el reloj de Redis (TIME) para que todas las
+# réplicas compartan la misma hora y responden
+# {permitido, restantes, reset_ms, retry_ms}.
+
+class RateLimitAlgorithm(ABC):
+    """Interfaz de un algoritmo de rate limiting"""
+
+    name = "base"
+    LUA = ""
+
+    @abstractmethod
+    def check(self, state: Any, rate: RateLimit, now: float) -> Tuple[Any, RateLimitResult]:
+        """Devuelve el nuevo estado de la clave y la decisión"""
+
+    def lua_args(self, rate: RateLimit) -> List[Any]:
+        return [rate.limit, int(rate.period * 1000)]
+
+
+class FixedWindow(RateLimitAlgorithm):
+    """
+    Ventana fija: contador que se reinicia cada `period`.
+
+    El más barato (un INCR), pero admite hasta 2x el límite en el borde
+    entre dos ventanas.
+    """
+
+    name = "fixed_window"
+    LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local limit, period = tonumber(ARGV[1]), tonumber(ARGV[2])
+local window = math.floor(now / period)
+local key = KEYS[1] .. ':' .. window
+local reset = (window + 1) * period - now
+local count = tonumber(redis.call('GET', key) or '0')
+if count >= limit then
+    return {0, 0, reset, reset}
+end
+count = redis.call('INCR', key)
+if count == 1 then
+    redis.call('PEXPIRE', key, period)
+end
+return {1, limit - count, reset, 0}
+"""
+
+    def check(self, state, rate, now):
+        window = math.floor(now / rate.period)
+        count = state[1] if state and state[0] == window else 0
+        reset = (window + 1) * rate.period - now
+
+        if count >= rate.limit:
+            return (window, count), RateLimitResult(False, rate.limit, 0, reset, reset)
+        count += 1
+        return (window, count), RateLimitResult(True, rate.limit, rate.limit - count, reset)
+
+
+class SlidingWindowLog(RateLimitAlgorithm):
+    """
+    Log de ventana deslizante: guarda la hora de cada request aceptado.
+
+    Exacto (nunca más de `limit` en cualquier ventana de `period`); la
+    memoria por clave es O(limit).
+    """
+
+    name = "sliding_window_log"
+    LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local limit, period = tonumber(ARGV[1]), tonumber(ARGV[2])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - period)
+local count = redis.call('ZCARD', KEYS[1])
+if count >= limit then
+    local oldest = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+    local retry = tonumber(oldest[2]) + period - now
+    return {0, 0, period, retry}
+end
+redis.call('ZADD', KEYS[1], now, now .. '-' .. ARGV[3])
+redis.call('PEXPIRE', KEYS[1], period)
+local first = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+return {1, limit - count - 1, tonumber(first[2]) + period - now, 0}
+"""
+
+    def check(self, state, rate, now):
+        log = state if state is not None else deque()
+        start = now - rate.period
+        while log and log[0] <= start:
+            log.popleft()
+
+        if len(log) >= rate.limit:
+            retry = log[0] + rate.period - now
+            return log, RateLimitResult(False, rate.limit, 0, rate.period, retry)
+        log.append(now)
+        return log, RateLimitResult(True, rate.limit, rate.limit - len(log), log[0] + rate.period - now)
+
+    def lua_args(self, rate):
+        return [rate.limit, int(rate.period * 1000), uuid.uuid4().hex[:12]]
+
+
+class GCRA(RateLimitAlgorithm):
+    """
+    Generic Cell Rate Algorithm (token bucket sin temporizador).
+
+    Guarda un solo número por clave (el "theoretical arrival time"): reparte
+    los requests a ritmo constante de `limit/period` permitiendo ráfagas de
+    hasta `burst` (por defecto `limit`).
+    """
+
+    name = "gcra"
+    LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local interval, burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+local tat = tonumber(redis.call('GET', KEYS[1]) or now)
+if tat < now then
+    tat = now
+end
+local new_tat = tat + interval
+local allow_at = new_tat - burst * interval
+if now < allow_at then
+    return {0, 0, tat - now, allow_at - now}
+end
+redis.call('SET', KEYS[1], new_tat, 'PX', math.ceil(new_tat - now))
+return {1, math.floor((now - allow_at) / interval), new_tat - now, 0}
+"""
+
+    def __init__(self, burst: Optional[int] = None):
+        self.burst = burst
+
+    def check(self, state, rate, now):
+        interval = rate.period / rate.limit
+        burst = self.burst or rate.limit
+        tat = max(state or now, now)
+        new_tat = tat + interval
+        allow_at = new_tat - burst * interval
+
+        if now < allow_at:
+            return tat, RateLimitResult(False, rate.limit, 0, tat - now, allow_at - now)
+        remaining = int((now - allow_at) / interval + 1e-9)
+        return new_tat, RateLimitResult(True, rate.limit, remaining, new_tat - now)
+
+    def lua_args(self, rate):
+        return [rate.period * 1000 / rate.limit, self.burst or rate.limit]
+
+
+ALGORITHMS = {a.name: a for a in (FixedWindow, SlidingWindowLog, GCRA)}
+
+
+# ═══════════════════════════════════════════
+# STORES
+# ═══════════════════════════════════════════
+
+class MemoryStore:
+    """
+    Estado en memoria del proceso, acotado a `max_keys` claves.
+
+    Al superar el máximo se desaloja la clave usada hace más tiempo, así
+    un barrido de IPs o API keys no hace crecer la memoria sin límite.
+    """
+
+    def __init__(self, max_keys: int = 100_000, clock: Callable[[], float] = time.monotonic):
+        self.max_keys = max_keys
+        self.clock = clock
+        self._states: "OrderedDict[str, Any]" = OrderedDict()
+
+    def check(self, algorithm: RateLimitAlgorithm, key: str, rate: RateLimit) -> RateLimitResult:
+        """Versión síncrona (sin I/O)"""
+        states = self._states
+        state = states.get(key)
+        state, result = algorithm.check(state, rate, self.clock())
+        states[key] = state
+        states.move_to_end(key)
+        if len(states) > self.max_keys:
+            states.popitem(last=False)
+        return result
+
+    async def hit(self, algorithm: RateLimitAlgorithm, key: str, rate: RateLimit) -> RateLimitResult:
+        return self.check(algorithm, key, rate)
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+
+class RedisStore:
+    """
+    Estado compartido en Redis: cada decisión es un EVALSHA atómico.
+
+    Las claves expiran solas al vencer su ventana.
+    """
+
+    def __init__(self, client: "redis.Redis", prefix: str = "ratelimit:"):
+        self.client = client
+        self.prefix = prefix
+        self._scripts: Dict[str, Any] = {}
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs) -> "RedisStore":
+        if not REDIS_AVAILABLE:
+            raise RuntimeError("redis no instalado: pip install redis")
+        return cls(redis.from_url(url), **kwargs)
+
+    async def hit(self, algorithm: RateLimitAlgorithm, key: str, rate: RateLimit) -> RateLimitResult:
+        script = self._scripts.get(algorithm.name)
+        if script is None:
+            script = self._scripts[algorithm.name] = self.client.register_script(algorithm.LUA)
+
+        allowed, remaining, reset_ms, retry_ms = await script(
+            keys=[f"{self.prefix}{algorithm.name}:{key}"],
+            args=algorithm.lua_args(rate)
+        )
+        return RateLimitResult(
+            allowed=bool(allowed),
+            limit=rate.limit,
+            remaining=int(remaining),
+            reset_after=float(reset_ms) / 1000,
+            retry_after=float(retry_ms) / 1000
+        )
+
+
+# ═══════════════════════════════════════════
+# MIDDLEWARE
+# ═══════════════════════════════════════════
+
+@dataclass
+class RouteLimit:
+    """Límite para las rutas que empiezan con `path` (opcionalmente solo ciertos métodos)"""
+    path: str
+    rate: Union[str, RateLimit]
+    methods: Optional[Sequence[str]] = None
+
+    def __post_init__(self):
+        self.rate = RateLimit.parse(self.rate)
+        self.methods = {m.upper() for m in self.methods} if self.methods else None
+
+    def matches(self, path: str, method: str) -> bool:
+        return path.startswith(self.path) and (self.methods is None or method in self.methods)
+
+
+class RateLimitMiddleware:
+    """
+    Middleware ASGI de rate limiting.
+
+    Identifica al cliente por su API key (cabecera X-API-Key) solo si
+    `api_key_validator` la acepta o su prefijo tiene un límite en
+    `api_key_limits`; cualquier otra key cuenta por IP, así inventar keys no
+    da cuota nueva. El límite aplicado es el de la regla de ruta más específica; las
+    rutas sin regla usan el límite de la API key (si tiene uno propio) o el
+    límite por defecto. Cada regla tiene su propio contador. Los preflight
+    OPTIONS no consumen cuota.
+
+    Si el store falla (p. ej. Redis caído) el request pasa: es preferible no
+    limitar a tumbar la API.
+    """
+
+    def __init__(
+        self,
+        app,
+        default: Union[str, RateLimit] = "300/minute",
+        routes: Optional[Sequence[RouteLimit]] = None,
+        api_key_limits: Optional[Dict[str, Union[str, RateLimit]]] = None,
+        algorithm: Union[str, RateLimitAlgorithm] = "gcra",
+        store=None,
+        exempt: Sequence[str] = ("/health", "/docs", "/redoc", "/openapi.json"),
+        api_key_header: str = "x-api-key",
+        api_key_validator: Optional[Callable[[str], Awaitable[bool]]] = None,
+        trust_forwarded: bool = False,
+    ):
+        self.app = app
+        self.default = RateLimit.parse(default)
+        # La ruta más larga primero: gana la regla más específica
+        self.routes = sorted(routes or [], key=lambda r: len(r.path), reverse=True)
+        self.api_key_limits = {k: RateLimit.parse(v) for k, v in (api_key_limits or {}).items()}
+        self.algorithm = ALGORITHMS[algorithm]() if isinstance(algorithm, str) else algorithm
+        self.store = store or MemoryStore()
+        self.exempt = tuple(exempt)
+        self.api_key_header = api_key_header.lower().encode()
+        self.api_key_validator = api_key_validator
+        self.trust_forwarded = trust_forwarded
+
+    async def identify(self, scope) -> Tuple[str, Optional[str]]:
+        """(identidad, prefijo de API key) del cliente"""
+        api_key = forwarded = None
+        for name, value in scope.get("headers", ()):
+            if name == self.api_key_header:
+                api_key = value
+            elif self.trust_forwarded and name == b"x-forwarded-for":
+                forwarded = value.decode("latin-1").split(",")[0].strip()
+
+        if api_key is not None:
+            identity = await self._key_identity(api_key.decode("latin-1"))
+            if identity is not None:
+                return identity, api_key.decode("latin-1")[:12]
+
+        client = scope.get("client")
+        return f"ip:{forwarded or (client[0] if client else 'desconocido')}", None
+
+    async def _key_identity(self, api_key: str) -> Optional[str]:
+        """
+        Contador de una API key, o None si hay que limitar por IP.
+
+        Una key que el validador acepta tiene contador propio; si solo coincide
+        el prefijo configurado, todas las keys con ese prefijo comparten uno.
+        """
+        if self.api_key_validator is not None:
+            try:
+                if await self.api_key_validator(api_key):
+                    return f"key:{hashlib.sha256(api_key.encode('latin-1')).hexdigest()[:16]}"
+            except Exception as e:
+                logger.warning(f"No se pudo validar la API key: {e}")
+
+        prefix = api_key[:12]
+        if prefix in self.api_key_limits:
+            return f"key:{hashlib.sha256(prefix.encode('latin-1')).hexdigest()[:16]}"
+        return None
+
+    def resolve(self, path: str, method: str, key_prefix: Optional[str]) -> Tuple[str, RateLimit]:
+        """(nombre del contador, límite) aplicables al request"""
+        for route in self.routes:
+            if route.matches(path, method):
+                return route.path, route.rate
+        if key_prefix is not None and key_prefix in self.api_key_limits:
+            return "*", self.api_key_limits[key_prefix]
+        return "*", self.default
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "OPTIONS" or scope["path"].startswith(self.exempt):
+            await self.app(scope, receive, send)
+            return
+
+        identity, key_prefix = await self.identify(scope)
+        bucket, rate = self.resolve(scope["path"], scope["method"], key_prefix)
+
+        try:
+            result = await self.store.hit(self.algorithm, f"{identity}:{bucket}", rate)
+        except Exception as e:
+            logger.warning(f"Rate limit no disponible, se deja pasar el request: {e}")
+            await self.app(scope, receive, send)
+            return
+
+        headers = result.headers(rate)
+
+        if not result.allowed:
+            body = json.dumps({"detail": "Límite de requests excedido. Intenta más tarde."}).encode()
+            await send({
+                "type": "http.response.start",
+                "status": 429,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    *headers
+                ],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", ()), *headers]}
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
@@ -3,8 +3,9 @@
 
 from sqlalchemy.orm import Session
 from sqlalchemy import func, and_, or_, desc
+from collections import Counter
 from datetime import datetime, date, timedelta
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Iterable
 import logging
 
 from ..models.carga_models import (
@@ -15,6 +16,53 @@ from ..models.carga_models import (
 
 logger = logging.getLogger(__name__)
 
+# Contadores por estado de la carga (cada guía cuenta en uno o en ninguno)
+CONTADORES_ESTADO = ("entregadas", "en_transito", "con_novedad", "devueltas")
+
+
+def _categoria_estado(estado: Optional[str], tiene_novedad: bool) -> Optional[str]:
+    """Contador de estado en el que cuenta una guía"""
+    estado = (estado or "").lower()
+
+    if "entregado" in estado:
+        return "entregadas"
+    if "tránsito" in estado or "transito" in estado:
+        return "en_transito"
+    if tiene_novedad or "novedad" in estado:
+        return "con_novedad"
+    if "devuelto" in estado or "retorno" in estado:
+        return "devueltas"
+    return None
+
+
+def _aporte(estado: Optional[str], tiene_novedad: bool, dias: int,
+            transportadora: Optional[str], ciudad: Optional[str], cantidad: int = 1) -> Counter:
+    """
+    Aporte de `cantidad` guías iguales a las stats de su carga.
+
+    Las claves de los histogramas son tuplas ('transportadoras', nombre) y
+    ('ciudades', nombre). Con cantidad negativa el aporte se resta.
+    """
+    aporte = Counter({"total": cantidad, "dias": dias})
+
+    categoria = _categoria_estado(estado, tiene_novedad)
+    if categoria:
+        aporte[categoria] += cantidad
+    if transportadora:
+        aporte[("transportadoras", transportadora)] += cantidad
+    if ciudad:
+        aporte[("ciudades", ciudad)] += cantidad
+
+    return aporte
+
+
+def _aporte_guia(guia: GuiaCarga, signo: int = 1) -> Counter:
+    """Aporte de una guía (signo -1 para retirarla)"""
+    return _aporte(
+        guia.estado, guia.tiene_novedad, signo * (guia.dias_transito or 0),
+        guia.transportadora, guia.ciudad_destino, signo
+    )
+
 
 class CargaServiceDB:
     """Servicio para operaciones de cargas en BD"""
@@ -132,6 +180,7 @@ class CargaServiceDB:
         )
 
         agregadas = 0
+        delta = Counter()
         for guia_data in guias:
             if guia_data.numero_guia not in guias_existentes:
                 guia = GuiaCarga(
@@ -153,11 +202,13 @@ class CargaServiceDB:
                 )
                 self.db.add(guia)
                 guias_existentes.add(guia_data.numero_guia)
+                delta.update(_aporte_guia(guia))
                 agregadas += 1
 
         if agregadas > 0:
+            # Stats en la misma transacción que las guías
+            self._aplicar_delta({carga_id: delta})
             self.db.commit()
-            self._actualizar_stats_carga(carga_id)
 
             self._registrar_actividad(carga.usuario_id, "guias_agregadas",
                 f"Agregó {agregadas} guías a {carga.nombre}", {
@@ -169,35 +220,37 @@ class CargaServiceDB:
 
     def actualizar_guia(self, guia_id: str, updates: Dict[str, Any]) -> Optional[GuiaCarga]:
         """Actualizar una guía"""
-        guia = self.db.query(GuiaCarga).filter(GuiaCarga.id == guia_id).first()
+        guia = self.db.query(GuiaCarga).filter(GuiaCarga.id == guia_id).with_for_update().first()
         if not guia:
             return None
 
+        # Aporte anterior y nuevo: la carga solo recibe la diferencia
+        carga_anterior = guia.carga_id
+        antes = _aporte_guia(guia, -1)
+
         for key, value in updates.items():
             if hasattr(guia, key):
                 setattr(guia, key, value)
 
+        deltas = {carga_anterior: antes}
+        deltas.setdefault(guia.carga_id, Counter()).update(_aporte_guia(guia))
+        self._aplicar_delta(deltas)
+
         self.db.commit()
         self.db.refresh(guia)
 
-        # Actualizar stats de la carga
-        self._actualizar_stats_carga(guia.carga_id)
-
         return guia
 
     def eliminar_guia(self, guia_id: str) -> bool:
         """Eliminar una guía"""
-        guia = self.db.query(GuiaCarga).filter(GuiaCarga.id == guia_id).first()
+        guia = self.db.query(GuiaCarga).filter(GuiaCarga.id == guia_id).with_for_update().first()
         if not guia:
             return False
 
-        carga_id = guia.carga_id
+        self._aplicar_delta({guia.carga_id: _aporte_guia(guia, -1)})
         self.db.delete(guia)
         self.db.commit()
 
-        # Actualizar stats
-        self._actualizar_stats_carga(carga_id)
-
         return True
 
     def obtener_guias_carga(self, carga_id: str, filtros: FiltrosCarga = None) -> List[GuiaCarga]:
@@ -252,14 +305,17 @@ class CargaServiceDB:
             if filtros.estado and filtros.estado != "todas":
                 query = query.filter(Carga.estado == filtros.estado)
 
-        cargas = query.order_by(desc(Carga.fecha), Carga.numero_carga).all()
+        # Nombre del usuario en la misma consulta
+        filas = query.outerjoin(Usuario, Usuario.id == Carga.usuario_id).add_columns(
+            Usuario.nombre
+        ).order_by(desc(Carga.fecha), Carga.numero_carga).all()
 
         # Agrupar por fecha
-        por_fecha: Dict[date, List[Carga]] = {}
-        for carga in cargas:
+        por_fecha: Dict[date, List[tuple]] = {}
+        for carga, usuario_nombre in filas:
             if carga.fecha not in por_fecha:
                 por_fecha[carga.fecha] = []
-            por_fecha[carga.fecha].append(carga)
+            por_fecha[carga.fecha].append((carga, usuario_nombre))
 
         # Construir respuesta
         fechas = []
@@ -269,16 +325,13 @@ class CargaServiceDB:
             cargas_list = []
             guias_dia = 0
 
-            for carga in cargas_dia:
-                # Obtener nombre del usuario
-                usuario = self.db.query(Usuario).filter(Usuario.id == carga.usuario_id).first()
-
+            for carga, usuario_nombre in cargas_dia:
                 cargas_list.append(CargaListResponse(
                     id=carga.id,
                     fecha=carga.fecha,
                     numero_carga=carga.numero_carga,
                     nombre=carga.nombre,
-                    usuario_nombre=usuario.nombre if usuario else "Desconocido",
+                    usuario_nombre=usuario_nombre or "Desconocido",
                     total_guias=carga.total_guias,
                     entregadas=carga.entregadas,
                     con_novedad=carga.con_novedad,
@@ -297,88 +350,149 @@ class CargaServiceDB:
 
         return HistorialResponse(
             fechas=fechas,
-            total_cargas=len(cargas),
+            total_cargas=len(filas),
             total_guias=total_guias
         )
 
     def buscar_guia(self, numero_guia: str) -> List[Dict[str, Any]]:
         """Buscar una guía en todas las cargas"""
-        guias = self.db.query(GuiaCarga).filter(
+        filas = self.db.query(GuiaCarga, Carga, Usuario.nombre).join(
+            Carga, Carga.id == GuiaCarga.carga_id
+        ).outerjoin(
+            Usuario, Usuario.id == Carga.usuario_id
+        ).filter(
             GuiaCarga.numero_guia.ilike(f"%{numero_guia}%")
         ).all()
 
-        resultados = []
-        for guia in guias:
-            carga = self.obtener_carga(guia.carga_id)
-            if carga:
-                usuario = self.db.query(Usuario).filter(Usuario.id == carga.usuario_id).first()
-                resultados.append({
-                    "guia": guia,
-                    "carga": {
-                        "id": carga.id,
-                        "nombre": carga.nombre,
-                        "fecha": carga.fecha,
-                        "usuario_nombre": usuario.nombre if usuario else "Desconocido"
-                    }
-                })
+        return [
+            {
+                "guia": guia,
+                "carga": {
+                    "id": carga.id,
+                    "nombre": carga.nombre,
+                    "fecha": carga.fecha,
+                    "usuario_nombre": usuario_nombre or "Desconocido"
+                }
+            }
+            for guia, carga, usuario_nombre in filas
+        ]
+
+    def nombres_usuarios(self, usuario_ids: Iterable[str]) -> Dict[str, str]:
+        """Nombres de varios usuarios en una sola consulta"""
+        ids = set(usuario_ids)
+        if not ids:
+            return {}
+        return dict(self.db.query(Usuario.id, Usuario.nombre).filter(Usuario.id.in_(ids)).all())
+
+    # ==================== ESTADÍSTICAS ====================
+
+    def _aplicar_delta(self, deltas: Dict[str, Counter]):
+        """
+        Suma los deltas a las stats de cada carga sin recorrer sus guías.
+
+        Bloquea la fila de la carga (FOR UPDATE) para que dos ediciones
+        concurrentes no pisen sus contadores; no hace commit: va en la
+        transacción de la mutación de la guía.
+        """
+        for carga_id, delta in deltas.items():
+            if not +delta and not -delta:
+                continue  # Sin cambios netos
+
+            carga = self.db.query(Carga).filter(Carga.id == carga_id).with_for_update().first()
+            if not carga:
+                continue
+
+            stats = self._stats_actuales(carga)
+            stats.update(delta)
+            self._escribir_stats(carga, stats)
+
+    @staticmethod
+    def _stats_actuales(carga: Carga) -> Counter:
+        """Stats guardadas en la carga, en el formato de _aporte"""
+        total = carga.total_guias or 0
+        stats = Counter({
+            "total": total,
+            # La suma de días no se guarda: se reconstruye del promedio
+            "dias": round((carga.dias_promedio_transito or 0) * total),
+        })
+        for campo in CONTADORES_ESTADO:
+            stats[campo] = getattr(carga, campo) or 0
+        for nombre, cantidad in (carga.stats_transportadoras or {}).items():
+            stats[("transportadoras", nombre)] = cantidad
+        for ciudad, cantidad in (carga.stats_ciudades or {}).items():
+            stats[("ciudades", ciudad)] = cantidad
+        return stats
+
+    @staticmethod
+    def _escribir_stats(carga: Carga, stats: Counter):
+        """Escribe las stats en la carga (histogramas como dicts nuevos para que se detecte el cambio)"""
+        total = max(stats["total"], 0)
+
+        carga.total_guias = total
+        for campo in CONTADORES_ESTADO:
+            setattr(carga, campo, max(stats[campo], 0))
+        carga.porcentaje_entrega = (carga.entregadas / total * 100) if total > 0 else 0
+        carga.dias_promedio_transito = (stats["dias"] / total) if total > 0 else 0
+
+        histogramas = {"transportadoras": {}, "ciudades": {}}
+        for clave, cantidad in stats.items():
+            if isinstance(clave, tuple) and cantidad > 0:
+                histogramas[clave[0]][clave[1]] = cantidad
+        carga.stats_transportadoras = histogramas["transportadoras"]
+        carga.stats_ciudades = histogramas["ciudades"]
+
+    def recalcular_stats(self, carga_ids: Optional[List[str]] = None) -> int:
+        """
+        Reconstruye desde cero las stats de las cargas indicadas (o de todas).
+
+        Job de reconciliación para corregir cualquier deriva de los deltas:
+        agrega las guías en SQL (sin cargarlas como objetos) y reescribe
+        cada carga.
+
+        Returns:
+            Número de cargas cuyas stats cambiaron
+        """
+        query = self.db.query(
+            GuiaCarga.carga_id,
+            GuiaCarga.estado,
+            GuiaCarga.tiene_novedad,
+            GuiaCarga.transportadora,
+            GuiaCarga.ciudad_destino,
+            func.count(GuiaCarga.id),
+            func.coalesce(func.sum(GuiaCarga.dias_transito), 0)
+        ).group_by(
+            GuiaCarga.carga_id,
+            GuiaCarga.estado,
+            GuiaCarga.tiene_novedad,
+            GuiaCarga.transportadora,
+            GuiaCarga.ciudad_destino
+        )
+        cargas_query = self.db.query(Carga)
+        if carga_ids is not None:
+            query = query.filter(GuiaCarga.carga_id.in_(carga_ids))
+            cargas_query = cargas_query.filter(Carga.id.in_(carga_ids))
+
+        stats_por_carga: Dict[str, Counter] = {}
+        for carga_id, estado, tiene_novedad, transportadora, ciudad, cantidad, dias in query.all():
+            stats_por_carga.setdefault(carga_id, Counter()).update(
+                _aporte(estado, tiene_novedad, int(dias), transportadora, ciudad, cantidad)
+            )
 
-        return resultados
+        corregidas = 0
+        for carga in cargas_query.with_for_update().all():
+            stats = stats_por_carga.get(carga.id, Counter())
+            if +self._stats_actuales(carga) != +stats:
+                corregidas += 1
+            self._escribir_stats(carga, stats)
 
-    # ==================== UTILIDADES ====================
+        self.db.commit()
 
-    def _actualizar_stats_carga(self, carga_id: str):
-        """Actualizar estadísticas de una carga"""
-        carga = self.obtener_carga(carga_id)
-        if not carga:
-            return
-
-        guias = self.db.query(GuiaCarga).filter(GuiaCarga.carga_id == carga_id).all()
-
-        stats = {
-            "total": len(guias),
-            "entregadas": 0,
-            "en_transito": 0,
-            "con_novedad": 0,
-            "devueltas": 0,
-            "transportadoras": {},
-            "ciudades": {},
-            "total_dias": 0
-        }
-
-        for guia in guias:
-            estado = guia.estado.lower()
-
-            if "entregado" in estado:
-                stats["entregadas"] += 1
-            elif "tránsito" in estado or "transito" in estado:
-                stats["en_transito"] += 1
-            elif guia.tiene_novedad or "novedad" in estado:
-                stats["con_novedad"] += 1
-            elif "devuelto" in estado or "retorno" in estado:
-                stats["devueltas"] += 1
-
-            stats["total_dias"] += guia.dias_transito or 0
-
-            if guia.transportadora:
-                stats["transportadoras"][guia.transportadora] = \
-                    stats["transportadoras"].get(guia.transportadora, 0) + 1
-
-            if guia.ciudad_destino:
-                stats["ciudades"][guia.ciudad_destino] = \
-                    stats["ciudades"].get(guia.ciudad_destino, 0) + 1
-
-        # Actualizar carga
-        carga.total_guias = stats["total"]
-        carga.entregadas = stats["entregadas"]
-        carga.en_transito = stats["en_transito"]
-        carga.con_novedad = stats["con_novedad"]
-        carga.devueltas = stats["devueltas"]
-        carga.porcentaje_entrega = (stats["entregadas"] / stats["total"] * 100) if stats["total"] > 0 else 0
-        carga.dias_promedio_transito = (stats["total_dias"] / stats["total"]) if stats["total"] > 0 else 0
-        carga.stats_transportadoras = stats["transportadoras"]
-        carga.stats_ciudades = stats["ciudades"]
+        if corregidas:
+            logger.warning(f"Stats de {corregidas} cargas corregidas por reconciliación")
 
-        self.db.commit()
+        return corregidas
+
+    # ==================== UTILIDADES ====================
 
     def _registrar_actividad(self, usuario_id: str, tipo: str, descripcion: str, metadata: Dict = None):
         """Registrar actividad de usuario"""
@@ -386,7 +500,7 @@ class CargaServiceDB:
             usuario_id=usuario_id,
             tipo=tipo,
             descripcion=descripcion,
-            metadata=metadata or {}
+            metadata_=metadata or {}
         )
         self.db.add(actividad)
         self.db.commit()
@@ -0,0 +1,351 @@
+"""
+LITPER - Despachador de Mensajes Salientes
+Envío masivo compartido por WhatsApp, push y Chatea Pro con concurrencia
+acotada, rate limit por proveedor y reintentos con backoff
+"""
+
+import asyncio
+import random
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from enum import Enum
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from loguru import logger
+
+# Clientes HTTP de los proveedores (opcionales): sus errores de transporte
+# no heredan de OSError
+try:
+    import httpx
+    HTTPX_AVAILABLE = True
+except ImportError:
+    HTTPX_AVAILABLE = False
+
+try:
+    import aiohttp
+    AIOHTTP_AVAILABLE = True
+except ImportError:
+    AIOHTTP_AVAILABLE = False
+
+
+class DeliveryStatus(str, Enum):
+    """Estado de entrega por destinatario"""
+    PENDING = "PENDING"
+    SENT = "SENT"
+    FAILED = "FAILED"     # Error definitivo o reintentos agotados
+    GONE = "GONE"         # El destinatario ya no existe (404/410)
+
+
+@dataclass
+class ProviderPolicy:
+    """Límites de un proveedor"""
+    concurrency: int = 10          # Envíos simultáneos
+    rate: float = 20.0             # Envíos por segundo sostenidos
+    burst: int = 20                # Capacidad del token bucket
+    max_attempts: int = 4
+    base_delay: float = 0.5        # Segundos del primer backoff
+    max_delay: float = 30.0
+
+
+# Límites por defecto (Meta permite ~80 msg/s por número)
+DEFAULT_POLICIES: Dict[str, ProviderPolicy] = {
+    "whatsapp": ProviderPolicy(concurrency=20, rate=50, burst=50),
+    "push": ProviderPolicy(concurrency=50, rate=200, burst=200),
+    "chatea_pro": ProviderPolicy(concurrency=10, rate=20, burst=20),
+}
+
+# Códigos que indican que el destinatario no existe más
+GONE_STATUS_CODES = (404, 410)
+
+
+def is_transient_error(error: BaseException) -> bool:
+    """
+    Timeout o fallo de conexión: el envío no llegó al proveedor y vale la
+    pena reintentar. Errores de configuración o de programación no lo son.
+    """
+    if isinstance(error, (OSError, asyncio.TimeoutError)):
+        return True
+    if HTTPX_AVAILABLE and isinstance(error, httpx.TransportError):
+        return True
+    return AIOHTTP_AVAILABLE and isinstance(error, aiohttp.ClientConnectionError)
+
+
+@dataclass
+class ProviderResponse:
+    """Respuesta normalizada de un proveedor"""
+    success: bool
+    status_code: Optional[int] = None
+    retry_after: Optional[float] = None
+    message_id: str = ""
+    error: str = ""
+    transient: bool = False    # Sin respuesta por timeout o conexión
+
+    @classmethod
+    def from_result(cls, result: Any) -> "ProviderResponse":
+        """Normaliza los resultados de los servicios (SendResult o dict)"""
+        if isinstance(result, cls):
+            return result
+
+        if isinstance(result, dict):
+            get = result.get
+        else:
+            def get(key, default=None):
+                return getattr(result, key, default)
+
+        status_code = get("status_code") or get("status")
+        return cls(
+            success=bool(get("success")),
+            status_code=status_code if isinstance(status_code, int) else None,
+            retry_after=get("retry_after"),
+            message_id=get("message_id") or "",
+            error=get("error_message") or get("error") or "",
+            transient=bool(get("transient"))
+        )
+
+    @property
+    def retryable(self) -> bool:
+        """
+        Timeout o error de conexión, 429 o 5xx: vale la pena reintentar.
+
+        Sin código HTTP solo se reintenta si el fallo fue de transporte; un
+        proveedor no disponible o mal configurado falla en el primer intento.
+        """
+        if self.success:
+            return False
+        if self.status_code is None:
+            return self.transient
+        return self.status_code == 429 or self.status_code >= 500
+
+    @property
+    def gone(self) -> bool:
+        return self.status_code in GONE_STATUS_CODES
+
+
+@dataclass
+class DeliveryRecord:
+    """Seguimiento de la entrega a un destinatario"""
+    recipient_id: str
+    status: DeliveryStatus = DeliveryStatus.PENDING
+    attempts: int = 0
+    message_id: str = ""
+    status_code: Optional[int] = None
+    error: str = ""
+    result: Any = None
+    sent_at: Optional[datetime] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "recipient_id": self.recipient_id,
+            "status": self.status.value,
+            "attempts": self.attempts,
+            "message_id": self.message_id,
+            "status_code": self.status_code,
+            "error": self.error,
+            "sent_at": self.sent_at.isoformat() if self.sent_at else None
+        }
+
+
+@dataclass
+class DispatchReport:
+    """Resultado de un envío masivo"""
+    channel: str
+    records: List[DeliveryRecord] = field(default_factory=list)
+    started_at: datetime = field(default_factory=datetime.now)
+    duration_seconds: float = 0.0
+
+    def count(self, status: DeliveryStatus) -> int:
+        return sum(1 for r in self.records if r.status == status)
+
+    @property
+    def sent(self) -> int:
+        return self.count(DeliveryStatus.SENT)
+
+    @property
+    def failed(self) -> int:
+        return len(self.records) - self.sent
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "channel": self.channel,
+            "total": len(self.records),
+            "sent": self.sent,
+            "failed": self.count(DeliveryStatus.FAILED),
+            "gone": self.count(DeliveryStatus.GONE),
+            "duration_seconds": round(self.duration_seconds, 2),
+            "records": [r.to_dict() for r in self.records]
+        }
+
+
+class TokenBucket:
+    """
+    Rate limit de un proveedor compartido por todos los envíos.
+
+    Un Retry-After del proveedor pausa el bucket completo: si el proveedor
+    está saturado, ningún envío debe seguir golpeándolo.
+    """
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+Sender = Callable[[Any], Awaitable[Any]]
+
+
+class OutboundDispatcher:
+    """
+    Despachador de mensajes salientes
+
+    Cada canal tiene su política: semáforo de concurrencia y token bucket
+    compartidos entre campañas, reintentos con backoff exponencial con
+    jitter que respetan el Retry-After del proveedor, y un estado de entrega
+    por destinatario. Un destinatario que falla no frena a los demás.
+    """
+
+    def __init__(self, policies: Optional[Dict[str, ProviderPolicy]] = None):
+        self.policies: Dict[str, ProviderPolicy] = dict(DEFAULT_POLICIES)
+        self.policies.update(policies or {})
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._buckets: Dict[str, TokenBucket] = {}
+        self.stats = {"dispatches": 0, "sent": 0, "failed": 0, "gone": 0, "retries": 0}
+
+    def policy(self, channel: str) -> ProviderPolicy:
+        return self.policies.get(channel) or self.policies.setdefault(channel, ProviderPolicy())
+
+    def _limits(self, channel: str):
+        """Semáforo y bucket del canal, compartidos por todas las campañas"""
+        if channel not in self._semaphores:
+            policy = self.policy(channel)
+            self._semaphores[channel] = asyncio.Semaphore(policy.concurrency)
+            self._buckets[channel] = TokenBucket(policy.rate, policy.burst)
+        return self._semaphores[channel], self._buckets[channel]
+
+    def backoff(self, channel: str, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Espera antes del reintento `attempt` (1, 2, ...): full jitter, nunca menos que Retry-After"""
+        policy = self.policy(channel)
+        delay = random.uniform(0, min(policy.max_delay, policy.base_delay * 2 ** (attempt - 1)))
+        if retry_after:
+            delay = max(delay, min(float(retry_after), policy.max_delay))
+        return delay
+
+    async def dispatch(
+        self,
+        channel: str,
+        recipients: List[Any],
+        send: Sender,
+        recipient_id: Callable[[Any], str] = str,
+        on_gone: Optional[Callable[[Any], Any]] = None
+    ) -> DispatchReport:
+        """
+        Envía a todos los destinatarios de un canal
+
+        Args:
+            channel: Canal/proveedor (define los límites)
+            recipients: Destinatarios en el formato que espera `send`
+            send: Corrutina de envío a un destinatario (devuelve SendResult, dict o ProviderResponse)
+            recipient_id: Identificador del destinatario para el reporte
+            on_gone: Se llama con el destinatario cuando el proveedor responde 404/410
+        """
+        report = DispatchReport(channel=channel)
+        start = time.monotonic()
+        self.stats["dispatches"] += 1
+
+        report.records = list(await asyncio.gather(*(
+            self._deliver(channel, recipient, recipient_id(recipient), send, on_gone)
+            for recipient in recipients
+        )))
+
+        report.duration_seconds = time.monotonic() - start
+        logger.info(
+            f"📤 Envío {channel}: {report.sent}/{len(report.records)} entregados "
+            f"en {report.duration_seconds:.1f}s"
+        )
+        return report
+
+    async def _deliver(self, channel: str, recipient: Any, rid: str, send: Sender, on_gone) -> DeliveryRecord:
+        record = DeliveryRecord(recipient_id=rid)
+        semaphore, bucket = self._limits(channel)
+        policy = self.policy(channel)
+
+        while True:
+            record.attempts += 1
+            async with semaphore:
+                await bucket.acquire()
+                try:
+                    result = await send(recipient)
+                    response = ProviderResponse.from_result(result)
+                except Exception as e:
+                    result = None
+                    response = ProviderResponse(success=False, error=str(e), transient=is_transient_error(e))
+
+            record.result = result
+            record.status_code = response.status_code
+            record.message_id = response.message_id
+            record.error = response.error
+
+            if response.success:
+                record.status = DeliveryStatus.SENT
+                record.sent_at = datetime.now()
+                self.stats["sent"] += 1
+                return record
+
+            if response.gone:
+                record.status = DeliveryStatus.GONE
+                self.stats["gone"] += 1
+                if on_gone:
+                    try:
+                        on_gone(recipient)
+                    except Exception as e:
+                        logger.error(f"Error limpiando destinatario {rid}: {e}")
+                return record
+
+            if not response.retryable or record.attempts >= policy.max_attempts:
+                record.status = DeliveryStatus.FAILED
+                self.stats["failed"] += 1
+                return record
+
+            if response.retry_after:
+                bucket.pause(min(float(response.retry_after), policy.max_delay))
+            self.stats["retries"] += 1
+            await asyncio.sleep(self.backoff(channel, record.attempts, response.retry_after))
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Interpreta la cabecera Retry-After (segundos o fecha HTTP)"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        from email.utils import parsedate_to_datetime
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+# Singleton
+outbound_dispatcher = OutboundDispatcher()
@@ -5,12 +5,15 @@ Maneja el envío de notificaciones push a los usuarios suscritos.
 
 import os
 import json
+import asyncio
 import hashlib
 import hmac
 from datetime import datetime
-from typing import Dict, List, Optional, Any
+from typing import Callable, Dict, List, Optional, Any
 from loguru import logger
 
+from .outbound_dispatcher import DeliveryStatus, is_transient_error, outbound_dispatcher, parse_retry_after
+
 # Intentar importar pywebpush (opcional)
 try:
     from pywebpush import webpush, WebPushException
@@ -32,6 +35,9 @@ class PushNotificationService:
         self.vapid_claims = {
             "sub": os.getenv('VAPID_CONTACT', 'mailto:soporte@litper.com')
         }
+        self.dispatcher = outbound_dispatcher
+        # Se llama con el endpoint de cada suscripción que el push service da por muerta
+        self.on_subscription_gone: Optional[Callable[[str], Any]] = None
 
     def is_available(self) -> bool:
         """Verifica si el servicio está disponible"""
@@ -60,7 +66,9 @@ class PushNotificationService:
             return {"success": False, "error": "Push service not available"}
 
         try:
-            webpush(
+            # webpush es bloqueante: fuera del event loop
+            await asyncio.to_thread(
+                webpush,
                 subscription_info=subscription_info,
                 data=json.dumps(payload, ensure_ascii=False),
                 vapid_private_key=self.vapid_private_key,
@@ -71,7 +79,8 @@ class PushNotificationService:
             return {"success": True}
 
         except WebPushException as e:
-            error_code = e.response.status_code if e.response else None
+            # requests.Response es falsy con 4xx/5xx: comparar con None
+            error_code = e.response.status_code if e.response is not None else None
 
             if error_code == 410:
                 # Suscripción expirada
@@ -85,11 +94,16 @@ class PushNotificationService:
 
             else:
                 logger.error(f"Error enviando push: {e}")
-                return {"success": False, "error": str(e), "status_code": error_code}
+                return {
+                    "success": False,
+                    "error": str(e),
+                    "status_code": error_code,
+                    "retry_after": parse_retry_after(e.response.headers.get("Retry-After")) if e.response is not None else None
+                }
 
         except Exception as e:
             logger.error(f"Error inesperado enviando push: {e}")
-            return {"success": False, "error": str(e)}
+            return {"success": False, "error": str(e), "transient": is_transient_error(e)}
 
     async def broadcast_notification(
         self,
@@ -99,6 +113,10 @@ class PushNotificationService:
         """
         Envía una notificación a múltiples suscriptores.
 
+        Los envíos salen en paralelo por el despachador compartido; las
+        suscripciones que responden 404/410 se reportan en "expired" y se
+        eliminan con `on_subscription_gone`.
+
         Args:
             subscriptions: Lista de suscripciones
             payload: Datos a enviar
@@ -113,7 +131,11 @@ class PushNotificationService:
             "expired": []
         }
 
-        for sub in subscriptions:
+        if not self.is_available():
+            results["failed"] = len(subscriptions)
+            return results
+
+        async def send(sub: Dict[str, Any]) -> Dict[str, Any]:
             subscription_info = {
                 "endpoint": sub.get("endpoint"),
                 "keys": {
@@ -121,15 +143,21 @@ class PushNotificationService:
                     "auth": sub.get("auth_key")
                 }
             }
+            return await self.send_notification(subscription_info, payload)
 
-            result = await self.send_notification(subscription_info, payload)
+        def gone(sub: Dict[str, Any]):
+            if self.on_subscription_gone:
+                self.on_subscription_gone(sub.get("endpoint"))
 
-            if result.get("success"):
-                results["success"] += 1
-            else:
-                results["failed"] += 1
-                if result.get("error") == "expired":
-                    results["expired"].append(sub.get("endpoint"))
+        report = await self.dispatcher.dispatch(
+            "push", subscriptions, send,
+            recipient_id=lambda sub: sub.get("endpoint") or "",
+            on_gone=gone
+        )
+
+        results["success"] = report.sent
+        results["failed"] = report.failed
+        results["expired"] = [r.recipient_id for r in report.records if r.status == DeliveryStatus.GONE]
 
         logger.info(
             f"Broadcast completado: {results['success']}/{results['total']} exitosos"
@@ -5,14 +5,27 @@ Gestión automatizada de guías con novedades para maximizar entregas
 
 import os
 import asyncio
-from datetime import datetime, timedelta
-from typing import Optional, List, Dict, Any
+import heapq
+import itertools
+import threading
+from collections import Counter
+from datetime import datetime, date, timedelta
+from typing import Optional, List, Dict, Any, Callable, Iterator
 from dataclasses import dataclass, field
 from enum import Enum
+from functools import wraps
 from loguru import logger
 
-from .tracking_service import TrackingService, TrackingStatus, tracking_service
-from .whatsapp_service import WhatsAppService, whatsapp_service
+try:
+    from sqlalchemy import func, or_
+    from database import get_db_session, ItemRescate
+    DB_AVAILABLE = True
+except ImportError:
+    DB_AVAILABLE = False
+
+from .tracking_service import TrackingService, TrackingStatus, tracking_service as default_tracking_service
+from .whatsapp_service import WhatsAppService, whatsapp_service as default_whatsapp_service
+from .outbound_dispatcher import DeliveryStatus
 
 
 class RescuePriority(str, Enum):
@@ -72,6 +85,9 @@ class RescueItem:
     notes: List[str] = field(default_factory=list)
     whatsapp_sent: bool = False
     call_made: bool = False
+    claimed_by: Optional[str] = None
+    claimed_until: Optional[datetime] = None
+    closed_at: Optional[datetime] = None
 
 
 @dataclass
@@ -89,6 +105,18 @@ class RescueStats:
     avg_recovery_time_hours: float = 0.0
 
 
+# Orden de atención de las prioridades
+PRIORITY_RANK = {
+    RescuePriority.CRITICAL: 0,
+    RescuePriority.HIGH: 1,
+    RescuePriority.MEDIUM: 2,
+    RescuePriority.LOW: 3
+}
+
+# Estados con los que una guía sale de la cola
+CLOSED_STATUSES = (RescueStatus.RECOVERED, RescueStatus.LOST, RescueStatus.CANCELLED)
+OPEN_STATUSES = tuple(s for s in RescueStatus if s not in CLOSED_STATUSES)
+
 # Probabilidades de recuperación por tipo de novedad
 RECOVERY_RATES = {
     NoveltyType.NO_ESTABA: 0.80,
@@ -155,6 +183,389 @@ Gracias por su tiempo.
 }
 
 
+def _item_to_row(item: RescueItem) -> "ItemRescate":
+    """Convierte un RescueItem en su fila de cola_rescate"""
+    horas = None
+    if item.status == RescueStatus.RECOVERED and item.closed_at:
+        horas = (item.closed_at - item.created_at).total_seconds() / 3600
+
+    return ItemRescate(
+        id=item.id,
+        numero_guia=item.tracking_number,
+        transportadora=item.carrier,
+        nombre_cliente=item.customer_name,
+        telefono=item.customer_phone,
+        ciudad_destino=item.destination_city,
+        direccion=item.address,
+        tipo_novedad=item.novelty_type.value,
+        descripcion_novedad=item.novelty_description,
+        dias_sin_movimiento=item.days_without_movement,
+        prioridad=item.priority.value,
+        rango_prioridad=PRIORITY_RANK[item.priority],
+        estado=item.status.value,
+        probabilidad_recuperacion=item.recovery_probability,
+        intentos=item.attempts,
+        max_intentos=item.max_attempts,
+        ultimo_contacto=item.last_contact_at,
+        proxima_accion=item.next_action_at,
+        notas=list(item.notes),
+        whatsapp_enviado=item.whatsapp_sent,
+        llamada_realizada=item.call_made,
+        reclamado_por=item.claimed_by,
+        reclamado_hasta=item.claimed_until,
+        fecha_creacion=item.created_at,
+        fecha_cierre=item.closed_at,
+        horas_recuperacion=horas
+    )
+
+
+def _row_to_item(row: "ItemRescate") -> RescueItem:
+    """Convierte una fila de cola_rescate en RescueItem"""
+    return RescueItem(
+        id=row.id,
+        tracking_number=row.numero_guia,
+        carrier=row.transportadora or "",
+        customer_name=row.nombre_cliente or "",
+        customer_phone=row.telefono or "",
+        destination_city=row.ciudad_destino or "",
+        address=row.direccion or "",
+        novelty_type=NoveltyType(row.tipo_novedad),
+        novelty_description=row.descripcion_novedad or "",
+        days_without_movement=row.dias_sin_movimiento or 0,
+        priority=RescuePriority(row.prioridad),
+        status=RescueStatus(row.estado),
+        recovery_probability=row.probabilidad_recuperacion,
+        attempts=row.intentos or 0,
+        max_attempts=row.max_intentos or 3,
+        last_contact_at=row.ultimo_contacto,
+        next_action_at=row.proxima_accion,
+        created_at=row.fecha_creacion,
+        notes=list(row.notas or []),
+        whatsapp_sent=bool(row.whatsapp_enviado),
+        call_made=bool(row.llamada_realizada),
+        claimed_by=row.reclamado_por,
+        claimed_until=row.reclamado_hasta,
+        closed_at=row.fecha_cierre
+    )
+
+
+def _synchronized(method):
+    """
+    Ejecuta el método con el lock del store tomado.
+
+    Las rutas síncronas corren en el threadpool de FastAPI: el conjunto
+    caliente (heaps y contadores) solo se toca con el lock.
+    """
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with getattr(self, "store", self).lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class RescueQueueStore:
+    """
+    Almacén de la cola de rescate.
+
+    La tabla cola_rescate es la fuente de verdad (escritura inmediata en cada
+    cambio). En memoria queda solo el conjunto caliente: las guías abiertas,
+    con un heap por prioridad ordenado por (-probabilidad, -días) para servir
+    la cola en orden sin reordenarla en cada consulta, y contadores que se
+    actualizan con cada alta y cierre en lugar de recorrer el historial.
+
+    Sin base de datos disponible funciona solo en memoria.
+    """
+
+    def __init__(self, session_factory: Callable = None):
+        self._session_factory = session_factory or (get_db_session if DB_AVAILABLE else None)
+        self.persistent = self._session_factory is not None
+        self._loaded = False
+        self.lock = threading.RLock()
+
+        # Conjunto caliente: guías abiertas por número de guía
+        self.items: Dict[str, RescueItem] = {}
+        self._heaps: Dict[RescuePriority, List[tuple]] = {p: [] for p in PRIORITY_RANK}
+        self._entries: Dict[str, tuple] = {}
+        self._seq = itertools.count()
+        # Guías que no se pudieron escribir: se reintentan en la próxima escritura
+        self._dirty: Dict[str, RescueItem] = {}
+
+        # Contadores incrementales
+        self.open_by_priority: Counter = Counter()
+        self.closed_by_status: Counter = Counter()
+        self.closed_by_day: Counter = Counter()   # (estado, fecha) de la última semana
+        self.recovery_hours = 0.0
+
+    # ==================== CARGA ====================
+
+    @_synchronized
+    def _ensure_loaded(self):
+        """Carga la cola abierta y los contadores la primera vez que se usa"""
+        if self._loaded:
+            return
+        self._loaded = True
+
+        if not self.persistent:
+            return
+
+        try:
+            self._load()
+        except Exception as e:
+            logger.warning(f"Cola de rescate sin base de datos, se usa solo memoria: {e}")
+            self.persistent = False
+
+    def _load(self):
+        week_ago = datetime.combine(date.today() - timedelta(days=7), datetime.min.time())
+        closed = [s.value for s in CLOSED_STATUSES]
+
+        with self._session_factory() as session:
+            # Guías abiertas (usa el índice por estado)
+            rows = session.query(ItemRescate).filter(
+                ItemRescate.estado.in_([s.value for s in OPEN_STATUSES])
+            ).all()
+            for row in rows:
+                self._track(_row_to_item(row))
+
+            # Totales del historial agregados en la BD
+            totals = session.query(
+                ItemRescate.estado,
+                func.count(ItemRescate.id),
+                func.coalesce(func.sum(ItemRescate.horas_recuperacion), 0)
+            ).filter(ItemRescate.estado.in_(closed)).group_by(ItemRescate.estado).all()
+
+            by_day = session.query(
+                ItemRescate.estado,
+                func.date(ItemRescate.fecha_cierre),
+                func.count(ItemRescate.id)
+            ).filter(
+                ItemRescate.estado.in_(closed),
+                ItemRescate.fecha_cierre >= week_ago
+            ).group_by(ItemRescate.estado, func.date(ItemRescate.fecha_cierre)).all()
+
+        for estado, count, hours in totals:
+            self.closed_by_status[RescueStatus(estado)] = count
+            if estado == RescueStatus.RECOVERED.value:
+                self.recovery_hours = float(hours)
+        for estado, day, count in by_day:
+            day = day if isinstance(day, date) else date.fromisoformat(str(day)[:10])
+            self.closed_by_day[(RescueStatus(estado), day)] = count
+
+        logger.info(f"Cola de rescate cargada: {len(self.items)} guías abiertas")
+
+    # ==================== CONJUNTO CALIENTE ====================
+
+    def _push(self, item: RescueItem):
+        """(Re)inserta la guía en el heap de su prioridad; la entrada anterior queda obsoleta"""
+        entry = (-item.recovery_probability, -item.days_without_movement, next(self._seq), item.tracking_number)
+        self._entries[item.tracking_number] = entry
+        heap = self._heaps[item.priority]
+        heapq.heappush(heap, entry)
+
+        # Compactar cuando las entradas obsoletas dominan el heap
+        if len(heap) > 2 * self.open_by_priority[item.priority] + 32:
+            heap[:] = [e for e in heap if self._entries.get(e[3]) is e]
+            heapq.heapify(heap)
+
+    def _track(self, item: RescueItem):
+        self.items[item.tracking_number] = item
+        self.open_by_priority[item.priority] += 1
+        self._push(item)
+
+    def _untrack(self, item: RescueItem):
+        # Ya cerrada o reemplazada por otro registro de la misma guía
+        if self.items.get(item.tracking_number) is not item:
+            return
+        self.items.pop(item.tracking_number, None)
+        self._entries.pop(item.tracking_number, None)
+        self.open_by_priority[item.priority] -= 1
+
+    @staticmethod
+    def _walk(heap: List[tuple]) -> Iterator[tuple]:
+        """Recorre un heap en orden sin modificarlo (k elementos en O(k log k))"""
+        if not heap:
+            return
+        frontier = [(heap[0], 0)]
+        while frontier:
+            entry, i = heapq.heappop(frontier)
+            yield entry
+            for child in (2 * i + 1, 2 * i + 2):
+                if child < len(heap):
+                    heapq.heappush(frontier, (heap[child], child))
+
+    def ordered(self, priority: Optional[RescuePriority] = None) -> Iterator[RescueItem]:
+        """
+        Guías abiertas en orden de atención: prioridad, probabilidad y días sin movimiento
+
+        Recorrer con `lock` tomado (ver RescueService.get_queue).
+        """
+        self._ensure_loaded()
+        priorities = [priority] if priority else sorted(PRIORITY_RANK, key=PRIORITY_RANK.get)
+
+        for p in priorities:
+            for entry in self._walk(self._heaps[p]):
+                if self._entries.get(entry[3]) is entry:
+                    yield self.items[entry[3]]
+
+    @_synchronized
+    def get(self, tracking_number: str) -> Optional[RescueItem]:
+        self._ensure_loaded()
+        return self.items.get(tracking_number)
+
+    # ==================== ESCRITURA ====================
+
+    def _write(self, items: List[RescueItem]):
+        """
+        Escribe las guías en la BD en una sola transacción
+
+        Si falla, las guías quedan marcadas y se vuelven a escribir junto con
+        las de la siguiente escritura: la BD no se queda con la versión vieja.
+        """
+        if not self.persistent:
+            return
+        pending = {**self._dirty, **{item.id: item for item in items}}
+        if not pending:
+            return
+        try:
+            with self._session_factory() as session:
+                for item in pending.values():
+                    session.merge(_item_to_row(item))
+        except Exception as e:
+            self._dirty = pending
+            logger.error(f"Error guardando cola de rescate ({len(pending)} guías pendientes de escribir): {e}")
+            return
+        self._dirty = {}
+
+    @_synchronized
+    def add_many(self, items: List[RescueItem]):
+        """Añade guías a la cola; una guía ya abierta se reemplaza y su registro anterior se cancela"""
+        self._ensure_loaded()
+        replaced = []
+        for item in items:
+            previous = self.items.get(item.tracking_number)
+            if previous:
+                self._close(previous, RescueStatus.CANCELLED)
+                if previous.id != item.id:
+                    replaced.append(previous)
+            self._track(item)
+
+        self._write(replaced + items)
+
+    @_synchronized
+    def save(self, item: RescueItem):
+        """Persiste los cambios de una guía abierta y actualiza su posición en la cola"""
+        if item.status != RescueStatus.RESCHEDULED:
+            item.claimed_by = None
+            item.claimed_until = None
+
+        entry = self._entries.get(item.tracking_number)
+        if entry and (entry[0], entry[1]) != (-item.recovery_probability, -item.days_without_movement):
+            self._push(item)
+
+        self._write([item])
+
+    def _close(self, item: RescueItem, status: RescueStatus):
+        item.status = status
+        item.closed_at = datetime.now()
+        item.claimed_by = None
+        item.claimed_until = None
+        self._untrack(item)
+
+        self.closed_by_status[status] += 1
+        self.closed_by_day[(status, item.closed_at.date())] += 1
+        if status == RescueStatus.RECOVERED:
+            self.recovery_hours += (item.closed_at - item.created_at).total_seconds() / 3600
+
+    @_synchronized
+    def close(self, item: RescueItem, status: RescueStatus):
+        """Saca una guía de la cola con un estado final"""
+        self._ensure_loaded()
+        self._close(item, status)
+        self._write([item])
+
+    # ==================== RECLAMACIÓN ====================
+
+    @_synchronized
+    def claim_due(self, agent_id: str, limit: int = 10, lease_minutes: int = 15) -> List[RescueItem]:
+        """
+        Reclama reagendados vencidos para un agente.
+
+        Con BD usa SELECT ... FOR UPDATE SKIP LOCKED: varios agentes (o
+        procesos) trabajan la cola a la vez sin tomar las mismas guías. La
+        reclamación vence a los `lease_minutes` si el agente no actúa.
+        """
+        self._ensure_loaded()
+        now = datetime.now()
+        until = now + timedelta(minutes=lease_minutes)
+
+        if not self.persistent:
+            claimed = [
+                i for i in self.ordered()
+                if i.status == RescueStatus.RESCHEDULED
+                and i.next_action_at and i.next_action_at <= now
+                and (i.claimed_until is None or i.claimed_until < now)
+            ][:limit]
+            for item in claimed:
+                item.claimed_by, item.claimed_until = agent_id, until
+            return claimed
+
+        # Cambios pendientes primero: una guía cerrada no debe reclamarse
+        self._write([])
+
+        claimed = []
+        with self._session_factory() as session:
+            rows = session.query(ItemRescate).filter(
+                ItemRescate.estado == RescueStatus.RESCHEDULED.value,
+                ItemRescate.proxima_accion <= now,
+                or_(ItemRescate.reclamado_hasta.is_(None), ItemRescate.reclamado_hasta < now)
+            ).order_by(
+                ItemRescate.rango_prioridad, ItemRescate.proxima_accion
+            ).limit(limit).with_for_update(skip_locked=True).all()
+
+            for row in rows:
+                row.reclamado_por = agent_id
+                row.reclamado_hasta = until
+                claimed.append(_row_to_item(row))
+
+        # Refrescar el conjunto caliente con la versión reclamada
+        for item in claimed:
+            local = self.items.get(item.tracking_number)
+            if local:
+                local.claimed_by, local.claimed_until = item.claimed_by, item.claimed_until
+            else:
+                self._track(item)
+
+        return [self.items[i.tracking_number] for i in claimed]
+
+    # ==================== ESTADÍSTICAS ====================
+
+    @_synchronized
+    def stats(self) -> RescueStats:
+        """Estadísticas a partir de los contadores (sin recorrer cola ni historial)"""
+        self._ensure_loaded()
+        today = date.today()
+        week_ago = today - timedelta(days=7)
+
+        recovered = self.closed_by_status[RescueStatus.RECOVERED]
+        finished = recovered + self.closed_by_status[RescueStatus.LOST]
+
+        return RescueStats(
+            total_in_queue=len(self.items),
+            critical=self.open_by_priority[RescuePriority.CRITICAL],
+            high=self.open_by_priority[RescuePriority.HIGH],
+            medium=self.open_by_priority[RescuePriority.MEDIUM],
+            low=self.open_by_priority[RescuePriority.LOW],
+            recovered_today=self.closed_by_day[(RescueStatus.RECOVERED, today)],
+            recovered_week=sum(
+                count for (status, day), count in self.closed_by_day.items()
+                if status == RescueStatus.RECOVERED and day >= week_ago
+            ),
+            lost_today=self.closed_by_day[(RescueStatus.LOST, today)],
+            recovery_rate=round(recovered / finished * 100, 1) if finished > 0 else 0,
+            avg_recovery_time_hours=round(self.recovery_hours / recovered, 1) if recovered > 0 else 0.0
+        )
+
+
+
 class RescueService:
     """
     Servicio de Sistema de Rescate
@@ -164,14 +575,20 @@ class RescueService:
     def __init__(
         self,
         tracking_service: TrackingService = None,
-        whatsapp_service: WhatsAppService = None
+        whatsapp_service: WhatsAppService = None,
+        store: RescueQueueStore = None
     ):
-        self.tracking = tracking_service or tracking_service
-        self.whatsapp = whatsapp_service or whatsapp_service
-        self.queue: Dict[str, RescueItem] = {}
-        self.history: List[RescueItem] = []
+        self.tracking = tracking_service or default_tracking_service
+        self.whatsapp = whatsapp_service or default_whatsapp_service
+        self.store = store or RescueQueueStore()
         self._running = False
 
+    @property
+    def queue(self) -> Dict[str, RescueItem]:
+        """Guías abiertas (conjunto caliente del store)"""
+        self.store._ensure_loaded()
+        return self.store.items
+
     def add_to_queue(
         self,
         tracking_number: str,
@@ -198,6 +615,28 @@ class RescueService:
             novelty_description: Descripción de la novedad
             days_without_movement: Días sin movimiento
         """
+        item = self._build_item(
+            tracking_number, carrier, customer_name, customer_phone, destination_city,
+            address, novelty_type, novelty_description, days_without_movement
+        )
+        self.store.add_many([item])
+        logger.info(f"Guía {item.tracking_number} añadida a rescate - Prioridad: {item.priority.value}")
+
+        return item
+
+    def _build_item(
+        self,
+        tracking_number: str,
+        carrier: str,
+        customer_name: str,
+        customer_phone: str,
+        destination_city: str,
+        address: str = "",
+        novelty_type: str = "OTRO",
+        novelty_description: str = "",
+        days_without_movement: int = 0
+    ) -> RescueItem:
+        """Construye el item de rescate de una guía"""
         # Determinar tipo de novedad
         try:
             nov_type = NoveltyType[novelty_type.upper().replace(' ', '_')]
@@ -228,17 +667,13 @@ class RescueService:
             next_action_at=datetime.now() + timedelta(hours=1)
         )
 
-        self.queue[tracking_number] = item
-        logger.info(f"Guía {tracking_number} añadida a rescate - Prioridad: {priority.value}")
-
         return item
 
     def add_bulk_to_queue(self, guides: List[Dict]) -> List[RescueItem]:
-        """Añade múltiples guías a la cola"""
-        items = []
-        for guide in guides:
-            item = self.add_to_queue(**guide)
-            items.append(item)
+        """Añade múltiples guías a la cola (una sola escritura en la BD)"""
+        items = [self._build_item(**guide) for guide in guides]
+        self.store.add_many(items)
+        logger.info(f"{len(items)} guías añadidas a rescate")
         return items
 
     def _detect_novelty_type(self, description: str) -> NoveltyType:
@@ -297,6 +732,7 @@ class RescueService:
 
         return max(0.05, min(0.95, base_rate))
 
+    @_synchronized
     def get_queue(
         self,
         priority: Optional[RescuePriority] = None,
@@ -311,37 +747,27 @@ class RescueService:
             status: Filtrar por estado
             limit: Límite de resultados
         """
-        items = list(self.queue.values())
-
-        if priority:
-            items = [i for i in items if i.priority == priority]
-
-        if status:
-            items = [i for i in items if i.status == status]
-
-        # Ordenar por prioridad y probabilidad
-        priority_order = {
-            RescuePriority.CRITICAL: 0,
-            RescuePriority.HIGH: 1,
-            RescuePriority.MEDIUM: 2,
-            RescuePriority.LOW: 3
-        }
+        items = []
+        for item in self.store.ordered(priority):
+            if status and item.status != status:
+                continue
+            items.append(item)
+            if len(items) >= limit:
+                break
 
-        items.sort(key=lambda x: (
-            priority_order.get(x.priority, 99),
-            -x.recovery_probability,
-            -x.days_without_movement
-        ))
+        return items
 
-        return items[:limit]
+    def claim_due(self, agent_id: str, limit: int = 10) -> List[RescueItem]:
+        """Reclama para un agente los reagendados cuya próxima acción ya venció"""
+        return self.store.claim_due(agent_id, limit)
 
     def get_item(self, tracking_number: str) -> Optional[RescueItem]:
         """Obtiene un item específico de la cola"""
-        return self.queue.get(tracking_number)
+        return self.store.get(tracking_number)
 
     async def send_whatsapp(self, tracking_number: str) -> Dict:
         """Envía WhatsApp de rescate a una guía"""
-        item = self.queue.get(tracking_number)
+        item = await asyncio.to_thread(self.get_item, tracking_number)
         if not item:
             return {"success": False, "error": "Guía no encontrada en cola"}
 
@@ -355,44 +781,51 @@ class RescueService:
         )
 
         if result.success:
-            item.whatsapp_sent = True
-            item.status = RescueStatus.WHATSAPP_SENT
-            item.last_contact_at = datetime.now()
-            item.attempts += 1
-            item.notes.append(f"WhatsApp enviado: {datetime.now().isoformat()}")
+            await asyncio.to_thread(self._record_whatsapp, item)
 
         return {
             "success": result.success,
             "message_id": result.message_id,
-            "error": result.error_message
+            "error": result.error_message,
+            "status_code": result.status_code,
+            "retry_after": result.retry_after
         }
 
+    @_synchronized
+    def _record_whatsapp(self, item: RescueItem):
+        """Registra el WhatsApp enviado y lo persiste"""
+        item.whatsapp_sent = True
+        item.status = RescueStatus.WHATSAPP_SENT
+        item.last_contact_at = datetime.now()
+        item.attempts += 1
+        item.notes.append(f"WhatsApp enviado: {datetime.now().isoformat()}")
+        self.store.save(item)
+
     async def send_bulk_whatsapp(
         self,
         priority: Optional[RescuePriority] = None
     ) -> Dict:
-        """Envía WhatsApp masivo a guías en cola"""
-        items = self.get_queue(priority=priority, status=RescueStatus.PENDING)
-
-        results = {"sent": 0, "failed": 0, "errors": []}
+        """Envía WhatsApp masivo a guías en cola (en paralelo por el despachador compartido)"""
+        pending = await asyncio.to_thread(self.get_queue, priority=priority, status=RescueStatus.PENDING)
+        items = [item for item in pending if item.customer_phone]
+
+        report = await self.whatsapp.dispatcher.dispatch(
+            "whatsapp",
+            items,
+            lambda item: self.send_whatsapp(item.tracking_number),
+            recipient_id=lambda item: item.tracking_number
+        )
 
-        for item in items:
-            if item.customer_phone:
-                result = await self.send_whatsapp(item.tracking_number)
-                if result.get("success"):
-                    results["sent"] += 1
-                else:
-                    results["failed"] += 1
-                    results["errors"].append({
-                        "guia": item.tracking_number,
-                        "error": result.get("error")
-                    })
-
-                # Pequeña pausa
-                await asyncio.sleep(0.2)
-
-        return results
+        return {
+            "sent": report.sent,
+            "failed": report.failed,
+            "errors": [
+                {"guia": r.recipient_id, "error": r.error}
+                for r in report.records if r.status != DeliveryStatus.SENT
+            ]
+        }
 
+    @_synchronized
     def get_call_script(self, tracking_number: str) -> Dict:
         """Obtiene el script de llamada para una guía"""
         item = self.queue.get(tracking_number)
@@ -448,6 +881,7 @@ class RescueService:
         }
         return tips.get(novelty_type, ["Escuchar al cliente", "Tomar nota de la solución"])
 
+    @_synchronized
     def mark_call_completed(
         self,
         tracking_number: str,
@@ -471,38 +905,38 @@ class RescueService:
             item.days_without_movement,
             item.attempts
         )
+        self.store.save(item)
 
         return {"success": True, "item": item}
 
+    @_synchronized
     def mark_recovered(self, tracking_number: str, notes: str = "") -> Dict:
         """Marca una guía como recuperada"""
         item = self.queue.get(tracking_number)
         if not item:
             return {"success": False, "error": "Guía no encontrada"}
 
-        item.status = RescueStatus.RECOVERED
         item.notes.append(f"RECUPERADA: {notes} ({datetime.now().isoformat()})")
 
-        # Mover a historial
-        self.history.append(item)
-        del self.queue[tracking_number]
+        # Sale de la cola y queda en el historial de la BD
+        self.store.close(item, RescueStatus.RECOVERED)
 
         return {"success": True, "message": "Guía marcada como recuperada"}
 
+    @_synchronized
     def mark_lost(self, tracking_number: str, reason: str = "") -> Dict:
         """Marca una guía como perdida"""
         item = self.queue.get(tracking_number)
         if not item:
             return {"success": False, "error": "Guía no encontrada"}
 
-        item.status = RescueStatus.LOST
         item.notes.append(f"PERDIDA: {reason} ({datetime.now().isoformat()})")
 
-        self.history.append(item)
-        del self.queue[tracking_number]
+        self.store.close(item, RescueStatus.LOST)
 
         return {"success": True, "message": "Guía marcada como perdida"}
 
+    @_synchronized
     def reschedule(
         self,
         tracking_number: str,
@@ -517,52 +951,15 @@ class RescueService:
         item.status = RescueStatus.RESCHEDULED
         item.next_action_at = next_action_at
         item.notes.append(f"Reagendado para {next_action_at}: {notes}")
+        self.store.save(item)
 
         return {"success": True, "next_action": next_action_at.isoformat()}
 
     def get_stats(self) -> RescueStats:
         """Obtiene estadísticas del sistema de rescate"""
-        items = list(self.queue.values())
-
-        today = datetime.now().date()
-        week_ago = today - timedelta(days=7)
-
-        recovered_today = sum(
-            1 for h in self.history
-            if h.status == RescueStatus.RECOVERED
-            and h.created_at.date() == today
-        )
-
-        recovered_week = sum(
-            1 for h in self.history
-            if h.status == RescueStatus.RECOVERED
-            and h.created_at.date() >= week_ago
-        )
-
-        lost_today = sum(
-            1 for h in self.history
-            if h.status == RescueStatus.LOST
-            and h.created_at.date() == today
-        )
-
-        total_history = len(self.history)
-        total_recovered = sum(
-            1 for h in self.history
-            if h.status == RescueStatus.RECOVERED
-        )
-
-        return RescueStats(
-            total_in_queue=len(items),
-            critical=sum(1 for i in items if i.priority == RescuePriority.CRITICAL),
-            high=sum(1 for i in items if i.priority == RescuePriority.HIGH),
-            medium=sum(1 for i in items if i.priority == RescuePriority.MEDIUM),
-            low=sum(1 for i in items if i.priority == RescuePriority.LOW),
-            recovered_today=recovered_today,
-            recovered_week=recovered_week,
-            lost_today=lost_today,
-            recovery_rate=round(total_recovered / total_history * 100, 1) if total_history > 0 else 0
-        )
+        return self.store.stats()
 
+    @_synchronized
     def export_queue_csv(self) -> str:
         """Exporta la cola a formato CSV"""
         import csv
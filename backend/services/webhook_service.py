@@ -8,8 +8,9 @@ import json
 import hmac
 import hashlib
 import asyncio
-from datetime import datetime
-from typing import Dict, List, Optional, Any
+import random
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Any, Tuple
 from loguru import logger
 
 # Intentar importar httpx (opcional)
@@ -20,6 +21,14 @@ except ImportError:
     HTTPX_AVAILABLE = False
     logger.warning("httpx no instalado. Webhooks deshabilitados.")
 
+# Outbox en base de datos (opcional)
+try:
+    from sqlalchemy import event, func
+    from database import get_db_session, WebhookOutbox, EstadoEntregaWebhook
+    DB_AVAILABLE = True
+except ImportError:
+    DB_AVAILABLE = False
+
 
 class WebhookService:
     """Servicio para gestionar y despachar webhooks"""
@@ -47,10 +56,29 @@ class WebhookService:
         "test.ping": "Evento de prueba",
     }
 
-    def __init__(self):
+    def __init__(self, session_factory: Callable = None):
         self.timeout = float(os.getenv('WEBHOOK_TIMEOUT', '30'))
         self.user_agent = "LitperPro-Webhook/1.0"
 
+        # Cliente HTTP compartido (pool de conexiones keep-alive)
+        self.max_connections = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', '50'))
+        self._client = None
+
+        # Outbox y worker de entregas
+        self.session_factory = session_factory or (get_db_session if DB_AVAILABLE else None)
+        self.retry_delays = list(self.RETRY_DELAYS)
+        self.batch_size = int(os.getenv('WEBHOOK_BATCH_SIZE', '1'))
+        self.poll_interval = float(os.getenv('WEBHOOK_POLL_INTERVAL', '5'))
+        # Segundos que una cola reclamada queda reservada para el worker que la tomó
+        self.claim_lease = float(os.getenv('WEBHOOK_CLAIM_LEASE', '300'))
+        # Resuelve webhook_id -> {url, secret, is_active, batch_size, ...}
+        self.subscriber_lookup: Optional[Callable[[int], Optional[Dict[str, Any]]]] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+        self.stats = {"enqueued": 0, "delivered": 0, "retries": 0, "dead_letter": 0, "requests": 0}
+
     def is_available(self) -> bool:
         """Verifica si el servicio está disponible"""
         return HTTPX_AVAILABLE
@@ -78,14 +106,14 @@ class WebhookService:
 
         Args:
             payload: String JSON del payload
-            signature: Firma recibida
+            signature: Firma recibida (hex o cabecera "sha256=<hex>")
             secret: Secret key esperado
 
         Returns:
             True si la firma es válida
         """
         expected = self.generate_signature(payload, secret)
-        return hmac.compare_digest(expected, signature)
+        return hmac.compare_digest(expected, signature.removeprefix("sha256="))
 
     async def deliver(
         self,
@@ -124,19 +152,58 @@ class WebhookService:
         }
 
         payload_str = json.dumps(full_payload, sort_keys=True, ensure_ascii=False)
-        signature = self.generate_signature(payload_str, secret)
 
+        result = await self._post(url, payload_str, secret, {"X-Webhook-Event": event_type})
+        result.update({"webhook_id": webhook_id, "event_type": event_type})
+
+        if result["success"]:
+            logger.debug(f"Webhook entregado: {event_type} -> {url[:50]}...")
+        elif result["status_code"]:
+            logger.warning(
+                f"Webhook fallido ({result['status_code']}): {event_type} -> {url[:50]}..."
+            )
+
+        return result
+
+    def _get_client(self) -> "httpx.AsyncClient":
+        """Cliente HTTP compartido por todas las entregas"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections
+                ),
+                headers={"User-Agent": self.user_agent}
+            )
+        return self._client
+
+    async def close(self):
+        """Cierra el cliente HTTP compartido"""
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+
+    async def _post(
+        self,
+        url: str,
+        body: str,
+        secret: str,
+        extra_headers: Optional[Dict[str, str]] = None
+    ) -> Dict[str, Any]:
+        """
+        Envía un cuerpo ya serializado, firmado con HMAC-SHA256.
+
+        La firma cubre exactamente los bytes enviados (un evento o un lote).
+        """
         headers = {
             "Content-Type": "application/json",
-            "X-Webhook-Signature": f"sha256={signature}",
-            "X-Webhook-Event": event_type,
+            "X-Webhook-Signature": f"sha256={self.generate_signature(body, secret)}",
             "X-Webhook-Timestamp": datetime.utcnow().isoformat(),
-            "User-Agent": self.user_agent
+            **(extra_headers or {})
         }
 
         result = {
-            "webhook_id": webhook_id,
-            "event_type": event_type,
             "url": url,
             "success": False,
             "status_code": None,
@@ -145,33 +212,22 @@ class WebhookService:
             "delivered_at": None
         }
 
+        self.stats["requests"] += 1
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.post(
-                    url,
-                    content=payload_str,
-                    headers=headers
-                )
-
-                result["status_code"] = response.status_code
-                result["response_body"] = response.text[:1000]  # Limitar respuesta
-                result["success"] = 200 <= response.status_code < 300
-                result["delivered_at"] = datetime.utcnow().isoformat()
-
-                if result["success"]:
-                    logger.debug(f"Webhook entregado: {event_type} -> {url[:50]}...")
-                else:
-                    logger.warning(
-                        f"Webhook fallido ({response.status_code}): {event_type} -> {url[:50]}..."
-                    )
+            response = await self._get_client().post(url, content=body.encode('utf-8'), headers=headers)
+
+            result["status_code"] = response.status_code
+            result["response_body"] = response.text[:1000]  # Limitar respuesta
+            result["success"] = 200 <= response.status_code < 300
+            result["delivered_at"] = datetime.utcnow().isoformat()
 
         except httpx.TimeoutException:
             result["error"] = "timeout"
-            logger.warning(f"Webhook timeout: {event_type} -> {url[:50]}...")
+            logger.warning(f"Webhook timeout: {url[:50]}...")
 
         except httpx.RequestError as e:
             result["error"] = str(e)
-            logger.error(f"Webhook error: {event_type} -> {url[:50]}... - {e}")
+            logger.error(f"Webhook error: {url[:50]}... - {e}")
 
         except Exception as e:
             result["error"] = str(e)
@@ -188,6 +244,9 @@ class WebhookService:
         """
         Despacha un evento a todos los webhooks suscritos.
 
+        Con outbox disponible el evento se encola y lo entrega el worker (con
+        reintentos); sin base de datos se entrega directamente, una sola vez.
+
         Args:
             event_type: Tipo de evento
             payload: Datos del evento
@@ -199,6 +258,19 @@ class WebhookService:
         if not webhooks:
             return {"total": 0, "success": 0, "failed": 0, "results": []}
 
+        if self.session_factory is not None:
+            def encolar():
+                with self.session_factory() as session:
+                    rows = self.enqueue(session, event_type, payload, webhooks)
+                    session.flush()
+                    return [r.id for r in rows]
+
+            try:
+                delivery_ids = await asyncio.to_thread(encolar)
+                return {"total": len(delivery_ids), "queued": len(delivery_ids), "delivery_ids": delivery_ids}
+            except Exception as e:
+                logger.error(f"Outbox no disponible, entrega directa: {e}")
+
         results = {
             "total": len(webhooks),
             "success": 0,
@@ -243,6 +315,339 @@ class WebhookService:
 
         return results
 
+    # === Outbox transaccional ===
+
+    def enqueue(
+        self,
+        session,
+        event_type: str,
+        payload: Dict[str, Any],
+        webhooks: List[Dict[str, Any]]
+    ) -> List["WebhookOutbox"]:
+        """
+        Escribe el evento en el outbox, una fila por webhook suscrito.
+
+        No hace commit: las filas se guardan en la misma transacción que el
+        cambio de negocio del llamador (si este hace rollback, no se envía
+        nada). Al hacer commit se despierta al worker.
+
+        Args:
+            session: Sesión de SQLAlchemy del cambio de negocio
+            event_type: Tipo de evento
+            payload: Datos del evento
+            webhooks: Webhooks candidatos (se filtran activos y suscritos)
+        """
+        rows = [
+            WebhookOutbox(
+                webhook_id=wh["id"],
+                url=wh["url"],
+                event_type=event_type,
+                payload=payload,
+                estado=EstadoEntregaWebhook.PENDIENTE,
+                proximo_intento=datetime.utcnow()
+            )
+            for wh in webhooks
+            if wh.get("is_active", True) and event_type in wh.get("events", [])
+        ]
+        if not rows:
+            return rows
+
+        session.add_all(rows)
+        self.stats["enqueued"] += len(rows)
+        event.listen(session, "after_commit", lambda _: self.notify(), once=True)
+        return rows
+
+    def discard_pending(self, session, webhook_id: int, url: str) -> int:
+        """
+        Manda a dead-letter las entregas pendientes de un webhook eliminado.
+
+        No hace commit (igual que `enqueue`). Se filtra también por URL para no
+        tocar filas de un webhook anterior que tuviera el mismo id.
+
+        Returns:
+            Número de entregas descartadas
+        """
+        return session.query(WebhookOutbox).filter(
+            WebhookOutbox.webhook_id == webhook_id,
+            WebhookOutbox.url == url,
+            WebhookOutbox.estado == EstadoEntregaWebhook.PENDIENTE
+        ).update({
+            WebhookOutbox.estado: EstadoEntregaWebhook.DEAD_LETTER,
+            WebhookOutbox.ultimo_error: "Webhook eliminado"
+        }, synchronize_session=False)
+
+    def notify(self):
+        """Despierta al worker (seguro desde cualquier hilo)"""
+        if self._wake is not None and self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    def start_worker(self):
+        """Arranca el worker de entregas en el event loop actual"""
+        if self._worker and not self._worker.done():
+            return
+        if self.session_factory is None or not self.is_available():
+            logger.warning("Worker de webhooks no iniciado: sin base de datos o sin httpx")
+            return
+
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._worker = asyncio.create_task(self._run_worker())
+        logger.info("📮 Worker de webhooks iniciado")
+
+    async def stop_worker(self):
+        """Detiene el worker y cierra el cliente HTTP"""
+        if self._worker:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        await self.close()
+
+    async def _run_worker(self):
+        while True:
+            try:
+                processed = await self.process_outbox()
+            except Exception as e:
+                logger.error(f"Error en worker de webhooks: {e}")
+                processed = 0
+
+            if processed:
+                continue  # Vaciar el backlog sin esperar
+
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def process_outbox(self) -> int:
+        """
+        Una ronda del worker.
+
+        Toma la cabeza de la cola de cada suscriptor (hasta su batch_size) y
+        entrega los suscriptores en paralelo; dentro de un suscriptor los
+        eventos salen en orden y un fallo detiene a los siguientes hasta que
+        el reintento pase o el evento vaya a dead-letter.
+
+        Returns:
+            Número de entregas intentadas
+        """
+        batches = await asyncio.to_thread(self._claim_batches)
+        if not batches:
+            return 0
+
+        outcomes = await asyncio.gather(*(
+            self._deliver_batch(subscriber, rows) for subscriber, rows in batches
+        ))
+
+        for (subscriber, _), results in zip(batches, outcomes):
+            subscriber["last_triggered"] = datetime.utcnow().isoformat()
+            if any(not r["success"] for _, r in results):
+                subscriber["failure_count"] = subscriber.get("failure_count", 0) + 1
+
+        results = [item for group in outcomes for item in group]
+        attempted = {delivery_id for delivery_id, _ in results}
+        unsent = [r["id"] for _, rows in batches for r in rows if r["id"] not in attempted]
+        await asyncio.to_thread(self._record_results, results, unsent)
+        return len(results)
+
+    def _claim_batches(self) -> List[Tuple[Dict[str, Any], List[Dict[str, Any]]]]:
+        """
+        Reclama los lotes listos: cabeza de la cola de cada suscriptor cuyo
+        próximo intento ya venció, más las filas que le siguen.
+
+        Las filas se bloquean con FOR UPDATE SKIP LOCKED y se reservan moviendo
+        su próximo intento al fin del lease, así que con un worker por proceso
+        ninguna cola se entrega dos veces ni fuera de orden.
+        """
+        now = datetime.utcnow()
+        lease_until = now + timedelta(seconds=self.claim_lease)
+        batches = []
+        pendiente = EstadoEntregaWebhook.PENDIENTE
+
+        with self.session_factory() as session:
+            heads = session.query(func.min(WebhookOutbox.id)).filter(
+                WebhookOutbox.estado == pendiente
+            ).group_by(WebhookOutbox.webhook_id, WebhookOutbox.url).subquery()
+
+            due = session.query(WebhookOutbox).filter(
+                WebhookOutbox.id.in_(heads.select()),
+                WebhookOutbox.proximo_intento <= now
+            ).with_for_update(skip_locked=True).all()
+
+            for head in due:
+                subscriber = self._subscriber_for(head)
+                if subscriber is None or not subscriber.get("is_active", True):
+                    continue  # Sin suscriptor registrado o pausado: la cola espera
+
+                size = max(1, subscriber.get("batch_size") or self.batch_size)
+                rows = session.query(WebhookOutbox).filter(
+                    WebhookOutbox.webhook_id == head.webhook_id,
+                    WebhookOutbox.url == head.url,
+                    WebhookOutbox.estado == pendiente,
+                    WebhookOutbox.id >= head.id
+                ).order_by(WebhookOutbox.id).limit(size).with_for_update(skip_locked=True).all()
+
+                for r in rows:
+                    r.proximo_intento = lease_until
+
+                batches.append((subscriber, [
+                    {
+                        "id": r.id,
+                        "event_type": r.event_type,
+                        "payload": r.payload,
+                        "created_at": r.fecha_creacion.isoformat() if r.fecha_creacion else None
+                    }
+                    for r in rows
+                ]))
+
+        return batches
+
+    def _subscriber_for(self, row: "WebhookOutbox") -> Optional[Dict[str, Any]]:
+        """
+        Suscriptor al que se entrega una fila, con su secret actual.
+
+        El secret no se guarda en el outbox: sale del registro, y solo si aún
+        tiene ese id con la misma URL. Si no (p. ej. tras un reinicio, o el id
+        ahora es de otro webhook) devuelve None y la fila queda pendiente:
+        nunca se envía con otro secret ni va a dead-letter por eso.
+        """
+        subscriber = self.subscriber_lookup(row.webhook_id) if self.subscriber_lookup else None
+        if subscriber is None or subscriber.get("url") != row.url:
+            return None
+        return subscriber
+
+    async def _deliver_batch(
+        self,
+        subscriber: Dict[str, Any],
+        rows: List[Dict[str, Any]]
+    ) -> List[Tuple[int, Dict[str, Any]]]:
+        """Entrega los eventos de un suscriptor en orden (un POST por lote si batch_size > 1)"""
+        url = subscriber["url"]
+        secret = subscriber.get("secret") or ""
+        webhook_id = subscriber.get("id")
+
+        def event_body(row):
+            return {
+                "delivery_id": row["id"],
+                "event": row["event_type"],
+                "timestamp": row["created_at"],
+                "webhook_id": webhook_id,
+                "data": row["payload"]
+            }
+
+        if (subscriber.get("batch_size") or self.batch_size) > 1:
+            body = json.dumps({
+                "batch": True,
+                "webhook_id": webhook_id,
+                "timestamp": datetime.utcnow().isoformat(),
+                "events": [event_body(r) for r in rows]
+            }, sort_keys=True, ensure_ascii=False)
+            result = await self._post(url, body, secret, {
+                "X-Webhook-Event": "batch",
+                "X-Webhook-Batch-Size": str(len(rows)),
+                "X-Webhook-Delivery": ",".join(str(r["id"]) for r in rows)
+            })
+            return [(r["id"], result) for r in rows]
+
+        outcomes = []
+        for row in rows:
+            body = json.dumps(event_body(row), sort_keys=True, ensure_ascii=False)
+            result = await self._post(url, body, secret, {
+                "X-Webhook-Event": row["event_type"],
+                "X-Webhook-Delivery": str(row["id"])
+            })
+            outcomes.append((row["id"], result))
+            if not result["success"]:
+                break  # Orden por suscriptor: lo siguiente espera al reintento
+        return outcomes
+
+    def retry_delay(self, attempts: int) -> float:
+        """Espera tras el intento fallido número `attempts` (±10% de jitter)"""
+        delay = self.retry_delays[min(attempts, len(self.retry_delays)) - 1]
+        return delay * random.uniform(0.9, 1.1)
+
+    def _record_results(self, results: List[Tuple[int, Dict[str, Any]]], unsent: Optional[List[int]] = None):
+        """
+        Guarda el resultado de cada entrega: entregado, reintento o dead-letter.
+
+        Las filas reclamadas que no se llegaron a enviar (`unsent`) liberan su
+        lease para salir en cuanto la cabeza de su cola se entregue.
+        """
+        now = datetime.utcnow()
+        with self.session_factory() as session:
+            if unsent:
+                session.query(WebhookOutbox).filter(
+                    WebhookOutbox.id.in_(unsent),
+                    WebhookOutbox.estado == EstadoEntregaWebhook.PENDIENTE
+                ).update({WebhookOutbox.proximo_intento: now}, synchronize_session=False)
+
+            for delivery_id, result in results:
+                row = session.get(WebhookOutbox, delivery_id)
+                if row is None:
+                    continue
+
+                row.intentos = (row.intentos or 0) + 1
+                row.ultimo_status_code = result.get("status_code")
+
+                if result.get("success"):
+                    row.estado = EstadoEntregaWebhook.ENTREGADO
+                    row.fecha_entrega = now
+                    row.ultimo_error = None
+                    self.stats["delivered"] += 1
+                    continue
+
+                row.ultimo_error = result.get("error") or (result.get("response_body") or "")[:500]
+                if row.intentos > len(self.retry_delays):
+                    row.estado = EstadoEntregaWebhook.DEAD_LETTER
+                    self.stats["dead_letter"] += 1
+                    logger.warning(f"Webhook {row.webhook_id} entrega {row.id} a dead-letter tras {row.intentos} intentos")
+                else:
+                    row.proximo_intento = now + timedelta(seconds=self.retry_delay(row.intentos))
+                    self.stats["retries"] += 1
+
+    # === Dead-letter ===
+
+    def list_dead_letters(self, webhook_id: Optional[int] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """Entregas en dead-letter (más recientes primero)"""
+        with self.session_factory() as session:
+            query = session.query(WebhookOutbox).filter(
+                WebhookOutbox.estado == EstadoEntregaWebhook.DEAD_LETTER
+            )
+            if webhook_id is not None:
+                query = query.filter(WebhookOutbox.webhook_id == webhook_id)
+            return [r.to_dict() for r in query.order_by(WebhookOutbox.id.desc()).limit(limit).all()]
+
+    def replay(self, delivery_ids: Optional[List[int]] = None, webhook_id: Optional[int] = None) -> int:
+        """
+        Vuelve a encolar entregas en dead-letter (por id o todas las de un webhook).
+
+        Returns:
+            Número de entregas reencoladas
+        """
+        with self.session_factory() as session:
+            query = session.query(WebhookOutbox).filter(
+                WebhookOutbox.estado == EstadoEntregaWebhook.DEAD_LETTER
+            )
+            if delivery_ids is not None:
+                query = query.filter(WebhookOutbox.id.in_(delivery_ids))
+            if webhook_id is not None:
+                query = query.filter(WebhookOutbox.webhook_id == webhook_id)
+
+            replayed = query.update({
+                WebhookOutbox.estado: EstadoEntregaWebhook.PENDIENTE,
+                WebhookOutbox.intentos: 0,
+                WebhookOutbox.proximo_intento: datetime.utcnow(),
+                WebhookOutbox.ultimo_error: None
+            }, synchronize_session=False)
+
+        if replayed:
+            logger.info(f"{replayed} entregas de webhook reencoladas desde dead-letter")
+            self.notify()
+        return replayed
+
     def get_available_events(self) -> Dict[str, str]:
         """Retorna los eventos disponibles para webhooks"""
         return self.AVAILABLE_EVENTS.copy()
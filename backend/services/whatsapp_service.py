@@ -12,6 +12,8 @@ from dataclasses import dataclass, field
 from enum import Enum
 from loguru import logger
 
+from .outbound_dispatcher import is_transient_error, outbound_dispatcher, parse_retry_after
+
 
 class WhatsAppProvider(str, Enum):
     """Proveedores de WhatsApp soportados"""
@@ -61,6 +63,9 @@ class SendResult:
     phone: str = ""
     error_message: str = ""
     provider: WhatsAppProvider = WhatsAppProvider.META_OFFICIAL
+    status_code: Optional[int] = None       # HTTP del proveedor (None si no respondió)
+    retry_after: Optional[float] = None     # Segundos pedidos por el proveedor (Retry-After)
+    transient: bool = False                 # Sin respuesta por timeout o conexión (reintentable)
 
 
 # Templates predefinidos para logística
@@ -246,7 +251,9 @@ class MetaOfficialProvider(BaseWhatsAppProvider):
                     success=False,
                     phone=formatted_phone,
                     error_message=f"HTTP {response.status_code}: {response.text}",
-                    provider=WhatsAppProvider.META_OFFICIAL
+                    provider=WhatsAppProvider.META_OFFICIAL,
+                    status_code=response.status_code,
+                    retry_after=parse_retry_after(response.headers.get('Retry-After'))
                 )
 
         except Exception as e:
@@ -255,7 +262,8 @@ class MetaOfficialProvider(BaseWhatsAppProvider):
                 success=False,
                 phone=phone,
                 error_message=str(e),
-                provider=WhatsAppProvider.META_OFFICIAL
+                provider=WhatsAppProvider.META_OFFICIAL,
+                transient=is_transient_error(e)
             )
 
     async def send_template(
@@ -314,7 +322,9 @@ class MetaOfficialProvider(BaseWhatsAppProvider):
                     success=False,
                     phone=formatted_phone,
                     error_message=response.text,
-                    provider=WhatsAppProvider.META_OFFICIAL
+                    provider=WhatsAppProvider.META_OFFICIAL,
+                    status_code=response.status_code,
+                    retry_after=parse_retry_after(response.headers.get('Retry-After'))
                 )
 
         except Exception as e:
@@ -323,7 +333,8 @@ class MetaOfficialProvider(BaseWhatsAppProvider):
                 success=False,
                 phone=phone,
                 error_message=str(e),
-                provider=WhatsAppProvider.META_OFFICIAL
+                provider=WhatsAppProvider.META_OFFICIAL,
+                transient=is_transient_error(e)
             )
 
     def _simulate_send(self, phone: str, message: str) -> SendResult:
@@ -385,7 +396,9 @@ class TwilioProvider(BaseWhatsAppProvider):
                     success=False,
                     phone=formatted_phone,
                     error_message=response.text,
-                    provider=WhatsAppProvider.TWILIO
+                    provider=WhatsAppProvider.TWILIO,
+                    status_code=response.status_code,
+                    retry_after=parse_retry_after(response.headers.get('Retry-After'))
                 )
 
         except Exception as e:
@@ -394,7 +407,8 @@ class TwilioProvider(BaseWhatsAppProvider):
                 success=False,
                 phone=phone,
                 error_message=str(e),
-                provider=WhatsAppProvider.TWILIO
+                provider=WhatsAppProvider.TWILIO,
+                transient=is_transient_error(e)
             )
 
     async def send_template(
@@ -435,6 +449,7 @@ class WhatsAppService:
         self.active_provider = self._detect_active_provider()
         self.message_history: List[WhatsAppMessage] = []
         self.templates = MESSAGE_TEMPLATES
+        self.dispatcher = outbound_dispatcher
 
     def _detect_active_provider(self) -> WhatsAppProvider:
         """Detecta qué proveedor tiene credenciales configuradas"""
@@ -583,29 +598,38 @@ class WhatsAppService:
         """
         Envía mensajes masivos
 
+        Los envíos salen en paralelo por el despachador compartido (límite de
+        concurrencia y de tasa del proveedor, reintentos con backoff).
+
         Args:
             contacts: Lista de {phone, nombre, guia, ...params}
             template_name: Template a usar
         """
-        results = []
-
+        recipients = []
         for contact in contacts:
             phone = contact.pop('phone', contact.pop('telefono', ''))
-            if not phone:
-                continue
+            if phone:
+                recipients.append((phone, contact))
 
-            result = await self.send_template(
-                phone=phone,
-                template_name=template_name,
-                params=contact
-            )
-            results.append(result)
+        if template_name not in self.templates:
+            return [
+                SendResult(success=False, phone=phone, error_message=f"Template '{template_name}' no encontrado")
+                for phone, _ in recipients
+            ]
 
-            # Pequeña pausa para evitar rate limiting
-            import asyncio
-            await asyncio.sleep(0.1)
+        async def send(recipient) -> SendResult:
+            phone, params = recipient
+            return await self.send_template(phone=phone, template_name=template_name, params=params)
+
+        report = await self.dispatcher.dispatch(
+            "whatsapp", recipients, send, recipient_id=lambda r: r[0]
+        )
 
-        return results
+        return [
+            record.result if isinstance(record.result, SendResult)
+            else SendResult(success=False, phone=record.recipient_id, error_message=record.error)
+            for record in report.records
+        ]
 
     def _log_message(
         self,
@@ -0,0 +1,145 @@
+# backend/tests/test_action_plan.py
+"""
+Tests para los planes de acciones del ejecutor (DAG, límites y compensaciones).
+"""
+
+import asyncio
+
+from brain.core.action_executor import ActionExecutor, parse_plan
+
+import pytest
+
+
+def _ejecutor_con_registro():
+    """Ejecutor con tools de prueba que registran su orden de ejecución"""
+    ejecutor = ActionExecutor()
+    orden = []
+
+    @ejecutor.register("lento")
+    async def lento(params):
+        orden.append(('inicio', params['nombre']))
+        await asyncio.sleep(0.05)
+        orden.append(('fin', params['nombre']))
+        return {'nombre': params['nombre']}
+
+    @ejecutor.register("falla")
+    async def falla(params):
+        raise RuntimeError("transportadora caída")
+
+    @ejecutor.register("deshacer")
+    async def deshacer(params):
+        orden.append(('deshacer', params['nombre']))
+        return {'deshecho': True}
+
+    return ejecutor, orden
+
+
+class TestPlanes:
+    """Tests de ejecución de planes con dependencias"""
+
+    def test_playbook_encadena_salidas(self):
+        """predecir -> seleccionar -> notificar usa la salida de cada paso"""
+        ejecutor = ActionExecutor()
+        plan = {'steps': [
+            {'id': 'predecir', 'tool': 'predict_delivery_time',
+             'input': {'carrier': 'Servientrega', 'destination': 'Cali'}},
+            {'id': 'seleccionar', 'tool': 'select_carrier',
+             'input': {'destination_city': '{{predecir.destination}}'}},
+            {'id': 'notificar', 'tool': 'send_whatsapp',
+             'input': {'phone': '+573001234567',
+                       'message': 'Tu pedido llega en {{predecir.estimated_days}} días con {{seleccionar.carrier}}'}},
+            {'id': 'alerta', 'tool': 'create_alert', 'depends_on': ['notificar'],
+             'input': {'type': 'delay', 'title': 'Retraso en {{seleccionar.destination}}'}},
+        ]}
+
+        resultado = asyncio.run(ejecutor.execute_plan(plan))
+
+        assert resultado.success
+        assert resultado.steps['seleccionar'].result['destination'] == 'Cali'
+        assert resultado.steps['notificar'].result['message_preview'] == 'Tu pedido llega en 3 días con Coordinadora'
+        assert len(ejecutor.action_history) == 1
+        assert ejecutor.action_history[0].tool == 'execute_plan'
+
+    def test_ramas_independientes_corren_en_paralelo(self):
+        """Dos ramas sin dependencias arrancan antes de que termine la primera"""
+        ejecutor, orden = _ejecutor_con_registro()
+        plan = [
+            {'id': 'a', 'tool': 'lento', 'input': {'nombre': 'a'}},
+            {'id': 'b', 'tool': 'lento', 'input': {'nombre': 'b'}},
+            {'id': 'c', 'tool': 'lento', 'input': {'nombre': 'c'}, 'depends_on': ['a', 'b']},
+        ]
+
+        asyncio.run(ejecutor.execute_plan(plan))
+
+        assert orden[:2] == [('inicio', 'a'), ('inicio', 'b')]
+        assert orden.index(('inicio', 'c')) > orden.index(('fin', 'b'))
+
+    def test_limite_de_concurrencia_por_tool(self):
+        """Con concurrencia 1 los pasos de la misma tool no se solapan"""
+        ejecutor, orden = _ejecutor_con_registro()
+        ejecutor.limits['lento'] = (1, 5)
+        plan = [{'id': n, 'tool': 'lento', 'input': {'nombre': n}} for n in 'abc']
+
+        asyncio.run(ejecutor.execute_plan(plan))
+
+        assert orden == [(evento, n) for n in 'abc' for evento in ('inicio', 'fin')]
+
+    def test_timeout_falla_el_paso(self):
+        """Un paso que excede su timeout falla sin colgar el plan"""
+        ejecutor, _ = _ejecutor_con_registro()
+        ejecutor.limits['lento'] = (1, 0.01)
+
+        resultado = asyncio.run(ejecutor.execute_plan([{'id': 'a', 'tool': 'lento', 'input': {'nombre': 'a'}}]))
+
+        assert not resultado.success
+        assert 'Timeout' in resultado.steps['a'].error
+        assert ejecutor.stats['timeouts'] == 1
+
+
+class TestFallosYCompensaciones:
+    """Tests de fallos parciales"""
+
+    def test_fallo_compensa_pasos_completados_en_orden_inverso(self):
+        """Si falla un paso se deshacen los completados y se omiten sus dependientes"""
+        ejecutor, orden = _ejecutor_con_registro()
+        plan = [
+            {'id': 'a', 'tool': 'lento', 'input': {'nombre': 'a'},
+             'compensate': {'tool': 'deshacer', 'input': {'nombre': '{{a.nombre}}'}}},
+            {'id': 'b', 'tool': 'lento', 'input': {'nombre': 'b'}, 'depends_on': ['a'],
+             'compensate': {'tool': 'deshacer', 'input': {'nombre': 'b'}}},
+            {'id': 'c', 'tool': 'falla', 'depends_on': ['b']},
+            {'id': 'd', 'tool': 'lento', 'input': {'nombre': 'd'}, 'depends_on': ['c']},
+        ]
+
+        resultado = asyncio.run(ejecutor.execute_plan(plan))
+
+        assert not resultado.success
+        assert resultado.skipped == ['d']
+        assert resultado.compensated == ['b', 'a']
+        assert orden[-2:] == [('deshacer', 'b'), ('deshacer', 'a')]
+        assert 'transportadora caída' in resultado.error
+
+    def test_paso_opcional_no_tumba_el_plan(self):
+        """Un paso opcional que falla no dispara compensaciones"""
+        ejecutor, _ = _ejecutor_con_registro()
+        plan = [
+            {'id': 'a', 'tool': 'lento', 'input': {'nombre': 'a'},
+             'compensate': {'tool': 'deshacer', 'input': {'nombre': 'a'}}},
+            {'id': 'aviso', 'tool': 'falla', 'optional': True},
+        ]
+
+        resultado = asyncio.run(ejecutor.execute_plan(plan))
+
+        assert resultado.success
+        assert resultado.compensated == []
+
+    def test_plan_con_ciclo_es_invalido(self):
+        """Ciclos y dependencias inexistentes se rechazan antes de ejecutar"""
+        with pytest.raises(ValueError, match="ciclo"):
+            parse_plan([
+                {'id': 'a', 'tool': 'lento', 'depends_on': ['b']},
+                {'id': 'b', 'tool': 'lento', 'input': {'x': '{{a.nombre}}'}},
+            ])
+
+        resultado = asyncio.run(ActionExecutor().execute_plan([{'id': 'a', 'tool': 'x', 'depends_on': ['z']}]))
+        assert not resultado.success and 'inexistentes' in resultado.error
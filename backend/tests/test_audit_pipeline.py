@@ -0,0 +1,312 @@
+# backend/tests/test_audit_pipeline.py
+"""
+Tests para la auditoría con buffer por lotes, sinks locales y detección en streaming.
+"""
+
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("email_validator")  # el paquete security usa EmailStr
+
+from security.audit import (
+    AnomalyDetector,
+    AuditAction,
+    AuditService,
+    CountMinSketch,
+    JSONLAuditSink,
+    SQLiteAuditSink,
+    SlidingWindowCounter,
+)
+
+
+class LoggerFalso:
+    """Logger estructurado (acepta kwargs) que guarda cada llamada"""
+
+    def __init__(self):
+        self.registros = []
+
+    def _registrar(self, nivel):
+        return lambda mensaje, **campos: self.registros.append((nivel, mensaje, campos))
+
+    def __getattr__(self, nivel):
+        return self._registrar(nivel)
+
+    def eventos(self, event_type):
+        return [campos for _, _, campos in self.registros if campos.get("event_type") == event_type]
+
+
+class ColeccionFalsa:
+    """audit_logs de Mongo: solo insert_many, con latencia por viaje"""
+
+    def __init__(self, latencia=0.0):
+        self.latencia = latencia
+        self.lotes = []
+
+    async def insert_many(self, docs, ordered=True):
+        await asyncio.sleep(self.latencia)
+        self.lotes.append(list(docs))
+
+    def __getattr__(self, nombre):
+        raise AssertionError(f"consulta a la base de datos en el camino de log(): {nombre}")
+
+
+class MongoFalso:
+    def __init__(self, latencia=0.0):
+        self.audit_logs = ColeccionFalsa(latencia)
+
+
+class Reloj:
+    def __init__(self):
+        self.ahora = 1000.0
+
+    def __call__(self):
+        return self.ahora
+
+
+async def _registrar(servicio, action=AuditAction.ORDER_VIEW, user_id="u1", ip="10.0.0.1", success=True, **kwargs):
+    return await servicio.log(
+        action=action, user_id=user_id, user_email="ana@litper.co", user_role="operator",
+        ip_address=ip, user_agent="pytest", success=success, **kwargs
+    )
+
+
+class TestBuffer:
+    """Tests del buffer asíncrono y la escritura por lotes"""
+
+    def test_lotes_por_tamano_y_vaciado_al_cerrar(self):
+        """25 eventos con batch_size=10 son 3 insert_many y close() no pierde nada"""
+        db = MongoFalso()
+
+        async def escenario():
+            servicio = AuditService(db, LoggerFalso(), batch_size=10, flush_interval=60)
+            for i in range(25):
+                await _registrar(servicio, resource_id=str(i))
+            await asyncio.sleep(0)
+            await servicio.close()
+            return servicio
+
+        servicio = asyncio.run(escenario())
+
+        assert [len(lote) for lote in db.audit_logs.lotes] == [10, 10, 5]
+        assert [d["resource_id"] for lote in db.audit_logs.lotes for d in lote] == [str(i) for i in range(25)]
+        assert servicio.stats["written"] == 25 and servicio.stats["lost"] == 0
+
+    def test_lote_por_tiempo_y_respaldo_si_el_sink_falla(self, tmp_path):
+        """Un lote pequeño sale al cumplirse flush_interval; si Mongo falla va al JSONL"""
+        db = MongoFalso()
+        respaldo = JSONLAuditSink(tmp_path / "audit.jsonl")
+
+        async def escenario():
+            servicio = AuditService(db, LoggerFalso(), batch_size=100, flush_interval=0.05)
+            await _registrar(servicio)
+            await _registrar(servicio)
+            await asyncio.sleep(0.2)
+            escritos_por_tiempo = sum(map(len, db.audit_logs.lotes))
+
+            async def caido(docs):
+                raise ConnectionError("mongo caído")
+
+            servicio.sink.write = caido
+            servicio.fallback_sink = respaldo
+            servicio.max_retries = 1
+            await _registrar(servicio, resource_id="en-respaldo")
+            await servicio.close()
+            return escritos_por_tiempo
+
+        assert asyncio.run(escenario()) == 2
+        [guardado] = asyncio.run(respaldo.find({}))
+        assert guardado["resource_id"] == "en-respaldo"
+
+
+class ErrorDeLoteFalso(Exception):
+    """BulkWriteError de pymongo: trae el detalle de cada documento rechazado"""
+
+    def __init__(self, details):
+        super().__init__("error de lote")
+        self.details = details
+
+
+class ColeccionConIds:
+    """audit_logs con `_id` único; el primer insert_many se corta a la mitad"""
+
+    def __init__(self):
+        self.docs = {}
+        self.cortes = 1
+
+    async def insert_many(self, docs, ordered=True):
+        duplicados = []
+        for i, doc in enumerate(docs):
+            if self.cortes and i == len(docs) // 2:
+                self.cortes -= 1
+                raise ConnectionError("conexión perdida a mitad del lote")
+            if doc["_id"] in self.docs:
+                duplicados.append({"index": i, "code": 11000})
+            else:
+                self.docs[doc["_id"]] = doc
+        if duplicados:
+            raise ErrorDeLoteFalso({"writeErrors": duplicados, "writeConcernErrors": []})
+
+
+class TestReintentos:
+    """Reintentos de lotes y cierre del flusher"""
+
+    def test_reintento_tras_fallo_parcial_no_duplica(self, monkeypatch):
+        """El _id es el id del evento y los duplicados del reintento cuentan como escritos"""
+        import security.audit as audit
+        monkeypatch.setattr(audit, "BulkWriteError", ErrorDeLoteFalso, raising=False)
+        monkeypatch.setattr(audit, "PYMONGO_AVAILABLE", True)
+
+        class Mongo:
+            audit_logs = ColeccionConIds()
+
+        async def escenario():
+            servicio = AuditService(Mongo(), LoggerFalso(), batch_size=10, flush_interval=60)
+            servicio.max_retries = 2
+            eventos = [await _registrar(servicio, resource_id=str(i)) for i in range(6)]
+            await servicio.close()
+            return servicio, eventos
+
+        servicio, eventos = asyncio.run(escenario())
+
+        assert sorted(Mongo.audit_logs.docs) == sorted(e.id for e in eventos)
+        assert servicio.stats["written"] == 6 and servicio.stats["lost"] == 0
+        assert servicio.stats["write_errors"] == 1
+
+    def test_flush_durante_close_no_lo_cuelga(self):
+        """Un flush() que vacía la cola mientras close() espera deja la marca de fin"""
+        db = MongoFalso(latencia=0.05)
+
+        async def escenario():
+            servicio = AuditService(db, LoggerFalso(), batch_size=1, flush_interval=60)
+            for i in range(3):
+                await _registrar(servicio, resource_id=str(i))
+            await asyncio.sleep(0)  # El flusher empieza a escribir el primero
+
+            cierre = asyncio.create_task(servicio.close())
+            await asyncio.sleep(0)  # close() ya encoló la marca y espera al flusher
+            await servicio.flush()
+            await asyncio.wait_for(cierre, timeout=2)
+
+        asyncio.run(escenario())
+
+        assert sorted(d["resource_id"] for lote in db.audit_logs.lotes for d in lote) == ["0", "1", "2"]
+
+
+class TestSinkLocal:
+    """Tests del sink SQLite cuando no hay MongoDB"""
+
+    def test_sqlite_sin_mongo_con_consultas(self, tmp_path, monkeypatch):
+        """Con db=None se escribe en SQLite y las consultas leen lo recién registrado"""
+        monkeypatch.setenv("AUDIT_SQLITE_PATH", str(tmp_path / "audit.db"))
+
+        async def escenario():
+            servicio = AuditService(None, LoggerFalso())
+            assert isinstance(servicio.sink, SQLiteAuditSink)
+            await _registrar(servicio, AuditAction.ORDER_CREATE, resource_type="order", resource_id="P1")
+            await _registrar(servicio, AuditAction.ORDER_UPDATE, resource_type="order", resource_id="P1")
+            await _registrar(servicio, AuditAction.LOGIN_FAILED, user_id="u2", success=False)
+
+            historial = await servicio.get_resource_history("order", "P1")
+            fallidos = await servicio.get_failed_actions(action_filter=[AuditAction.LOGIN_FAILED])
+            desde, hasta = datetime.utcnow() - timedelta(minutes=1), datetime.utcnow() + timedelta(minutes=1)
+            resumen = await servicio.generate_summary(desde, hasta)
+            await servicio.close()
+
+            # Otro proceso lee el mismo archivo
+            otro = AuditService(None, LoggerFalso())
+            actividad = await otro.get_user_activity("u1", desde, hasta)
+            await otro.close()
+            return historial, fallidos, resumen, actividad
+
+        historial, fallidos, resumen, actividad = asyncio.run(escenario())
+
+        assert [h.action for h in historial] == [AuditAction.ORDER_UPDATE, AuditAction.ORDER_CREATE]
+        assert [f.user_id for f in fallidos] == ["u2"]
+        assert resumen.total_events == 3 and resumen.failed_events == 1
+        assert resumen.events_by_user == {"u1": 2, "u2": 1}
+        assert len(actividad) == 2
+
+
+class TestDeteccionEnStreaming:
+    """Tests de sketches y alertas sin consultar historial"""
+
+    def test_count_min_nunca_subestima(self):
+        """Las estimaciones son >= al conteo real y cercanas para claves frecuentes"""
+        sketch = CountMinSketch(width=256, depth=4)
+        reales = {f"u{i}": (i % 7) + 1 for i in range(2000)}
+        reales["pesado"] = 500
+        for clave, n in reales.items():
+            for _ in range(n):
+                sketch.add(clave)
+
+        assert all(sketch.estimate(clave) >= n for clave, n in reales.items())
+        assert sketch.estimate("pesado") <= 500 * 1.1
+
+    def test_ventana_deslizante_de_logins_fallidos(self):
+        """Los fallos viejos salen de la ventana"""
+        reloj = Reloj()
+        contador = SlidingWindowCounter(window=3600, buckets=60, clock=reloj)
+        for _ in range(4):
+            contador.add("1.2.3.4")
+        reloj.ahora += 3000
+        assert contador.add("1.2.3.4") == 5
+        reloj.ahora += 700
+        assert contador.count("1.2.3.4") == 1
+
+    def test_alertas_sin_consultar_la_base(self):
+        """Fuerza bruta, exportación masiva e IP inusual se alertan una vez, sin leer Mongo"""
+        reloj = Reloj()
+        logger = LoggerFalso()
+
+        async def escenario():
+            servicio = AuditService(MongoFalso(), logger, detector=AnomalyDetector(clock=reloj))
+            for _ in range(7):
+                await _registrar(servicio, AuditAction.LOGIN_FAILED, ip="6.6.6.6", success=False)
+            for _ in range(10):
+                await _registrar(servicio, AuditAction.CUSTOMER_EXPORT, user_id="u3")
+            await _registrar(servicio, user_id="u3", ip="200.1.1.1")
+            anomalias = await servicio.detect_anomalies()
+            await servicio.close()
+            return anomalias
+
+        anomalias = asyncio.run(escenario())
+
+        assert logger.eventos("brute_force_detected") == [
+            {"event_type": "brute_force_detected", "ip_address": "6.6.6.6", "count": 5}
+        ]
+        assert [e["user_id"] for e in logger.eventos("mass_export_detected")] == ["u3"]
+        assert [e["ip_address"] for e in logger.eventos("unusual_ip_detected")] == ["200.1.1.1"]
+        assert {a["type"] for a in anomalias} == {"multiple_failed_logins", "mass_data_export", "unusual_ip"}
+
+        reloj.ahora += 2 * 86400
+        assert AnomalyDetector(clock=reloj).active_anomalies() == []
+
+
+@pytest.mark.slow
+class TestBenchmarkAuditoria:
+    """Ráfaga de eventos contra un Mongo con 2ms por viaje"""
+
+    def test_rafaga_de_5k_eventos(self):
+        """Latencia de log() y viajes a la base con el buffer"""
+        db = MongoFalso(latencia=0.002)
+
+        async def escenario():
+            servicio = AuditService(db, LoggerFalso(), batch_size=500, flush_interval=0.05)
+            inicio = time.perf_counter()
+            await asyncio.gather(*(_registrar(servicio, user_id=f"u{i % 50}", ip=f"10.0.{i % 20}.1") for i in range(5000)))
+            en_log = time.perf_counter() - inicio
+            await servicio.close()
+            return en_log, time.perf_counter() - inicio
+
+        en_log, total = asyncio.run(escenario())
+
+        viajes = len(db.audit_logs.lotes)
+        print(
+            f"\n5k eventos: log() {en_log / 5000 * 1e6:.0f}µs por evento, {total:.2f}s hasta persistir, "
+            f"{viajes} insert_many (antes: 5000 insert_one + 5000 agregaciones)"
+        )
+        assert sum(map(len, db.audit_logs.lotes)) == 5000
+        assert viajes <= 20
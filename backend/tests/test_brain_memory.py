@@ -0,0 +1,234 @@
+# backend/tests/test_brain_memory.py
+"""
+Tests para la memoria del cerebro (índices, búsqueda vectorizada y desalojo).
+"""
+
+import asyncio
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from brain.core.memory_store import SQLiteMemoryStore
+from brain.core.memory_system import BrainMemory, MemoryEntry
+
+
+def _evento(priority: str = 'normal', **data) -> SimpleNamespace:
+    return SimpleNamespace(type='shipment_delayed', data=data, priority=priority)
+
+
+async def _guardar(memoria: BrainMemory, priority: str = 'normal', **data) -> str:
+    return await memoria.store_event(_evento(priority, **data), {'decision': 'notificar'}, [{'success': True}])
+
+
+class TestBusquedaSimilares:
+    """Tests de find_similar sobre el índice vectorial"""
+
+    def test_ordena_por_similitud_y_filtra_umbral(self):
+        """Gana el evento que comparte más características; los lejanos no aparecen"""
+        async def escenario():
+            memoria = BrainMemory()
+            await _guardar(memoria, city='Bogotá', carrier='Servientrega', status='retraso')
+            await _guardar(memoria, city='Bogotá', carrier='Coordinadora', status='retraso')
+            await _guardar(memoria, city='Cali', carrier='TCC', status='entregado')
+            return await memoria.find_similar(
+                {'city': 'Bogotá', 'carrier': 'Servientrega', 'status': 'retraso'}
+            )
+
+        similares = asyncio.run(escenario())
+
+        assert [s['event_data']['carrier'] for s in similares] == ['Servientrega', 'Coordinadora']
+
+    def test_evento_en_ambas_memorias_aparece_una_vez(self):
+        """Un evento importante vive en short y long-term pero se indexa una sola vez"""
+        async def escenario():
+            memoria = BrainMemory()
+            await _guardar(memoria, priority='critical', city='Medellín', carrier='Envia')
+            similares = await memoria.find_similar({'city': 'Medellín', 'carrier': 'Envia'})
+            return memoria, similares
+
+        memoria, similares = asyncio.run(escenario())
+
+        assert len(memoria.long_term) == 1
+        assert len(similares) == 1
+        assert memoria.get_stats()['indexed_events'] == 1
+
+    def test_desalojo_de_short_term_sale_del_indice(self):
+        """Al llenarse short-term, el evento más viejo deja de ser encontrable"""
+        async def escenario():
+            memoria = BrainMemory(short_term_size=2)
+            for ciudad in ('Quito', 'Lima', 'Cali'):
+                await _guardar(memoria, priority='low', city=ciudad, carrier='DHL')
+            return memoria, await memoria.find_similar({'city': 'Quito', 'carrier': 'DHL'})
+
+        memoria, similares = asyncio.run(escenario())
+
+        assert len(memoria.event_index) == 2
+        assert all(s['event_data']['city'] != 'Quito' for s in similares)
+
+
+class TestIndicesYDesalojo:
+    """Tests de índices invertidos y desalojo por heap"""
+
+    def test_learnings_por_categoria(self):
+        """get_learnings usa los índices de tipo y tag"""
+        async def escenario():
+            memoria = BrainMemory()
+            await memoria.store_learning({'category': 'novedades', 'texto': 'a'})
+            await memoria.store_learning({'category': 'tiempos', 'texto': 'b'})
+            return await memoria.get_learnings(category='novedades')
+
+        assert [aprendizaje['texto'] for aprendizaje in asyncio.run(escenario())] == ['a']
+
+    def test_cleanup_desaloja_menor_importancia_decaida(self):
+        """Sale primero lo menos importante; un acceso reciente compensa el decaimiento"""
+        async def escenario():
+            memoria = BrainMemory(long_term_size=2)
+            hace_dias = datetime.now() - timedelta(days=3)
+            for entry_id, importancia in (('vieja', 0.9), ('media', 0.5), ('baja', 0.3)):
+                await memoria._store_long_term(MemoryEntry(
+                    id=entry_id, type='learning', content={}, importance=importancia,
+                    last_accessed=hace_dias
+                ))
+            # La más baja se usó recién: 3 días de decaimiento pesan más que 0.3 vs 0.9
+            memoria._touch(memoria.long_term['baja'])
+            removidas = await memoria.cleanup()
+            return memoria, removidas
+
+        memoria, removidas = asyncio.run(escenario())
+
+        assert removidas == 1
+        assert set(memoria.long_term) == {'vieja', 'baja'}
+        assert memoria.type_index['learning'] == {'vieja', 'baja'}
+
+
+class TestPersistencia:
+    """Tests del log de mutaciones, snapshots y workers compartiendo store"""
+
+    def test_arranque_en_caliente_reproduce_log(self, tmp_path):
+        """Un proceso nuevo recupera eventos y aprendizajes del log"""
+        ruta = tmp_path / "memoria.db"
+
+        async def escenario():
+            antes = BrainMemory(store=SQLiteMemoryStore(ruta))
+            await _guardar(antes, priority='critical', city='Bogotá', carrier='TCC')
+            await antes.store_learning({'category': 'novedades', 'texto': 'llamar antes de las 10'})
+
+            despues = BrainMemory(store=SQLiteMemoryStore(ruta))
+            cargadas = await despues.load()
+            return cargadas, despues, await despues.find_similar({'city': 'Bogotá', 'carrier': 'TCC'})
+
+        cargadas, despues, similares = asyncio.run(escenario())
+
+        assert cargadas == 2
+        assert len(similares) == 1
+        assert len(despues.short_term) == 1 and len(despues.long_term) == 2
+        assert asyncio.run(despues.get_learnings('novedades'))[0]['texto'] == 'llamar antes de las 10'
+
+    def test_snapshot_compacta_log(self, tmp_path):
+        """Al compactar, el log se trunca y el snapshot conserva los desalojos"""
+        ruta = tmp_path / "memoria.db"
+
+        async def escenario():
+            memoria = BrainMemory(long_term_size=2, store=SQLiteMemoryStore(ruta), snapshot_every=100)
+            for i in range(3):
+                await memoria.store_learning({'category': 'tiempos', 'texto': str(i)})
+            await memoria.cleanup()
+            await memoria.snapshot()
+
+            store = SQLiteMemoryStore(ruta)
+            _, pendientes = store.read_since(0)
+            nueva = BrainMemory(store=store)
+            await nueva.load()
+            return memoria, nueva, pendientes
+
+        memoria, nueva, pendientes = asyncio.run(escenario())
+
+        assert pendientes == []
+        assert set(nueva.long_term) == set(memoria.long_term)
+        assert len(nueva.long_term) == 2
+
+    def test_workers_comparten_store(self, tmp_path):
+        """Lo que escribe un worker lo ve otro al leer (read-through)"""
+        ruta = tmp_path / "memoria.db"
+
+        async def escenario():
+            a = BrainMemory(store=SQLiteMemoryStore(ruta), refresh_interval_seconds=0)
+            b = BrainMemory(store=SQLiteMemoryStore(ruta), refresh_interval_seconds=0)
+            await a.load()
+            await b.load()
+
+            await a.store_learning({'category': 'rutas', 'texto': 'de a'})
+            await b.snapshot()  # b compacta; a debe seguir viendo lo de b
+            await b.store_learning({'category': 'rutas', 'texto': 'de b'})
+
+            return (
+                sorted(aprendizaje['texto'] for aprendizaje in await a.get_learnings('rutas')),
+                sorted(aprendizaje['texto'] for aprendizaje in await b.get_learnings('rutas'))
+            )
+
+        vistos_a, vistos_b = asyncio.run(escenario())
+
+        assert vistos_a == vistos_b == ['de a', 'de b']
+
+
+def _find_similar_lineal(memoria: BrainMemory, query: dict, limit: int = 5) -> list:
+    """Implementación anterior: recorre todas las entradas y compara en Python"""
+    def similitud(f1, f2):
+        if not f1 or not f2:
+            return 0.0
+        total = len(set(f1) | set(f2))
+        return sum(1 for k in f1 if k in f2 and f1[k] == f2[k]) / total
+
+    features = memoria._extract_features(query)
+    similares = []
+    for entry in reversed(list(memoria.short_term)):
+        s = similitud(features, memoria._extract_features(entry.content.get('event_data', {})))
+        if s > 0.5:
+            similares.append((s, entry))
+    similares.sort(key=lambda x: x[0], reverse=True)
+    return [e.content for _, e in similares[:limit]]
+
+
+@pytest.mark.slow
+class TestBenchmarkMemoria:
+    """Latencia de find_similar con 100k memorias"""
+
+    def test_100k_memorias(self):
+        """La búsqueda vectorizada debe ser mucho más rápida que el recorrido lineal"""
+        ciudades = [f'ciudad-{i}' for i in range(50)]
+        transportadoras = ['Servientrega', 'Coordinadora', 'Envia', 'TCC', 'Deprisa']
+        estados = ['retraso', 'entregado', 'devuelto', 'en_ruta']
+
+        memoria = BrainMemory(short_term_size=100_000)
+        ahora = datetime.now()
+        for i in range(100_000):
+            data = {
+                'city': ciudades[i % 50],
+                'carrier': transportadoras[i % 5],
+                'status': estados[i % 4],
+                'guia': i
+            }
+            memoria._store_short_term(MemoryEntry(
+                id=f'e{i}', type='event', content={'event_data': data}, timestamp=ahora
+            ))
+
+        consultas = [
+            {'city': ciudades[i % 50], 'carrier': transportadoras[i % 5], 'status': estados[i % 4]}
+            for i in range(20)
+        ]
+
+        inicio = time.perf_counter()
+        for consulta in consultas:
+            _find_similar_lineal(memoria, consulta)
+        lineal = (time.perf_counter() - inicio) / len(consultas)
+
+        inicio = time.perf_counter()
+        for consulta in consultas:
+            memoria.search_cache.clear()
+            asyncio.run(memoria.find_similar(consulta))
+        vectorizado = (time.perf_counter() - inicio) / len(consultas)
+
+        print(f"\nlineal: {lineal * 1000:.1f} ms/consulta | vectorizado: {vectorizado * 1000:.2f} ms/consulta")
+        assert vectorizado * 10 < lineal
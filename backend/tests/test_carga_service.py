@@ -0,0 +1,134 @@
+# backend/tests/test_carga_service.py
+"""
+Tests para las stats incrementales y las consultas del servicio de cargas.
+"""
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from backend.models.carga_models import Base, Usuario, Carga, GuiaCargaCreate
+from backend.services.carga_service import CargaServiceDB
+
+import pytest
+
+
+@pytest.fixture
+def servicio():
+    """Servicio sobre SQLite en memoria con un usuario creado"""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    sesion = sessionmaker(bind=engine)()
+    sesion.add(Usuario(id="u1", email="ana@litper.co", nombre="Ana", password_hash="x"))
+    sesion.commit()
+
+    servicio = CargaServiceDB(sesion)
+    servicio.engine = engine
+    yield servicio
+    sesion.close()
+
+
+def _guia(numero, estado, transportadora="TCC", ciudad="Cali", dias=2, novedad=False):
+    return GuiaCargaCreate(
+        numero_guia=numero, estado=estado, transportadora=transportadora,
+        ciudad_destino=ciudad, dias_transito=dias, tiene_novedad=novedad
+    )
+
+
+def _stats(carga: Carga) -> dict:
+    return {
+        campo: getattr(carga, campo)
+        for campo in ("total_guias", "entregadas", "en_transito", "con_novedad", "devueltas",
+                      "porcentaje_entrega", "dias_promedio_transito",
+                      "stats_transportadoras", "stats_ciudades")
+    }
+
+
+class TestStatsIncrementales:
+    """Los deltas deben dejar las mismas stats que un recálculo completo"""
+
+    def test_agregar_actualizar_y_eliminar(self, servicio):
+        """Tras cada mutación las stats coinciden con la reconciliación"""
+        carga = servicio.crear_carga("u1")
+        servicio.agregar_guias(carga.id, [
+            _guia("G1", "Entregado", dias=3),
+            _guia("G2", "En tránsito", "COORDINADORA", "Bogotá", dias=1),
+            _guia("G3", "Devuelto", ciudad="Bogotá", dias=5),
+        ])
+
+        assert carga.total_guias == 3 and carga.entregadas == 1
+        assert carga.stats_transportadoras == {"TCC": 2, "COORDINADORA": 1}
+        assert carga.dias_promedio_transito == 3
+
+        g2 = next(g for g in servicio.obtener_guias_carga(carga.id) if g.numero_guia == "G2")
+        servicio.actualizar_guia(g2.id, {"estado": "Entregado", "transportadora": "TCC", "dias_transito": 4})
+        assert carga.entregadas == 2 and carga.en_transito == 0
+        assert carga.stats_transportadoras == {"TCC": 3}
+
+        g3 = next(g for g in servicio.obtener_guias_carga(carga.id) if g.numero_guia == "G3")
+        servicio.eliminar_guia(g3.id)
+        incremental = _stats(carga)
+
+        assert incremental["total_guias"] == 2 and incremental["devueltas"] == 0
+        assert incremental["stats_ciudades"] == {"Cali": 1, "Bogotá": 1}
+        assert servicio.recalcular_stats([carga.id]) == 0
+        assert _stats(carga) == incremental
+
+    def test_mover_guia_de_carga(self, servicio):
+        """Cambiar carga_id resta en la carga anterior y suma en la nueva"""
+        origen = servicio.crear_carga("u1")
+        destino = servicio.crear_carga("u1")
+        servicio.agregar_guias(origen.id, [_guia("G1", "Novedad", novedad=True)])
+
+        guia = servicio.obtener_guias_carga(origen.id)[0]
+        servicio.actualizar_guia(guia.id, {"carga_id": destino.id})
+
+        assert origen.total_guias == 0 and origen.stats_transportadoras == {}
+        assert destino.total_guias == 1 and destino.con_novedad == 1
+
+    def test_reconciliacion_corrige_deriva(self, servicio):
+        """El job reescribe las stats que no coinciden con las guías"""
+        carga = servicio.crear_carga("u1")
+        servicio.agregar_guias(carga.id, [_guia("G1", "Entregado"), _guia("G2", "Entregado")])
+        carga.entregadas = 7
+        carga.stats_ciudades = {"Pasto": 4}
+        servicio.db.commit()
+
+        assert servicio.recalcular_stats() == 1
+        assert carga.entregadas == 2 and carga.porcentaje_entrega == 100
+        assert carga.stats_ciudades == {"Cali": 2}
+
+
+class TestConsultasSinNMasUno:
+    """El historial y la búsqueda no consultan usuarios por carga"""
+
+    def test_historial_con_numero_constante_de_consultas(self, servicio):
+        """Con una o muchas cargas el historial hace la misma cantidad de consultas"""
+        consultas = []
+        event.listen(servicio.engine, "before_cursor_execute", lambda *args: consultas.append(args[2]))
+
+        def contar():
+            consultas.clear()
+            historial = servicio.obtener_historial()
+            return len(consultas), historial
+
+        servicio.crear_carga("u1")
+        pocas, _ = contar()
+        for _ in range(4):
+            servicio.crear_carga("u1")
+        muchas, historial = contar()
+
+        assert pocas == muchas
+        assert historial.total_cargas == 5
+        assert all(c.usuario_nombre == "Ana" for f in historial.fechas for c in f.cargas)
+
+    def test_buscar_guia_trae_carga_y_usuario(self, servicio):
+        """La búsqueda devuelve la carga y el nombre del usuario en una consulta"""
+        carga = servicio.crear_carga("u1")
+        servicio.agregar_guias(carga.id, [_guia("800123", "Entregado")])
+
+        resultados = servicio.buscar_guia("0012")
+
+        assert len(resultados) == 1
+        assert resultados[0]["carga"]["usuario_nombre"] == "Ana"
+        assert resultados[0]["carga"]["id"] == carga.id
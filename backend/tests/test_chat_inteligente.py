@@ -0,0 +1,186 @@
+# backend/tests/test_chat_inteligente.py
+"""
+Tests para el chat inteligente: detección de consultas, contexto y streaming.
+"""
+
+import asyncio
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+from sqlalchemy import create_engine
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import sessionmaker
+
+import chat_inteligente as modulo
+from chat_inteligente import ChatInteligente, TipoConsulta
+from database.models import GuiaHistorica
+from services.cache_service import cache_service
+
+
+class SesionFalsa:
+    """Sesión que cuenta las consultas y guarda lo agregado"""
+
+    def __init__(self, filas=None):
+        self.filas = filas or []
+        self.consultas = 0
+        self.agregados = []
+
+    def execute(self, consulta):
+        self.consultas += 1
+        return SimpleNamespace(all=lambda: self.filas)
+
+    def get_bind(self):
+        return SimpleNamespace(dialect=postgresql.dialect())
+
+    def add(self, objeto):
+        self.agregados.append(objeto)
+
+    def commit(self):
+        pass
+
+
+def _fila(transportadora=None, ciudad=None, todas_t=0, todas_c=0, total=0, entregadas=0, retraso=0, novedad=0, avg_dias=None):
+    return SimpleNamespace(
+        transportadora=transportadora, ciudad_destino=ciudad,
+        todas_transportadoras=todas_t, todas_ciudades=todas_c,
+        total=total, entregadas=entregadas, retraso=retraso, novedad=novedad, avg_dias=avg_dias
+    )
+
+
+class TestAnalizarPregunta:
+    """Tests del regex único de tipos de consulta"""
+
+    def test_prioridad_no_depende_de_la_posicion(self):
+        """La transportadora gana a 'retrasos' aunque aparezca después"""
+        tipo, parametros = ChatInteligente.analizar_pregunta(None, "retrasos de servientrega en cali")
+
+        assert tipo == TipoConsulta.CONSULTAR_TRANSPORTADORA
+        assert parametros == {'transportadora': 'SERVIENTREGA'}
+
+    def test_extrae_parametros_con_grupos_con_nombre(self):
+        """Número de guía, ciudad y días se extraen del grupo correspondiente"""
+        def analizar(texto):
+            return ChatInteligente.analizar_pregunta(None, texto)
+
+        assert analizar("estado de la guía 123456789012") == (
+            TipoConsulta.BUSCAR_GUIA, {'numero_guia': '123456789012'}
+        )
+        assert analizar("hacia barranquilla esta semana") == (
+            TipoConsulta.CONSULTAR_CIUDAD, {'ciudad': 'Barranquilla', 'periodo': 'semana'}
+        )
+        assert analizar("resumen de los últimos 5 días") == (TipoConsulta.CONSULTAR_PERIODO, {'dias': 5})
+        assert analizar("hola") == (TipoConsulta.ESTADISTICAS_GENERALES, {})
+
+
+class TestEstadisticasGenerales:
+    """Tests de la consulta agregada y su cache"""
+
+    def test_una_sola_consulta_con_filter_y_grouping_sets(self):
+        """El resumen general sale de un único SELECT"""
+        sql = str(ChatInteligente.consulta_estadisticas_generales().compile(dialect=postgresql.dialect()))
+
+        assert sql.count('SELECT') == 1
+        assert 'GROUPING SETS((), guias_historicas.transportadora, guias_historicas.ciudad_destino)' in sql
+        assert 'FILTER (WHERE guias_historicas.tiene_retraso)' in sql
+
+    def test_resumen_y_cache_por_tipo_de_contexto(self):
+        """Las filas de cada grouping set se reparten y la segunda pregunta no consulta la BD"""
+        cache_service.clear()
+        sesion = SesionFalsa([
+            _fila(todas_t=1, todas_c=1, total=10, entregadas=6, retraso=2, novedad=1, avg_dias=3.25),
+            _fila(transportadora='TCC', todas_c=1, total=3),
+            _fila(transportadora='COORDINADORA', todas_c=1, total=7),
+            _fila(transportadora=None, todas_c=1, total=0),
+            _fila(ciudad='Cali', todas_t=1, total=10),
+        ])
+        chat = ChatInteligente()
+
+        primero = chat.preparar_contexto(TipoConsulta.ESTADISTICAS_GENERALES, {}, sesion)
+        segundo = chat.preparar_contexto(TipoConsulta.ESTADISTICAS_GENERALES, {}, sesion)
+
+        datos = primero['datos']
+        assert datos['tasa_entrega'] == 60.0 and datos['promedio_dias_transito'] == 3.2
+        assert [t['nombre'] for t in datos['top_transportadoras']] == ['COORDINADORA', 'TCC']
+        assert datos['top_ciudades'] == [{'ciudad': 'Cali', 'total': 10}]
+        assert segundo is primero
+        assert sesion.consultas == 1
+        cache_service.clear()
+
+    def test_sqlite_sin_grouping_sets(self):
+        """En SQLite (desarrollo) el resumen y la consulta por ciudad se ejecutan sin GROUPING SETS"""
+        engine = create_engine("sqlite://")
+        GuiaHistorica.__table__.create(engine)
+        session = sessionmaker(bind=engine)()
+        guias = [
+            ("TCC", "Cali", "ENTREGADO", True, 2),
+            ("TCC", "Cali", "EN TRANSITO", False, 4),
+            ("COORDINADORA", "Cali", "ENTREGADO", False, 3),
+            ("COORDINADORA", "Pasto", "ENTREGADO", True, 7),
+        ]
+        session.add_all([
+            GuiaHistorica(numero_guia=str(i), transportadora=t, ciudad_destino=c, estatus=e,
+                          tiene_retraso=r, tiene_novedad=False, dias_transito=d)
+            for i, (t, c, e, r, d) in enumerate(guias)
+        ])
+        session.commit()
+        chat = ChatInteligente()
+
+        general = chat._obtener_estadisticas_generales(session)
+        cali = chat._consultar_ciudad("cali", session)
+        session.close()
+
+        assert 'error' not in general
+        assert (general['total_guias'], general['guias_entregadas'], general['guias_en_retraso']) == (4, 3, 2)
+        assert general['promedio_dias_transito'] == 4.0
+        assert sorted((t['nombre'], t['total']) for t in general['top_transportadoras']) == [('COORDINADORA', 2), ('TCC', 2)]
+        assert general['top_ciudades'] == [{'ciudad': 'Cali', 'total': 3}, {'ciudad': 'Pasto', 'total': 1}]
+        assert (cali['total_guias'], cali['entregas_exitosas'], cali['guias_retraso']) == (3, 2, 1)
+        assert sorted((t['nombre'], t['total']) for t in cali['por_transportadora']) == [('COORDINADORA', 1), ('TCC', 2)]
+
+
+class StreamFalso:
+    """Imita messages.stream de AsyncAnthropic"""
+
+    def __init__(self, partes):
+        self.partes = partes
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+    @property
+    async def text_stream(self):
+        for parte in self.partes:
+            yield parte
+
+    async def get_final_message(self):
+        return SimpleNamespace(usage=SimpleNamespace(input_tokens=20, output_tokens=5))
+
+
+class TestStreaming:
+    """Tests de la respuesta por SSE"""
+
+    def test_tokens_por_sse_y_conversacion_al_final(self, monkeypatch):
+        """Cada token es un evento y la conversación se guarda con el texto completo"""
+        sesion = SesionFalsa()
+
+        @contextmanager
+        def sesion_falsa():
+            yield sesion
+
+        monkeypatch.setattr(modulo, 'get_db_session', sesion_falsa)
+        chat = ChatInteligente()
+        chat.client = SimpleNamespace(messages=SimpleNamespace(stream=lambda **kw: StreamFalso(["Hay ", "3 ", "retrasos"])))
+
+        async def consumir():
+            return [e async for e in chat.responder_stream("hola", usar_contexto=False)]
+
+        eventos = asyncio.run(consumir())
+
+        assert [e.split('\n')[0] for e in eventos] == [
+            'event: contexto', 'event: token', 'event: token', 'event: token', 'event: fin'
+        ]
+        assert sesion.agregados[0].respuesta_ia == "Hay 3 retrasos"
+        assert sesion.agregados[0].tokens_usados == 25
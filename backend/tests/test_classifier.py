@@ -0,0 +1,144 @@
+# backend/tests/test_classifier.py
+"""
+Tests para el clasificador de contenido (matcher compilado + fallback a IA).
+"""
+
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from knowledge_system.classifier import ContentClassifier, KeywordMatcher
+
+
+class ClaudeFalso:
+    """Cliente mínimo con la forma de anthropic.Anthropic; cuenta las llamadas"""
+
+    def __init__(self, categoria: str = "Legal y Compliance"):
+        self.llamadas = 0
+        self.messages = self
+        self._respuesta = json.dumps({
+            'categoria': categoria,
+            'subcategoria': 'Contratos',
+            'tags': ['ia'],
+            'confianza': 0.9,
+            'razonamiento': 'respuesta del modelo',
+            'relevancia_litper': 7,
+            'aplicaciones': []
+        })
+
+    def create(self, **kwargs):
+        self.llamadas += 1
+        return SimpleNamespace(content=[SimpleNamespace(text=self._respuesta)])
+
+
+@pytest.fixture
+def clasificador():
+    classifier = ContentClassifier()
+    classifier.claude = None
+    return classifier
+
+
+class TestKeywordMatcher:
+    """Tests del matcher compilado"""
+
+    def test_ignora_tildes(self, clasificador):
+        """'envio' y 'envío', 'interrapidísimo' e 'interrapidisimo' deben coincidir igual"""
+        con_tilde = clasificador.matcher.puntuar("Envío por Interrapidísimo")
+        sin_tilde = clasificador.matcher.puntuar("envio por interrapidisimo")
+
+        assert con_tilde.categorias == sin_tilde.categorias
+        assert con_tilde.keywords['Logística'] == 2
+
+    def test_respeta_limites_de_palabra(self, clasificador):
+        """'ia' no debe coincidir dentro de 'guía' ni 'api' dentro de 'capital'"""
+        puntajes = clasificador.matcher.puntuar("La guía del capital de trabajo")
+
+        assert 'Tecnología' not in puntajes.categorias
+        assert puntajes.keywords['Logística'] == 1
+
+    def test_plurales_cuentan_como_la_keyword(self, clasificador):
+        """'envíos' y 'devoluciones' deben sumar como 'envío' y 'devolución'"""
+        plural = clasificador.matcher.puntuar("Envíos y devoluciones")
+        singular = clasificador.matcher.puntuar("Envío y devolución")
+
+        assert plural.categorias == singular.categorias
+        assert plural.keywords == singular.keywords and plural.keywords
+
+    def test_keywords_con_peso(self):
+        """Una keyword con peso alto pesa más que varias genéricas"""
+        matcher = KeywordMatcher({
+            'A': {'subcategorias': ['Uno'], 'keywords': [('dropshipping', 3.0)]},
+            'B': {'subcategorias': ['Dos'], 'keywords': ['tienda', 'cliente']},
+        })
+        puntajes = matcher.puntuar("dropshipping para la tienda de un cliente")
+
+        assert puntajes.categorias == {'A': 3.0, 'B': 2.0}
+
+
+class TestClasificacion:
+    """Tests del flujo reglas -> IA"""
+
+    def test_reglas_confiables_no_llaman_ia(self, clasificador):
+        """Si las reglas superan el umbral no se consulta al modelo"""
+        clasificador.claude = ClaudeFalso()
+        texto = "Tracking y rastreo de guías con Servientrega y Coordinadora. " * 3
+
+        resultado = asyncio.run(clasificador.clasificar("Tracking de envíos", texto))
+
+        assert resultado['categoria'] == 'Logística'
+        assert resultado['subcategoria'] == 'Tracking y Rastreo'
+        assert resultado['confianza'] >= clasificador.umbral_confianza
+        assert clasificador.claude.llamadas == 0
+
+    def test_reglas_ambiguas_usan_ia(self, clasificador):
+        """Con poca evidencia se delega al modelo"""
+        clasificador.claude = ClaudeFalso(categoria="Legal y Compliance")
+
+        resultado = asyncio.run(clasificador.clasificar("Notas", "Reunión sobre el contrato y el envío"))
+
+        assert resultado['categoria'] == 'Legal y Compliance'
+        assert clasificador.claude.llamadas == 1
+
+
+def _clasificar_con_subcadenas(taxonomia: dict, texto: str) -> dict:
+    """Implementación anterior: un `in` por keyword y categoría"""
+    texto_lower = texto.lower()
+    puntajes = {}
+    for categoria, info in taxonomia.items():
+        puntaje = 0
+        for keyword in info['keywords']:
+            termino = keyword if isinstance(keyword, str) else keyword[0]
+            if termino.lower() in texto_lower:
+                puntaje += 1
+        puntajes[categoria] = puntaje
+    return puntajes
+
+
+@pytest.mark.slow
+class TestBenchmarkMatcher:
+    """Compara el matcher compilado contra el recorrido por subcadenas"""
+
+    def test_documentos_grandes(self, clasificador):
+        """Una pasada con frecuencias y límites de palabra cuesta lo mismo que el `in` por keyword"""
+        parrafo = (
+            "La transportadora Servientrega reportó una novedad en la guía del pedido. "
+            "El proveedor de dropshipping actualizó el inventario en Shopify y la API "
+            "notificó al webhook. Se revisó el contrato de habeas data para Colombia. "
+        )
+        documentos = [parrafo * 400 for _ in range(20)]  # ~90 KB cada uno
+
+        inicio = time.perf_counter()
+        for doc in documentos:
+            _clasificar_con_subcadenas(clasificador.taxonomia, doc)
+        anterior = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        for doc in documentos:
+            clasificador.matcher.puntuar(doc)
+        compilado = time.perf_counter() - inicio
+
+        print(f"\nsubcadenas: {anterior * 1000:.1f} ms | matcher: {compilado * 1000:.1f} ms")
+        assert compilado < anterior * 2
@@ -0,0 +1,190 @@
+# backend/tests/test_document_parser.py
+"""
+Tests y benchmark del parser de documentos (streaming, fuera del event loop).
+"""
+
+import asyncio
+import resource
+import time
+import tracemalloc
+
+import pytest
+
+from knowledge_system.document_parser import BLOQUE_TEXTO_BYTES, DocumentParser
+
+
+# ==================== FIXTURES GENERADAS ====================
+
+def generar_pdf(ruta, paginas: int, lineas_por_pagina: int = 40):
+    """Escribe un PDF válido con texto en cada página (sin dependencias)"""
+    objetos = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # Pages, se completa al final
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    kids = []
+    for p in range(paginas):
+        lineas = [f"Pagina {p + 1} linea {i}: guia 2400{p:04d}{i:02d} en reparto" for i in range(lineas_por_pagina)]
+        texto = "".join(f"({linea}) Tj T* " for linea in lineas)
+        stream = f"BT /F1 9 Tf 11 TL 40 800 Td {texto}ET".encode()
+        objetos.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        objetos.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % len(objetos)
+        )
+        kids.append(f"{len(objetos)} 0 R")
+    objetos[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {paginas} >>".encode()
+
+    salida = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for n, obj in enumerate(objetos, start=1):
+        offsets.append(len(salida))
+        salida += b"%d 0 obj\n" % n + obj + b"\nendobj\n"
+    xref = len(salida)
+    salida += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objetos) + 1)
+    salida += b"".join(b"%010d 00000 n \n" % o for o in offsets)
+    salida += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objetos) + 1, xref)
+    ruta.write_bytes(bytes(salida))
+    return ruta
+
+
+def generar_csv(ruta, filas: int):
+    """Escribe un CSV de guías con `filas` filas de datos"""
+    with open(ruta, "w", encoding="utf-8") as f:
+        f.write("guia,transportadora,ciudad,estado\n")
+        for i in range(filas):
+            f.write(f"2400{i:08d},Servientrega,Bogotá,EN REPARTO\n")
+    return ruta
+
+
+async def _max_bloqueo_loop(corutina) -> tuple:
+    """Ejecuta la corutina midiendo el mayor retraso del event loop (segundos)"""
+    retraso = 0.0
+    activo = True
+
+    async def ticker():
+        nonlocal retraso
+        while activo:
+            antes = time.perf_counter()
+            await asyncio.sleep(0.005)
+            retraso = max(retraso, time.perf_counter() - antes - 0.005)
+
+    tarea = asyncio.create_task(ticker())
+    try:
+        resultado = await corutina
+    finally:
+        activo = False
+        await tarea
+    return resultado, retraso
+
+
+# ==================== TESTS ====================
+
+class TestStreaming:
+    """Tests del parseo por bloques"""
+
+    def test_csv_por_bloques_con_limite_de_filas(self, tmp_path):
+        """El CSV debe producirse en varios bloques y contar las filas omitidas"""
+        ruta = generar_csv(tmp_path / "guias.csv", 1500)
+        parser = DocumentParser()
+
+        async def run():
+            return [b async for b in parser.iterar(str(ruta))], await parser.parsear(str(ruta))
+
+        bloques, texto = asyncio.run(run())
+        assert len(bloques) > 1
+        assert texto.startswith("ENCABEZADOS: guia | transportadora | ciudad | estado")
+        assert texto.endswith("... y 500 filas más")
+        assert texto.count("Servientrega") == parser.max_filas
+
+    def test_texto_multibyte_entre_bloques(self, tmp_path):
+        """Un carácter multibyte partido entre trozos no debe corromperse"""
+        ruta = tmp_path / "notas.txt"
+        contenido = "a" * (BLOQUE_TEXTO_BYTES - 1) + "ñandú " * 1000
+        ruta.write_text(contenido, encoding="utf-8")
+
+        texto = asyncio.run(DocumentParser().parsear(str(ruta)))
+        assert texto == contenido.strip()
+
+    def test_limite_de_tamano(self, tmp_path):
+        """Archivos por encima del tamaño máximo se rechazan antes de leer"""
+        ruta = generar_csv(tmp_path / "grande.csv", 100)
+        parser = DocumentParser()
+        parser.max_file_size = 100
+
+        with pytest.raises(ValueError, match="muy grande"):
+            asyncio.run(parser.parsear(str(ruta)))
+
+
+class TestPDF:
+    """Tests del parseo de PDF página a página"""
+
+    def test_limite_de_paginas(self, tmp_path):
+        """Solo se extraen `max_paginas` páginas y se indica cuántas faltan"""
+        pytest.importorskip("PyPDF2")
+        ruta = generar_pdf(tmp_path / "manual.pdf", 12, lineas_por_pagina=3)
+        parser = DocumentParser()
+        parser.max_paginas = 10
+
+        texto = asyncio.run(parser.parsear(str(ruta)))
+        assert "[Página 10]" in texto and "[Página 11]" not in texto
+        assert texto.endswith("... y 2 páginas más (límite 10)")
+
+    def test_no_bloquea_el_event_loop(self, tmp_path):
+        """Parsear un PDF grande no debe congelar el event loop"""
+        pytest.importorskip("PyPDF2")
+        ruta = generar_pdf(tmp_path / "reporte.pdf", 300)
+
+        inicio = time.perf_counter()
+        texto, retraso = asyncio.run(_max_bloqueo_loop(DocumentParser().parsear(str(ruta))))
+        duracion = time.perf_counter() - inicio
+
+        assert "[Página 300]" in texto
+        # En el hilo del loop el retraso sería la duración completa del parseo
+        assert retraso < min(0.25, duracion / 3)
+
+
+@pytest.mark.slow
+class TestBenchmarkParser:
+    """Benchmark de throughput y memoria pico con documentos generados"""
+
+    def _medir(self, ruta) -> dict:
+        parser = DocumentParser()
+
+        async def consumir():
+            total = 0
+            async for bloque in parser.iterar(str(ruta)):
+                total += len(bloque)
+            return total
+
+        tracemalloc.start()
+        inicio = time.perf_counter()
+        caracteres, retraso = asyncio.run(_max_bloqueo_loop(consumir()))
+        duracion = time.perf_counter() - inicio
+        _, pico_python = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        return {
+            'mb_s': ruta.stat().st_size / 1024 / 1024 / duracion,
+            'caracteres': caracteres,
+            'pico_python_mb': pico_python / 1024 / 1024,
+            'rss_max_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            'retraso_loop_ms': retraso * 1000,
+        }
+
+    def test_benchmark_pdf_300_paginas(self, tmp_path):
+        pytest.importorskip("PyPDF2")
+        ruta = generar_pdf(tmp_path / "bench.pdf", 300)
+        r = self._medir(ruta)
+        print(f"\nPDF 300 págs: {r['mb_s']:.2f} MB/s, pico Python {r['pico_python_mb']:.1f} MB, "
+              f"RSS máx {r['rss_max_mb']:.0f} MB, retraso loop {r['retraso_loop_ms']:.1f} ms")
+        assert r['retraso_loop_ms'] < 100
+
+    def test_benchmark_csv_grande(self, tmp_path):
+        ruta = generar_csv(tmp_path / "bench.csv", 500_000)
+        r = self._medir(ruta)
+        print(f"\nCSV 500k filas ({ruta.stat().st_size / 1024 / 1024:.0f} MB): {r['mb_s']:.1f} MB/s, "
+              f"pico Python {r['pico_python_mb']:.1f} MB, RSS máx {r['rss_max_mb']:.0f} MB, "
+              f"retraso loop {r['retraso_loop_ms']:.1f} ms")
+        # Las filas más allá del límite solo se cuentan: la memoria no crece con el archivo
+        assert r['pico_python_mb'] < 5
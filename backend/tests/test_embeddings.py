@@ -0,0 +1,123 @@
+# backend/tests/test_embeddings.py
+"""
+Tests para el pipeline de embeddings del sistema de conocimiento.
+"""
+
+import asyncio
+import math
+import pytest
+
+from knowledge_system.embeddings import (
+    EmbeddingPipeline,
+    EmbeddingProvider,
+    HashingEmbeddingProvider,
+    dividir_en_chunks,
+    hash_texto,
+)
+
+
+class ProveedorContador(EmbeddingProvider):
+    """Proveedor de prueba que cuenta llamadas y textos"""
+
+    nombre = "contador"
+    max_lote = 100
+
+    def __init__(self, falla: bool = False):
+        self.falla = falla
+        self.llamadas = []
+
+    async def embed(self, textos):
+        if self.falla:
+            raise ConnectionError("proveedor caído")
+        self.llamadas.append(list(textos))
+        return [[float(len(t)), 1.0] for t in textos]
+
+
+def _texto(palabras: int) -> str:
+    return " ".join(f"palabra{i}" for i in range(palabras))
+
+
+class TestChunking:
+    """Tests de la división en chunks"""
+
+    def test_cubre_todo_el_documento_con_solapamiento(self):
+        """Los chunks deben cubrir el final del documento y solaparse"""
+        texto = _texto(3000)
+        chunks = dividir_en_chunks(texto, max_tokens=200, solapamiento=20)
+
+        assert len(chunks) > 1
+        assert all(c.tokens <= 200 for c in chunks)
+        assert chunks[-1].contenido.endswith("palabra2999")
+        assert chunks[1].contenido.split()[0] in chunks[0].contenido.split()
+
+    def test_hash_ignora_espacios_y_mayusculas(self):
+        """La clave de cache debe usar el texto normalizado"""
+        assert hash_texto("Envío  a\nBogotá ") == hash_texto("envío a bogotá")
+
+
+class TestProveedorHashing:
+    """Tests del proveedor local por hashing"""
+
+    def test_determinista_y_normalizado(self):
+        """El mismo texto debe producir el mismo vector unitario"""
+        async def run():
+            proveedor = HashingEmbeddingProvider(dimension=256)
+            return await proveedor.embed(["guía con novedad", "guía con novedad", "otra cosa"])
+
+        a, b, c = asyncio.run(run())
+        assert a == b
+        assert a != c
+        assert math.isclose(sum(v * v for v in a), 1.0)
+
+
+class TestPipeline:
+    """Tests del pipeline con lotes y cache"""
+
+    def test_un_solo_lote_y_pasajes_repetidos_gratis(self):
+        """Los chunks van en una llamada y los repetidos no se re-embeben"""
+        async def run():
+            proveedor = ProveedorContador()
+            pipeline = EmbeddingPipeline(proveedor, max_tokens=50, solapamiento=5)
+            texto = _texto(400)
+            primera = await pipeline.procesar(texto)
+            segunda = await pipeline.procesar(texto)
+            return proveedor, primera, segunda
+
+        proveedor, primera, segunda = asyncio.run(run())
+        assert len(proveedor.llamadas) == 1
+        assert len(proveedor.llamadas[0]) == len(primera)
+        assert [c.embedding for c in segunda] == [c.embedding for c in primera]
+
+    def test_reutiliza_vectores_persistidos(self):
+        """Los hashes ya guardados en BD no deben llegar al proveedor"""
+        async def run():
+            proveedor = ProveedorContador()
+            pipeline = EmbeddingPipeline(proveedor)
+            guardado = hash_texto("texto ya importado")
+
+            async def buscar(modelo, hashes):
+                return {guardado: [9.0, 9.0]} if guardado in hashes else {}
+
+            chunks = await pipeline.procesar("texto ya importado", buscar_persistidos=buscar)
+            return proveedor, chunks
+
+        proveedor, chunks = asyncio.run(run())
+        assert proveedor.llamadas == []
+        assert chunks[0].embedding == [9.0, 9.0]
+
+    def test_fallo_usa_respaldo_y_nunca_vectores_en_cero(self):
+        """Con respaldo se degrada al hashing local; sin respaldo se propaga el error"""
+        async def run():
+            con_respaldo = EmbeddingPipeline(
+                ProveedorContador(falla=True), respaldo=HashingEmbeddingProvider(dimension=64)
+            )
+            chunks = await con_respaldo.procesar("guía 123 en reparto")
+
+            sin_respaldo = EmbeddingPipeline(ProveedorContador(falla=True))
+            with pytest.raises(ConnectionError):
+                await sin_respaldo.procesar("guía 123 en reparto")
+            return chunks
+
+        chunks = asyncio.run(run())
+        assert chunks[0].modelo == "hashing-64"
+        assert any(v != 0 for v in chunks[0].embedding)
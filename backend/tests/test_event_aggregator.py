@@ -0,0 +1,138 @@
+# backend/tests/test_event_aggregator.py
+"""
+Tests para el agregador de eventos del cerebro (micro-batching y fan-out).
+"""
+
+import asyncio
+from dataclasses import dataclass, field
+from typing import Any, Dict
+
+from brain.core.event_aggregator import EventAggregator
+
+
+@dataclass
+class Evento:
+    """Evento con la forma de BrainEvent"""
+    id: str
+    type: str
+    data: Dict[str, Any] = field(default_factory=dict)
+    priority: str = "normal"
+
+
+class ProcesadorFalso:
+    """Procesador de grupos que registra cada grupo recibido"""
+
+    def __init__(self):
+        self.grupos = []
+
+    async def __call__(self, group):
+        self.grupos.append(group)
+        return {
+            e.id: {
+                'event_id': e.id,
+                'decision': group.rule_decisions.get(e.id) or {'grupo': len(group.events)},
+                'success': True
+            }
+            for e in group.events
+        }
+
+
+def _retraso(i: int, guia: str) -> Evento:
+    return Evento(f"evt_{i}", 'shipment_delayed', {'guia': guia, 'dias': i})
+
+
+class TestMicroBatching:
+    """Tests de agrupación por tipo y entidad"""
+
+    def test_rafaga_se_resuelve_con_un_grupo_por_tipo(self):
+        """Diez retrasos y dos consultas en la ventana -> dos grupos, cada evento con su resultado"""
+        procesador = ProcesadorFalso()
+        agregador = EventAggregator(procesador, max_wait_ms=20, max_items=50)
+
+        async def escenario():
+            eventos = [_retraso(i, f"G{i % 3}") for i in range(10)]
+            eventos += [Evento(f"q_{i}", 'customer_query', {'phone': f"300{i}"}) for i in range(2)]
+            return eventos, await asyncio.gather(*(agregador.process(e) for e in eventos))
+
+        eventos, resultados = asyncio.run(escenario())
+
+        assert sorted(g.event_type for g in procesador.grupos) == ['customer_query', 'shipment_delayed']
+        assert [r['event_id'] for r in resultados] == [e.id for e in eventos]
+        retrasos = next(g for g in procesador.grupos if g.event_type == 'shipment_delayed')
+        assert set(retrasos.by_entity) == {'guia:G0', 'guia:G1', 'guia:G2'}
+
+    def test_max_items_dispara_sin_esperar_la_ventana(self):
+        """Al llegar a max_items el lote sale aunque la ventana sea larga"""
+        procesador = ProcesadorFalso()
+        agregador = EventAggregator(procesador, max_wait_ms=10_000, max_items=4)
+
+        async def escenario():
+            return await asyncio.wait_for(
+                asyncio.gather(*(agregador.process(_retraso(i, f"G{i}")) for i in range(4))),
+                timeout=1
+            )
+
+        assert len(asyncio.run(escenario())) == 4
+        assert agregador.stats['flushes'] == 1
+
+    def test_entidad_no_se_parte_entre_grupos(self):
+        """Los eventos de una misma guía quedan en el mismo prompt"""
+        procesador = ProcesadorFalso()
+        agregador = EventAggregator(procesador, max_wait_ms=10_000, max_items=3)
+
+        eventos = [_retraso(0, "A"), _retraso(1, "B"), _retraso(2, "B"), _retraso(3, "B")]
+        grupos = agregador._group(eventos)
+
+        assert [[e.data['guia'] for e in g.events] for g in grupos] == [['A'], ['B', 'B', 'B']]
+
+
+class TestReglasYPrioridad:
+    """Tests de eventos que no pasan por el LLM o no esperan"""
+
+    def test_eventos_rutinarios_se_resuelven_por_reglas(self):
+        """order_created y estados rutinarios llegan con decisión de regla"""
+        procesador = ProcesadorFalso()
+        agregador = EventAggregator(procesador, max_wait_ms=10)
+
+        async def escenario():
+            return await asyncio.gather(
+                agregador.process(Evento("e1", 'order_created', {'order_id': 1})),
+                agregador.process(Evento("e2", 'order_status_changed', {'guia': 'X', 'status': 'en_reparto'})),
+                agregador.process(Evento("e3", 'order_status_changed', {'guia': 'Y', 'status': 'novedad'})),
+            )
+
+        creado, rutinario, novedad = asyncio.run(escenario())
+
+        assert creado['decision']['handled_by'] == 'rule'
+        assert rutinario['decision']['handled_by'] == 'rule'
+        assert 'handled_by' not in novedad['decision']
+        assert agregador.stats['rule_handled'] == 2
+
+    def test_evento_critico_no_espera_la_ventana(self):
+        """Un evento crítico se procesa solo y de inmediato"""
+        procesador = ProcesadorFalso()
+        agregador = EventAggregator(procesador, max_wait_ms=10_000)
+
+        async def escenario():
+            agregador.submit(_retraso(0, "A"))
+            critico = Evento("c1", 'shipment_delayed', {'guia': 'B'}, priority='critical')
+            return await asyncio.wait_for(agregador.process(critico), timeout=1)
+
+        resultado = asyncio.run(escenario())
+
+        assert resultado['event_id'] == "c1"
+        assert [len(g.events) for g in procesador.grupos] == [1]
+
+    def test_error_del_procesador_llega_a_cada_evento(self):
+        """Si el grupo falla, cada llamador recibe un resultado con error"""
+        async def falla(group):
+            raise RuntimeError("sin modelo")
+
+        agregador = EventAggregator(falla, max_wait_ms=5)
+
+        async def escenario():
+            return await asyncio.gather(*(agregador.process(_retraso(i, "A")) for i in range(3)))
+
+        resultados = asyncio.run(escenario())
+
+        assert all(not r['success'] and r['error'] == "sin modelo" for r in resultados)
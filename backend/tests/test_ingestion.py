@@ -0,0 +1,172 @@
+# backend/tests/test_ingestion.py
+"""
+Tests para el runner de ingesta por lotes del sistema de conocimiento.
+"""
+
+import asyncio
+
+from knowledge_system.embeddings import EmbeddingPipeline, HashingEmbeddingProvider
+from knowledge_system.ingestion import IngestionRunner
+from knowledge_system.retrieval import IndiceMemoria
+
+
+class KnowledgeManagerFalso:
+    """KnowledgeManager mínimo en memoria que registra las llamadas por etapa"""
+
+    def __init__(self, fallos_guardado: int = 0, demora: float = 0.0, fallos_consulta: int = 0):
+        self.embeddings = EmbeddingPipeline(HashingEmbeddingProvider(dimension=64))
+        self.indice = IndiceMemoria()
+        self.llamadas = {'extraccion': 0, 'analisis': 0, 'embeddings': 0, 'guardado': 0}
+        self.fallos_guardado = fallos_guardado
+        self.fallos_consulta = fallos_consulta
+        self.demora = demora
+        self.extrayendo = 0
+        self.max_extrayendo = 0
+        self._web_scraper = None
+        self._document_parser = None
+
+    def _generar_hash(self, fuente):
+        return f"hash-{fuente}"
+
+    async def _existe_en_db(self, hash_fuente):
+        if self.fallos_consulta:
+            self.fallos_consulta -= 1
+            raise ConnectionError("BD no responde")
+        return self.indice.buscar_por_hash(hash_fuente) is not None
+
+    async def _procesar_fuente(self, fuente, tipo, opciones):
+        self.llamadas['extraccion'] += 1
+        self.extrayendo += 1
+        self.max_extrayendo = max(self.max_extrayendo, self.extrayendo)
+        await asyncio.sleep(self.demora)
+        self.extrayendo -= 1
+        if "vacia" in fuente:
+            return ""
+        return f"Contenido de {fuente} sobre envíos y novedades de transportadoras en Colombia."
+
+    async def analizar_contenido(self, contenido, fuente):
+        self.llamadas['analisis'] += 1
+        return {
+            'info': {'titulo': fuente, 'contenido': contenido, 'resumen': contenido[:50]},
+            'clasificacion': {'categoria': 'Logística', 'subcategoria': None, 'tags': []}
+        }
+
+    async def generar_chunks(self, contenido):
+        self.llamadas['embeddings'] += 1
+        return await self.embeddings.procesar(contenido)
+
+    async def guardar_conocimiento(self, hash_fuente, tipo, fuente, analisis, chunks, metadata=None):
+        self.llamadas['guardado'] += 1
+        if self.fallos_guardado:
+            self.fallos_guardado -= 1
+            raise RuntimeError("BD caída")
+        doc_id = self.indice.agregar({'hash_fuente': hash_fuente, 'titulo': fuente}, chunks)
+        return {'success': True, 'id': doc_id, 'titulo': fuente, 'chunks': len(chunks)}
+
+
+def _runner(km, **kwargs) -> IngestionRunner:
+    kwargs.setdefault('espera_reintento', 0)
+    return IngestionRunner(km, **kwargs)
+
+
+class TestIngestionRunner:
+    """Tests del runner de ingesta"""
+
+    def test_lote_con_progreso_por_item(self):
+        """El job debe reportar estado por item, incluidos duplicados y fallidos"""
+        async def run():
+            km = KnowledgeManagerFalso()
+            runner = _runner(km, max_reintentos=0)
+            job_id = await runner.enviar([
+                {'fuente': 'https://a.com', 'tipo': 'web'},
+                {'fuente': 'https://b.com', 'tipo': 'web'},
+                {'fuente': 'https://a.com', 'tipo': 'web'},
+                {'fuente': 'https://vacia.com', 'tipo': 'web'},
+            ])
+            return await runner.esperar(job_id)
+
+        progreso = asyncio.run(run())
+        assert progreso['estado'] == 'completado_con_errores'
+        assert (progreso['completados'], progreso['duplicados'], progreso['fallidos']) == (2, 1, 1)
+        assert progreso['progreso'] == 100.0
+        fallido = progreso['items'][3]
+        assert fallido['etapa'] == 'extraccion' and 'corto' in fallido['error']
+
+    def test_concurrencia_acotada_por_tipo(self):
+        """Las extracciones web simultáneas no deben superar el límite del tipo"""
+        async def run():
+            km = KnowledgeManagerFalso(demora=0.02)
+            runner = _runner(km, limites_extraccion={'web': 3})
+            job_id = await runner.enviar([{'fuente': f'https://{i}.com', 'tipo': 'web'} for i in range(12)])
+            await runner.esperar(job_id)
+            return km
+
+        km = asyncio.run(run())
+        assert km.max_extrayendo == 3
+        assert km.llamadas['guardado'] == 12
+
+    def test_reintento_no_repite_etapas_completadas(self):
+        """Un fallo al guardar debe reintentarse sin volver a extraer ni embeber"""
+        async def run():
+            km = KnowledgeManagerFalso(fallos_guardado=2)
+            runner = _runner(km, max_reintentos=1)
+            job_id = await runner.enviar([{'fuente': 'https://a.com', 'tipo': 'web'}])
+            primero = await runner.esperar(job_id)
+            relanzados = await runner.reintentar(job_id)
+            final = await runner.esperar(job_id)
+            return km, primero, relanzados, final
+
+        km, primero, relanzados, final = asyncio.run(run())
+        assert primero['fallidos'] == 1 and primero['items'][0]['etapa'] == 'guardado'
+        assert relanzados == 1
+        assert final['completados'] == 1
+        assert km.llamadas == {'extraccion': 1, 'analisis': 1, 'embeddings': 1, 'guardado': 3}
+
+    def test_repetido_del_lote_toma_el_lugar_del_que_falla(self):
+        """Si la primera copia falla, la repetida se procesa en vez de quedar como duplicado"""
+        async def run():
+            km = KnowledgeManagerFalso(fallos_guardado=1)
+            runner = _runner(km, max_reintentos=0)
+            job_id = await runner.enviar([{'fuente': 'https://a.com', 'tipo': 'web'}] * 3)
+            return await runner.esperar(job_id)
+
+        final = asyncio.run(run())
+        assert [i['estado'] for i in final['items']] == ['fallido', 'completado', 'duplicado']
+
+    def test_fallo_al_consultar_la_bd_no_marca_duplicado(self):
+        """Un reintento tras fallar _existe_en_db vuelve a consultar y guarda el item"""
+        async def run():
+            km = KnowledgeManagerFalso(fallos_consulta=1)
+            runner = _runner(km, max_reintentos=1)
+            job_id = await runner.enviar([{'fuente': 'https://a.com', 'tipo': 'web'}])
+            return km, await runner.esperar(job_id)
+
+        km, final = asyncio.run(run())
+        assert final['completados'] == 1 and final['duplicados'] == 0
+        assert km.llamadas['guardado'] == 1
+
+
+class TestRutaIngesta:
+    """Tests del endpoint /admin/ingest"""
+
+    def test_rechaza_rutas_de_archivo_del_servidor(self, monkeypatch):
+        """archivo y documento leerían cualquier ruta: el endpoint responde 400 sin encolar"""
+        from fastapi import FastAPI
+        from fastapi.testclient import TestClient
+        from knowledge_system import admin_routes, ingestion
+
+        def sin_runner():
+            raise AssertionError("no debe crear el job")
+
+        monkeypatch.setattr(ingestion, 'get_ingestion_runner', sin_runner)
+        app = FastAPI()
+        app.include_router(admin_routes.router)
+        app.dependency_overrides[admin_routes.verificar_token] = lambda: True
+
+        for tipo in ('archivo', 'documento'):
+            respuesta = TestClient(app).post('/admin/ingest', json={'fuentes': [
+                {'fuente': 'https://a.com', 'tipo': 'web'},
+                {'fuente': '/etc/passwd', 'tipo': tipo},
+            ]})
+            assert respuesta.status_code == 400
+            assert tipo in respuesta.json()['detail']
@@ -0,0 +1,125 @@
+# backend/tests/test_llm_call_layer.py
+"""
+Tests para la capa de llamadas al LLM del cerebro (cache, coalescing, presupuesto).
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from brain.claude.call_layer import BudgetExceededError, LLMCallLayer, semantic_key
+
+
+class ClienteFalso:
+    """Cliente con la forma de AsyncAnthropic que registra cada llamada"""
+
+    def __init__(self, demora: float = 0.0, tokens: int = 100):
+        self.llamadas = []
+        self.demora = demora
+        self.tokens = tokens
+        self.messages = self
+
+    async def create(self, **kwargs):
+        self.llamadas.append(kwargs)
+        await asyncio.sleep(self.demora)
+        return SimpleNamespace(
+            content=[SimpleNamespace(type='text', text='{"decision": "esperar"}')],
+            usage=SimpleNamespace(input_tokens=self.tokens, output_tokens=self.tokens)
+        )
+
+
+class Reloj:
+    """Reloj manual para TTL y recarga del bucket"""
+
+    def __init__(self):
+        self.ahora = 0.0
+
+    def __call__(self) -> float:
+        return self.ahora
+
+
+def _request(texto: str, system: str = "Eres el cerebro") -> dict:
+    return {
+        'model': 'modelo-test',
+        'max_tokens': 256,
+        'system': LLMCallLayer.system_blocks(system),
+        'messages': [{'role': 'user', 'content': texto}]
+    }
+
+
+class TestCacheYCoalescing:
+    """Tests de reutilización de respuestas"""
+
+    def test_prompt_normalizado_usa_cache_hasta_ttl(self):
+        """Espacios y timestamps distintos no cuentan; tras el TTL se vuelve a llamar"""
+        cliente, reloj = ClienteFalso(), Reloj()
+        capa = LLMCallLayer(cliente, cache_ttl_seconds=60, clock=reloj)
+
+        async def escenario():
+            fuentes = [
+                (await capa.create(_request("Guía 123 retrasada\n  desde 2026-10-19T08:00:00"))).source,
+                (await capa.create(_request("Guía 123 retrasada desde 2026-10-19T09:30:12.5"))).source,
+            ]
+            reloj.ahora = 61
+            fuentes.append((await capa.create(_request("Guía 123 retrasada desde 2026-10-19T10:00:00"))).source)
+            return fuentes
+
+        assert asyncio.run(escenario()) == ['api', 'cache', 'api']
+        assert len(cliente.llamadas) == 2
+
+    def test_prompts_identicos_en_vuelo_comparten_llamada(self):
+        """Diez llamadas concurrentes iguales producen una sola llamada real"""
+        cliente = ClienteFalso(demora=0.05)
+        capa = LLMCallLayer(cliente)
+
+        async def escenario():
+            return await asyncio.gather(*[capa.create(_request("misma pregunta")) for _ in range(10)])
+
+        resultados = asyncio.run(escenario())
+
+        assert len(cliente.llamadas) == 1
+        assert sorted(r.source for r in resultados) == ['api'] + ['coalesced'] * 9
+
+    def test_clave_semantica_ignora_campos_volatiles(self):
+        """Mismo tipo y misma guía en el mismo estado -> misma clave"""
+        a = semantic_key('shipment_delayed', {'guia': '123', 'estado': 'retraso', 'timestamp': 1})
+        b = semantic_key('shipment_delayed', {'guia': '123', 'estado': 'retraso', 'timestamp': 2})
+        c = semantic_key('shipment_delayed', {'guia': '123', 'estado': 'entregado', 'timestamp': 2})
+
+        assert a == b != c
+
+    def test_system_prompt_estatico_marcado_para_prompt_caching(self):
+        """El system se envía como bloque con cache_control"""
+        cliente = ClienteFalso()
+        asyncio.run(LLMCallLayer(cliente).create(_request("hola")))
+
+        system = cliente.llamadas[0]['system']
+        assert system[0]['cache_control'] == {'type': 'ephemeral'}
+
+
+class TestPresupuesto:
+    """Tests del token bucket con descarte por prioridad"""
+
+    def test_descarta_baja_prioridad_primero(self):
+        """Con el bucket casi vacío se descarta 'low' pero 'critical' pasa"""
+        cliente, reloj = ClienteFalso(tokens=400), Reloj()
+        capa = LLMCallLayer(cliente, tokens_per_hour=3600, clock=reloj)
+
+        async def escenario():
+            await capa.create(_request("primera"), priority='normal')
+            await capa.create(_request("segunda"), priority='normal')
+            with pytest.raises(BudgetExceededError):
+                await capa.create(_request("tercera"), priority='low')
+            critica = await capa.create(_request("cuarta"), priority='critical')
+
+            # Una hora después el bucket se recupera
+            reloj.ahora = 3600
+            baja = await capa.create(_request("quinta"), priority='low')
+            return critica, baja
+
+        critica, baja = asyncio.run(escenario())
+
+        assert critica.source == baja.source == 'api'
+        assert capa.metrics['shed'] == 1
+        assert len(cliente.llamadas) == 4
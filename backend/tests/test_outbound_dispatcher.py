@@ -0,0 +1,204 @@
+# backend/tests/test_outbound_dispatcher.py
+"""
+Tests para el despachador de mensajes salientes contra un proveedor falso local.
+"""
+
+import asyncio
+import time
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from integrations.chatea_pro import ChateaProClient, ChateaProConfig
+from services.outbound_dispatcher import DeliveryStatus, OutboundDispatcher, ProviderPolicy
+from services.push_service import PushNotificationService
+from services.whatsapp_service import WhatsAppProvider, WhatsAppService
+
+
+class ProveedorFalso:
+    """
+    Servidor HTTP local que imita a un proveedor de mensajería.
+
+    Según el final del teléfono responde 429 (una vez, con Retry-After),
+    400, 500 o 200; registra concurrencia máxima y hora de cada intento.
+    """
+
+    def __init__(self, retry_after="0.2"):
+        self.retry_after = retry_after
+        self.intentos = {}
+        self.en_vuelo = 0
+        self.max_en_vuelo = 0
+        self.server = None
+
+    async def _responder(self, request):
+        data = await request.json()
+        telefono = data.get("to") or data["data"]["phone"]
+        self.intentos.setdefault(telefono, []).append(time.monotonic())
+
+        self.en_vuelo += 1
+        self.max_en_vuelo = max(self.max_en_vuelo, self.en_vuelo)
+        await asyncio.sleep(0.01)
+        self.en_vuelo -= 1
+
+        if telefono.endswith("429") and len(self.intentos[telefono]) == 1:
+            return web.Response(status=429, text="rate limited", headers={"Retry-After": self.retry_after})
+        if telefono.endswith("400"):
+            return web.Response(status=400, text="numero invalido")
+        if telefono.endswith("500"):
+            return web.Response(status=500, text="caido")
+        return web.json_response({"messages": [{"id": f"wamid.{telefono}"}]})
+
+    async def __aenter__(self):
+        app = web.Application()
+        app.router.add_post("/{ruta:.*}", self._responder)
+        self.server = TestServer(app)
+        await self.server.start_server()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.server.close()
+
+    def url(self, ruta=""):
+        return str(self.server.make_url(f"/{ruta}")).rstrip("/")
+
+
+def _politica(**kwargs):
+    valores = dict(concurrency=5, rate=1000, burst=1000, max_attempts=3, base_delay=0.01, max_delay=1)
+    valores.update(kwargs)
+    return ProviderPolicy(**valores)
+
+
+class TestWhatsAppMasivo:
+    """Tests del envío masivo de WhatsApp por el despachador"""
+
+    def test_campana_con_errores_no_frena_al_resto(self):
+        """Concurrencia acotada, Retry-After respetado y estado por destinatario"""
+        async def escenario():
+            async with ProveedorFalso() as proveedor:
+                servicio = WhatsAppService()
+                meta = servicio.providers[WhatsAppProvider.META_OFFICIAL]
+                meta.access_token, meta.phone_number_id, meta.API_URL = "token", "numero", proveedor.url()
+                servicio.active_provider = WhatsAppProvider.META_OFFICIAL
+                servicio.dispatcher = OutboundDispatcher({"whatsapp": _politica()})
+
+                contactos = [{"phone": f"57300{i:07d}", "nombre": "Ana", "guia": f"G{i}"} for i in range(20)]
+                contactos += [{"phone": f"573001112{s}", "nombre": "Ana", "guia": s} for s in ("429", "400", "500")]
+                resultados = await servicio.send_bulk_messages(contactos, "RESCUE_CONTACT")
+                return proveedor, servicio.dispatcher, resultados
+
+        proveedor, despachador, resultados = asyncio.run(escenario())
+
+        assert sum(r.success for r in resultados) == 21
+        assert 1 < proveedor.max_en_vuelo <= 5
+        assert len(proveedor.intentos["573001112400"]) == 1
+        assert len(proveedor.intentos["573001112500"]) == 3
+        primero, segundo = proveedor.intentos["573001112429"]
+        assert segundo - primero >= 0.2
+        assert despachador.stats["failed"] == 2 and despachador.stats["retries"] == 3
+
+
+class TestDespachador:
+    """Tests de límites y limpieza de destinatarios"""
+
+    def test_token_bucket_limita_la_tasa(self):
+        """Con 20 envíos/s y ráfaga 1, diez envíos tardan ~0.45s"""
+        despachador = OutboundDispatcher({"lento": _politica(rate=20, burst=1)})
+
+        async def enviar(destinatario):
+            return {"success": True, "message_id": destinatario}
+
+        reporte = asyncio.run(despachador.dispatch("lento", [str(i) for i in range(10)], enviar))
+
+        assert reporte.sent == 10
+        assert reporte.duration_seconds >= 0.4
+
+    def test_sin_codigo_http_solo_reintenta_errores_de_transporte(self):
+        """Un proveedor no configurado falla al primer intento; una conexión caída se reintenta"""
+        despachador = OutboundDispatcher({"x": _politica()})
+        intentos = {"config": 0, "red": 0}
+
+        async def enviar(destinatario):
+            intentos[destinatario] += 1
+            if destinatario == "config":
+                return {"success": False, "error": "Proveedor no disponible"}
+            raise ConnectionError("conexión rechazada")
+
+        reporte = asyncio.run(despachador.dispatch("x", ["config", "red"], enviar))
+
+        assert reporte.failed == 2
+        assert intentos == {"config": 1, "red": 3}
+
+    def test_suscripciones_push_muertas_se_eliminan(self):
+        """Las suscripciones que responden 410/404 salen del almacén y del reintento"""
+        servicio = PushNotificationService()
+        servicio.dispatcher = OutboundDispatcher({"push": _politica()})
+        servicio.is_available = lambda: True
+        suscripciones = {f"https://push/{i}": {"endpoint": f"https://push/{i}"} for i in range(5)}
+        servicio.on_subscription_gone = lambda endpoint: suscripciones.pop(endpoint)
+        llamadas = []
+
+        async def enviar(info, payload):
+            llamadas.append(info["endpoint"])
+            if info["endpoint"].endswith(("1", "3")):
+                return {"success": False, "error": "expired", "status_code": 410}
+            return {"success": True}
+
+        servicio.send_notification = enviar
+        resultado = asyncio.run(servicio.broadcast_notification(list(suscripciones.values()), {"title": "x"}))
+
+        assert resultado["success"] == 3 and resultado["failed"] == 2
+        assert sorted(resultado["expired"]) == ["https://push/1", "https://push/3"]
+        assert sorted(suscripciones) == ["https://push/0", "https://push/2", "https://push/4"]
+        assert len(llamadas) == 5
+
+    def test_push_410_de_webpush_se_clasifica_como_gone(self, monkeypatch):
+        """Un WebPushException con respuesta 410 (falsy, como requests.Response) elimina la suscripción"""
+        from services import push_service as modulo
+
+        class RespuestaFalsa:
+            status_code = 410
+            headers = {}
+
+            def __bool__(self):  # igual que requests.Response: False si no es 2xx/3xx
+                return False
+
+        class WebPushExceptionFalsa(Exception):
+            def __init__(self, mensaje, response=None):
+                super().__init__(mensaje)
+                self.response = response
+
+        def webpush(**kwargs):
+            raise WebPushExceptionFalsa("Push failed: 410 Gone", response=RespuestaFalsa())
+
+        monkeypatch.setattr(modulo, "webpush", webpush, raising=False)
+        monkeypatch.setattr(modulo, "WebPushException", WebPushExceptionFalsa, raising=False)
+
+        servicio = PushNotificationService()
+        servicio.dispatcher = OutboundDispatcher({"push": _politica()})
+        servicio.is_available = lambda: True
+        eliminadas = []
+        servicio.on_subscription_gone = eliminadas.append
+
+        resultado = asyncio.run(servicio.broadcast_notification([{"endpoint": "https://push/x"}], {"title": "x"}))
+
+        assert resultado["expired"] == ["https://push/x"]
+        assert eliminadas == ["https://push/x"]
+
+    def test_chatea_pro_reintenta_y_reporta(self):
+        """El envío masivo por Chatea Pro reintenta el 429 y reporta cada teléfono"""
+        async def escenario():
+            async with ProveedorFalso(retry_after="0") as proveedor:
+                cliente = ChateaProClient(ChateaProConfig(api_key="k", webhook_url=proveedor.url("webhook")))
+                mensajes = [{"phone": p, "message": "hola"} for p in ("573000000001", "573000000429", "573000000400")]
+                reporte = await cliente.send_bulk_messages(mensajes, OutboundDispatcher({"chatea_pro": _politica()}))
+                await cliente.close()
+                return reporte
+
+        reporte = asyncio.run(escenario())
+
+        estados = {r["recipient_id"]: (r["status"], r["attempts"]) for r in reporte["records"]}
+        assert estados == {
+            "573000000001": (DeliveryStatus.SENT.value, 1),
+            "573000000429": (DeliveryStatus.SENT.value, 2),
+            "573000000400": (DeliveryStatus.FAILED.value, 1),
+        }
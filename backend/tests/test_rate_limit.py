@@ -0,0 +1,244 @@
+# backend/tests/test_rate_limit.py
+"""
+Tests para el middleware de rate limiting, sus algoritmos y stores.
+"""
+
+import asyncio
+import time
+
+import pytest
+
+pytest.importorskip("email_validator")  # security.authentication usa EmailStr
+
+import httpx
+from fastapi import FastAPI
+
+from security.rate_limit import (
+    FixedWindow, GCRA, MemoryStore, RateLimit, RateLimitMiddleware, RedisStore, RouteLimit, SlidingWindowLog,
+)
+
+
+class Reloj:
+    """Reloj manual para los algoritmos en memoria"""
+
+    def __init__(self):
+        self.ahora = 1000.0
+
+    def __call__(self):
+        return self.ahora
+
+
+def _permitidos(store, algoritmo, rate, n, clave="c"):
+    return [store.check(algoritmo, clave, rate).allowed for _ in range(n)]
+
+
+class TestAlgoritmos:
+    """Tests de los algoritmos sobre el store en memoria"""
+
+    def test_ventana_fija_se_reinicia_con_la_ventana(self):
+        """Hasta el límite por ventana; la siguiente ventana empieza de cero"""
+        reloj = Reloj()
+        store = MemoryStore(clock=reloj)
+        rate = RateLimit.parse("3/minute")
+
+        assert _permitidos(store, FixedWindow(), rate, 4) == [True, True, True, False]
+        reloj.ahora = 1020.0
+        assert store.check(FixedWindow(), "c", rate).allowed
+
+    def test_ventana_deslizante_es_exacta(self):
+        """Nunca más de `limit` en cualquier ventana; Retry-After apunta al más viejo"""
+        reloj = Reloj()
+        store = MemoryStore(clock=reloj)
+        rate = RateLimit(2, 10)
+
+        store.check(SlidingWindowLog(), "c", rate)
+        reloj.ahora += 6
+        store.check(SlidingWindowLog(), "c", rate)
+        rechazo = store.check(SlidingWindowLog(), "c", rate)
+
+        assert not rechazo.allowed and rechazo.retry_after == pytest.approx(4)
+        reloj.ahora += 4
+        assert store.check(SlidingWindowLog(), "c", rate).allowed
+
+    def test_gcra_reparte_a_ritmo_constante_con_rafaga(self):
+        """Una ráfaga de `burst` y después un request cada `period/limit`"""
+        reloj = Reloj()
+        store = MemoryStore(clock=reloj)
+        rate = RateLimit(10, 10)  # un request por segundo
+
+        assert _permitidos(store, GCRA(burst=3), rate, 4) == [True, True, True, False]
+        rechazo = store.check(GCRA(burst=3), "c", rate)
+        assert rechazo.retry_after == pytest.approx(1)
+        reloj.ahora += 1
+        assert _permitidos(store, GCRA(burst=3), rate, 2) == [True, False]
+
+    def test_store_en_memoria_acotado(self):
+        """Un barrido de claves no supera max_keys y desaloja la menos usada"""
+        store = MemoryStore(max_keys=100)
+        rate = RateLimit(1, 60)
+        for i in range(1000):
+            store.check(GCRA(), f"ip:{i}", rate)
+
+        assert len(store) == 100
+        assert store.check(GCRA(), "ip:0", rate).allowed
+
+
+def _app(**kwargs):
+    api = FastAPI()
+
+    @api.get("/api/guias")
+    async def guias():
+        return {"ok": True}
+
+    @api.post("/api/chat")
+    async def chat():
+        return {"ok": True}
+
+    @api.get("/health")
+    async def health():
+        return {"ok": True}
+
+    api.add_middleware(RateLimitMiddleware, **kwargs)
+    return api
+
+
+async def _pedir(api, metodo, ruta, n, **kwargs):
+    transporte = httpx.ASGITransport(app=api)
+    async with httpx.AsyncClient(transport=transporte, base_url="http://test") as cliente:
+        return [await cliente.request(metodo, ruta, **kwargs) for _ in range(n)]
+
+
+class TestMiddleware:
+    """Tests del middleware ASGI"""
+
+    def test_cabeceras_y_rechazo(self):
+        """Cabeceras RateLimit-* en cada respuesta y 429 con Retry-After"""
+        api = _app(default="2/minute", algorithm="fixed_window")
+
+        respuestas = asyncio.run(_pedir(api, "GET", "/api/guias", 3))
+
+        assert [r.status_code for r in respuestas] == [200, 200, 429]
+        assert respuestas[0].headers["RateLimit-Limit"] == "2"
+        assert respuestas[0].headers["RateLimit-Remaining"] == "1"
+        assert respuestas[0].headers["RateLimit-Policy"] == "2;w=60"
+        assert int(respuestas[2].headers["Retry-After"]) >= 1
+        assert asyncio.run(_pedir(api, "GET", "/health", 5))[-1].status_code == 200
+
+    def test_limites_por_ruta_y_por_api_key(self):
+        """La regla de ruta tiene su contador; la API key con límite propio lo usa en el resto"""
+        api = _app(
+            default="1/minute",
+            routes=[RouteLimit("/api/chat", "3/minute", methods=["POST"])],
+            api_key_limits={"ltpr_socio12": "5/minute"},
+        )
+
+        async def escenario():
+            chat = await _pedir(api, "POST", "/api/chat", 4)
+            anonimo = await _pedir(api, "GET", "/api/guias", 2)
+            socio = await _pedir(api, "GET", "/api/guias", 6, headers={"X-API-Key": "ltpr_socio12_xyz"})
+            return chat, anonimo, socio
+
+        chat, anonimo, socio = asyncio.run(escenario())
+
+        assert [r.status_code for r in chat] == [200, 200, 200, 429]
+        assert [r.status_code for r in anonimo] == [200, 429]
+        assert [r.status_code for r in socio].count(200) == 5
+
+
+    def test_keys_inventadas_cuentan_por_ip(self):
+        """Una key sin validar ni prefijo configurado no abre un contador nuevo"""
+        validas = {"ltpr_valida_1"}
+
+        async def validar(key):
+            return key in validas
+
+        api = _app(default="2/minute", api_key_limits={"ltpr_socio12": "3/minute"}, api_key_validator=validar)
+
+        async def escenario():
+            basura = [
+                (await _pedir(api, "GET", "/api/guias", 1, headers={"X-API-Key": f"basura-{n}"}))[0]
+                for n in range(3)
+            ]
+            prefijo = [
+                (await _pedir(api, "GET", "/api/guias", 1, headers={"X-API-Key": f"ltpr_socio12_{n}"}))[0]
+                for n in range(4)
+            ]
+            valida = await _pedir(api, "GET", "/api/guias", 2, headers={"X-API-Key": "ltpr_valida_1"})
+            return basura, prefijo, valida
+
+        basura, prefijo, valida = asyncio.run(escenario())
+
+        assert [r.status_code for r in basura] == [200, 200, 429]
+        assert [r.status_code for r in prefijo] == [200, 200, 200, 429]
+        assert [r.status_code for r in valida] == [200, 200]
+
+    def test_preflight_no_consume_cuota(self):
+        """Los OPTIONS pasan sin contar contra el límite"""
+        api = _app(default="1/minute")
+
+        async def escenario():
+            await _pedir(api, "OPTIONS", "/api/guias", 3)
+            return await _pedir(api, "GET", "/api/guias", 1)
+
+        assert asyncio.run(escenario())[0].status_code == 200
+
+
+class TestRedis:
+    """El mismo comportamiento con scripts Lua sobre Redis"""
+
+    @pytest.mark.parametrize("algoritmo", [FixedWindow(), SlidingWindowLog(), GCRA()])
+    def test_limite_compartido_entre_workers(self, algoritmo):
+        """Dos middlewares (dos workers) comparten el contador en Redis"""
+        fakeredis = pytest.importorskip("fakeredis")
+        cliente = fakeredis.aioredis.FakeRedis()
+        workers = [_app(default="4/minute", algorithm=algoritmo, store=RedisStore(cliente)) for _ in range(2)]
+
+        async def escenario():
+            codigos = []
+            for i in range(6):
+                respuesta = (await _pedir(workers[i % 2], "GET", "/api/guias", 1))[0]
+                codigos.append(respuesta.status_code)
+            return codigos, respuesta
+
+        codigos, ultima = asyncio.run(escenario())
+
+        assert codigos == [200, 200, 200, 200, 429, 429]
+        assert int(ultima.headers["Retry-After"]) >= 1
+
+
+@pytest.mark.slow
+class TestBenchmarkRateLimit:
+    """Sobrecosto por request del middleware con el store en memoria"""
+
+    def test_sobrecosto_por_request(self):
+        """Se mide la llamada ASGI directa con y sin middleware"""
+        async def app_vacia(scope, receive, send):
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await send({"type": "http.response.body", "body": b"ok"})
+
+        async def recibir():
+            return {"type": "http.request", "body": b""}
+
+        async def enviar(mensaje):
+            pass
+
+        def scope(i):
+            return {
+                "type": "http", "method": "GET", "path": "/api/guias",
+                "headers": [], "client": (f"10.0.{i % 250}.{i % 200}", 1234),
+            }
+
+        async def medir(app, n=20_000):
+            inicio = time.perf_counter()
+            for i in range(n):
+                await app(scope(i), recibir, enviar)
+            return (time.perf_counter() - inicio) / n * 1e6
+
+        resultados = {}
+        for nombre, algoritmo in (("fixed_window", FixedWindow()), ("sliding_window_log", SlidingWindowLog()), ("gcra", GCRA())):
+            limitada = RateLimitMiddleware(app_vacia, default="1000000/minute", algorithm=algoritmo)
+            base = asyncio.run(medir(app_vacia))
+            resultados[nombre] = asyncio.run(medir(limitada)) - base
+
+        print("\nSobrecosto por request (µs): " + ", ".join(f"{k}={v:.1f}" for k, v in resultados.items()))
+        assert all(v < 50 for v in resultados.values())
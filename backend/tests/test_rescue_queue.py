@@ -0,0 +1,175 @@
+# backend/tests/test_rescue_queue.py
+"""
+Tests para la cola persistente del sistema de rescate.
+"""
+
+import asyncio
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from database import ItemRescate
+from services.rescue_service import RescueService, RescueQueueStore, RescuePriority, RescueStatus
+from services.whatsapp_service import SendResult, whatsapp_service
+
+import pytest
+
+
+@pytest.fixture
+def sesiones():
+    """Fábrica de sesiones sobre SQLite en memoria con la tabla cola_rescate"""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    ItemRescate.__table__.create(engine)
+    SessionLocal = sessionmaker(bind=engine, expire_on_commit=False)
+
+    @contextmanager
+    def sesion():
+        session = SessionLocal()
+        try:
+            yield session
+            session.commit()
+        finally:
+            session.close()
+
+    return sesion
+
+
+def _servicio(sesiones) -> RescueService:
+    return RescueService(store=RescueQueueStore(sesiones))
+
+
+def _guia(numero, dias, novedad="NO_ESTABA"):
+    return {
+        "tracking_number": numero, "carrier": "TCC", "customer_name": "Ana",
+        "customer_phone": "3001234567", "destination_city": "Cali",
+        "novelty_type": novedad, "days_without_movement": dias,
+    }
+
+
+class TestColaPersistente:
+    """Tests de orden, persistencia y contadores"""
+
+    def test_orden_de_la_cola_y_filtros(self, sesiones):
+        """La cola sale por prioridad, probabilidad y días sin movimiento"""
+        servicio = _servicio(sesiones)
+        servicio.add_bulk_to_queue([
+            _guia("G-LOW", 0),
+            _guia("G-CRIT-7", 7),
+            _guia("G-CRIT", 6),
+            _guia("G-HIGH", 4),
+        ])
+
+        orden = [i.tracking_number for i in servicio.get_queue()]
+        assert orden == ["G-CRIT", "G-CRIT-7", "G-HIGH", "G-LOW"]
+        assert [i.tracking_number for i in servicio.get_queue(priority=RescuePriority.CRITICAL, limit=1)] == ["G-CRIT"]
+
+        # Tras una llamada baja la probabilidad y la guía cambia de puesto
+        servicio.mark_call_completed("G-CRIT", "no contesta")
+        assert [i.tracking_number for i in servicio.get_queue(limit=2)] == ["G-CRIT-7", "G-CRIT"]
+        assert [i.tracking_number for i in servicio.get_queue(status=RescueStatus.CALL_COMPLETED)] == ["G-CRIT"]
+
+    def test_la_cola_sobrevive_al_reinicio(self, sesiones):
+        """Un servicio nuevo recupera la cola abierta y los contadores desde la BD"""
+        servicio = _servicio(sesiones)
+        servicio.add_bulk_to_queue([_guia(f"G{i}", i) for i in range(6)])
+        servicio.mark_recovered("G1")
+        servicio.mark_recovered("G2")
+        servicio.mark_lost("G3")
+        servicio.reschedule("G4", datetime.now() + timedelta(days=1), "cliente viaja")
+
+        reiniciado = _servicio(sesiones)
+
+        assert [i.tracking_number for i in reiniciado.get_queue()] == ["G4", "G5", "G0"]
+        assert reiniciado.get_item("G4").status == RescueStatus.RESCHEDULED
+        assert reiniciado.get_stats() == servicio.get_stats()
+        stats = reiniciado.get_stats()
+        assert (stats.total_in_queue, stats.recovered_today, stats.lost_today) == (3, 2, 1)
+        assert stats.recovery_rate == 66.7
+
+    def test_reingresar_guia_abierta_cancela_la_anterior(self, sesiones):
+        """Solo queda un registro abierto por guía"""
+        servicio = _servicio(sesiones)
+        anterior = servicio.add_to_queue(**_guia("G1", 2))
+        anterior.id = "RSC-G1-080000"
+        servicio.store.save(anterior)
+        servicio.add_to_queue(**_guia("G1", 6))
+
+        with sesiones() as session:
+            estados = dict(session.query(ItemRescate.id, ItemRescate.estado).all())
+
+        assert sorted(estados.values()) == ["CANCELLED", "PENDING"]
+        assert servicio.get_stats().critical == 1 and servicio.get_stats().medium == 0
+
+
+    def test_fallo_al_escribir_se_reintenta(self, sesiones):
+        """Una escritura fallida queda pendiente y se guarda con la siguiente"""
+        fallar = {"n": 0}
+
+        @contextmanager
+        def sesiones_inestables():
+            if fallar["n"]:
+                fallar["n"] -= 1
+                raise ConnectionError("BD caida")
+            with sesiones() as session:
+                yield session
+
+        servicio = RescueService(store=RescueQueueStore(sesiones_inestables))
+        servicio.add_bulk_to_queue([_guia("G1", 2), _guia("G2", 3)])
+        g1 = servicio.get_item("G1")
+        fallar["n"] = 1
+        servicio.mark_recovered("G1")
+        servicio.mark_lost("G2")
+
+        with sesiones() as session:
+            estados = dict(session.query(ItemRescate.numero_guia, ItemRescate.estado).all())
+        assert estados == {"G1": "RECOVERED", "G2": "LOST"}
+        assert servicio.store._dirty == {}
+
+        # Sacar de nuevo una guía ya cerrada no descuadra los contadores
+        servicio.store._untrack(g1)
+        assert servicio.get_stats().total_in_queue == 0 and servicio.get_stats().medium == 0
+
+
+class TestReclamacion:
+    """Tests de reclamación de reagendados entre agentes"""
+
+    def test_agentes_no_reciben_las_mismas_guias(self, sesiones):
+        """Un reagendado vencido va a un solo agente hasta que vence la reclamación"""
+        servicio = _servicio(sesiones)
+        servicio.add_bulk_to_queue([_guia(f"G{i}", i) for i in range(3)])
+        servicio.reschedule("G0", datetime.now() - timedelta(minutes=5))
+        servicio.reschedule("G2", datetime.now() - timedelta(minutes=1))
+        servicio.reschedule("G1", datetime.now() + timedelta(hours=2))
+
+        primero = servicio.claim_due("agente-1")
+        segundo = _servicio(sesiones).claim_due("agente-2")
+
+        assert [i.tracking_number for i in primero] == ["G2", "G0"]
+        assert segundo == []
+        assert servicio.get_item("G2").claimed_by == "agente-1"
+
+        # Al actuar sobre la guía se libera la reclamación
+        servicio.mark_call_completed("G2", "reprogramada")
+        assert servicio.get_item("G2").claimed_by is None
+
+
+class TestWhatsAppRescate:
+    """Tests del envío de WhatsApp con los servicios por defecto"""
+
+    def test_envio_masivo_usa_el_servicio_de_whatsapp_del_modulo(self, sesiones, monkeypatch):
+        """Sin servicios inyectados se usa el singleton de WhatsApp y su despachador"""
+        async def enviar(phone, nombre, guia):
+            return SendResult(success=True, message_id=f"wamid.{guia}", phone=phone)
+
+        monkeypatch.setattr(whatsapp_service, "send_rescue_contact", enviar)
+        servicio = _servicio(sesiones)
+        servicio.add_bulk_to_queue([_guia(f"G{i}", i) for i in range(3)])
+
+        resultado = asyncio.run(servicio.send_bulk_whatsapp())
+
+        assert servicio.whatsapp is whatsapp_service
+        assert resultado == {"sent": 3, "failed": 0, "errors": []}
+        assert servicio.get_item("G1").status == RescueStatus.WHATSAPP_SENT
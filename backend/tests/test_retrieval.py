@@ -0,0 +1,106 @@
+# backend/tests/test_retrieval.py
+"""
+Tests para la recuperación híbrida (léxica + vectorial) del conocimiento.
+"""
+
+import asyncio
+
+from knowledge_system.embeddings import EmbeddingPipeline, HashingEmbeddingProvider
+from knowledge_system.knowledge_manager import KnowledgeManager
+from knowledge_system.retrieval import Coincidencia, IndiceMemoria, fusionar_rrf
+
+
+def _indice_con(documentos: dict) -> tuple:
+    """Crea un índice en memoria con {titulo: contenido}; retorna (indice, pipeline)"""
+    pipeline = EmbeddingPipeline(HashingEmbeddingProvider(dimension=256))
+
+    async def cargar():
+        indice = IndiceMemoria()
+        for titulo, contenido in documentos.items():
+            chunks = await pipeline.procesar(contenido)
+            indice.agregar({'titulo': titulo, 'categoria': 'Logística'}, chunks)
+        return indice
+
+    return asyncio.run(cargar()), pipeline
+
+
+def _buscar(indice, pipeline, query: str, **kwargs) -> list:
+    vector, modelo = asyncio.run(pipeline.embed_consulta(query))
+    return indice.buscar(query, vector, modelo, **kwargs)
+
+
+class TestFusionRRF:
+    """Tests de Reciprocal Rank Fusion"""
+
+    def test_documento_en_ambas_ramas_gana(self):
+        """Un documento presente en las dos ramas debe quedar primero"""
+        def c(doc_id, similitud=None):
+            return Coincidencia(doc_id, {'id': doc_id}, f"chunk {doc_id}", similitud)
+
+        resultados = fusionar_rrf([[c(1, 0.9), c(2, 0.8), c(1, 0.7)], [c(2), c(3)]], limite=3)
+
+        assert [r['id'] for r in resultados] == [2, 1, 3]
+        assert resultados[0]['similitud'] == 0.8
+        assert resultados[2]['similitud'] is None
+
+
+class TestIndiceMemoria:
+    """Tests del índice híbrido en memoria"""
+
+    def test_termino_exacto_rankea_primero(self):
+        """Un número de guía exacto debe encontrarse por la rama léxica"""
+        indice, pipeline = _indice_con({
+            "Novedades": "La guía 240045678912 de Servientrega quedó en novedad por dirección errada",
+            "Tiempos": "Los tiempos de entrega de Coordinadora dependen de la ciudad destino",
+            "Devoluciones": "Proceso de devolución al proveedor cuando el cliente rechaza el pedido",
+        })
+
+        resultados = _buscar(indice, pipeline, "240045678912", limite=3, umbral_similitud=0.99)
+
+        assert resultados[0]['titulo'] == "Novedades"
+        assert "240045678912" in resultados[0]['fragmento']
+
+    def test_umbral_antes_del_limite(self):
+        """Con muchos chunks debajo del umbral se deben devolver `limite` resultados válidos"""
+        documentos = {f"Ruido {i}": f"texto irrelevante numero {i} sobre otra cosa" for i in range(30)}
+        documentos.update({f"Bogotá {i}": f"entregas en bogotá zona norte {i}" for i in range(5)})
+        indice, pipeline = _indice_con(documentos)
+
+        resultados = _buscar(indice, pipeline, "entregas en bogotá zona norte", limite=5, umbral_similitud=0.5)
+
+        assert len(resultados) == 5
+        assert all(r['titulo'].startswith("Bogotá") for r in resultados)
+
+    def test_eliminar_documento(self):
+        """Un documento eliminado no debe volver a aparecer"""
+        indice, pipeline = _indice_con({"Único": "tarifa de flete para Medellín"})
+
+        assert indice.eliminar(1)
+        assert _buscar(indice, pipeline, "flete Medellín", limite=5) == []
+
+
+class TestBusquedaSinPostgres:
+    """Tests del flujo completo de KnowledgeManager sin base de datos"""
+
+    def test_cargar_y_buscar_en_memoria(self, monkeypatch):
+        """cargar_conocimiento y buscar_conocimiento deben funcionar con el índice en memoria"""
+        for variable in ('OPENAI_API_KEY', 'CLAUDE_API_KEY', 'ANTHROPIC_API_KEY'):
+            monkeypatch.delenv(variable, raising=False)
+        monkeypatch.setattr(KnowledgeManager, 'engine', property(lambda self: None))
+
+        fuente = (
+            "Protocolo de rescate: llamar al cliente cuando Interrapidísimo reporta novedad "
+            "de dirección errada y reprogramar la entrega en menos de 24 horas."
+        )
+
+        async def run():
+            km = KnowledgeManager()
+            guardado = await km.cargar_conocimiento(fuente=fuente, tipo="texto")
+            duplicado = await km.cargar_conocimiento(fuente=fuente, tipo="texto")
+            resultados = await km.buscar_conocimiento("Interrapidísimo", limite=3)
+            return guardado, duplicado, resultados
+
+        guardado, duplicado, resultados = asyncio.run(run())
+        assert guardado['success'] and guardado['id'] == 1
+        assert duplicado.get('duplicado')
+        assert resultados[0]['id'] == 1
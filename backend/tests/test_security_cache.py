@@ -0,0 +1,223 @@
+# backend/tests/test_security_cache.py
+"""
+Tests para el cache de tokens verificados y la encriptación por lotes con rotación.
+"""
+
+import time
+from datetime import datetime, timedelta
+
+import fakeredis
+import pytest
+
+pytest.importorskip("email_validator")  # security.authentication usa EmailStr
+
+import pandas as pd
+
+from security import authentication as auth
+from security.authentication import (
+    RedisRevocationStore, Role, TokenCache, User, create_access_token, decode_token
+)
+from security.encryption import EncryptionService, PII_FIELDS, derive_key, init_encryption
+
+
+def _token(user_id="u1", **claims):
+    usuario = User(id=user_id, email="ana@litper.co", hashed_password="x", role=Role.OPERATOR)
+    return create_access_token(usuario, claims or None)
+
+
+@pytest.fixture(autouse=True)
+def cache_limpio(monkeypatch):
+    """Cada test con su propio cache de tokens"""
+    monkeypatch.setattr(auth, "token_cache", TokenCache(max_size=3))
+    return auth.token_cache
+
+
+class TestCacheDeTokens:
+    """Tests de verificación cacheada, expiración y revocación"""
+
+    def test_segunda_verificacion_sale_del_cache(self, monkeypatch, cache_limpio):
+        """El JWT se verifica una sola vez"""
+        llamadas = []
+        decode_original = auth.jwt.decode
+        monkeypatch.setattr(auth.jwt, "decode", lambda *a, **k: llamadas.append(1) or decode_original(*a, **k))
+        token = _token()
+
+        primero = decode_token(token)
+        segundo = decode_token(token)
+
+        assert primero.user_id == segundo.user_id == "u1"
+        assert len(llamadas) == 1 and cache_limpio.hits == 1
+        assert decode_token(token + "x") is None
+
+    def test_expiracion_y_tamano_acotado(self, cache_limpio):
+        """Una entrada vencida no se sirve y el cache no pasa de max_size"""
+        datos = decode_token(_token())
+        cache_limpio.put("vencido", datos, exp=time.time() - 1, iat=0)
+        assert cache_limpio.get("vencido") is None
+
+        for i in range(10):
+            decode_token(_token(f"u{i}"))
+        assert len(cache_limpio._entries) == 3
+
+    def test_revocacion_de_token_y_de_usuario(self):
+        """Un token revocado y los tokens previos a revoke_user dejan de valer"""
+        cerrado = _token()
+        decode_token(cerrado)
+        auth.revoke_token(cerrado)
+        assert decode_token(cerrado) is None
+
+        viejo = _token("u2", iat=datetime.utcnow() - timedelta(minutes=5))
+        assert decode_token(viejo) is not None
+        auth.revoke_user_tokens("u2")
+        assert decode_token(viejo) is None
+        assert decode_token(_token("u2")) is not None
+
+    def test_revocacion_del_mismo_segundo(self, monkeypatch):
+        """Un token emitido en el mismo segundo pero antes de revoke_user deja de valer"""
+        reloj = {"t": 1_700_000_000.1}
+        monkeypatch.setattr(auth.time, "time", lambda: reloj["t"])
+        previo = _token("u3")
+        assert decode_token(previo) is not None
+
+        reloj["t"] += 0.3
+        auth.revoke_user_tokens("u3")
+        reloj["t"] += 0.3
+        nuevo = _token("u3")
+
+        assert decode_token(previo) is None
+        assert decode_token(nuevo) is not None
+
+    def test_revocacion_compartida_entre_procesos(self, monkeypatch):
+        """Con Redis, revocar en un worker invalida el token cacheado en otro"""
+        servidor = fakeredis.FakeServer()
+        worker_a = TokenCache(revocations=RedisRevocationStore(fakeredis.FakeRedis(server=servidor)))
+        worker_b = TokenCache(revocations=RedisRevocationStore(fakeredis.FakeRedis(server=servidor)))
+        cerrado, viejo = _token(), _token("u2", iat=datetime.utcnow() - timedelta(minutes=5))
+
+        monkeypatch.setattr(auth, "token_cache", worker_b)
+        assert decode_token(cerrado) is not None and decode_token(viejo) is not None
+
+        monkeypatch.setattr(auth, "token_cache", worker_a)
+        auth.revoke_token(cerrado)
+        auth.revoke_user_tokens("u2")
+
+        monkeypatch.setattr(auth, "token_cache", worker_b)
+        assert decode_token(cerrado) is None
+        assert decode_token(viejo) is None
+        assert decode_token(_token("u2")) is not None
+
+
+class TestEncriptacion:
+    """Tests de derivación memoizada, rotación y lotes"""
+
+    def test_derivacion_una_vez_por_proceso(self):
+        """Crear varios servicios con la misma clave no repite PBKDF2"""
+        derive_key.cache_clear()
+        EncryptionService("clave-maestra")
+        EncryptionService("clave-maestra")
+
+        info = derive_key.cache_info()
+        assert (info.misses, info.hits) == (1, 1)
+
+    def test_init_encryption_descarta_keys_derivadas(self):
+        """Al reinicializar no quedan en memoria keys de claves que salieron de rotación"""
+        init_encryption("clave-2024", previous_keys=[])
+        assert derive_key.cache_info().currsize == 1
+
+        init_encryption("clave-2025", previous_keys=[])
+
+        assert derive_key.cache_info().currsize == 1
+
+    def test_rotacion_con_multifernet(self):
+        """La key nueva lee lo viejo y rotate() lo deja legible solo con la nueva"""
+        viejo = EncryptionService("clave-2024")
+        actual = EncryptionService("clave-2025", previous_keys=["clave-2024"])
+        solo_nueva = EncryptionService("clave-2025")
+
+        cifrado_viejo = viejo.encrypt("3001234567")
+        assert actual.decrypt(cifrado_viejo) == "3001234567"
+        assert solo_nueva.decrypt(cifrado_viejo) == cifrado_viejo
+
+        rotado = actual.rotate(cifrado_viejo)
+        assert solo_nueva.decrypt(rotado) == "3001234567"
+
+    def test_registros_y_dataframe_en_un_llamado(self):
+        """Los lotes equivalen a encrypt_pii por registro y respetan vacíos"""
+        servicio = EncryptionService("clave-maestra")
+        campos = PII_FIELDS["order"]
+        pedidos = [
+            {"order_id": "1", "customer_name": "Ana", "customer_phone": "300", "customer_email": None},
+            {"order_id": "2", "customer_name": "Luis", "customer_phone": "", "shipping_address": "Calle 1, Cali"},
+        ]
+
+        cifrados = servicio.encrypt_records(pedidos, campos)
+
+        assert pedidos[0]["customer_name"] == "Ana"
+        assert cifrados[0]["customer_name"] != "Ana" and cifrados[0]["customer_email"] is None
+        assert cifrados[1]["customer_phone"] == "" and cifrados[1]["order_id"] == "2"
+        assert servicio.decrypt_records(cifrados, campos) == pedidos
+        assert servicio.decrypt_pii(servicio.encrypt_pii(pedidos[1], campos), campos) == pedidos[1]
+
+        df = pd.DataFrame(pedidos)
+        cifrado_df = servicio.encrypt_dataframe(df, ["customer_name", "customer_phone"])
+        assert cifrado_df["customer_name"].tolist() != df["customer_name"].tolist()
+        assert servicio.decrypt_dataframe(cifrado_df, ["customer_name", "customer_phone"]).equals(df)
+
+    def test_nulos_de_pandas_no_se_encriptan(self):
+        """NaN, None y NA quedan como nulos en vez de cifrarse como texto"""
+        servicio = EncryptionService("clave-maestra")
+        df = pd.DataFrame({"customer_email": ["ana@x.co", None, float("nan")], "customer_phone": ["300", pd.NA, "301"]})
+
+        cifrado = servicio.encrypt_dataframe(df, ["customer_email", "customer_phone"])
+
+        assert cifrado["customer_email"].isna().tolist() == [False, True, True]
+        assert cifrado["customer_phone"].isna().tolist() == [False, True, False]
+        assert servicio.decrypt_dataframe(cifrado, ["customer_email", "customer_phone"]).equals(df)
+        assert pd.isna(servicio.encrypt_records([{"customer_email": float("nan")}], ["customer_email"])[0]["customer_email"])
+
+
+@pytest.mark.slow
+class TestBenchmarkEncriptacion:
+    """Encriptación de PII de 10k registros"""
+
+    def test_10k_registros(self):
+        """Lote vs encrypt_pii por registro, y costo de crear el servicio"""
+        campos = PII_FIELDS["customer"]
+        registros = [
+            {"id": i, "name": f"Cliente {i}", "phone": f"300{i:07d}", "email": f"c{i}@mail.co",
+             "address": f"Calle {i}, Cali", "document_id": str(10_000_000 + i)}
+            for i in range(10_000)
+        ]
+
+        derive_key.cache_clear()
+        inicio = time.perf_counter()
+        servicio = EncryptionService("clave-benchmark")
+        en_frio = time.perf_counter() - inicio
+        inicio = time.perf_counter()
+        EncryptionService("clave-benchmark")
+        memoizado = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        uno_a_uno = [servicio.encrypt_pii(r, campos) for r in registros]
+        t_uno_a_uno = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        lote = servicio.encrypt_records(registros, campos)
+        t_lote = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        df = servicio.encrypt_dataframe(pd.DataFrame(registros), campos)
+        t_df = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        servicio.decrypt_records(lote, campos)
+        t_descifrado = time.perf_counter() - inicio
+
+        print(
+            f"\nServicio: {en_frio * 1000:.1f}ms en frío, {memoizado * 1000:.2f}ms memoizado"
+            f"\n10k registros x {len(campos)} campos: encrypt_pii {t_uno_a_uno:.2f}s, "
+            f"encrypt_records {t_lote:.2f}s, DataFrame {t_df:.2f}s, decrypt_records {t_descifrado:.2f}s"
+        )
+        assert len(uno_a_uno) == len(lote) == len(df) == 10_000
+        assert memoizado < en_frio / 10
+        assert t_lote <= t_uno_a_uno * 1.2
@@ -0,0 +1,401 @@
+# backend/tests/test_task_queue.py
+"""
+Tests para la cola de tareas distribuida (workers/task_queue.py).
+
+Usan fakeredis como Redis local; se omiten si no está instalado.
+"""
+
+import asyncio
+import os
+import statistics
+import time
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")
+
+from datetime import datetime
+from workers.task_queue import Task, TaskQueue, TaskPriority, TaskStatus, TaskWorker
+
+
+def _crear_cola(**kwargs) -> TaskQueue:
+    """TaskQueue conectada a un Redis en memoria"""
+    client = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    return TaskQueue("redis://localhost:6379/0", redis_client=client, **kwargs)
+
+
+class TestDequeuePrioridad:
+    """Tests del dequeue con un solo BRPOP multi-clave"""
+
+    def test_dequeue_respeta_prioridad(self):
+        """Debe salir primero la tarea de mayor prioridad"""
+        async def run():
+            queue = _crear_cola()
+            await queue.enqueue("baja", {}, priority=TaskPriority.LOW)
+            await queue.enqueue("normal", {}, priority=TaskPriority.NORMAL)
+            await queue.enqueue("critica", {}, priority=TaskPriority.CRITICAL)
+
+            orden = [(await queue.dequeue(timeout=1)).type for _ in range(3)]
+            return orden, await queue.dequeue(timeout=1)
+
+        orden, vacia = asyncio.run(run())
+        assert orden == ["critica", "normal", "baja"]
+        assert vacia is None
+
+    def test_dequeue_marca_tarea_procesando(self):
+        """La tarea obtenida debe quedar en estado processing"""
+        async def run():
+            queue = _crear_cola()
+            task_id = await queue.enqueue("tarea", {"x": 1})
+            await queue.dequeue(timeout=1)
+            return await queue.redis.hget(f"task:{task_id}", "status")
+
+        assert asyncio.run(run()) == TaskStatus.PROCESSING.value
+
+    def test_reclamar_consume_las_senales(self):
+        """Las señales no se acumulan y la espera con colas vacías no gira sobre señales viejas"""
+        async def run():
+            queue = _crear_cola()
+            for i in range(5):
+                await queue.enqueue("tarea", {"i": i})
+            for _ in range(3):
+                await queue.dequeue(timeout=1)
+            tras_reclamar = await queue.redis.llen(queue.signal_name)
+
+            for _ in range(2):
+                await queue.dequeue(timeout=1)
+            await queue.redis.lpush(queue.signal_name, 1, 1, 1)
+            inicio = time.monotonic()
+            vacia = await queue.dequeue(timeout=0.3)
+            return tras_reclamar, vacia, time.monotonic() - inicio, await queue.redis.llen(queue.signal_name)
+
+        tras_reclamar, vacia, espera, restantes = asyncio.run(run())
+        assert tras_reclamar == 2
+        assert vacia is None
+        assert espera >= 0.25
+        assert restantes == 0
+
+
+class TestPromocionProgramadas:
+    """Tests de la promoción atómica de tareas programadas"""
+
+    def test_solo_el_lider_promueve(self):
+        """Un segundo worker no debe mover tareas mientras el líder tenga el lease"""
+        async def run():
+            queue = _crear_cola()
+            vencida = Task(id="task_1", type="tarde", payload={}, priority=TaskPriority.HIGH,
+                           created_at=datetime.utcnow())
+            await queue.redis.zadd(queue.scheduled_name, {vencida.json(): 0})
+
+            lider = await queue.promote_scheduled_tasks("worker-1")
+            otro = await queue.promote_scheduled_tasks("worker-2")
+            return lider, otro, await queue.redis.llen(queue.queue_names[TaskPriority.HIGH])
+
+        lider, otro, en_cola = asyncio.run(run())
+        assert (lider, otro, en_cola) == (1, -1, 1)
+
+    def test_no_promueve_tareas_futuras(self):
+        """Las tareas cuyo tiempo no ha llegado deben seguir programadas"""
+        async def run():
+            queue = _crear_cola()
+            await queue.enqueue("futura", {}, delay_seconds=3600)
+            movidas = await queue.promote_scheduled_tasks("worker-1")
+            return movidas, await queue.redis.zcard(queue.scheduled_name)
+
+        assert asyncio.run(run()) == (0, 1)
+
+
+class TestEntregaConfiable:
+    """Tests de leases, reentrega y confirmación (ack)"""
+
+    def test_tarea_queda_en_procesamiento_hasta_ack(self):
+        """La tarea reclamada debe seguir en Redis hasta complete()"""
+        async def run():
+            queue = _crear_cola()
+            await queue.enqueue("tarea", {})
+            task = await queue.dequeue(timeout=1, worker_id="w1")
+            en_proceso = await queue.redis.llen(queue.processing_list("w1"))
+            await queue.complete(task, {"ok": True})
+            return en_proceso, await queue.redis.llen(queue.processing_list("w1")), await queue.redis.zcard(queue.leases_name)
+
+        assert asyncio.run(run()) == (1, 0, 0)
+
+    def test_lease_vencido_se_reentrega(self):
+        """Si el worker muere sin ack, el reaper debe devolver la tarea a su cola"""
+        async def run():
+            queue = _crear_cola(lease_seconds=0)
+            await queue.enqueue("tarea", {}, priority=TaskPriority.HIGH)
+            perdida = await queue.dequeue(timeout=1, worker_id="caido")
+
+            reencoladas = await queue.reap_expired_leases()
+            recuperada = await queue.dequeue(timeout=1, worker_id="w2")
+            return perdida.id, reencoladas, recuperada.id, await queue.redis.llen(queue.processing_list("caido"))
+
+        perdida_id, reencoladas, recuperada_id, restantes = asyncio.run(run())
+        assert reencoladas == 1
+        assert recuperada_id == perdida_id
+        assert restantes == 0
+
+    def test_reentregas_agotadas_van_a_dead_letter(self):
+        """Una tarea que agota sus reintentos por leases vencidos debe ir a la DLQ"""
+        async def run():
+            queue = _crear_cola(lease_seconds=0)
+            await queue.enqueue("tarea", {}, max_retries=2)
+            for _ in range(2):
+                await queue.dequeue(timeout=1, worker_id="caido")
+                await queue.reap_expired_leases()
+            return await queue.get_queue_stats()
+
+        stats = asyncio.run(run())
+        assert stats["dead_letter"] == 1
+        assert stats["total_pending"] == 0
+
+    def test_reaper_respeta_leases_renovados(self):
+        """Solo se devuelven las tareas cuyo lease sigue vencido"""
+        async def run():
+            queue = _crear_cola(lease_seconds=0)
+            await queue.enqueue("tarea", {"n": 1})
+            await queue.enqueue("tarea", {"n": 2})
+            caida = await queue.dequeue(timeout=1, worker_id="caido")
+            viva = await queue.dequeue(timeout=1, worker_id="vivo")
+            await queue.redis.zadd(queue.leases_name, {f"vivo|{viva.id}": time.time() + 60})
+
+            reencoladas = await queue.reap_expired_leases()
+            return (
+                reencoladas,
+                await queue.redis.hget(f"task:{caida.id}", "status"),
+                await queue.redis.llen(queue.processing_list("vivo")),
+            )
+
+        assert asyncio.run(run()) == (1, TaskStatus.PENDING.value, 1)
+
+    def test_worker_omite_reentrega_completada_y_pasa_clave(self):
+        """Una reentrega de una tarea completada no debe volver a ejecutar el handler"""
+        llamadas = []
+
+        async def handler(payload, idempotency_key=None):
+            llamadas.append(idempotency_key)
+            return {}
+
+        async def run():
+            queue = _crear_cola()
+            queue.register_handler("notificar", handler)
+            worker = TaskWorker(queue, "w1")
+            await queue.enqueue("notificar", {}, idempotency_key="pedido-1")
+
+            task = await queue.dequeue(timeout=1, worker_id="w1")
+            await worker._process_task(task)
+            # Simula la reentrega tras un lease vencido
+            duplicada = task.copy()
+            await worker._process_task(duplicada)
+
+        asyncio.run(run())
+        assert llamadas == ["pedido-1"]
+
+
+def _tarea_cpu(payload: dict) -> dict:
+    """Handler CPU-bound de prueba (de módulo, para poder enviarlo a otro proceso)"""
+    return {"suma": sum(i * i for i in range(payload["n"])), "pid": os.getpid()}
+
+
+async def _correr_worker(queue: TaskQueue, worker: TaskWorker, total: int, limite: float = 30) -> float:
+    """Corre el worker hasta procesar `total` tareas; retorna los segundos empleados"""
+    inicio = time.perf_counter()
+    corriendo = asyncio.create_task(worker.start())
+    while worker.processed + worker.failed < total and time.perf_counter() - inicio < limite:
+        await asyncio.sleep(0.01)
+    duracion = time.perf_counter() - inicio
+    await worker.stop()
+    await corriendo
+    return duracion
+
+
+class TestMotorWorker:
+    """Tests del motor de ejecución concurrente del worker"""
+
+    def test_slots_ejecutan_tareas_io_en_paralelo(self):
+        """Con N slots, N tareas de I/O deben solaparse"""
+        async def run():
+            queue = _crear_cola()
+            activas = {"ahora": 0, "max": 0}
+
+            async def io(payload):
+                activas["ahora"] += 1
+                activas["max"] = max(activas["max"], activas["ahora"])
+                await asyncio.sleep(0.05)
+                activas["ahora"] -= 1
+                return {}
+
+            queue.register_handler("io", io)
+            await queue.enqueue_batch([{"type": "io"} for _ in range(8)])
+            worker = TaskWorker(queue, "w1", concurrency=4)
+            await _correr_worker(queue, worker, 8)
+            return activas["max"], worker.processed
+
+        maximo, procesadas = asyncio.run(run())
+        assert procesadas == 8
+        assert maximo == 4
+
+    def test_handler_cpu_bound_corre_en_otro_proceso(self):
+        """Los handlers cpu_bound deben ejecutarse en el pool de procesos"""
+        async def run():
+            queue = _crear_cola()
+            queue.register_handler("cpu", _tarea_cpu, cpu_bound=True)
+            task_id = await queue.enqueue("cpu", {"n": 1000})
+            await _correr_worker(queue, TaskWorker(queue, "w1", concurrency=2, cpu_workers=1), 1)
+            return await queue.get_status(task_id)
+
+        task = asyncio.run(run())
+        assert task.status == TaskStatus.COMPLETED.value
+        assert task.result["pid"] != os.getpid()
+
+    def test_cpu_bound_en_ejecucion_no_se_envia_otra_vez_al_pool(self):
+        """Una segunda entrega de una tarea cpu_bound en curso no llega al pool de procesos"""
+        async def run():
+            queue = _crear_cola()
+            queue.register_handler("cpu", _tarea_cpu, cpu_bound=True)
+            worker = TaskWorker(queue, "w1", cpu_workers=1)
+            await queue.enqueue("cpu", {"n": 10}, idempotency_key="modelo-1")
+
+            task = await queue.dequeue(timeout=1, worker_id="w1")
+            # Otra entrega de la misma tarea ya se está ejecutando
+            assert await queue.claim_execution(task.copy())
+            await worker._process_task(task)
+            return worker._process_pool, worker.processed, await queue.redis.llen(queue.processing_list("w1"))
+
+        assert asyncio.run(run()) == (None, 0, 0)
+
+    def test_backpressure_detiene_el_fetch(self):
+        """Bajo presión de recursos el worker no debe reservar tareas"""
+        async def run():
+            queue = _crear_cola()
+            queue.register_handler("io", lambda payload: asyncio.sleep(0))
+            await queue.enqueue("io", {})
+            worker = TaskWorker(queue, "w1")
+            worker._under_pressure = lambda: True
+            corriendo = asyncio.create_task(worker.start())
+            await asyncio.sleep(0.2)
+            estado = worker.paused, (await queue.get_queue_stats())["total_pending"]
+            await worker.stop()
+            await corriendo
+            return estado
+
+        assert asyncio.run(run()) == (True, 1)
+
+    def test_stop_devuelve_el_prefetch_y_espera_los_slots(self):
+        """Al detenerse, las tareas prefetched vuelven a la cola sin lease y la en curso termina"""
+        async def run():
+            queue = _crear_cola()
+
+            async def lenta(payload):
+                await asyncio.sleep(0.2)
+                return {}
+
+            queue.register_handler("lenta", lenta)
+            await queue.enqueue_batch([{"type": "lenta"} for _ in range(4)])
+            worker = TaskWorker(queue, "w1", concurrency=1, prefetch=3)
+            corriendo = asyncio.create_task(worker.start())
+            while worker.current_tasks == 0 or worker._buffer.qsize() < 3:
+                await asyncio.sleep(0.01)
+            await worker.stop()
+            await corriendo
+            return (
+                worker.processed,
+                (await queue.get_queue_stats())["total_pending"],
+                await queue.redis.llen(queue.processing_list("w1")),
+                await queue.redis.zcard(queue.leases_name),
+            )
+
+        assert asyncio.run(run()) == (1, 3, 0, 0)
+
+    def test_heartbeat_publica_tareas_en_curso(self):
+        """El heartbeat debe publicar slots y tareas en curso en Redis"""
+        async def run():
+            queue = _crear_cola()
+            worker = TaskWorker(queue, "w1", concurrency=3, heartbeat_interval=0.05)
+            corriendo = asyncio.create_task(worker.start())
+            await asyncio.sleep(0.1)
+            heartbeat = await queue.redis.hgetall(worker.heartbeat_key)
+            await worker.stop()
+            await corriendo
+            return heartbeat
+
+        heartbeat = asyncio.run(run())
+        assert heartbeat["slots"] == "3"
+        assert heartbeat["in_flight"] == "0"
+
+
+@pytest.mark.slow
+class TestBenchmarkThroughput:
+    """Benchmark de throughput del worker con tareas sintéticas de I/O y CPU"""
+
+    def _medir(self, concurrency: int, total_io: int = 200, total_cpu: int = 8) -> float:
+        async def run():
+            queue = _crear_cola()
+
+            async def io(payload):
+                await asyncio.sleep(0.01)
+                return {}
+
+            queue.register_handler("io", io)
+            queue.register_handler("cpu", _tarea_cpu, cpu_bound=True)
+            await queue.enqueue_batch(
+                [{"type": "io"} for _ in range(total_io)]
+                + [{"type": "cpu", "payload": {"n": 300_000}} for _ in range(total_cpu)]
+            )
+            worker = TaskWorker(queue, f"bench-{concurrency}", concurrency=concurrency, cpu_workers=2)
+            return await _correr_worker(queue, worker, total_io + total_cpu, limite=120)
+
+        duracion = asyncio.run(run())
+        return (total_io + total_cpu) / duracion
+
+    def test_throughput(self):
+        """Varios slots deben multiplicar el throughput frente a un solo slot"""
+        un_slot = self._medir(concurrency=1)
+        veinte_slots = self._medir(concurrency=20)
+        print(f"\nThroughput: 1 slot={un_slot:.0f} tareas/s, 20 slots={veinte_slots:.0f} tareas/s")
+        assert veinte_slots > un_slot * 3
+
+
+@pytest.mark.slow
+class TestBenchmarkLatencia:
+    """Benchmark de latencia de una tarea CRITICAL con el worker ocioso"""
+
+    @staticmethod
+    async def _dequeue_secuencial(queue: TaskQueue):
+        """Implementación anterior: un BRPOP de 1s por cola, en orden"""
+        for priority in TaskPriority:
+            result = await queue.redis.brpop(queue.queue_names[priority], timeout=1)
+            if result:
+                return result
+        return None
+
+    @staticmethod
+    async def _medir(queue: TaskQueue, dequeue, muestras: int, retraso: float) -> list:
+        latencias = []
+        for _ in range(muestras):
+            consumidor = asyncio.create_task(dequeue())
+            await asyncio.sleep(retraso)
+            inicio = time.perf_counter()
+            await queue.enqueue("critica", {}, priority=TaskPriority.CRITICAL)
+            while not await consumidor:
+                consumidor = asyncio.create_task(dequeue())
+            latencias.append(time.perf_counter() - inicio)
+        return latencias
+
+    def test_latencia_critica(self):
+        """La tarea CRITICAL debe salir en milisegundos, no tras timeouts de otras colas"""
+        async def run():
+            queue = _crear_cola()
+            # Llega mientras el worker ya espera en la cola LOW (implementación anterior)
+            antes = await self._medir(queue, lambda: self._dequeue_secuencial(queue), 3, 3.2)
+            despues = await self._medir(queue, lambda: queue.dequeue(timeout=5), 20, 0.05)
+            return antes, despues
+
+        antes, despues = asyncio.run(run())
+        print(
+            f"\nLatencia CRITICAL (p50): secuencial={statistics.median(antes) * 1000:.1f}ms "
+            f"dequeue actual={statistics.median(despues) * 1000:.1f}ms"
+        )
+        assert statistics.median(despues) < 0.1
+        assert statistics.median(despues) < statistics.median(antes)
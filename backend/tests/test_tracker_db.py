@@ -0,0 +1,198 @@
+# backend/tests/test_tracker_db.py
+"""
+Tests para la capa de almacenamiento SQLite del Tracker.
+"""
+
+import asyncio
+import pytest
+
+import database_tracker as db
+
+
+@pytest.fixture
+def tracker_db(tmp_path, monkeypatch):
+    """Base de datos del tracker aislada en un directorio temporal"""
+    db.cerrar_pool()
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "tracker.db")
+    yield db
+    db.cerrar_pool()
+
+
+def _ronda_guias(id: str, usuario_id: str = "cat1", realizado: int = 10) -> dict:
+    return {
+        "id": id, "tipo": "guias", "usuario_id": usuario_id, "usuario_nombre": "CATALINA",
+        "numero": 1, "fecha": "2026-01-15", "hora_inicio": "08:00", "hora_fin": "09:00",
+        "tiempo_usado": 60, "realizado": realizado, "cancelado": 1,
+    }
+
+
+class TestPoolConexiones:
+    """Tests del pool de conexiones"""
+
+    def test_conexiones_en_modo_wal(self, tracker_db):
+        """Las conexiones del pool deben usar WAL y synchronous=NORMAL"""
+        with tracker_db.get_pool().conexion() as conn:
+            assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+            assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1
+
+    def test_pool_reutiliza_conexiones(self, tracker_db):
+        """Una conexión devuelta debe reutilizarse en el siguiente préstamo"""
+        pool = tracker_db.get_pool()
+        with pool.conexion() as primera:
+            pass
+        with pool.conexion() as segunda:
+            assert segunda is primera
+
+    def test_transaccion_hace_rollback_en_error(self, tracker_db):
+        """Un error dentro de la transacción no debe dejar escrituras parciales"""
+        with pytest.raises(RuntimeError):
+            with tracker_db.get_pool().transaccion() as conn:
+                valores = tracker_db._valores_ronda_guias(_ronda_guias("r1")) + (0, tracker_db._nueva_version(conn))
+                conn.execute(tracker_db.SQL_INSERT_RONDA_GUIAS, valores)
+                raise RuntimeError("fallo")
+
+        assert tracker_db.get_rondas_guias() == []
+
+    def test_conexion_fallida_libera_el_cupo(self, tracker_db, monkeypatch):
+        """Un connect() que falla no debe consumir un cupo del pool"""
+        pool = tracker_db.PoolConexiones(tamano=2)
+        conectar = tracker_db.get_connection
+
+        def caido():
+            raise tracker_db.sqlite3.OperationalError("disco lleno")
+
+        monkeypatch.setattr(tracker_db, "get_connection", caido)
+        for _ in range(3):
+            with pytest.raises(tracker_db.sqlite3.OperationalError):
+                pool._tomar()
+
+        monkeypatch.setattr(tracker_db, "get_connection", conectar)
+        assert pool._creadas == 0
+        with pool.conexion() as conn:
+            assert conn.execute("SELECT 1").fetchone()[0] == 1
+
+
+class TestSincronizacionLote:
+    """Tests de escritura por lotes"""
+
+    def test_sincronizar_lote_guarda_usuarios_y_rondas(self, tracker_db):
+        """El lote debe guardar usuarios y rondas de ambos tipos"""
+        resultado = tracker_db.sincronizar_lote(
+            usuarios=[{"id": "nuevo1", "nombre": "NUEVO"}],
+            rondas=[
+                _ronda_guias("r1"),
+                {"id": "n1", "tipo": "novedades", "usuario_id": "cat1", "fecha": "2026-01-15", "hora_inicio": "09:30", "solucionadas": 4},
+            ],
+        )
+
+        assert resultado["usuarios"] == 1
+        assert resultado["rondas_guias"] == 1
+        assert resultado["rondas_novedades"] == 1
+        assert tracker_db.get_usuario("nuevo1")["nombre"] == "NUEVO"
+        assert len(tracker_db.get_todas_rondas("2026-01-15")) == 2
+
+    def test_reenviar_lote_es_idempotente(self, tracker_db):
+        """Reenviar las mismas rondas no debe fallar ni duplicarlas"""
+        rondas = [_ronda_guias("r1"), _ronda_guias("r2")]
+        tracker_db.sincronizar_lote(rondas=rondas)
+        tracker_db.sincronizar_lote(rondas=rondas)
+
+        assert len(tracker_db.get_rondas_guias("2026-01-15")) == 2
+
+    def test_ejecutar_corre_en_hilo(self, tracker_db):
+        """ejecutar() debe devolver el resultado de la función de la capa"""
+        usuarios = asyncio.run(tracker_db.ejecutar(tracker_db.get_usuarios, activos_only=True))
+        assert {u["id"] for u in usuarios} >= {"cat1", "kar1"}
+
+
+class TestSincronizacionDelta:
+    """Tests del protocolo de sincronización incremental"""
+
+    def test_cambios_solo_incluye_filas_posteriores(self, tracker_db):
+        """obtener_cambios debe devolver solo lo escrito después de la versión dada"""
+        v1 = tracker_db.sincronizar_lote(rondas=[_ronda_guias("r1")])["version"]
+        tracker_db.sincronizar_lote(rondas=[_ronda_guias("r2")])
+
+        cambios = tracker_db.obtener_cambios(v1)
+
+        assert [r["id"] for r in cambios["rondas"]] == ["r2"]
+        assert cambios["usuarios"] == []
+        assert cambios["version"] == tracker_db.get_version_actual()
+
+    def test_eliminaciones_se_envian_como_tombstones(self, tracker_db):
+        """Rondas eliminadas y usuarios desactivados deben llegar en eliminados"""
+        version = tracker_db.sincronizar_lote(rondas=[_ronda_guias("r1")])["version"]
+        tracker_db.eliminar_ronda("guias", "r1")
+        tracker_db.eliminar_usuario("kar1")
+
+        cambios = tracker_db.obtener_cambios(version)
+
+        assert {(e["tipo"], e["id"]) for e in cambios["eliminados"]} == {("guias", "r1"), ("usuario", "kar1")}
+        assert cambios["rondas"] == []
+        assert tracker_db.get_rondas_guias("2026-01-15") == []
+
+    def test_last_writer_wins_por_version(self, tracker_db):
+        """Una escritura basada en una versión vieja no debe pisar la del servidor"""
+        v1 = tracker_db.sincronizar_lote(rondas=[_ronda_guias("r1", realizado=10)])["version"]
+        v2 = tracker_db.sincronizar_lote(rondas=[{**_ronda_guias("r1", realizado=20), "version": v1}])["version"]
+
+        # Otro cliente todavía conocía v1
+        resultado = tracker_db.sincronizar_lote(rondas=[{**_ronda_guias("r1", realizado=99), "version": v1}])
+
+        assert tracker_db.get_rondas_guias("2026-01-15")[0]["realizado"] == 20
+        assert [(c["id"], c["version"]) for c in resultado["conflictos"]] == [("r1", v2)]
+
+
+class TestResumenIncremental:
+    """Tests de los agregados por (fecha, usuario) mantenidos por triggers"""
+
+    def _resumen(self, tracker_db):
+        with tracker_db.get_pool().conexion() as conn:
+            return [tuple(r) for r in conn.execute(
+                "SELECT * FROM resumen_usuario_dia WHERE rondas_guias + rondas_novedades > 0 ORDER BY fecha, usuario_id"
+            )]
+
+    def test_ranking_y_resumen_desde_agregados(self, tracker_db):
+        """Ranking y resumen del día deben reflejar las rondas guardadas"""
+        tracker_db.sincronizar_lote(rondas=[
+            _ronda_guias("r1", "cat1", realizado=10),
+            _ronda_guias("r2", "cat1", realizado=5),
+            _ronda_guias("r3", "ang1", realizado=30),
+        ])
+
+        ranking = tracker_db.get_ranking("2026-01-15", "guias")
+        resumen = tracker_db.get_resumen_dia("2026-01-15")
+
+        assert [(r["usuario_id"], r["rondas"], r["total"]) for r in ranking] == [("ang1", 1, 30), ("cat1", 2, 15)]
+        assert resumen["usuarios_activos"] == 2
+        assert resumen["guias"] == {"rondas": 3, "realizado": 45, "cancelado": 3}
+        assert tracker_db.get_estadisticas_usuario("cat1", "2026-01-15")["guias"]["tiempo"] == 120
+
+    def test_agregados_coinciden_con_reconstruccion(self, tracker_db):
+        """Actualizaciones y tombstones deben dejar el mismo resultado que recalcular"""
+        v1 = tracker_db.sincronizar_lote(rondas=[_ronda_guias("r1"), _ronda_guias("r2", "ang1")])["version"]
+        tracker_db.sincronizar_lote(rondas=[{**_ronda_guias("r1", realizado=50), "version": v1}])
+        tracker_db.eliminar_ronda("guias", "r2")
+
+        incremental = self._resumen(tracker_db)
+        tracker_db.reconstruir_resumenes()
+
+        assert self._resumen(tracker_db) == incremental
+        assert tracker_db.get_ranking("2026-01-15")[0]["total"] == 50
+        assert tracker_db.get_resumen_dia("2026-01-15")["usuarios_activos"] == 1
+
+    def test_exportacion_en_orden_de_fecha(self, tracker_db):
+        """La exportación debe recorrer ambos tipos de ronda ordenados por fecha"""
+        tracker_db.sincronizar_lote(rondas=[
+            {**_ronda_guias("r1"), "fecha": "2026-01-16"},
+            _ronda_guias("r2"),
+            {"id": "n1", "tipo": "novedades", "usuario_id": "cat1", "fecha": "2026-01-15",
+             "hora_inicio": "10:00", "solucionadas": 4},
+        ])
+
+        filas = list(tracker_db.iterar_rondas_exportacion("2026-01-01"))
+        columnas = tracker_db.COLUMNAS_EXPORTACION
+
+        assert [f[columnas.index("id")] for f in filas] == ["r2", "n1", "r1"]
+        assert filas[1][columnas.index("solucionadas")] == 4
+        assert filas[1][columnas.index("realizado")] is None
@@ -0,0 +1,220 @@
+# backend/tests/test_webhook_handler.py
+"""
+Tests para el pipeline de webhooks entrantes: cola, handlers aislados e historial.
+"""
+
+import asyncio
+import hashlib
+import hmac
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from database import EventoWebhookEntrante
+from integrations.webhook_handler import EventType, WebhookHandler, WebhookQueueFull
+
+import pytest
+
+
+@pytest.fixture
+def sesiones():
+    """Fábrica de sesiones sobre SQLite en memoria con la tabla de eventos entrantes"""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    EventoWebhookEntrante.__table__.create(engine)
+    SessionLocal = sessionmaker(bind=engine, expire_on_commit=False)
+
+    @contextmanager
+    def sesion():
+        session = SessionLocal()
+        try:
+            yield session
+            session.commit()
+        finally:
+            session.close()
+
+    return sesion
+
+
+def _evento(nombre, n=0):
+    return {"event": nombre, "data": {"n": n}}
+
+
+class TestHandlersAislados:
+    """Los handlers corren en paralelo y un fallo no afecta a los demás"""
+
+    def test_timeout_y_error_por_handler(self, sesiones):
+        """Un handler colgado se corta en su timeout y el resto termina"""
+        handler = WebhookHandler(workers=4, handler_timeout=0.2, session_factory=sesiones)
+        completados = []
+
+        async def lento(evento):
+            await asyncio.sleep(0.1)
+            completados.append(evento.data["n"])
+            return {"ok": evento.data["n"]}
+
+        async def colgado(evento):
+            await asyncio.sleep(5)
+
+        async def roto(evento):
+            raise ValueError("sin guía")
+
+        for h in (lento, colgado, roto):
+            handler.register_handler(EventType.DELAY_DETECTED, h)
+
+        async def escenario():
+            inicio = time.monotonic()
+            eventos = [handler.accept_event(_evento("delay_detected", n))[0] for n in range(8)]
+            await handler.drain()
+            duracion = time.monotonic() - inicio
+            await handler.close()
+            return eventos, duracion
+
+        eventos, duracion = asyncio.run(escenario())
+
+        assert sorted(completados) == list(range(8))
+        assert duracion < 1.0
+        resultados = eventos[0].result["results"]
+        assert resultados[0] == {"ok": 0}
+        assert resultados[1] == {"handler": "colgado", "error": "timeout"}
+        assert resultados[2] == {"handler": "roto", "error": "sin guía"}
+        assert all(e.processed for e in eventos)
+        assert handler.get_stats()["handler_timeouts"] == 8
+
+
+class TestRecepcion:
+    """Tests de idempotencia, cola acotada y firma"""
+
+    def test_duplicados_y_cola_llena(self):
+        """La misma clave no se encola dos veces y la cola llena rechaza"""
+        handler = WebhookHandler(queue_size=2, workers=1, session_factory=None)
+
+        async def escenario():
+            primero, dup1 = handler.accept_event(_evento("order_created"), idempotency_key="k1")
+            repetido, dup2 = handler.accept_event(_evento("order_created"), idempotency_key="k1")
+            handler.accept_event(_evento("order_created"), idempotency_key="k2")
+            with pytest.raises(WebhookQueueFull):
+                handler.accept_event(_evento("order_created"), idempotency_key="k3")
+            await handler.close()
+            return primero, dup1, repetido, dup2
+
+        primero, dup1, repetido, dup2 = asyncio.run(escenario())
+
+        assert (dup1, dup2) == (False, True)
+        assert repetido.id == primero.id
+        stats = handler.get_stats()
+        assert (stats["total_received"], stats["total_duplicates"], stats["total_rejected"]) == (2, 1, 1)
+        assert "k3" not in handler._seen_keys
+
+    def test_lote_entra_completo_o_no_entra(self):
+        """Un lote que no cabe entero no encola nada, así el reintento no duplica"""
+        handler = WebhookHandler(queue_size=3, workers=1, session_factory=None)
+        lote = [(_evento("order_created", n), "n8n", None) for n in range(2)]
+
+        async def escenario():
+            handler.accept_events(lote)
+            with pytest.raises(WebhookQueueFull):
+                handler.accept_events(lote)
+            en_cola = handler._queue.qsize()
+            await handler.close()
+            return en_cola
+
+        assert asyncio.run(escenario()) == 2
+        assert handler.get_stats()["total_received"] == 2
+
+    def test_firma_opcional_u_obligatoria(self):
+        """Una firma presente debe coincidir; sin firma depende de la configuración"""
+        handler = WebhookHandler(session_factory=None)
+        handler.secret = "secreto"
+        cuerpo = b'{"event": "order_created"}'
+        firma = "sha256=" + hmac.new(b"secreto", cuerpo, hashlib.sha256).hexdigest()
+
+        assert handler.check_signature(cuerpo, firma)
+        assert not handler.check_signature(cuerpo + b" ", firma)
+        assert handler.check_signature(cuerpo, None)
+        handler.require_signature = True
+        assert not handler.check_signature(cuerpo, None)
+
+
+class TestHistorial:
+    """Tests del buffer circular, la tabla persistente y los contadores"""
+
+    def test_historial_completo_y_resumen(self, sesiones):
+        """El buffer guarda los últimos N y la tabla completa el resto"""
+        handler = WebhookHandler(history_size=3, session_factory=sesiones)
+        nombres = ["order_created", "delay_detected", "issue_reported", "order_created", "delivery_failed"]
+
+        async def escenario():
+            for n, nombre in enumerate(nombres):
+                handler.accept_event(_evento(nombre, n))
+                await handler.drain()
+            await handler.close()
+            return (
+                await handler.get_event_history(limit=10),
+                await handler.get_event_history(limit=10, event_name="order_created")
+            )
+
+        historial, creados = asyncio.run(escenario())
+
+        assert [e["data"]["n"] for e in historial] == [4, 3, 2, 1, 0]
+        assert [e["data"]["n"] for e in creados] == [3, 0]
+
+        resumen = handler.get_analytics_summary()
+        assert resumen["total_events"] == 5
+        assert resumen["events_by_type"]["order_created"] == 2
+        assert resumen["critical_events_count"] == 3
+        assert [e["event"] for e in resumen["recent_critical"]] == ["delivery_failed", "issue_reported", "delay_detected"]
+
+
+class TestPersistencia:
+    """Errores al guardar el historial: duplicados y fallos puntuales"""
+
+    def test_clave_repetida_y_fallo_transitorio_no_apagan_la_tabla(self, sesiones):
+        """Una clave ya guardada cuenta como duplicado y un fallo puntual solo afecta a su evento"""
+        fallar = {"n": 1}
+
+        @contextmanager
+        def sesiones_inestables():
+            if fallar["n"] == 1:
+                fallar["n"] = 0
+                raise ConnectionError("BD caida")
+            with sesiones() as session:
+                yield session
+
+        async def escenario():
+            # Tras un reinicio las claves vistas en memoria se pierden
+            for n in range(3):
+                handler = WebhookHandler(workers=1, session_factory=sesiones_inestables)
+                handler.accept_event(_evento("order_created", n), idempotency_key="k1" if n else None)
+                await handler.close()
+            return handler
+
+        handler = asyncio.run(escenario())
+
+        with sesiones() as session:
+            assert [r.datos["n"] for r in session.query(EventoWebhookEntrante).all()] == [1]
+        assert handler.get_stats()["total_duplicates"] == 1
+        assert handler.session_factory is sesiones_inestables
+
+    def test_clave_guardada_no_vuelve_a_ejecutar_handlers(self, sesiones):
+        """Tras un reinicio, un evento con una clave ya persistida no ejecuta los handlers"""
+        ejecutados = []
+
+        async def registrar(evento):
+            ejecutados.append(evento.data["n"])
+
+        async def escenario():
+            for n in range(2):
+                handler = WebhookHandler(workers=1, session_factory=sesiones)
+                handler.register_handler(None, registrar)
+                evento, duplicado = handler.accept_event(_evento("order_created", n), idempotency_key="k1")
+                await handler.close()
+            return handler, evento, duplicado
+
+        handler, evento, duplicado = asyncio.run(escenario())
+
+        assert ejecutados == [0]
+        assert duplicado is False and evento.result["duplicate"] is True
+        assert handler.get_stats()["total_duplicates"] == 1
@@ -0,0 +1,284 @@
+# backend/tests/test_webhook_outbox.py
+"""
+Tests para el outbox de webhooks: transacción, orden, reintentos, dead-letter y lotes.
+"""
+
+import asyncio
+import json
+from contextlib import contextmanager
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from database import WebhookOutbox, EstadoEntregaWebhook
+from services.webhook_service import WebhookService
+
+import pytest
+
+
+@pytest.fixture
+def sesiones():
+    """Fábrica de sesiones sobre SQLite en memoria con la tabla webhook_outbox"""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    WebhookOutbox.__table__.create(engine)
+    SessionLocal = sessionmaker(bind=engine, expire_on_commit=False)
+
+    @contextmanager
+    def sesion():
+        session = SessionLocal()
+        try:
+            yield session
+            session.commit()
+        finally:
+            session.close()
+
+    return sesion
+
+
+class SuscriptorFalso:
+    """
+    Servidor HTTP local con un endpoint por suscriptor.
+
+    Registra cada cuerpo recibido con su firma; `fallos[ruta]` indica cuántas
+    respuestas 500 dar antes de aceptar.
+    """
+
+    def __init__(self, fallos=None, demora=0.0):
+        self.fallos = dict(fallos or {})
+        self.demora = demora
+        self.recibidos = {}
+        self.en_vuelo = 0
+        self.max_en_vuelo = 0
+        self.server = None
+
+    async def _responder(self, request):
+        ruta = request.match_info["ruta"]
+        cuerpo = await request.text()
+        self.en_vuelo += 1
+        self.max_en_vuelo = max(self.max_en_vuelo, self.en_vuelo)
+        await asyncio.sleep(self.demora)
+        self.en_vuelo -= 1
+
+        if self.fallos.get(ruta, 0) > 0:
+            self.fallos[ruta] -= 1
+            return web.Response(status=500, text="caido")
+
+        self.recibidos.setdefault(ruta, []).append((cuerpo, request.headers["X-Webhook-Signature"]))
+        return web.Response(text="ok")
+
+    async def __aenter__(self):
+        app = web.Application()
+        app.router.add_post("/{ruta}", self._responder)
+        self.server = TestServer(app)
+        await self.server.start_server()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.server.close()
+
+    def url(self, ruta):
+        return str(self.server.make_url(f"/{ruta}"))
+
+    def eventos(self, ruta):
+        return [json.loads(cuerpo)["data"]["n"] for cuerpo, _ in self.recibidos.get(ruta, [])]
+
+
+def _suscriptores(servidor, *rutas, batch_size=1):
+    return {
+        i: {"id": i, "url": servidor.url(ruta), "secret": f"secreto-{ruta}", "events": ["shipment.delivered"],
+            "is_active": True, "batch_size": batch_size, "failure_count": 0}
+        for i, ruta in enumerate(rutas, start=1)
+    }
+
+
+def _servicio(sesiones, suscriptores) -> WebhookService:
+    servicio = WebhookService(session_factory=sesiones)
+    servicio.subscriber_lookup = suscriptores.get
+    servicio.retry_delays = [0, 0]
+    return servicio
+
+
+def _encolar(servicio, sesiones, suscriptores, eventos):
+    with sesiones() as session:
+        for n in eventos:
+            servicio.enqueue(session, "shipment.delivered", {"n": n}, list(suscriptores.values()))
+
+
+async def _vaciar(servicio, rondas=20):
+    for _ in range(rondas):
+        if not await servicio.process_outbox():
+            break
+    await servicio.close()
+
+
+def _estados(sesiones):
+    with sesiones() as session:
+        return dict(session.query(WebhookOutbox.id, WebhookOutbox.estado).all())
+
+
+class TestOutbox:
+    """Tests de escritura transaccional y orden de entrega"""
+
+    def test_las_filas_viven_en_la_transaccion_del_llamador(self, sesiones):
+        """Un rollback del cambio de negocio descarta también los eventos"""
+        suscriptores = {1: {"id": 1, "url": "http://x", "events": ["shipment.delivered"]}}
+        servicio = _servicio(sesiones, suscriptores)
+
+        with sesiones() as session:
+            servicio.enqueue(session, "shipment.delivered", {"n": 1}, list(suscriptores.values()))
+            servicio.enqueue(session, "alert.created", {"n": 2}, list(suscriptores.values()))
+            session.rollback()
+
+        assert _estados(sesiones) == {}
+
+        _encolar(servicio, sesiones, suscriptores, [1])
+        assert list(_estados(sesiones).values()) == [EstadoEntregaWebhook.PENDIENTE]
+
+    def test_orden_por_suscriptor_con_reintentos_y_paralelo_entre_ellos(self, sesiones):
+        """Un suscriptor que falla no adelanta eventos ni frena a los demás"""
+        async def escenario():
+            async with SuscriptorFalso(fallos={"a": 2}, demora=0.05) as servidor:
+                suscriptores = _suscriptores(servidor, "a", "b", "c")
+                servicio = _servicio(sesiones, suscriptores)
+                _encolar(servicio, sesiones, suscriptores, [1, 2, 3])
+                await _vaciar(servicio)
+                return servidor, suscriptores, servicio
+
+        servidor, suscriptores, servicio = asyncio.run(escenario())
+
+        assert servidor.eventos("a") == servidor.eventos("b") == servidor.eventos("c") == [1, 2, 3]
+        assert servidor.max_en_vuelo == 3
+        assert suscriptores[1]["failure_count"] == 2 and suscriptores[2]["failure_count"] == 0
+        assert set(_estados(sesiones).values()) == {EstadoEntregaWebhook.ENTREGADO}
+        assert servicio.stats["retries"] == 2 and servicio.stats["delivered"] == 9
+
+
+class TestDeadLetter:
+    """Tests de reintentos agotados y reenvío"""
+
+    def test_dead_letter_y_replay(self, sesiones):
+        """Tras agotar reintentos la entrega queda en dead-letter y el replay la entrega"""
+        async def escenario():
+            async with SuscriptorFalso(fallos={"a": 3}) as servidor:
+                suscriptores = _suscriptores(servidor, "a")
+                servicio = _servicio(sesiones, suscriptores)
+                _encolar(servicio, sesiones, suscriptores, [1, 2])
+                await _vaciar(servicio)
+
+                muertas = servicio.list_dead_letters(webhook_id=1)
+                entregados_antes = servidor.eventos("a")
+
+                assert servicio.replay(delivery_ids=[muertas[0]["id"]]) == 1
+                await _vaciar(servicio)
+                return servidor, muertas, entregados_antes
+
+        servidor, muertas, entregados_antes = asyncio.run(escenario())
+
+        assert [m["intentos"] for m in muertas] == [3]
+        assert entregados_antes == [2]
+        assert servidor.eventos("a") == [2, 1]
+        assert set(_estados(sesiones).values()) == {EstadoEntregaWebhook.ENTREGADO}
+
+
+class TestLotes:
+    """Tests del envío de varios eventos por POST"""
+
+    def test_lote_firmado_sobre_el_cuerpo_completo(self, sesiones):
+        """Un solo POST con los eventos en orden y firma HMAC verificable"""
+        async def escenario():
+            async with SuscriptorFalso() as servidor:
+                suscriptores = _suscriptores(servidor, "lote", batch_size=10)
+                servicio = _servicio(sesiones, suscriptores)
+                _encolar(servicio, sesiones, suscriptores, [1, 2, 3])
+                await _vaciar(servicio)
+                return servidor, servicio
+
+        servidor, servicio = asyncio.run(escenario())
+
+        [(cuerpo, firma)] = servidor.recibidos["lote"]
+        lote = json.loads(cuerpo)
+        assert lote["batch"] is True
+        assert [e["data"]["n"] for e in lote["events"]] == [1, 2, 3]
+        assert servicio.verify_signature(cuerpo, firma, "secreto-lote")
+        assert not servicio.verify_signature(cuerpo.replace('"n": 3', '"n": 4'), firma, "secreto-lote")
+
+
+class TestSuscriptores:
+    """Tests de entregas cuando el registro en memoria no conoce el webhook"""
+
+    def test_tras_un_reinicio_las_filas_esperan_al_suscriptor(self, sesiones):
+        """Sin el webhook en el registro la fila queda pendiente y sale con el secret del registro"""
+        async def escenario():
+            async with SuscriptorFalso() as servidor:
+                suscriptores = _suscriptores(servidor, "a")
+                _encolar(_servicio(sesiones, suscriptores), sesiones, suscriptores, [1, 2])
+
+                await _vaciar(_servicio(sesiones, {}))
+                pendientes = set(_estados(sesiones).values())
+                enviados = servidor.eventos("a")
+
+                suscriptores[1]["secret"] = "secreto-nuevo"
+                servicio = _servicio(sesiones, suscriptores)
+                await _vaciar(servicio)
+                return servidor, servicio, pendientes, enviados
+
+        servidor, servicio, pendientes, enviados = asyncio.run(escenario())
+
+        assert (pendientes, enviados) == ({EstadoEntregaWebhook.PENDIENTE}, [])
+        assert servidor.eventos("a") == [1, 2]
+        cuerpo, firma = servidor.recibidos["a"][0]
+        assert servicio.verify_signature(cuerpo, firma, "secreto-nuevo")
+        assert set(_estados(sesiones).values()) == {EstadoEntregaWebhook.ENTREGADO}
+        assert "secret" not in WebhookOutbox.__table__.columns
+
+    def test_un_id_reutilizado_no_recibe_eventos_ajenos(self, sesiones):
+        """Si el id ahora es de otro webhook, las filas viejas no salen hacia él"""
+        async def escenario():
+            async with SuscriptorFalso() as servidor:
+                viejos = _suscriptores(servidor, "viejo")
+                _encolar(_servicio(sesiones, viejos), sesiones, viejos, [1])
+
+                await _vaciar(_servicio(sesiones, _suscriptores(servidor, "nuevo")))
+                return servidor
+
+        servidor = asyncio.run(escenario())
+
+        assert servidor.eventos("viejo") == servidor.eventos("nuevo") == []
+        assert set(_estados(sesiones).values()) == {EstadoEntregaWebhook.PENDIENTE}
+
+    def test_eliminar_descarta_solo_las_filas_de_ese_webhook(self, sesiones):
+        """discard_pending manda a dead-letter lo pendiente del webhook y URL indicados"""
+        suscriptores = {
+            1: {"id": 1, "url": "http://a", "events": ["shipment.delivered"]},
+            2: {"id": 2, "url": "http://b", "events": ["shipment.delivered"]},
+        }
+        servicio = _servicio(sesiones, suscriptores)
+        _encolar(servicio, sesiones, suscriptores, [1, 2])
+
+        with sesiones() as session:
+            assert servicio.discard_pending(session, 1, "http://otra") == 0
+            assert servicio.discard_pending(session, 1, "http://a") == 2
+
+        assert [m["webhook_id"] for m in servicio.list_dead_letters()] == [1, 1]
+        assert list(_estados(sesiones).values()).count(EstadoEntregaWebhook.PENDIENTE) == 2
+
+
+class TestVariosWorkers:
+    """Tests del reclamo de colas cuando hay un worker por proceso"""
+
+    def test_una_cola_reclamada_no_la_toma_otro_worker(self, sesiones):
+        """El lease del reclamo deja fuera al segundo worker hasta que el primero registra el resultado"""
+        suscriptores = {1: {"id": 1, "url": "http://a", "events": ["shipment.delivered"], "batch_size": 1}}
+        primero = _servicio(sesiones, suscriptores)
+        segundo = _servicio(sesiones, suscriptores)
+        _encolar(primero, sesiones, suscriptores, [1, 2])
+
+        [(_, filas)] = primero._claim_batches()
+        assert segundo._claim_batches() == []
+
+        primero._record_results([(filas[0]["id"], {"success": True, "status_code": 200})])
+        [(_, siguientes)] = segundo._claim_batches()
+        assert siguientes[0]["id"] == filas[0]["id"] + 1
@@ -7,6 +7,7 @@ Implementa:
 - Tareas con retry automático
 - Workers escalables
 - Dead letter queues
+- Entrega at-least-once: leases por worker, reaper y ack
 
 Uso:
     queue = TaskQueue("redis://localhost:6379/0")
@@ -23,13 +24,148 @@ Uso:
 """
 
 import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
 from typing import Callable, Dict, Any, Optional, List
 from datetime import datetime, timedelta
-from pydantic import BaseModel
+from pydantic import BaseModel, PrivateAttr
 from enum import Enum
+import inspect
+import time
 import uuid
 import redis.asyncio as redis
 
+try:
+    import psutil
+    PSUTIL_AVAILABLE = True
+except ImportError:
+    PSUTIL_AVAILABLE = False
+
+
+# Los scripts Lua reciben las colas por prioridad al final de KEYS, en
+# orden CRITICAL..LOW; la cola de una tarea se ubica por su prioridad.
+#
+# Cada vez que una tarea entra a una cola se empuja también una señal a
+# tasks:signal, para que los workers ociosos bloqueados en ella despierten;
+# el script que reclama tareas consume esas señales.
+#
+# Toda clave que toca un script llega por KEYS (nunca se arma dentro de Lua),
+# así los scripts también funcionan en Redis Cluster.
+
+# Mueve a su cola de prioridad las tareas programadas que ya vencieron.
+# Solo la ejecuta el worker que tiene el lease de scheduler: si otro worker
+# lo tiene, retorna -1 sin tocar nada. Todo ocurre de forma atómica.
+#
+# KEYS[1] = zset de programadas, KEYS[2] = lease del scheduler,
+# KEYS[3] = señal, KEYS[4..7] = colas por prioridad
+# ARGV[1] = timestamp actual, ARGV[2] = tamaño del lote,
+# ARGV[3] = id del worker, ARGV[4] = duración del lease en ms
+PROMOTE_SCHEDULED_LUA = """
+local owner = redis.call('GET', KEYS[2])
+if owner and owner ~= ARGV[3] then
+    return -1
+end
+redis.call('SET', KEYS[2], ARGV[3], 'PX', ARGV[4])
+
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+for _, data in ipairs(due) do
+    local priority = tonumber(cjson.decode(data)['priority']) or 2
+    redis.call('LPUSH', KEYS[priority + 4], data)
+    redis.call('LPUSH', KEYS[3], 1)
+end
+if #due > 0 then
+    redis.call('ZREM', KEYS[1], unpack(due))
+    redis.call('LTRIM', KEYS[3], 0, 999)
+end
+return #due
+"""
+
+# Reclama la siguiente tarea respetando prioridad: LMOVE de la primera cola
+# no vacía a la lista de procesamiento del worker y registra su lease.
+#
+# También consume las señales: si la tarea se reclamó sin esperar en la
+# lista de señales (ARGV[3] = 1), retira la señal que dejó al encolarse; si
+# todas las colas están vacías, las señales que queden son viejas y se
+# borran, así un worker ocioso no despierta por tareas que ya salieron.
+#
+# KEYS[1] = lista de procesamiento del worker, KEYS[2] = zset de leases,
+# KEYS[3] = señal, KEYS[4..7] = colas por prioridad
+# ARGV[1] = id del worker, ARGV[2] = timestamp de expiración del lease,
+# ARGV[3] = 1 si hay que consumir una señal al reclamar
+CLAIM_TASK_LUA = """
+for i = 4, #KEYS do
+    local data = redis.call('LMOVE', KEYS[i], KEYS[1], 'RIGHT', 'LEFT')
+    if data then
+        local task_id = cjson.decode(data)['id']
+        redis.call('ZADD', KEYS[2], ARGV[2], ARGV[1] .. '|' .. task_id)
+        if ARGV[3] == '1' then
+            redis.call('RPOP', KEYS[3])
+        end
+        return data
+    end
+end
+redis.call('DEL', KEYS[3])
+return false
+"""
+
+# Devuelve a su cola una tarea cuyo lease venció (worker caído o colgado).
+# La reentrega cuenta como intento; si se agotan los reintentos la tarea
+# pasa a la dead letter queue. Los datos de la tarea no se re-serializan.
+# Si el lease se renovó o se confirmó desde que se leyó, no hace nada.
+#
+# Se ejecuta una vez por lease vencido para que todas las claves que toca
+# (lista de procesamiento y metadata de esa tarea) lleguen por KEYS.
+#
+# KEYS[1] = zset de leases, KEYS[2] = dead letter queue, KEYS[3] = señal,
+# KEYS[4] = lista de procesamiento del worker, KEYS[5] = metadata de la tarea,
+# KEYS[6..9] = colas por prioridad
+# ARGV[1] = miembro del lease, ARGV[2] = id de la tarea, ARGV[3] = timestamp actual
+REAP_EXPIRED_LUA = """
+local score = redis.call('ZSCORE', KEYS[1], ARGV[1])
+if not score or tonumber(score) > tonumber(ARGV[3]) then
+    return 0
+end
+redis.call('ZREM', KEYS[1], ARGV[1])
+for _, data in ipairs(redis.call('LRANGE', KEYS[4], 0, -1)) do
+    local task = cjson.decode(data)
+    if task['id'] == ARGV[2] then
+        redis.call('LREM', KEYS[4], 1, data)
+        local attempts = redis.call('HINCRBY', KEYS[5], 'lease_expirations', 1)
+        if attempts >= (tonumber(task['max_retries']) or 3) then
+            redis.call('LPUSH', KEYS[2], data)
+            redis.call('HSET', KEYS[5], 'status', 'dead')
+            return 0
+        end
+        local priority = tonumber(task['priority']) or 2
+        redis.call('LPUSH', KEYS[priority + 6], data)
+        redis.call('LPUSH', KEYS[3], 1)
+        redis.call('HSET', KEYS[5], 'status', 'pending')
+        return 1
+    end
+end
+return 0
+"""
+
+# Devuelve al frente de su cola una tarea reservada que no se llegó a
+# procesar (prefetch al apagar un worker). No cuenta como intento. Si la
+# tarea ya no está en la lista de procesamiento (ack o reaper) no hace nada.
+#
+# KEYS[1] = lista de procesamiento del worker, KEYS[2] = zset de leases,
+# KEYS[3] = señal, KEYS[4..7] = colas por prioridad
+# ARGV[1] = JSON de la tarea, ARGV[2] = miembro del lease, ARGV[3] = metadata
+RELEASE_TASK_LUA = """
+if redis.call('LREM', KEYS[1], 1, ARGV[1]) == 0 then
+    return 0
+end
+redis.call('ZREM', KEYS[2], ARGV[2])
+local priority = tonumber(cjson.decode(ARGV[1])['priority']) or 2
+redis.call('RPUSH', KEYS[priority + 4], ARGV[1])
+redis.call('LPUSH', KEYS[3], 1)
+redis.call('HSET', ARGV[3], 'status', 'pending')
+return 1
+"""
+
+
 
 # ═══════════════════════════════════════════
 # TIPOS Y MODELOS
@@ -69,6 +205,11 @@ class Task(BaseModel):
     result: Optional[Dict[str, Any]] = None
     country: Optional[str] = None
     worker_id: Optional[str] = None
+    idempotency_key: Optional[str] = None
+
+    # JSON exacto con el que la tarea quedó en la lista de procesamiento,
+    # necesario para retirarla al confirmarla (ack)
+    _raw: Optional[str] = PrivateAttr(default=None)
 
     class Config:
         use_enum_values = True
@@ -89,15 +230,25 @@ class TaskQueue:
     - Dead letter queue
     """
 
-    def __init__(self, redis_url: str):
+    def __init__(
+        self,
+        redis_url: str,
+        lease_seconds: int = 60,
+        redis_client: Optional[redis.Redis] = None
+    ):
         """
         Inicializar cola.
 
         Args:
             redis_url: URL de conexión a Redis
+            lease_seconds: Tiempo que un worker tiene para confirmar o
+                renovar una tarea antes de que se reentregue
+            redis_client: Cliente ya creado (con decode_responses=True);
+                si se pasa, se ignora redis_url
         """
-        self.redis = redis.from_url(redis_url, decode_responses=True)
+        self.redis = redis_client or redis.from_url(redis_url, decode_responses=True)
         self.handlers: Dict[str, Callable] = {}
+        self.cpu_bound_types: set = set()
 
         # Nombres de colas por prioridad
         self.queue_names = {
@@ -107,18 +258,49 @@ class TaskQueue:
             TaskPriority.LOW: "tasks:low",
         }
 
+        # Claves en orden de prioridad para un único BRPOP
+        self.priority_keys = [self.queue_names[p] for p in sorted(TaskPriority)]
+
         # Dead letter queue
         self.dlq_name = "tasks:dead_letter"
 
-    def register_handler(self, task_type: str, handler: Callable):
+        # Tareas programadas y lease del worker que las promueve
+        self.scheduled_name = "tasks:scheduled"
+        self.scheduler_lease_name = "tasks:scheduler:leader"
+
+        # Entrega confiable: lista de procesamiento por worker + leases
+        self.lease_seconds = lease_seconds
+        self.processing_prefix = "tasks:processing:"
+        self.leases_name = "tasks:leases"
+        self.signal_name = "tasks:signal"
+        self.done_prefix = "tasks:done:"
+        self.running_prefix = "tasks:running:"
+
+        self._promote_script = self.redis.register_script(PROMOTE_SCHEDULED_LUA)
+        self._claim_script = self.redis.register_script(CLAIM_TASK_LUA)
+        self._reap_script = self.redis.register_script(REAP_EXPIRED_LUA)
+        self._release_script = self.redis.register_script(RELEASE_TASK_LUA)
+
+    def processing_list(self, worker_id: str) -> str:
+        """Nombre de la lista de procesamiento de un worker."""
+        return f"{self.processing_prefix}{worker_id}"
+
+    def register_handler(self, task_type: str, handler: Callable, cpu_bound: bool = False):
         """
         Registrar handler para tipo de tarea.
 
         Args:
             task_type: Tipo de tarea
             handler: Función async que procesa la tarea
+            cpu_bound: Si True, el worker lo ejecuta en un proceso aparte
+                para no bloquear el event loop. Debe ser una función de
+                módulo (picklable) y recibe solo el payload.
         """
         self.handlers[task_type] = handler
+        if cpu_bound:
+            self.cpu_bound_types.add(task_type)
+        else:
+            self.cpu_bound_types.discard(task_type)
 
     async def enqueue(
         self,
@@ -127,7 +309,8 @@ class TaskQueue:
         priority: TaskPriority = TaskPriority.NORMAL,
         country: str = None,
         delay_seconds: int = 0,
-        max_retries: int = 3
+        max_retries: int = 3,
+        idempotency_key: str = None
     ) -> str:
         """
         Encolar nueva tarea.
@@ -139,6 +322,7 @@ class TaskQueue:
             country: País (para routing)
             delay_seconds: Segundos de delay
             max_retries: Máximo de reintentos
+            idempotency_key: Clave para deduplicar reentregas (por defecto, el ID)
 
         Returns:
             ID de la tarea creada
@@ -150,7 +334,8 @@ class TaskQueue:
             priority=priority,
             created_at=datetime.utcnow(),
             country=country,
-            max_retries=max_retries
+            max_retries=max_retries,
+            idempotency_key=idempotency_key
         )
 
         task_data = task.json()
@@ -159,13 +344,14 @@ class TaskQueue:
             # Tarea con delay (scheduled)
             execute_at = datetime.utcnow() + timedelta(seconds=delay_seconds)
             await self.redis.zadd(
-                "tasks:scheduled",
+                self.scheduled_name,
                 {task_data: execute_at.timestamp()}
             )
         else:
             # Tarea inmediata
             queue_name = self.queue_names[priority]
             await self.redis.lpush(queue_name, task_data)
+            await self._signal()
 
         # Guardar metadata
         await self.redis.hset(f"task:{task.id}", mapping={
@@ -204,7 +390,8 @@ class TaskQueue:
                 priority=task_data.get("priority", priority),
                 created_at=datetime.utcnow(),
                 country=task_data.get("country"),
-                max_retries=task_data.get("max_retries", 3)
+                max_retries=task_data.get("max_retries", 3),
+                idempotency_key=task_data.get("idempotency_key")
             )
 
             task_json = task.json()
@@ -219,69 +406,245 @@ class TaskQueue:
 
             task_ids.append(task.id)
 
+        if task_ids:
+            pipe.lpush(self.signal_name, *([1] * len(task_ids)))
+            pipe.ltrim(self.signal_name, 0, 999)
         await pipe.execute()
         return task_ids
 
-    async def dequeue(self, timeout: int = 5) -> Optional[Task]:
+    async def _signal(self, count: int = 1):
+        """Despertar workers bloqueados esperando tareas."""
+        pipe = self.redis.pipeline()
+        pipe.lpush(self.signal_name, *([1] * count))
+        pipe.ltrim(self.signal_name, 0, 999)
+        await pipe.execute()
+
+    async def dequeue(self, timeout: int = 5, worker_id: str = "default") -> Optional[Task]:
         """
-        Obtener siguiente tarea (respetando prioridad).
+        Obtener siguiente tarea (respetando prioridad) con entrega confiable.
+
+        Un script Lua hace LMOVE desde la primera cola no vacía, en orden de
+        prioridad, hacia la lista de procesamiento del worker y registra un
+        lease. La tarea no sale de Redis hasta que se confirma con complete()
+        o fail(); si el worker muere, reap_expired_leases() la reentrega.
+
+        BLMOVE solo puede bloquear sobre una lista, así que cuando todas las
+        colas están vacías el worker se bloquea en la lista de señales (que
+        recibe un elemento por cada tarea encolada) y vuelve a reclamar. El
+        mismo script consume las señales de lo que reclama y borra las que
+        quedan cuando no hay tareas, así la espera no gira sobre señales viejas.
+
+        Las tareas programadas no se promueven aquí; ver
+        promote_scheduled_tasks().
 
         Args:
             timeout: Timeout en segundos para esperar
+            worker_id: ID del worker que reclama la tarea
 
         Returns:
             Task si hay disponible, None si no
         """
-        # Procesar tareas scheduled primero
-        await self._process_scheduled_tasks()
+        deadline = time.monotonic() + timeout
+        signaled = False
 
-        # Intentar obtener de cada cola en orden de prioridad
-        for priority in TaskPriority:
-            queue_name = self.queue_names[priority]
+        while True:
+            task_data = await self._claim_script(
+                keys=[self.processing_list(worker_id), self.leases_name, self.signal_name, *self.priority_keys],
+                args=[worker_id, time.time() + self.lease_seconds, 0 if signaled else 1]
+            )
+            if task_data:
+                break
 
-            result = await self.redis.brpop(queue_name, timeout=1)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            signaled = bool(await self.redis.brpop(self.signal_name, timeout=remaining))
 
-            if result:
-                _, task_data = result
-                task = Task.parse_raw(task_data)
+        task = Task.parse_raw(task_data)
+        task._raw = task_data
 
-                # Marcar como procesando
-                task.status = TaskStatus.PROCESSING
-                task.started_at = datetime.utcnow()
+        # Marcar como procesando
+        task.status = TaskStatus.PROCESSING
+        task.started_at = datetime.utcnow()
+        task.worker_id = worker_id
 
-                await self.redis.hset(f"task:{task.id}", mapping={
-                    "data": task.json(),
-                    "status": TaskStatus.PROCESSING.value
-                })
+        await self.redis.hset(f"task:{task.id}", mapping={
+            "data": task.json(),
+            "status": TaskStatus.PROCESSING.value
+        })
 
-                return task
+        return task
 
-        return None
+    def _ack(self, pipe, task: Task):
+        """Agregar al pipeline el retiro de la tarea de procesamiento y su lease."""
+        if task._raw is not None and task.worker_id:
+            pipe.lrem(self.processing_list(task.worker_id), 1, task._raw)
+            pipe.zrem(self.leases_name, f"{task.worker_id}|{task.id}")
 
-    async def _process_scheduled_tasks(self):
-        """Mover tareas scheduled que ya deben ejecutarse."""
-        now = datetime.utcnow().timestamp()
-
-        # Obtener tareas cuyo tiempo ya pasó
-        tasks = await self.redis.zrangebyscore(
-            "tasks:scheduled",
-            "-inf",
-            now,
-            start=0,
-            num=100
+    async def ack(self, task: Task):
+        """
+        Confirmar una tarea sin cambiar su estado.
+
+        complete() y fail() ya confirman; esto sirve para descartar
+        reentregas duplicadas.
+        """
+        pipe = self.redis.pipeline(transaction=True)
+        self._ack(pipe, task)
+        await pipe.execute()
+
+    async def release(self, task: Task) -> bool:
+        """
+        Devolver a su cola una tarea reservada que no se procesó.
+
+        La tarea vuelve al frente de su prioridad sin contar como intento.
+
+        Returns:
+            True si la tarea seguía reservada y se devolvió
+        """
+        if task._raw is None or not task.worker_id:
+            return False
+        released = await self._release_script(
+            keys=[self.processing_list(task.worker_id), self.leases_name, self.signal_name, *self.priority_keys],
+            args=[task._raw, f"{task.worker_id}|{task.id}", f"task:{task.id}"]
         )
+        return bool(released)
 
-        for task_data in tasks:
-            task = Task.parse_raw(task_data)
-            queue_name = self.queue_names[task.priority]
+    async def extend_leases(self, tasks: List[Task]) -> int:
+        """
+        Renovar el lease de tareas en curso (heartbeat del worker).
 
-            # Mover a cola normal
-            await self.redis.lpush(queue_name, task_data)
-            await self.redis.zrem("tasks:scheduled", task_data)
+        Solo renueva leases que siguen existiendo: si el reaper ya reentregó
+        una tarea, no se revive su lease.
+
+        Args:
+            tasks: Tareas que el worker sigue procesando
+
+        Returns:
+            Número de leases renovados
+        """
+        leases = {
+            f"{task.worker_id}|{task.id}": time.time() + self.lease_seconds
+            for task in tasks if task.worker_id
+        }
+        if not leases:
+            return 0
+
+        pipe = self.redis.pipeline()
+        pipe.zadd(self.leases_name, leases, xx=True, ch=True)
+        for task in tasks:
+            if task.type in self.cpu_bound_types:
+                pipe.pexpire(self._execution_key(task), self._execution_ttl_ms)
+        return (await pipe.execute())[0]
+
+    async def reap_expired_leases(self, batch_size: int = 100) -> int:
+        """
+        Reencolar tareas cuyo lease venció.
+
+        Args:
+            batch_size: Máximo de leases a revisar por llamada
+
+        Returns:
+            Número de tareas devueltas a su cola
+        """
+        now = time.time()
+        expired = await self.redis.zrangebyscore(self.leases_name, "-inf", now, start=0, num=batch_size)
+
+        requeued = 0
+        for member in expired:
+            worker_id, _, task_id = member.rpartition("|")
+            requeued += await self._reap_script(
+                keys=[
+                    self.leases_name, self.dlq_name, self.signal_name,
+                    self.processing_list(worker_id), f"task:{task_id}", *self.priority_keys
+                ],
+                args=[member, task_id, now]
+            )
+        return requeued
+
+    async def promote_scheduled_tasks(
+        self,
+        owner_id: str,
+        lease_seconds: float = 5.0,
+        batch_size: int = 500
+    ) -> int:
+        """
+        Mover tareas scheduled que ya deben ejecutarse (solo el líder).
+
+        Un script Lua toma o renueva el lease de scheduler para `owner_id` y,
+        si lo tiene, mueve en lote las tareas vencidas a su cola de forma
+        atómica. Los demás workers reciben -1 sin hacer trabajo.
+
+        Args:
+            owner_id: ID del worker que intenta promover
+            lease_seconds: Duración del lease de líder
+            batch_size: Máximo de tareas a mover por llamada
+
+        Returns:
+            Número de tareas movidas, o -1 si otro worker es el líder
+        """
+        return await self._promote_script(
+            keys=[self.scheduled_name, self.scheduler_lease_name, self.signal_name, *self.priority_keys],
+            args=[datetime.utcnow().timestamp(), batch_size, owner_id, int(lease_seconds * 1000)]
+        )
+
+    # ─────────────── Idempotencia ───────────────
+
+    def _idempotency_key(self, task: Task) -> str:
+        return f"{self.done_prefix}{task.idempotency_key or task.id}"
+
+    async def is_completed(self, task: Task) -> bool:
+        """
+        Verificar si una tarea con la misma clave de idempotencia ya se completó.
+
+        Permite descartar reentregas (por lease vencido) de tareas que en
+        realidad terminaron.
+        """
+        return bool(await self.redis.exists(self._idempotency_key(task)))
+
+    async def claim_idempotency_key(self, key: str, ttl_seconds: int = 86400) -> bool:
+        """
+        Reservar una clave de idempotencia para un efecto externo.
+
+        Los handlers la usan para no repetir efectos (enviar un mensaje,
+        cobrar) cuando una tarea se reintenta.
+
+        Returns:
+            True la primera vez, False si la clave ya estaba reservada
+        """
+        return bool(await self.redis.set(f"{self.done_prefix}effect:{key}", 1, nx=True, ex=ttl_seconds))
+
+    def _execution_key(self, task: Task) -> str:
+        return f"{self.running_prefix}{task.idempotency_key or task.id}"
+
+    @property
+    def _execution_ttl_ms(self) -> int:
+        # Más corto que el lease (se renueva cada tercio): si el worker
+        # muere, la reserva vence antes de que el reaper reentregue la tarea
+        return max(1, int(self.lease_seconds * 1000 * 2 / 3))
+
+    async def claim_execution(self, task: Task) -> bool:
+        """
+        Reservar la ejecución de una tarea cpu_bound.
+
+        Los handlers cpu_bound corren en otro proceso y no pueden usar
+        `claim_idempotency_key`; el worker reserva la clave de la tarea antes
+        de enviarla al pool para que dos entregas no la ejecuten a la vez.
+        La reserva se renueva junto con el lease.
+
+        Returns:
+            True si se reservó, False si otra entrega la está ejecutando
+        """
+        return bool(await self.redis.set(
+            self._execution_key(task), f"{task.worker_id}|{task.id}", nx=True, px=self._execution_ttl_ms
+        ))
+
+    async def release_execution(self, task: Task):
+        """Liberar la reserva de ejecución de una tarea cpu_bound."""
+        await self.redis.delete(self._execution_key(task))
 
     async def complete(self, task: Task, result: Dict[str, Any] = None):
         """
-        Marcar tarea como completada.
+        Marcar tarea como completada y confirmarla (ack).
 
         Args:
             task: Tarea completada
@@ -291,17 +654,20 @@ class TaskQueue:
         task.completed_at = datetime.utcnow()
         task.result = result
 
-        await self.redis.hset(f"task:{task.id}", mapping={
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.hset(f"task:{task.id}", mapping={
             "data": task.json(),
             "status": TaskStatus.COMPLETED.value
         })
-
         # Expirar después de 24 horas
-        await self.redis.expire(f"task:{task.id}", 86400)
+        pipe.expire(f"task:{task.id}", 86400)
+        pipe.set(self._idempotency_key(task), 1, ex=604800)
+        self._ack(pipe, task)
+        await pipe.execute()
 
     async def fail(self, task: Task, error: str):
         """
-        Marcar tarea como fallida (con reintento si aplica).
+        Marcar tarea como fallida (con reintento si aplica) y confirmarla (ack).
 
         Args:
             task: Tarea fallida
@@ -309,6 +675,7 @@ class TaskQueue:
         """
         task.retries += 1
         task.error_message = error
+        pipe = self.redis.pipeline(transaction=True)
 
         if task.retries < task.max_retries:
             # Reintentar con backoff exponencial
@@ -320,12 +687,12 @@ class TaskQueue:
             task_data = task.json()
 
             execute_at = datetime.utcnow() + timedelta(seconds=delay)
-            await self.redis.zadd(
-                "tasks:scheduled",
+            pipe.zadd(
+                self.scheduled_name,
                 {task_data: execute_at.timestamp()}
             )
 
-            await self.redis.hset(f"task:{task.id}", mapping={
+            pipe.hset(f"task:{task.id}", mapping={
                 "data": task_data,
                 "status": TaskStatus.RETRYING.value
             })
@@ -334,13 +701,16 @@ class TaskQueue:
             task.status = TaskStatus.DEAD
             task.completed_at = datetime.utcnow()
 
-            await self.redis.lpush(self.dlq_name, task.json())
+            pipe.lpush(self.dlq_name, task.json())
 
-            await self.redis.hset(f"task:{task.id}", mapping={
+            pipe.hset(f"task:{task.id}", mapping={
                 "data": task.json(),
                 "status": TaskStatus.DEAD.value
             })
 
+        self._ack(pipe, task)
+        await pipe.execute()
+
     async def get_status(self, task_id: str) -> Optional[Task]:
         """
         Obtener estado de tarea.
@@ -365,7 +735,7 @@ class TaskQueue:
         """
         stats = {
             "queues": {},
-            "scheduled": await self.redis.zcard("tasks:scheduled"),
+            "scheduled": await self.redis.zcard(self.scheduled_name),
             "dead_letter": await self.redis.llen(self.dlq_name)
         }
 
@@ -373,6 +743,7 @@ class TaskQueue:
             stats["queues"][priority.name] = await self.redis.llen(queue_name)
 
         stats["total_pending"] = sum(stats["queues"].values())
+        stats["in_flight"] = await self.redis.zcard(self.leases_name)
 
         return stats
 
@@ -419,6 +790,7 @@ class TaskQueue:
                     self.queue_names[task.priority],
                     task.json()
                 )
+                await self._signal()
 
                 return True
 
@@ -429,18 +801,35 @@ class TaskQueue:
 # WORKER
 # ═══════════════════════════════════════════
 
+def _run_handler_in_process(handler: Callable, payload: Dict[str, Any]) -> Any:
+    """Ejecutar un handler cpu_bound dentro de un proceso del pool."""
+    if inspect.iscoroutinefunction(handler):
+        return asyncio.run(handler(payload))
+    return handler(payload)
+
+
 class TaskWorker:
     """
     Worker que procesa tareas de la cola.
 
-    Soporta concurrencia configurable y shutdown graceful.
+    Corre `concurrency` slots async que consumen de un buffer local con
+    prefetch acotado; un fetcher lo llena desde Redis y deja de pedir
+    tareas cuando el buffer está lleno o hay presión de memoria/CPU. Los
+    handlers registrados como cpu_bound se ejecutan en un ProcessPoolExecutor.
+    Soporta shutdown graceful.
     """
 
     def __init__(
         self,
         queue: TaskQueue,
         worker_id: str,
-        concurrency: int = 10
+        concurrency: int = 10,
+        scheduler_interval: float = 1.0,
+        prefetch: Optional[int] = None,
+        cpu_workers: Optional[int] = None,
+        max_memory_percent: float = 90.0,
+        max_cpu_percent: float = 95.0,
+        heartbeat_interval: float = 10.0
     ):
         """
         Inicializar worker.
@@ -449,33 +838,60 @@ class TaskWorker:
             queue: Cola de tareas
             worker_id: ID único del worker
             concurrency: Número de tareas simultáneas
+            scheduler_interval: Segundos entre intentos de promover tareas programadas
+            prefetch: Tareas reservadas por adelantado (por defecto, concurrency)
+            cpu_workers: Procesos para handlers cpu_bound (por defecto, núcleos)
+            max_memory_percent: Uso de memoria del sistema sobre el que se deja de pedir tareas
+            max_cpu_percent: Uso de CPU del sistema sobre el que se deja de pedir tareas
+            heartbeat_interval: Segundos entre heartbeats publicados en Redis
         """
         self.queue = queue
         self.worker_id = worker_id
         self.concurrency = concurrency
+        self.scheduler_interval = scheduler_interval
+        self.prefetch = prefetch if prefetch is not None else concurrency
+        self.cpu_workers = cpu_workers or os.cpu_count() or 1
+        self.max_memory_percent = max_memory_percent
+        self.max_cpu_percent = max_cpu_percent
+        self.heartbeat_interval = heartbeat_interval
         self.running = False
+        self.paused = False
         self.current_tasks = 0
+        self.processed = 0
+        self.failed = 0
         self._tasks: List[asyncio.Task] = []
+        self._scheduler_task: Optional[asyncio.Task] = None
+        self._lease_task: Optional[asyncio.Task] = None
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._buffer: Optional[asyncio.Queue] = None
+        self._capacity: Optional[asyncio.Semaphore] = None
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+        self._in_flight: Dict[str, Task] = {}
+
+    @property
+    def heartbeat_key(self) -> str:
+        return f"workers:heartbeat:{self.worker_id}"
 
     async def start(self):
-        """Iniciar worker."""
+        """Iniciar worker (retorna cuando el worker se detiene)."""
         self.running = True
+        self._buffer = asyncio.Queue(maxsize=max(1, self.prefetch))
+        self._capacity = asyncio.Semaphore(max(1, self.prefetch))
+        self._scheduler_task = asyncio.create_task(self._scheduler_loop())
+        self._lease_task = asyncio.create_task(self._lease_loop())
+        self._heartbeat_task = asyncio.create_task(self._heartbeat_loop())
+        self._tasks = [asyncio.create_task(self._slot_loop()) for _ in range(self.concurrency)]
 
-        print(f"🚀 Worker {self.worker_id} iniciado (concurrency={self.concurrency})")
+        print(f"🚀 Worker {self.worker_id} iniciado (concurrency={self.concurrency}, prefetch={self.prefetch})")
 
-        while self.running:
-            if self.current_tasks < self.concurrency:
-                task = await self.queue.dequeue(timeout=5)
-
-                if task:
-                    task.worker_id = self.worker_id
-                    asyncio_task = asyncio.create_task(self._process_task(task))
-                    self._tasks.append(asyncio_task)
-            else:
-                await asyncio.sleep(0.1)
-
-            # Limpiar tareas completadas
-            self._tasks = [t for t in self._tasks if not t.done()]
+        try:
+            await self._fetch_loop()
+        finally:
+            # Los slots terminan lo que quede en el buffer y luego salen
+            for slot in self._tasks:
+                if not slot.done():
+                    await self._buffer.put(None)
+            await asyncio.gather(*self._tasks, return_exceptions=True)
 
     async def stop(self, graceful: bool = True):
         """
@@ -487,20 +903,216 @@ class TaskWorker:
         print(f"⏹️ Deteniendo worker {self.worker_id}...")
         self.running = False
 
-        if graceful:
-            # Esperar tareas en progreso
-            max_wait = 60  # segundos
-            waited = 0
+        if self._scheduler_task:
+            self._scheduler_task.cancel()
+
+        # Las tareas prefetched que ningún slot tomó vuelven a su cola
+        released = await self._release_buffered()
+        if released:
+            print(f"  ↩️ {released} tareas prefetched devueltas a la cola")
+
+        if self._tasks:
+            if graceful:
+                # Los slots salen al recibir el fin que envía start()
+                max_wait = 60  # segundos
+                _, pending = await asyncio.wait(self._tasks, timeout=max_wait)
+                if pending:
+                    print(f"  ⚠️ {self.current_tasks} tareas no completadas")
+            for slot in self._tasks:
+                slot.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+        # Sin renovación, las tareas interrumpidas se reentregan al vencer su lease
+        if self._lease_task:
+            self._lease_task.cancel()
+        if self._heartbeat_task:
+            self._heartbeat_task.cancel()
+        if self._process_pool:
+            self._process_pool.shutdown(wait=graceful, cancel_futures=not graceful)
+            self._process_pool = None
 
-            while self.current_tasks > 0 and waited < max_wait:
+        try:
+            await self.queue.redis.delete(self.heartbeat_key)
+        except Exception:
+            pass
+
+        print(f"✅ Worker {self.worker_id} detenido")
+
+    # ─────────────── Fetch y slots ───────────────
+
+    async def _release_buffered(self) -> int:
+        """Vaciar el buffer local devolviendo cada tarea a Redis."""
+        # Se vacía sin ceder el loop: el fin que start() encola después
+        # para los slots no debe perderse aquí
+        tasks = []
+        while self._buffer is not None and not self._buffer.empty():
+            task = self._buffer.get_nowait()
+            if task is not None:
+                tasks.append(task)
+                self._in_flight.pop(task.id, None)
+                self._capacity.release()
+
+        released = 0
+        for task in tasks:
+            try:
+                released += await self.queue.release(task)
+            except Exception as e:
+                print(f"⚠️ Worker {self.worker_id}: no se pudo devolver la tarea {task.id}: {e}")
+        return released
+
+    async def _fetch_loop(self):
+        """
+        Llenar el buffer local desde Redis.
+
+        Antes de pedir una tarea espera un lugar libre en el buffer (el
+        semáforo `_capacity`, que libera el slot al tomar una tarea), así
+        nunca hay más de `prefetch` tareas reservadas sin slot. Bajo presión
+        de memoria o CPU deja de pedir tareas hasta que baje.
+        """
+        while self.running:
+            if self._under_pressure():
+                if not self.paused:
+                    print(f"⏸️ Worker {self.worker_id}: backpressure, se pausa el fetch")
+                self.paused = True
                 await asyncio.sleep(1)
-                waited += 1
-                print(f"  Esperando {self.current_tasks} tareas...")
+                continue
+            self.paused = False
+
+            # Reservar antes de pedir: no sacar de Redis lo que no cabe
+            try:
+                await asyncio.wait_for(self._capacity.acquire(), timeout=1)
+            except asyncio.TimeoutError:
+                continue
+            if not self.running:
+                self._capacity.release()
+                break
+
+            task = await self.queue.dequeue(timeout=1, worker_id=self.worker_id)
+            if task and self.running:
+                self._in_flight[task.id] = task
+                self._buffer.put_nowait(task)
+                continue
+
+            self._capacity.release()
+            if task:
+                # stop() ya vació el buffer: no retener la tarea
+                await self.queue.release(task)
+
+    async def _slot_loop(self):
+        """Slot de ejecución: procesa tareas del buffer una a la vez."""
+        while True:
+            task = await self._buffer.get()
+            if task is None:
+                return
+            self._capacity.release()
+            await self._process_task(task)
+
+    def _under_pressure(self) -> bool:
+        """True si el sistema supera los umbrales de memoria o CPU."""
+        if PSUTIL_AVAILABLE:
+            if psutil.virtual_memory().percent >= self.max_memory_percent:
+                return True
+            return psutil.cpu_percent(interval=None) >= self.max_cpu_percent
 
-            if self.current_tasks > 0:
-                print(f"  ⚠️ {self.current_tasks} tareas no completadas")
+        # Sin psutil solo se puede estimar CPU con el load average
+        try:
+            load = os.getloadavg()[0] / (os.cpu_count() or 1) * 100
+        except (AttributeError, OSError):
+            return False
+        return load >= self.max_cpu_percent
 
-        print(f"✅ Worker {self.worker_id} detenido")
+    # ─────────────── Loops de mantenimiento ───────────────
+
+    async def _scheduler_loop(self):
+        """
+        Promover tareas programadas y reencolar leases vencidos.
+
+        Todos los workers lo intentan, pero el lease en Redis hace que solo
+        uno (el líder) mueva tareas; si el líder muere, el lease expira y
+        otro toma su lugar.
+        """
+        lease_seconds = max(5.0, self.scheduler_interval * 3)
+
+        while self.running:
+            try:
+                promoted = await self.queue.promote_scheduled_tasks(self.worker_id, lease_seconds=lease_seconds)
+                if promoted >= 0:
+                    reaped = await self.queue.reap_expired_leases()
+                    if reaped:
+                        print(f"♻️ {reaped} tareas con lease vencido reencoladas")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ Worker {self.worker_id}: error promoviendo tareas programadas: {e}")
+
+            await asyncio.sleep(self.scheduler_interval)
+
+    async def _lease_loop(self):
+        """Renovar los leases de las tareas en curso y prefetched."""
+        interval = self.queue.lease_seconds / 3
+
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.queue.extend_leases(list(self._in_flight.values()))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ Worker {self.worker_id}: error renovando leases: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Estado del worker (lo que se publica en el heartbeat)."""
+        return {
+            "worker_id": self.worker_id,
+            "slots": self.concurrency,
+            "in_flight": self.current_tasks,
+            "prefetched": self._buffer.qsize() if self._buffer else 0,
+            "processed": self.processed,
+            "failed": self.failed,
+            "paused": int(self.paused),
+            "timestamp": datetime.utcnow().isoformat(),
+        }
+
+    async def _heartbeat_loop(self):
+        """Publicar periódicamente el estado del worker en Redis."""
+        while True:
+            try:
+                pipe = self.queue.redis.pipeline()
+                pipe.hset(self.heartbeat_key, mapping=self.get_stats())
+                pipe.expire(self.heartbeat_key, int(self.heartbeat_interval * 3) + 1)
+                await pipe.execute()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ Worker {self.worker_id}: error publicando heartbeat: {e}")
+
+            await asyncio.sleep(self.heartbeat_interval)
+
+    # ─────────────── Ejecución ───────────────
+
+    async def _run_handler(self, handler: Callable, task: Task) -> Any:
+        """
+        Ejecutar handler, pasando la clave de idempotencia si la acepta.
+
+        Los handlers que declaran `idempotency_key` la reciben para
+        deduplicar efectos externos en reintentos. Los handlers cpu_bound
+        corren en el pool de procesos; `_process_task` reserva su ejecución
+        antes de enviarlos.
+        """
+        if task.type in self.queue.cpu_bound_types:
+            if self._process_pool is None:
+                self._process_pool = ProcessPoolExecutor(max_workers=self.cpu_workers)
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._process_pool, _run_handler_in_process, handler, task.payload)
+
+        try:
+            accepts_key = "idempotency_key" in inspect.signature(handler).parameters
+        except (TypeError, ValueError):
+            accepts_key = False
+
+        if accepts_key:
+            return await handler(task.payload, idempotency_key=task.idempotency_key or task.id)
+        return await handler(task.payload)
 
     async def _process_task(self, task: Task):
         """
@@ -510,19 +1122,37 @@ class TaskWorker:
             task: Tarea a procesar
         """
         self.current_tasks += 1
+        self._in_flight[task.id] = task
         start_time = datetime.utcnow()
+        execution_claimed = False
 
         try:
+            # Reentrega de una tarea que ya había terminado
+            if await self.queue.is_completed(task):
+                await self.queue.ack(task)
+                print(f"⏭️ Task {task.id} ya completada, se omite")
+                return
+
             handler = self.queue.handlers.get(task.type)
 
             if not handler:
                 raise ValueError(f"No hay handler para tarea tipo: {task.type}")
 
+            # Guarda antes de enviar al pool de procesos: otra entrega de la
+            # misma tarea ya se está ejecutando
+            if task.type in self.queue.cpu_bound_types:
+                execution_claimed = await self.queue.claim_execution(task)
+                if not execution_claimed:
+                    await self.queue.ack(task)
+                    print(f"⏭️ Task {task.id} ya en ejecución en otra entrega, se omite")
+                    return
+
             # Ejecutar handler
-            result = await handler(task.payload)
+            result = await self._run_handler(handler, task)
 
             # Marcar completada
             await self.queue.complete(task, result)
+            self.processed += 1
 
             duration = (datetime.utcnow() - start_time).total_seconds()
             print(f"✅ Task {task.id} completada ({duration:.2f}s)")
@@ -531,8 +1161,15 @@ class TaskWorker:
             duration = (datetime.utcnow() - start_time).total_seconds()
             print(f"❌ Task {task.id} falló ({duration:.2f}s): {str(e)}")
             await self.queue.fail(task, str(e))
+            self.failed += 1
 
         finally:
+            if execution_claimed:
+                try:
+                    await self.queue.release_execution(task)
+                except Exception as e:
+                    print(f"⚠️ Worker {self.worker_id}: no se pudo liberar la reserva de {task.id}: {e}")
+            self._in_flight.pop(task.id, None)
             self.current_tasks -= 1
 
 
@@ -647,6 +1284,6 @@ async def setup_task_queue(redis_url: str) -> TaskQueue:
     queue.register_handler("track_guide", track_guide_task)
     queue.register_handler("resolve_incident", resolve_incident_task)
     queue.register_handler("make_call", make_call_task)
-    queue.register_handler("train_model", train_model_task)
+    queue.register_handler("train_model", train_model_task, cpu_bound=True)
 
     return queue